@@ -3,7 +3,7 @@
 用户登录、注册、Token 刷新、角色管理
 """
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr, field_validator
@@ -19,6 +19,9 @@ from core.auth.security import (
     require_permission,
     get_user_menu_items,
     get_user_data_scope,
+    get_password_hasher_stats,
+    token_claims,
+    token_version_valid,
     SESSION_EXPIRE_HOURS,
 )
 from core.auth.roles import get_user_permissions, get_role_by_code
@@ -114,6 +117,13 @@ class RoleResponse(BaseModel):
         return str(v)
 
 
+class DeviceRegisterRequest(BaseModel):
+    """车间终端登记请求"""
+    device_id: str
+    name: Optional[str] = None
+    factory_id: Optional[str] = None
+
+
 class AssignRoleRequest(BaseModel):
     """分配角色请求"""
     user_id: str
@@ -156,10 +166,17 @@ def _build_user_response(user: User) -> UserResponse:
 # --- Endpoints ---
 
 @router.post("/login", response_model=TokenResponse)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db),
+    x_device_id: Optional[str] = Header(None),
+    x_device_key: Optional[str] = Header(None),
+):
     """
     用户登录
     返回 access_token 和 refresh_token
+    已登记的车间终端（X-Device-Id + X-Device-Key 校验通过）签发绑定该设备的长效 refresh_token，
+    其他请求一律签发普通会话令牌
     """
     user_service = UserService(db)
     
@@ -181,18 +198,20 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     # 更新最后登录时间
     await user_service.update_last_login(user.id)
     
+    device = await user_service.verify_device(x_device_id, x_device_key, user)
+    
     # 生成 Token（包含角色信息）
     access_token = create_access_token(
         data={
-            "sub": user.username,
-            "user_id": str(user.id),
+            **token_claims(user),
             "role": user.role,
             "is_superuser": user.is_superuser,
             "factory_id": user.factory_id,
         }
     )
     refresh_token = create_refresh_token(
-        data={"sub": user.username, "user_id": str(user.id)}
+        data=token_claims(user),
+        device_id=device.device_id if device else None,
     )
     
     return TokenResponse(
@@ -204,10 +223,17 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
 
 
 @router.post("/refresh", response_model=TokenResponse)
-async def refresh_token(request: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
+async def refresh_token(
+    request: RefreshTokenRequest,
+    db: AsyncSession = Depends(get_db),
+    x_device_id: Optional[str] = Header(None),
+    x_device_key: Optional[str] = Header(None),
+):
     """
     刷新 Token
-    使用 refresh_token 获取新的 access_token
+    使用 refresh_token 获取新的 access_token（不走 bcrypt）
+    设备绑定令牌须由同一台已登记、未停用的设备（X-Device-Id + X-Device-Key）刷新；
+    用户改密/停用后（token_version 变化）令牌失效
     """
     payload = decode_token(request.refresh_token)
     
@@ -233,18 +259,36 @@ async def refresh_token(request: RefreshTokenRequest, db: AsyncSession = Depends
             detail="用户不存在或已停用"
         )
     
+    if not token_version_valid(payload, user):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="令牌已失效，请重新登录"
+        )
+    
+    # 令牌里的 device_id 谁都能读到，绑定靠设备密钥 + 服务端登记状态校验
+    device_id = payload.get("device_id")
+    if device_id:
+        device = None
+        if x_device_id == device_id:
+            device = await user_service.verify_device(x_device_id, x_device_key, user)
+        if device is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="刷新令牌与设备不匹配或设备已停用"
+            )
+    
     # 生成新的 Token
     access_token = create_access_token(
         data={
-            "sub": user.username,
-            "user_id": str(user.id),
+            **token_claims(user),
             "role": user.role,
             "is_superuser": user.is_superuser,
             "factory_id": user.factory_id,
         }
     )
     new_refresh_token = create_refresh_token(
-        data={"sub": user.username, "user_id": str(user.id)}
+        data=token_claims(user),
+        device_id=device_id,
     )
     
     return TokenResponse(
@@ -314,7 +358,7 @@ async def change_password(
     user_service = UserService(db)
     
     # 验证旧密码
-    if not user_service.authenticate_user(current_user.username, old_password):
+    if not await user_service.authenticate_user(current_user.username, old_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="旧密码错误"
@@ -340,6 +384,55 @@ async def reset_password(request: ResetPasswordRequest, db: AsyncSession = Depen
     return {"message": "密码已重置, 请用新密码登录"}
 
 
+@router.get("/password-hasher/stats")
+async def password_hasher_stats(current_user: User = Depends(get_current_active_superuser)):
+    """密码哈希线程池指标（队列深度/运行中/累计完成）"""
+    return get_password_hasher_stats()
+
+
+@router.post("/devices", status_code=201)
+async def register_device(
+    request: DeviceRegisterRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """
+    登记车间终端（管理员）
+    返回的 device_key 只出现这一次，需配置到终端（X-Device-Key）；重复登记即轮换密钥
+    """
+    device_id = request.device_id.strip()
+    if not device_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="device_id 不能为空")
+    user_service = UserService(db)
+    device, device_key = await user_service.register_device(
+        device_id, request.name, request.factory_id, current_user.username,
+    )
+    return {**device.to_dict(), "device_key": device_key}
+
+
+@router.get("/devices")
+async def list_devices(
+    factory_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """已登记的车间终端"""
+    devices = await UserService(db).list_devices(factory_id)
+    return [d.to_dict() for d in devices]
+
+
+@router.delete("/devices/{device_pk}")
+async def revoke_device(
+    device_pk: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """停用车间终端，其长效 refresh_token 随即失效"""
+    if not await UserService(db).revoke_device(device_pk):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="设备不存在")
+    return {"message": "设备已停用"}
+
+
 @router.get("/roles", response_model=List[RoleResponse])
 async def list_roles(
     db: AsyncSession = Depends(get_db),
@@ -2,6 +2,7 @@
 BOM Routes - EngHub BOM 对接 EngFlow 数据接口
 """
 from fastapi import APIRouter, Depends, Query, BackgroundTasks
+from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
@@ -21,9 +22,28 @@ async def get_bom_models(db: AsyncSession = Depends(get_db)):
 
 @router.get("/tree/{model_name}")
 async def get_bom_tree(model_name: str, db: AsyncSession = Depends(get_db)):
-    """BOM 树形展开"""
+    """BOM 树形展开（按型号 + 同步版本缓存序列化结果）"""
     service = BomService(db)
-    return await service.get_bom_tree(model_name)
+    return Response(content=await service.get_bom_tree_json(model_name), media_type="application/json")
+
+
+@router.get("/explode/{model_name}")
+async def explode_bom(
+    model_name: str,
+    part_number: Optional[str] = Query(None, description="从该组件展开（默认整机）"),
+    max_depth: Optional[int] = Query(None, ge=1, description="最多展开层数"),
+    db: AsyncSession = Depends(get_db),
+):
+    """多级展开（扁平列表，含层数与展开用量）"""
+    service = BomService(db)
+    return await service.explode(model_name, part_number, max_depth)
+
+
+@router.get("/where-used/{part_number}")
+async def where_used(part_number: str, db: AsyncSession = Depends(get_db)):
+    """物料反查：被哪些型号/组件使用"""
+    service = BomService(db)
+    return await service.where_used(part_number)
 
 
 @router.get("/search")
@@ -34,11 +54,12 @@ async def search_materials(
     component_type: Optional[str] = Query(None, description="组件类型"),
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
+    cursor: Optional[int] = Query(None, description="上一页返回的 next_cursor（键集分页）"),
     db: AsyncSession = Depends(get_db),
 ):
-    """物料搜索"""
+    """物料搜索（带分类/组件类型分面）"""
     service = BomService(db)
-    return await service.search_materials(q, model_name, category_l1, component_type, limit, offset)
+    return await service.search_materials(q, model_name, category_l1, component_type, limit, offset, cursor)
 
 
 @router.get("/material/{part_number}")
@@ -11,11 +11,9 @@ AI Assistant chat routes（支持 Tool Calling）。
 from __future__ import annotations
 
 import asyncio
-import base64
 import json
 import os
 import re
-from pathlib import Path
 from typing import Any, Dict, List, Optional
 from urllib.parse import quote
 
@@ -35,6 +33,8 @@ from api.services.chat_tools_service import (
 from api.services.quick_command_service import (
     build_agent_system_prompt, record_agent_dispatch,
 )
+from api.services.attachment_image_service import build_image_parts
+from api.services.attachment_table_service import ParsedSheet, parse_sheet
 
 router = APIRouter(prefix="/api/v1/chat", tags=["ai-assistant"])
 
@@ -344,12 +344,15 @@ async def _verify_grounded_reply(
 async def _load_attachment_records(
     db: AsyncSession, attachments: List[Attachment], user: User,
 ) -> List[FileRecord]:
-    """按 file_id 加载附件记录（做工厂隔离：普通用户不可引用其他工厂文件）。"""
+    """按 file_id 一次批量加载附件记录，保持请求顺序（做工厂隔离：普通用户不可引用其他工厂文件）。"""
+    ids = list(dict.fromkeys(att.file_id for att in attachments))
+    found = {
+        rec.id: rec
+        for rec in (await db.execute(select(FileRecord).where(FileRecord.id.in_(ids)))).scalars()
+    }
     records: List[FileRecord] = []
-    for att in attachments:
-        rec = (await db.execute(
-            select(FileRecord).where(FileRecord.id == att.file_id)
-        )).scalar_one_or_none()
+    for file_id in ids:
+        rec = found.get(file_id)
         if not rec:
             continue
         if not user.is_superuser and rec.factory_id and user.factory_id \
@@ -363,23 +366,13 @@ def _is_image_record(rec: FileRecord) -> bool:
     return (rec.content_type or "").startswith("image/")
 
 
-def _build_multimodal_content(text: str, image_records: List[FileRecord]) -> Any:
+async def _build_multimodal_content(text: str, image_records: List[FileRecord]) -> Any:
     """构造 OpenAI 多模态 content：文本 + 图片(base64 data URL)。
 
-    图片实体从 UPLOAD_DIR 落盘文件读取并转 base64；实体缺失则跳过。
+    图片在线程里缩图/编码并缓存（见 attachment_image_service）；实体缺失则跳过。
     无可用图片时退化为纯文本字符串。"""
     parts: List[Dict[str, Any]] = [{"type": "text", "text": text}]
-    for rec in image_records:
-        try:
-            data = Path(rec.storage_path).read_bytes()
-        except OSError:
-            continue
-        b64 = base64.b64encode(data).decode("ascii")
-        ctype = rec.content_type or "image/png"
-        parts.append({
-            "type": "image_url",
-            "image_url": {"url": f"data:{ctype};base64,{b64}"},
-        })
+    parts += await build_image_parts(image_records)
     if len(parts) == 1:
         return text
     return parts
@@ -402,101 +395,50 @@ def _is_spreadsheet_record(rec: FileRecord) -> bool:
     return fn.endswith((".xlsx", ".xlsm", ".xls", ".csv")) or ct in _SPREADSHEET_CONTENT_TYPES
 
 
-def _parse_spreadsheet_record(
+async def _parse_spreadsheet_record(
     rec: FileRecord, max_rows: int = 100, max_cols: int = 20,
-) -> Optional[Dict[str, Any]]:
-    """解析 Excel/CSV 附件 → 结构化表格数据（与前端 TableData 结构一致）。
+) -> Optional[ParsedSheet]:
+    """解析 Excel/CSV 附件：table 与前端 TableData 结构一致（{title, columns, rows}），
+    另带行数与逐列统计；解析失败返回 None。
 
-    返回 {title, columns:[{key,label}], rows:[{...}]}；解析失败返回 None。
-    首行视作表头；截断 max_rows/max_cols 避免超大文件撑爆模型上下文。"""
-    try:
-        path = Path(rec.storage_path)
-        if not path.is_file():
-            return None
-        fn = (rec.filename or "").lower()
-        ct = (rec.content_type or "").lower()
-        grid: List[List[Any]] = []
-        if fn.endswith(".csv") or ct in ("text/csv", "application/csv"):
-            import csv as _csv
-            with path.open("r", encoding="utf-8-sig", errors="replace", newline="") as f:
-                for row in _csv.reader(f):
-                    grid.append(list(row))
-                    if len(grid) >= max_rows + 1:
-                        break
-        elif fn.endswith((".xlsx", ".xlsm")) or "spreadsheetml" in ct:
-            from openpyxl import load_workbook
-            wb = load_workbook(path, read_only=True, data_only=True)
-            try:
-                ws = wb.active
-                for row in ws.iter_rows(values_only=True, max_row=max_rows + 1):
-                    grid.append(list(row))
-            finally:
-                wb.close()
-        else:
-            return None  # .xls 等暂不支持的格式 → 退化为普通文件提示
+    首行视作表头；table 截断 max_rows/max_cols 避免超大文件撑爆模型上下文。
+    本轮只读样本（sheet.complete=False 时行数/统计仅覆盖样本），全表统计在后台计算并按附件缓存，
+    之后的对话轮次直接用全表结果。"""
+    return await parse_sheet(rec, max_rows=max_rows, max_cols=max_cols)
 
-        # 去掉全空行
-        grid = [r for r in grid if any(c is not None and str(c).strip() != "" for c in r)]
-        if not grid:
-            return None
 
-        header = [
-            str(c).strip() if c is not None and str(c).strip() else f"列{i + 1}"
-            for i, c in enumerate(grid[0][:max_cols])
-        ]
-        columns = [{"key": f"c{i}", "label": h} for i, h in enumerate(header)]
-        rows: List[Dict[str, Any]] = []
-        for raw in grid[1:]:
-            rows.append({
-                f"c{i}": ("" if i >= len(raw) or raw[i] is None else str(raw[i]))
-                for i in range(len(header))
-            })
-        return {"title": rec.filename or "上传表格", "columns": columns, "rows": rows}
-    except Exception:  # noqa: BLE001
-        return None
-
-
-def _spreadsheet_to_summary(table: Dict[str, Any], sample_rows: int = 30) -> str:
+def _spreadsheet_to_summary(sheet: ParsedSheet, sample_rows: int = 30) -> str:
     """智能摘要：表头 + 统计 + 样本行，替代全量 Markdown dump。
 
     小表（≤ sample_rows 行）给出全部行以保证 AI 分析精确；大表仅给统计+前 N 行样本省 token，
     完整数据由前端 Univer 在线表格渲染。明确告知模型数据是否完整，防止其编造表中不存在的行/值。"""
-    cols = table["columns"]
-    rows = table["rows"]
-    total_rows = len(rows)
+    cols = sheet.table["columns"]
+    rows = sheet.table["rows"]
+    total_rows = sheet.total_rows
     col_labels = [c["label"] for c in cols]
 
-    # --- 推断列类型 + 统计 ---
+    # --- 列类型 + 统计（全表统计未就绪时为样本统计） ---
     col_stats: List[str] = []
-    for c in cols:
-        key, label = c["key"], c["label"]
-        values = [r.get(key, "") for r in rows if r.get(key, "") != ""]
-        if not values:
+    for c, st in zip(cols, sheet.stats):
+        label = c["label"]
+        if not st.non_empty:
             col_stats.append(f"  - {label}: 全空")
-            continue
-        # 尝试数值推断
-        nums = []
-        for v in values:
-            try:
-                nums.append(float(str(v).replace(",", "")))
-            except (ValueError, TypeError):
-                break
-        if nums and len(nums) == len(values):
+        elif st.is_numeric:
             col_stats.append(
-                f"  - {label} [数值]: min={min(nums):.2f}, max={max(nums):.2f}, "
-                f"avg={sum(nums)/len(nums):.2f}, 非空{len(nums)}条"
+                f"  - {label} [数值]: min={st.min:.2f}, max={st.max:.2f}, "
+                f"avg={st.mean:.2f}, 非空{st.non_empty}条"
             )
         else:
-            unique = set(str(v) for v in values)
-            top = list(unique)[:5]
+            distinct = f"{len(st.counts)}+" if st.overflow else str(len(st.counts))
+            top = st.top(5)
             col_stats.append(
-                f"  - {label} [文本]: {len(unique)}种取值"
-                + (f", 如: {', '.join(top)}" if len(unique) <= 20 else f", 前5: {', '.join(top)}")
+                f"  - {label} [文本]: {distinct}种取值, 非空{st.non_empty}条"
+                + (f", 如: {', '.join(top)}" if len(st.counts) <= 5 else f", 最常见: {', '.join(top)}")
             )
 
     # --- 样本行：小表给全部行（保证精确），大表截断（省 token） ---
     shown = rows[:sample_rows]
-    is_full = total_rows <= sample_rows
+    is_full = sheet.complete and total_rows <= sample_rows
     sample_lines = []
     if shown:
         sample_lines.append("| " + " | ".join(col_labels) + " |")
@@ -504,15 +446,19 @@ def _spreadsheet_to_summary(table: Dict[str, Any], sample_rows: int = 30) -> str
         for r in shown:
             sample_lines.append("| " + " | ".join(str(r.get(c["key"], "")) for c in cols) + " |")
 
+    # 全表统计未就绪时只知道行数下限
+    total_text = f"共 {total_rows}" if sheet.complete else f"超过 {total_rows}"
     parts = [
-        f"共 {total_rows} 行 × {len(cols)} 列",
-        "列信息：\n" + "\n".join(col_stats),
+        f"{total_text} 行 × {len(cols)} 列"
+        + (f"（超出统计上限，仅统计前 {total_rows} 行）" if sheet.stats_truncated else "")
+        + ("" if sheet.complete else "（全表统计计算中）"),
+        ("列信息：" if sheet.complete else f"列信息（基于前 {total_rows} 行样本）：") + "\n" + "\n".join(col_stats),
     ]
     if sample_lines:
         header = (
             "全部数据如下（请严格基于这些真实数据分析，禁止编造表中不存在的行或数值）："
             if is_full else
-            f"前 {sample_rows} 行样本（共 {total_rows} 行，其余见用户在线表格）："
+            f"前 {len(shown)} 行样本（{total_text} 行，其余见用户在线表格）："
         )
         parts.append(header + "\n" + "\n".join(sample_lines))
     if is_full:
@@ -522,7 +468,7 @@ def _spreadsheet_to_summary(table: Dict[str, Any], sample_rows: int = 30) -> str
     return "\n".join(parts)
 
 
-def _attachment_text_note(records: List[FileRecord]) -> str:
+async def _attachment_text_note(records: List[FileRecord]) -> str:
     """附件文字摘要。
 
     - Excel/CSV：智能摘要（表头+统计+样本），完整数据由 Univer 在线表格渲染；
@@ -532,9 +478,9 @@ def _attachment_text_note(records: List[FileRecord]) -> str:
     lines = ["\n\n【用户本次上传的附件（已存入系统文件库）】"]
     for rec in records:
         if _is_spreadsheet_record(rec):
-            table = _parse_spreadsheet_record(rec)
-            if table:
-                lines.append(f"- 表格文件：{rec.filename}\n{_spreadsheet_to_summary(table)}")
+            sheet = await _parse_spreadsheet_record(rec)
+            if sheet:
+                lines.append(f"- 表格文件：{rec.filename}\n{_spreadsheet_to_summary(sheet)}")
             else:
                 # 解析失败（文件缺失/格式不支持/损坏）：明确告知模型，避免其按文件名幻觉编造表格内容
                 lines.append(
@@ -587,19 +533,19 @@ async def chat(
             await record_agent_dispatch(db, factory_id, request.agent_key, last_user)
     history = [m.model_dump() for m in request.messages]
     # 将附件注入「最后一条用户消息」：图片 → 多模态 content；非图片 → 文字摘要追加
-    non_image_note = _attachment_text_note([r for r in att_records if not _is_image_record(r)])
+    non_image_note = await _attachment_text_note([r for r in att_records if not _is_image_record(r)])
     injected = False
     for idx in range(len(history) - 1, -1, -1):
         if history[idx].get("role") == "user":
             text = history[idx].get("content") or ""
             if non_image_note:
                 text = f"{text}{non_image_note}"
-            history[idx]["content"] = _build_multimodal_content(text, image_records)
+            history[idx]["content"] = await _build_multimodal_content(text, image_records)
             injected = True
             break
     if not injected and image_records:
         # 历史中无用户消息（异常场景）：补一条多模态用户消息
-        history.append({"role": "user", "content": _build_multimodal_content(last_user, image_records)})
+        history.append({"role": "user", "content": await _build_multimodal_content(last_user, image_records)})
     messages += history
 
     payload: Dict[str, Any] = {
@@ -1035,9 +981,9 @@ async def chat_stream(
         # ---- Excel/CSV 附件 → 推送结构化表格事件（前端渲染可交互表格 + Univer 电子表格） ----
         for rec in att_records:
             if _is_spreadsheet_record(rec):
-                tbl = _parse_spreadsheet_record(rec)
-                if tbl:
-                    yield _sse("table", tbl)
+                sheet = await _parse_spreadsheet_record(rec)
+                if sheet:
+                    yield _sse("table", sheet.table)
 
         # 所有文本意图统一交给模型解析；后端仅执行模型返回的 tool_calls。
         messages: List[Dict[str, Any]] = [{"role": "system", "content": SYSTEM_PROMPT}]
@@ -1048,18 +994,18 @@ async def chat_stream(
                 messages.append({"role": "system", "content": agent_prompt})
                 await record_agent_dispatch(db, factory_id, request.agent_key, last_user)
         history = [m.model_dump() for m in request.messages]
-        non_image_note = _attachment_text_note([r for r in att_records if not _is_image_record(r)])
+        non_image_note = await _attachment_text_note([r for r in att_records if not _is_image_record(r)])
         injected = False
         for idx in range(len(history) - 1, -1, -1):
             if history[idx].get("role") == "user":
                 text = history[idx].get("content") or ""
                 if non_image_note:
                     text = f"{text}{non_image_note}"
-                history[idx]["content"] = _build_multimodal_content(text, image_records)
+                history[idx]["content"] = await _build_multimodal_content(text, image_records)
                 injected = True
                 break
         if not injected and image_records:
-            history.append({"role": "user", "content": _build_multimodal_content(last_user, image_records)})
+            history.append({"role": "user", "content": await _build_multimodal_content(last_user, image_records)})
         messages += history
 
         payload: Dict[str, Any] = {
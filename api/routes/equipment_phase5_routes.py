@@ -62,6 +62,23 @@ class OeeCalculate(BaseModel):
     ideal_cycle_minutes: float = 1.0
 
 
+class OeeBatchCalculate(BaseModel):
+    factory_id: str
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    planned_minutes: float = 960
+    ideal_cycle_minutes: float = 1.0
+    include_idle: bool = False
+
+
+class OeeBackfill(BaseModel):
+    factory_id: str
+    start_date: str
+    end_date: Optional[str] = None
+    planned_minutes: float = 960
+    ideal_cycle_minutes: float = 1.0
+
+
 class ReadingRecord(BaseModel):
     factory_id: str
     equipment_id: str
@@ -227,17 +244,60 @@ async def calculate_oee(
     )
 
 
+@router.post("/oee/calculate-batch")
+async def calculate_oee_batch(
+    req: OeeBatchCalculate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """整厂批量计算日 OEE（可指定日期区间）"""
+    svc = OeeService(db)
+    return await svc.calculate_factory_oee(
+        factory_id=req.factory_id, start_date=req.start_date, end_date=req.end_date,
+        planned_minutes=req.planned_minutes, ideal_cycle_minutes=req.ideal_cycle_minutes,
+        include_idle=req.include_idle,
+    )
+
+
+@router.post("/oee/backfill")
+async def backfill_oee(
+    req: OeeBackfill,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """历史 OEE 回填"""
+    svc = OeeService(db)
+    return await svc.backfill_oee(
+        factory_id=req.factory_id, start_date=req.start_date, end_date=req.end_date,
+        planned_minutes=req.planned_minutes, ideal_cycle_minutes=req.ideal_cycle_minutes,
+    )
+
+
+@router.get("/oee/intraday")
+async def oee_intraday(
+    factory_id: str = Query(...),
+    planned_minutes: float = Query(default=960),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """当日实时 OEE"""
+    svc = OeeService(db)
+    return await svc.get_intraday_oee(factory_id, planned_minutes)
+
+
 @router.get("/oee/trend")
 async def oee_trend(
     factory_id: str = Query(...),
     equipment_id: Optional[str] = None,
-    days: int = Query(default=7),
+    line_id: Optional[str] = None,
+    days: int = Query(default=7, ge=1, le=1100),
+    granularity: str = Query(default="day", description="day / week / month"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """OEE 趋势"""
+    """OEE 趋势（day 读日快照；week/month 读预聚合，可查 1~3 年）"""
     svc = OeeService(db)
-    return await svc.get_oee_trend(factory_id, equipment_id, days)
+    return await svc.get_oee_trend(factory_id, equipment_id, days, granularity, line_id)
 
 
 @router.get("/oee/summary")
@@ -0,0 +1,87 @@
+"""
+Export Routes - 报表导出任务 API
+=============================================
+大报表（工单/报工明细、标准工时表）流式导出为 CSV/XLSX，后台执行：
+- POST /api/v1/exports：提交导出任务，立即返回任务（status=pending）
+- GET  /api/v1/exports/{id}：查进度；成功后 download_url 指向 /api/v1/files/{file_id}
+- GET  /api/v1/exports：当前用户最近的导出任务
+- GET  /api/v1/exports/types：可导出的数据源与过滤参数
+"""
+
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.db_config import get_db
+from database.models import User
+from core.auth.security import get_current_user
+from api.services.export_job_service import EXPORT_FORMATS, EXPORT_SOURCES, ExportError, ExportJobService
+
+router = APIRouter(prefix="/api/v1/exports", tags=["exports"])
+
+
+class ExportRequest(BaseModel):
+    export_type: str = Field(..., description="数据源：work_orders / production_reports / standard_times")
+    format: str = Field("xlsx", description="csv / xlsx")
+    params: Dict[str, Any] = Field(default_factory=dict, description="过滤条件，见 /types")
+
+
+@router.get("/types")
+async def list_export_types(current_user: User = Depends(get_current_user)):
+    """可导出的数据源、列与过滤参数。"""
+    return {
+        "formats": list(EXPORT_FORMATS),
+        "types": [
+            {
+                "export_type": key,
+                "title": source.title,
+                "columns": [label for _, label in source.columns],
+                "filters": list(source.filters),
+            }
+            for key, source in EXPORT_SOURCES.items()
+        ],
+    }
+
+
+@router.post("")
+async def submit_export(
+    body: ExportRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """提交导出任务（按当前用户工厂过滤数据），后台执行。"""
+    try:
+        job = await ExportJobService(db).submit(
+            body.export_type, body.format, body.params, current_user.username, current_user.factory_id,
+        )
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.to_dict()
+
+
+@router.get("/{job_id}")
+async def get_export(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """查询导出任务状态与进度。"""
+    job = await ExportJobService(db).get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    if not current_user.is_superuser and job.requested_by != current_user.username:
+        raise HTTPException(status_code=403, detail="无权查看他人的导出任务")
+    return job.to_dict()
+
+
+@router.get("")
+async def list_exports(
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """当前用户最近的导出任务。"""
+    jobs = await ExportJobService(db).list_jobs(current_user.username, limit)
+    return {"items": [j.to_dict() for j in jobs]}
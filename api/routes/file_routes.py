@@ -2,36 +2,39 @@
 File Routes - 文件/附件上传下载 API
 =============================================
 chatbot 多模态收发 + 系统表单/报告导出文件的统一存储。
-- POST /api/v1/files/upload：上传文件（落盘 UPLOAD_DIR + 写 FileRecord）
+- POST /api/v1/files/upload：上传文件（请求体边收边解析、流式落盘到内容地址 + 写 FileRecord）
+- POST /api/v1/files/uploads：建断点续传会话；PUT .../{upload_id}?offset= 写分块；
+  GET .../{upload_id} 查已接收长度；POST .../{upload_id}/complete 完成归档
 - GET  /api/v1/files/{id}：下载文件（鉴权 + 工厂校验）
 - GET  /api/v1/files：按业务对象列附件（related_type/related_id）
 
 多工厂隔离：普通用户仅能访问本工厂文件，超管可跨工厂。
 """
 
-import os
-import uuid
 from pathlib import Path
 from typing import Optional
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
+from fastapi import APIRouter, Depends, Form, HTTPException, Query, Request
 from fastapi.responses import FileResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.db_config import get_db
-from database.models import FileRecord, User
+from database.models import FileRecord, FileUploadSession, User
 from core.auth.security import get_current_user
+from api.services.file_storage_service import (
+    CHUNK_SIZE,
+    MAX_UPLOAD_SIZE,
+    MULTIPART_OVERHEAD,
+    UPLOAD_DIR,
+    FileStorageService,
+    MultipartUpload,
+    UploadOffsetMismatch,
+    UploadTooLarge,
+)
 
 router = APIRouter(prefix="/api/v1/files", tags=["files"])
 
-# 落盘目录：容器内 /app/uploads，本地 项目根/uploads
-UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", str(Path(__file__).resolve().parents[2] / "uploads")))
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-
-# 上传大小上限（默认 100MB），支持视频文件
-MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))
-
 
 def _ensure_same_factory(file: FileRecord, user: User) -> None:
     """多工厂隔离：普通用户不可访问其他工厂的文件（超管例外）。"""
@@ -41,44 +44,136 @@ def _ensure_same_factory(file: FileRecord, user: User) -> None:
         raise HTTPException(status_code=403, detail="无权访问其他工厂的文件")
 
 
-@router.post("/upload")
+def _file_payload(record: FileRecord) -> dict:
+    result = record.to_dict()
+    result["is_image"] = (record.content_type or "").startswith("image/")
+    result["is_video"] = (record.content_type or "").startswith("video/")
+    return result
+
+
+def _too_large(e: UploadTooLarge) -> HTTPException:
+    return HTTPException(status_code=413, detail=str(e))
+
+
+# 请求体不经 UploadFile（那会先把整个文件落到临时文件再交给路由），OpenAPI 里手工声明表单
+_UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {
+                "file": {"type": "string", "format": "binary"},
+                "related_type": {"type": "string"},
+                "related_id": {"type": "string"},
+            },
+        }}},
+    },
+}
+
+
+@router.post("/upload", openapi_extra=_UPLOAD_FORM_SCHEMA)
 async def upload_file(
-    file: UploadFile = File(...),
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """上传文件（表单字段 file / related_type / related_id）：边收边计数解析请求体，超限立即 413，
+    文件部分分块流式落盘到内容地址并写 FileRecord（按当前用户工厂隔离）。"""
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail=f"文件过大（上限 {MAX_UPLOAD_SIZE // 1024 // 1024}MB）")
+    try:
+        upload = MultipartUpload(request.headers.get("content-type", ""), request.stream())
+        record = await FileStorageService(db).save_upload(upload, current_user.username, current_user.factory_id)
+    except UploadTooLarge as e:
+        raise _too_large(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"上传表单无效: {e}")
+    return _file_payload(record)
+
+
+async def _own_session(service: FileStorageService, upload_id: str, user: User) -> FileUploadSession:
+    session = await service.get_session(upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    if not user.is_superuser and session.uploaded_by != user.username:
+        raise HTTPException(status_code=403, detail="无权访问他人的上传会话")
+    return session
+
+
+@router.post("/uploads")
+async def create_upload(
+    filename: str = Form(...),
+    size: Optional[int] = Form(None, ge=0, description="文件总字节数（建议提供，完成时校验）"),
+    content_type: Optional[str] = Form(None),
     related_type: Optional[str] = Form(None),
     related_id: Optional[str] = Form(None),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """上传文件：落盘 UPLOAD_DIR 并写 FileRecord（按当前用户工厂隔离）。"""
-    content = await file.read()
-    if len(content) > MAX_UPLOAD_SIZE:
-        raise HTTPException(status_code=413, detail=f"文件过大（上限 {MAX_UPLOAD_SIZE // 1024 // 1024}MB）")
+    """建断点续传会话：之后按 offset 分块 PUT，断线后 GET 查已接收长度再续传。"""
+    service = FileStorageService(db)
+    safe_name = filename.replace("/", "_").replace("\\", "_")
+    try:
+        session = await service.create_session(
+            safe_name, content_type, size, current_user.username, current_user.factory_id,
+            related_type, related_id,
+        )
+    except UploadTooLarge as e:
+        raise _too_large(e)
+    return {"upload_id": session.id, "offset": 0, "chunk_size": CHUNK_SIZE, "max_size": MAX_UPLOAD_SIZE}
+
+
+@router.get("/uploads/{upload_id}")
+async def get_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """查询续传会话已接收的字节数（续传从该偏移开始）。"""
+    service = FileStorageService(db)
+    session = await _own_session(service, upload_id, current_user)
+    return {"upload_id": upload_id, "offset": await service.received(session), "size": session.total_size}
 
-    file_id = str(uuid.uuid4())
-    # 以「id_原名」落盘，避免同名覆盖；清洗路径分隔符防目录穿越
-    safe_name = (file.filename or "file").replace("/", "_").replace("\\", "_")
-    storage_path = UPLOAD_DIR / f"{file_id}_{safe_name}"
-    storage_path.write_bytes(content)
-
-    record = FileRecord(
-        id=file_id,
-        filename=file.filename or "file",
-        content_type=file.content_type,
-        size=len(content),
-        storage_path=str(storage_path),
-        uploaded_by=current_user.username,
-        factory_id=current_user.factory_id,
-        related_type=related_type,
-        related_id=related_id,
-    )
-    db.add(record)
-    await db.commit()
-    await db.refresh(record)
 
-    result = record.to_dict()
-    result["is_image"] = (file.content_type or "").startswith("image/")
-    result["is_video"] = (file.content_type or "").startswith("video/")
-    return result
+@router.put("/uploads/{upload_id}")
+async def put_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="本块在文件中的起始偏移"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """写入一个分块（请求体为原始字节，流式写盘）；偏移有缺口时 409 并返回已接收长度。"""
+    service = FileStorageService(db)
+    session = await _own_session(service, upload_id, current_user)
+    try:
+        received = await service.append_chunks(session, offset, request.stream())
+    except UploadOffsetMismatch as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.offset})
+    except UploadTooLarge as e:
+        raise _too_large(e)
+    return {"upload_id": upload_id, "offset": received}
+
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    sha256: Optional[str] = Query(None, description="客户端计算的 SHA-256（可选，校验完整性）"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """完成续传：校验长度/哈希，归档到内容地址并写 FileRecord。"""
+    service = FileStorageService(db)
+    session = await _own_session(service, upload_id, current_user)
+    try:
+        record = await service.complete_session(session, sha256)
+    except UploadOffsetMismatch as e:
+        raise HTTPException(status_code=409, detail={"message": "文件未传完", "offset": e.offset})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return _file_payload(record)
 
 
 @router.get("/{file_id}")
@@ -5,7 +5,7 @@ IE Module API Routes - Industrial Engineering Module
 
 from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, BaseModel as PydanticModel
+from pydantic import BaseModel, BaseModel as PydanticModel, Field
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, or_
@@ -135,6 +135,16 @@ class LineBalanceInput(BaseModel):
     takt_time: Optional[float] = None  # 可选，如不传入则自动计算
 
 
+class LineBalanceOptimizeInput(BaseModel):
+    """产线平衡优化输入：takt_time（求最少工站）与 station_count（求最小节拍）二选一"""
+    factory_id: Optional[str] = None  # 仅超管可指定，普通用户固定为本工厂
+    product_id: str
+    routing_template_id: Optional[str] = None  # 不传则取该产品最近工单绑定的工艺路线
+    takt_time: Optional[float] = Field(None, gt=0)
+    station_count: Optional[int] = Field(None, gt=0)
+    time_limit: float = Field(2.0, gt=0, le=30)
+
+
 class LineBalanceResponse(BaseModel):
     """产线平衡分析报告"""
     id: str
@@ -473,6 +483,29 @@ async def get_line_balance_report(
     return LineBalanceResponse.model_validate(report.to_dict())
 
 
+@router.post("/line-balance-optimizations")
+async def optimize_line_balance(
+    input_data: LineBalanceOptimizeInput,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """按工艺路线求解产线平衡（SALBP-1/2），返回各工站作业分配（按当前用户工厂隔离）"""
+    factory_id = input_data.factory_id if current_user.is_superuser and input_data.factory_id \
+        else current_user.factory_id
+    service = LineBalanceService(db)
+    try:
+        return await service.optimize_line_balance(
+            factory_id=factory_id,
+            product_id=input_data.product_id,
+            routing_template_id=input_data.routing_template_id,
+            takt_time=input_data.takt_time,
+            station_count=input_data.station_count,
+            time_limit=input_data.time_limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # ============================================================
 # 工序价值分析端点 (Process Analysis Endpoints)
 # ============================================================
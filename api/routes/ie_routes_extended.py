@@ -562,24 +562,27 @@ async def value_stream_mapping(
 
 
 # ============================================================
-# 报告导出端点（简化版，实际实现需调用 ReportExportService）
+# 报告导出端点（后台流式导出，进度见 /api/v1/exports/{id}）
 # ============================================================
 
 @router.get("/reports/standard-times-export", response_model=Dict[str, Any])
 async def export_standard_times_report(
-    factory_id: str,
+    factory_id: Optional[str] = Query(None, description="仅超管可指定，普通用户固定为本工厂"),
     product_id: Optional[str] = None,
-    format: str = Query("xlsx", enum=["xlsx", "csv", "pdf"]),
+    format: str = Query("xlsx", enum=["xlsx", "csv"]),
     db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """导出标准工时报表（API触发后台生成任务）"""
-    # 返回文件下载链接或在异步任务完成后返回
-    return {
-        "status": "processing",
-        "request_id": f"export_{datetime.utcnow().timestamp()}",
-        "message": "Report generation initiated. Check status later.",
-    }
+    """导出标准工时报表（API触发后台生成任务，按当前用户工厂隔离）"""
+    from api.services.export_job_service import ExportError
+    if not current_user.is_superuser or not factory_id:
+        factory_id = current_user.factory_id
+    try:
+        return await ReportExportService(db).export_standard_times_to_excel(
+            factory_id, product_id, format, requested_by=current_user.username,
+        )
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # ============================================================
@@ -12,7 +12,7 @@ FactorySimResult 结构，供生产看板复用仿真结果 UI 组件。
 
 from fastapi import APIRouter, Depends, Query, HTTPException
 from typing import Any, Dict, List, Optional
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from collections import defaultdict
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, cast, String, text, func, and_, distinct
@@ -23,6 +23,7 @@ from database.models import (
     Routing, OutboundOrder, User, ShiftSummary, ProductionAlert, HourlyOutputSnapshot,
 )
 from core.auth.security import get_current_user
+from api.services.report_rollup_service import rollup_today
 
 router = APIRouter(prefix="/api/v1/production-dashboard", tags=["production-dashboard"])
 
@@ -572,7 +573,7 @@ async def production_dashboard_live(
     current_user: User = Depends(get_current_user),
 ) -> Dict[str, Any]:
     """实时看板精简版（只返回当日关键指标，无历史窗口，更轻量）"""
-    today = date.today()
+    today = rollup_today()
 
     # 今日产出汇总（单次聚合查询）
     stmt = select(
@@ -742,9 +743,9 @@ async def production_dashboard_hourly_trend(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    """小时产出趋势（今日 vs 昨日）"""
+    """小时产出趋势（今日 vs 昨日，小时快照按 UTC 日期分桶）"""
     from dateutil import parser
-    today = date.fromisoformat(target_date) if target_date else date.today()
+    today = date.fromisoformat(target_date) if target_date else rollup_today()
     yesterday = today - timedelta(days=1)
 
     async def _get_hourly(d: date) -> List[Dict]:
@@ -2,6 +2,7 @@
 岗位替代 Phase 4 路由 - 检验终端 / SPC 控制图 / 不良分析
 """
 from fastapi import APIRouter, Depends, Query, HTTPException
+from datetime import datetime
 from typing import Optional, List
 from pydantic import BaseModel
 
@@ -63,6 +64,21 @@ class SpcMeasurement(BaseModel):
     sample_group: Optional[int] = None
 
 
+class SpcBatchPoint(BaseModel):
+    characteristic_code: str
+    measured_value: float
+    characteristic_name: Optional[str] = None
+    work_order_id: Optional[str] = None
+    station_id: Optional[str] = None
+    sample_group: Optional[int] = None
+    measured_at: Optional[datetime] = None
+
+
+class SpcBatchMeasurement(BaseModel):
+    factory_id: str
+    points: List[SpcBatchPoint]
+
+
 class SpcConfigUpsert(BaseModel):
     factory_id: str
     characteristic_code: str
@@ -211,6 +227,25 @@ async def spc_measure(
     )
 
 
+@router.post("/qms/spc/measure/batch")
+async def spc_measure_batch(
+    req: SpcBatchMeasurement,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """批量记录 SPC 测量（量具流式上报，一次多行写入）"""
+    if len(req.points) > 5000:
+        raise HTTPException(status_code=400, detail="单批最多 5000 个测量点")
+    svc = SpcService(db)
+    result = await svc.ingest_batch(
+        req.factory_id, [p.model_dump() for p in req.points],
+        measured_by=current_user.username,
+    )
+    # 批量响应只回传失控点，避免大批次回显全部测量值
+    result["points"] = [p for p in result["points"] if p["is_out_of_control"]]
+    return result
+
+
 @router.get("/qms/spc/chart")
 async def spc_chart(
     factory_id: str = Query(...),
@@ -219,16 +254,28 @@ async def spc_chart(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """控制图数据"""
+    """控制图数据（points 为最近 limit 个点；Cpk/均值/标准差基于全部历史，见 cpk_scope）"""
     svc = SpcService(db)
     return await svc.get_control_chart(factory_id, characteristic_code, limit)
 
 
+@router.get("/qms/spc/rules/evaluate")
+async def spc_evaluate_rules(
+    factory_id: str = Query(...),
+    window: int = Query(default=50, ge=15, le=500),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """整厂判异（Western Electric / Nelson 规则，最近 window 点滑窗）"""
+    svc = SpcService(db)
+    return await svc.evaluate_rules(factory_id, window)
+
+
 @router.post("/qms/spc/calculate-limits")
 async def calculate_limits(
     factory_id: str = Query(...),
     characteristic_code: str = Query(...),
-    subgroup_size: int = Query(default=5),
+    subgroup_size: int = Query(default=5, ge=2, le=10),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -12,6 +12,7 @@ from api.services.user_service import UserService
 from core.auth.security import (
     create_access_token,
     create_refresh_token,
+    token_claims,
     get_current_user,
     SESSION_EXPIRE_HOURS,
 )
@@ -55,8 +56,7 @@ async def _build_test_user_response(user: User) -> TestSwitchResult:
 
     access_token = create_access_token(
         data={
-            "sub": user.username,
-            "user_id": str(user.id),
+            **token_claims(user),
             "role": user.role,
             "is_superuser": user.is_superuser,
             "factory_id": user.factory_id,
@@ -64,7 +64,7 @@ async def _build_test_user_response(user: User) -> TestSwitchResult:
         }
     )
     refresh_token = create_refresh_token(
-        data={"sub": user.username, "user_id": str(user.id)}
+        data=token_claims(user)
     )
 
     return TestSwitchResult(
@@ -17,6 +17,7 @@ from api.schemas.tms import (
     TaskCreate,
     TaskUpdate,
     TaskDistributeRequest,
+    BatchDistributeRequest,
     TaskClaimRequest,
     ApprovalFlowCreate,
     ApprovalActionRequest,
@@ -141,6 +142,21 @@ async def distribute_task(
     return result
 
 
+@router.post("/distribution/batch", summary="批量分发")
+async def distribute_batch(
+    payload: BatchDistributeRequest,
+    service: TMSService = Depends(get_tms_service),
+):
+    """批量分发待分发任务（整班次积压一次分配）"""
+    return await service.distribute_backlog(
+        task_ids=payload.task_ids,
+        strategy=payload.strategy,
+        limit=payload.limit,
+        optimal=payload.optimal,
+        triggered_by="api_user",
+    )
+
+
 @router.post("/tasks/{task_id}/claim", summary="认领任务")
 async def claim_task(
     task_id: str,
@@ -323,6 +339,23 @@ async def register_webhook(
     return result
 
 
+@router.get("/agent/webhook/metrics", summary="Webhook 投递指标")
+async def get_webhook_metrics(
+    service: TMSService = Depends(get_tms_service),
+):
+    """Outbox 积压、死信数、最老未投递事件滞后、近一分钟吞吐与平均投递延迟"""
+    return await service.get_webhook_metrics()
+
+
+@router.post("/agent/webhook/dead-letters/replay", summary="重放死信投递")
+async def replay_dead_webhooks(
+    agent_id: Optional[str] = Query(None, description="只重放该 Agent 的死信"),
+    service: TMSService = Depends(get_tms_service),
+):
+    """把死信投递重置为待投递，由后台投递器重新推送"""
+    return await service.replay_dead_webhooks(agent_id)
+
+
 @router.get("/agent/context/{task_id}", summary="获取任务 Agent 上下文")
 async def get_agent_context(
     task_id: str,
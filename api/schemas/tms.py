@@ -80,6 +80,14 @@ class TaskDistributeRequest(BaseModel):
     target_user_id: Optional[str] = Field(None, description="手动指定分配对象")
 
 
+class BatchDistributeRequest(BaseModel):
+    """批量分发请求（不传 task_ids 时分发全部待分发任务）"""
+    task_ids: Optional[List[str]] = Field(None, description="任务ID列表")
+    strategy: str = Field(default="skill_match", description="分发策略: skill_match, load_balance, priority_queue")
+    limit: int = Field(default=500, ge=1, le=5000, description="单次最多分发任务数")
+    optimal: bool = Field(default=False, description="容量约束下整体最优指派（否则逐单贪心）")
+
+
 class TaskClaimRequest(BaseModel):
     """任务认领请求"""
     user_id: str = Field(..., description="认领人ID")
@@ -9,6 +9,15 @@
 - patrol: 主动巡检（工单超时/安灯未响应）→ 生成预警 → 触发审查
 - validate_alert_data: 预警数据边界校验（防低级失误）
 
+巡检流水线：
+- 各来源并发扫描（独立会话），扫描 SQL 内反连接排除已有待处理审查
+- 审查结论按上下文哈希缓存（进程 LRU + 库内 context_hash），上下文不变不重复调 LLM
+- 其余预警经有界并发池调 LLM，共享一个连接池客户端；结果一次写入
+
+审查微批（ReviewBatcher）：
+- 同来源同工厂的审查请求在短窗口内攒成一批（相同上下文合并），一个多条目 prompt 调一次网关
+- 按条目序号把结论分发回各条预警；缺失条目或网关超时/失败时逐条规则兜底
+
 设计原则：
 - AI 审查+建议，不自动执行写操作
 - 异步执行，不阻塞预警创建主流程
@@ -17,14 +26,19 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
+import logging
 import os
 import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import httpx
-from sqlalchemy import select, func
+from sqlalchemy import String, cast, func, literal, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import (
@@ -38,6 +52,18 @@ GATEWAY_URL = os.getenv("LLM_GATEWAY_URL", "http://host.docker.internal:14040").
 API_KEY = os.getenv("LLM_API_KEY", "")
 MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 REQUEST_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+# 巡检审查并发上限（同时在途的 LLM 请求数）
+LLM_REVIEW_CONCURRENCY = int(os.getenv("ALERT_REVIEW_CONCURRENCY", "4"))
+VERDICT_CACHE_SIZE = 1024
+# 审查微批：攒批窗口、单批条目上限、单批网关超时（超时整批规则兜底）
+REVIEW_BATCH_WINDOW = float(os.getenv("ALERT_REVIEW_BATCH_WINDOW_MS", "200")) / 1000
+REVIEW_BATCH_MAX_ITEMS = int(os.getenv("ALERT_REVIEW_BATCH_MAX", "20"))
+REVIEW_BATCH_TIMEOUT = float(os.getenv("ALERT_REVIEW_BATCH_TIMEOUT", "20"))
+
+# 规则兜底结论的 raw_ai_response 前缀（兜底结论不进缓存）
+FALLBACK_MARK = "[规则兜底]"
+
+logger = logging.getLogger(__name__)
 
 # 预警来源标签
 SOURCE_LABELS = {
@@ -70,11 +96,39 @@ REVIEW_PROMPT_TEMPLATE = """你是 EngHub MES 制造执行系统的智能预警
 - dispatch_to：推荐由谁处理（如"设备维修组"、"品质经理"、"慢走丝工序组"等）
 """
 
+# 多条目批量审查 Prompt（同来源同工厂的一批预警）
+BATCH_REVIEW_PROMPT_TEMPLATE = """你是 EngHub MES 制造执行系统的智能预警审查员。以下是同一来源的 {count} 条被动预警，请逐条做初步审查。
+这些预警可能相互关联（同一产线、同一物料），可结合起来判断根因，但每条都要给出结论。
+
+【预警来源】{source_label}
+{items}
+
+请严格按以下 JSON 格式输出（不要输出其他内容），items 中每条预警一项，index 与上面的编号一致：
+{{
+  "items": [
+    {{
+      "index": 1,
+      "severity": "critical 或 high 或 medium 或 low",
+      "root_causes": ["根因假设1", "根因假设2"],
+      "actions": ["建议处置措施1", "建议处置措施2"],
+      "dispatch_to": "推荐分派对象（工序组/角色/岗位）"
+    }}
+  ]
+}}
+
+审查原则：
+- severity 判定：影响产线停线=critical，影响品质/交期=high，局部影响=medium，信息性=low
+- root_causes：基于预警内容做合理推断，1-3条
+- actions：具体可执行的处置建议
+- dispatch_to：推荐由谁处理
+"""
+
 
 # ==================== 边界校验（防低级失误） ====================
 
 VALID_PRIORITIES = {"low", "medium", "high", "urgent"}
 VALID_SEVERITIES = {"critical", "major", "minor"}
+REVIEW_SEVERITIES = {"critical", "high", "medium", "low"}  # AI 审查结论的严重度
 VALID_EQUIPMENT_TRANSITIONS = {
     "running": {"idle", "fault", "maintenance"},
     "available": {"running", "maintenance", "idle"},
@@ -140,6 +194,85 @@ def validate_equipment_transition(current_status: str, new_status: str) -> Optio
 
 # ==================== AI 审查引擎 ====================
 
+@dataclass
+class AlertCandidate:
+    """巡检发现的一条待审查预警"""
+    source: str
+    ref_id: str
+    ref_code: str
+    context: str
+    stable_context: Optional[str] = None  # 去掉随时间变化的字段（剩余小时、已开放分钟）后的上下文
+
+    @property
+    def context_hash(self) -> str:
+        """审查结论缓存键：来源 + 上下文中不随时间变化的部分"""
+        return _context_hash(self.source, self.stable_context or self.context)
+
+
+def _context_hash(source: str, context: str) -> str:
+    return hashlib.sha256(f"{source}\n{context}".encode("utf-8")).hexdigest()
+
+
+# LLM 共享连接池（每次审查不再新建客户端）
+_llm_client: Optional[httpx.AsyncClient] = None
+
+# 审查结论缓存：context_hash → 结论（只缓存 LLM 结论，规则兜底不缓存）
+_verdict_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+
+def _get_llm_client() -> httpx.AsyncClient:
+    global _llm_client
+    if _llm_client is None or _llm_client.is_closed:
+        _llm_client = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=LLM_REVIEW_CONCURRENCY * 2),
+        )
+    return _llm_client
+
+
+def _remember_verdict(context_hash: str, verdict: Dict[str, Any]) -> None:
+    if verdict.get("_fallback"):
+        return
+    _verdict_cache[context_hash] = verdict
+    _verdict_cache.move_to_end(context_hash)
+    while len(_verdict_cache) > VERDICT_CACHE_SIZE:
+        _verdict_cache.popitem(last=False)
+
+
+async def _cached_verdicts(db: AsyncSession, hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """按上下文哈希取已有结论：先查进程缓存，其余一次查库（取最近一条非兜底审查）"""
+    found: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for h in dict.fromkeys(hashes):
+        if h in _verdict_cache:
+            _verdict_cache.move_to_end(h)
+            found[h] = _verdict_cache[h]
+        else:
+            missing.append(h)
+    if not missing:
+        return found
+
+    rows = (await db.execute(
+        select(AlertIntelligenceReview).where(
+            AlertIntelligenceReview.context_hash.in_(missing),
+            ~func.coalesce(AlertIntelligenceReview.raw_ai_response, "").startswith(FALLBACK_MARK),
+        ).order_by(AlertIntelligenceReview.created_at.desc())
+    )).scalars().all()
+    for r in rows:
+        if r.context_hash in found:
+            continue
+        verdict = {
+            "severity": r.severity_assessment,
+            "root_causes": _json_list(r.root_cause_hypothesis),
+            "actions": _json_list(r.recommended_actions),
+            "dispatch_to": r.dispatch_recommendation or "",
+            "_raw": r.raw_ai_response or "",
+        }
+        found[r.context_hash] = verdict
+        _remember_verdict(r.context_hash, verdict)
+    return found
+
+
 async def _call_llm_for_review(context: str, source: str) -> Dict[str, Any]:
     """调用 LLM 做预警审查，返回结构化结果。LLM 不可用时返回规则兜底。"""
     source_label = SOURCE_LABELS.get(source, source)
@@ -149,16 +282,15 @@ async def _call_llm_for_review(context: str, source: str) -> Dict[str, Any]:
         headers = {"Content-Type": "application/json"}
         if API_KEY:
             headers["Authorization"] = f"Bearer {API_KEY}"
-        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
-            resp = await client.post(
-                f"{GATEWAY_URL}/v1/chat/completions",
-                json={
-                    "model": MODEL,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.2,
-                },
-                headers=headers,
-            )
+        resp = await _get_llm_client().post(
+            f"{GATEWAY_URL}/v1/chat/completions",
+            json={
+                "model": MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0.2,
+            },
+            headers=headers,
+        )
         if resp.status_code < 400:
             content = resp.json().get("choices", [{}])[0].get("message", {}).get("content", "")
             # 尝试解析 JSON
@@ -173,6 +305,189 @@ async def _call_llm_for_review(context: str, source: str) -> Dict[str, Any]:
     return _rule_based_review(context, source)
 
 
+async def _call_llm_for_batch(contexts: List[str], source: str) -> List[Dict[str, Any]]:
+    """一批同来源预警合成一个多条目 prompt 调 LLM，按 index 拆回逐条结论
+
+    单条直接走 _call_llm_for_review；网关失败/回复无法解析时整批规则兜底，缺失的条目单独兜底。
+    """
+    if len(contexts) == 1:
+        return [await _call_llm_for_review(contexts[0], source)]
+
+    items = "\n\n".join(f"【预警 {i}】\n{ctx}" for i, ctx in enumerate(contexts, 1))
+    prompt = BATCH_REVIEW_PROMPT_TEMPLATE.format(
+        count=len(contexts), source_label=SOURCE_LABELS.get(source, source), items=items,
+    )
+    by_index: Dict[int, Dict[str, Any]] = {}
+    try:
+        headers = {"Content-Type": "application/json"}
+        if API_KEY:
+            headers["Authorization"] = f"Bearer {API_KEY}"
+        resp = await _get_llm_client().post(
+            f"{GATEWAY_URL}/v1/chat/completions",
+            json={
+                "model": MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0.2,
+            },
+            headers=headers,
+            timeout=REVIEW_BATCH_TIMEOUT,
+        )
+        if resp.status_code < 400:
+            content = resp.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+            parsed = _extract_json(content) or {}
+            for item in parsed.get("items") or []:
+                verdict = _batch_item_verdict(item, len(contexts))
+                if verdict is not None:
+                    by_index.setdefault(item["index"], verdict)
+    except Exception:
+        pass
+
+    return [by_index.get(i) or _rule_based_review(ctx, source) for i, ctx in enumerate(contexts, 1)]
+
+
+def _batch_item_verdict(item: Any, count: int) -> Optional[Dict[str, Any]]:
+    """校验批量回复中的一条：index 须在 1..count 内、severity 须为四级之一，否则丢弃（该条走规则兜底）"""
+    if not isinstance(item, dict):
+        return None
+    index = item.get("index")
+    if not isinstance(index, int) or isinstance(index, bool) or not 1 <= index <= count:
+        return None
+    severity = str(item.get("severity") or "").strip().lower()
+    if severity not in REVIEW_SEVERITIES:
+        return None
+    root_causes, actions = item.get("root_causes"), item.get("actions")
+    return {
+        "severity": severity,
+        "root_causes": root_causes if isinstance(root_causes, list) else [],
+        "actions": actions if isinstance(actions, list) else [],
+        "dispatch_to": str(item.get("dispatch_to") or "")[:100],
+        "_raw": json.dumps(item, ensure_ascii=False),
+    }
+
+
+class _PendingBatch:
+    """攒批中的一组请求：上下文 → 等待结论的 future（相同上下文共用一个）"""
+
+    def __init__(self, timer: asyncio.TimerHandle):
+        self.timer = timer
+        self.futures: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+
+
+class ReviewBatcher:
+    """预警审查微批器
+
+    review() 把请求按 (来源, 工厂) 放进攒批队列：窗口到期或条目数达上限时整批送审，
+    同时在途的批次数受 concurrency 限制。结论按条目拆回给各调用方。
+    与攒批中或已在送审途中的条目上下文相同的请求直接等同一个结论。
+    """
+
+    def __init__(
+        self,
+        window: float = REVIEW_BATCH_WINDOW,
+        max_items: int = REVIEW_BATCH_MAX_ITEMS,
+        concurrency: int = LLM_REVIEW_CONCURRENCY,
+    ):
+        self.window = window
+        self.max_items = max_items
+        self.concurrency = concurrency
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[Tuple[str, str], _PendingBatch] = {}
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: set = set()
+        self.batches_sent = 0
+        self.items_sent = 0
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._pending = {}
+            self._inflight = {}
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return loop
+
+    async def review(self, factory_id: str, source: str, context: str) -> Dict[str, Any]:
+        """提交一条审查，等待所在批次返回的结论"""
+        loop = self._bind_loop()
+        key = (source, factory_id)
+        inflight = self._inflight.get((source, factory_id, context))
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _PendingBatch(loop.call_later(self.window, self._flush, key))
+        future = batch.futures.get(context)
+        if future is None:
+            future = batch.futures[context] = loop.create_future()
+            if len(batch.futures) >= self.max_items:
+                self._flush(key)
+        return await asyncio.shield(future)
+
+    def _flush(self, key: Tuple[str, str]) -> None:
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        for context, future in batch.futures.items():
+            self._inflight[(*key, context)] = future
+        task = asyncio.ensure_future(self._send(key, batch.futures))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, key: Tuple[str, str], futures: "OrderedDict[str, asyncio.Future]") -> None:
+        source = key[0]
+        contexts = list(futures)
+        try:
+            async with self._slots:
+                verdicts = await asyncio.wait_for(_call_llm_for_batch(contexts, source), REVIEW_BATCH_TIMEOUT)
+        except Exception:  # noqa: BLE001  网关过慢或异常：逐条规则兜底
+            verdicts = [_rule_based_review(ctx, source) for ctx in contexts]
+        self.batches_sent += 1
+        self.items_sent += len(contexts)
+        for (context, future), verdict in zip(futures.items(), verdicts):
+            self._inflight.pop((*key, context), None)
+            if not future.done():
+                future.set_result(verdict)
+
+    def stats(self) -> Dict[str, int]:
+        return {"batches_sent": self.batches_sent, "items_sent": self.items_sent}
+
+
+review_batcher = ReviewBatcher()
+
+
+async def _review_candidates(
+    db: AsyncSession, factory_id: str, candidates: List[AlertCandidate],
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """批量审查：命中结论缓存的直接复用，其余按上下文去重后交给微批器送审
+
+    返回 (与 candidates 一一对应的结论, 统计)。
+    """
+    verdicts: List[Optional[Dict[str, Any]]] = [None] * len(candidates)
+    cached = await _cached_verdicts(db, [c.context_hash for c in candidates])
+    pending: Dict[str, List[int]] = {}
+    for i, c in enumerate(candidates):
+        if c.context_hash in cached:
+            verdicts[i] = cached[c.context_hash]
+        else:
+            pending.setdefault(c.context_hash, []).append(i)
+
+    async def review(indices: List[int]) -> None:
+        first = candidates[indices[0]]
+        verdict = await review_batcher.review(factory_id, first.source, first.context)
+        _remember_verdict(first.context_hash, verdict)
+        for i in indices:
+            verdicts[i] = verdict
+
+    await asyncio.gather(*(review(indices) for indices in pending.values()))
+    stats = {
+        "cached_verdicts": len(candidates) - sum(len(ix) for ix in pending.values()),
+        "llm_reviews": len(pending),
+    }
+    return verdicts, stats
+
+
 def _extract_json(text: str) -> Optional[Dict[str, Any]]:
     """从 LLM 回复中提取 JSON 对象"""
     text = text.strip()
@@ -226,7 +541,8 @@ def _rule_based_review(context: str, source: str) -> Dict[str, Any]:
         "root_causes": ["待人工分析（AI 服务暂不可用，已按规则初步分级）"],
         "actions": ["请相关责任人尽快确认并处理", "如影响产线请立即上报"],
         "dispatch_to": dispatch_map.get(source, "生产经理"),
-        "_raw": f"[规则兜底] source={source}, severity={severity}",
+        "_raw": f"{FALLBACK_MARK} source={source}, severity={severity}",
+        "_fallback": True,
     }
 
 
@@ -238,42 +554,58 @@ async def review_alert(
     ref_code: str,
     context: str,
 ) -> AlertIntelligenceReview:
-    """核心入口：接收预警上下文 → 调 AI 审查 → 存储结果"""
-    ai_result = await _call_llm_for_review(context, source)
+    """核心入口：接收预警上下文 → 调 AI 审查（上下文审过则复用结论）→ 存储结果"""
+    candidate = AlertCandidate(source, ref_id, ref_code, context)
+    verdicts, _ = await _review_candidates(db, factory_id, [candidate])
+    review = _new_review(factory_id, candidate, verdicts[0])
+    db.add(review)
+    await db.commit()
+    await db.refresh(review)
+    return review
+
 
-    review = AlertIntelligenceReview(
+def _new_review(factory_id: str, candidate: AlertCandidate, ai_result: Dict[str, Any]) -> AlertIntelligenceReview:
+    return AlertIntelligenceReview(
         id=str(uuid.uuid4()),
         factory_id=factory_id,
-        alert_source=source,
-        alert_ref_id=ref_id,
-        alert_ref_code=ref_code,
-        alert_summary=context[:2000],  # 截断防溢出
+        alert_source=candidate.source,
+        alert_ref_id=candidate.ref_id,
+        alert_ref_code=candidate.ref_code,
+        alert_summary=candidate.context[:2000],  # 截断防溢出
         severity_assessment=ai_result.get("severity", "medium"),
         root_cause_hypothesis=json.dumps(ai_result.get("root_causes", []), ensure_ascii=False),
         recommended_actions=json.dumps(ai_result.get("actions", []), ensure_ascii=False),
         dispatch_recommendation=ai_result.get("dispatch_to", ""),
         raw_ai_response=ai_result.get("_raw", ""),
+        context_hash=candidate.context_hash,
         status="pending",
         created_at=datetime.utcnow(),
     )
-    db.add(review)
-    await db.commit()
-    await db.refresh(review)
-    return review
 
 
 # ==================== 巡检（Patrol） ====================
+# 各来源的扫描 SQL 自带反连接：已有同源待处理审查的记录在库里就被排除，LIMIT 作用于去重之后
 
-async def patrol(
-    db: AsyncSession,
-    factory_id: str,
-) -> Dict[str, Any]:
-    """主动巡检：扫描工单超时 + 安灯未响应 → 生成预警 → 触发审查"""
-    now = datetime.utcnow()
-    alerts_found = 0
-    reviews_created = 0
+def _pending_review_exists(source: str, ref_id_column):
+    """同源未处理审查是否存在（ORM 查询的反连接条件）"""
+    return select(AlertIntelligenceReview.id).where(
+        AlertIntelligenceReview.alert_source == source,
+        AlertIntelligenceReview.alert_ref_id == cast(ref_id_column, String),
+        AlertIntelligenceReview.status == "pending",
+    ).exists()
+
+
+def _no_pending_review_sql(source: str, ref_id_expr: str) -> str:
+    """同源未处理审查不存在（原生 SQL 的反连接条件）"""
+    return (
+        f"NOT EXISTS (SELECT 1 FROM alert_intelligence_reviews air "
+        f"WHERE air.alert_source = '{source}' AND air.alert_ref_id = {ref_id_expr}::text "
+        f"AND air.status = 'pending')"
+    )
 
-    # 1. 工单超时检测：in_progress 且 planned_due 已过期或 < 24h
+
+async def _scan_overdue_work_orders(db: AsyncSession, factory_id: str, now: datetime) -> List[AlertCandidate]:
+    """工单超时：in_progress/released 且 planned_due 已过期或 < 24h"""
     deadline_threshold = now + timedelta(hours=24)
     stmt = select(WorkOrder).where(
         WorkOrder.factory_id == factory_id,
@@ -281,222 +613,235 @@ async def patrol(
         WorkOrder.wo_type == "operation",
         WorkOrder.planned_due.isnot(None),
         WorkOrder.planned_due <= deadline_threshold,
+        ~_pending_review_exists("wo_timeout", WorkOrder.id),
     )
-    overdue_wos = (await db.execute(stmt)).scalars().all()
-
-    for wo in overdue_wos:
-        # 检查是否已有未处理的同源审查（去重）
-        existing = await db.execute(
-            select(AlertIntelligenceReview).where(
-                AlertIntelligenceReview.alert_source == "wo_timeout",
-                AlertIntelligenceReview.alert_ref_id == wo.id,
-                AlertIntelligenceReview.status == "pending",
-            )
-        )
-        if existing.scalar_one_or_none():
-            continue
-
+    candidates = []
+    for wo in (await db.execute(stmt)).scalars().all():
         is_overdue = wo.planned_due < now if wo.planned_due else False
         hours_left = (wo.planned_due - now).total_seconds() / 3600 if wo.planned_due else 0
-        context = (
-            f"工单超时预警：\n"
-            f"- 工单号：{wo.work_order_code}\n"
-            f"- 工序：{wo.process_code or '未知'}（工序组：{wo.work_center or '未知'}）\n"
-            f"- 状态：{'已超期' if is_overdue else f'距交期仅剩 {hours_left:.1f} 小时'}\n"
-            f"- 计划交期：{wo.planned_due.strftime('%Y-%m-%d %H:%M') if wo.planned_due else '未设置'}\n"
-            f"- 计划数量：{wo.planned_qty}，已完成：{wo.completed_qty or 0}\n"
-            f"- 优先级：{wo.priority}"
-        )
-        await review_alert(db, factory_id, "wo_timeout", wo.id, wo.work_order_code, context)
-        alerts_found += 1
-        reviews_created += 1
+        def render(status: str) -> str:
+            return (
+                f"工单超时预警：\n"
+                f"- 工单号：{wo.work_order_code}\n"
+                f"- 工序：{wo.process_code or '未知'}（工序组：{wo.work_center or '未知'}）\n"
+                f"- 状态：{status}\n"
+                f"- 计划交期：{wo.planned_due.strftime('%Y-%m-%d %H:%M') if wo.planned_due else '未设置'}\n"
+                f"- 计划数量：{wo.planned_qty}，已完成：{wo.completed_qty or 0}\n"
+                f"- 优先级：{wo.priority}"
+            )
+        context = render('已超期' if is_overdue else f'距交期仅剩 {hours_left:.1f} 小时')
+        stable = render('已超期' if is_overdue else '24 小时内到期')
+        candidates.append(AlertCandidate("wo_timeout", str(wo.id), wo.work_order_code, context, stable))
+    return candidates
 
-    # 2. 安灯工单超 30min 未响应
+
+async def _scan_stale_andon(db: AsyncSession, factory_id: str, now: datetime) -> List[AlertCandidate]:
+    """安灯工单超 30min 未响应"""
     threshold_30m = now - timedelta(minutes=30)
     stmt = select(AndonTicket).where(
         AndonTicket.factory_id == factory_id,
         AndonTicket.status == "open",
         AndonTicket.created_at <= threshold_30m,
+        ~_pending_review_exists("andon", AndonTicket.id),
     )
-    stale_tickets = (await db.execute(stmt)).scalars().all()
-
-    for ticket in stale_tickets:
-        existing = await db.execute(
-            select(AlertIntelligenceReview).where(
-                AlertIntelligenceReview.alert_source == "andon",
-                AlertIntelligenceReview.alert_ref_id == ticket.id,
-                AlertIntelligenceReview.status == "pending",
-            )
-        )
-        if existing.scalar_one_or_none():
-            continue
-
+    candidates = []
+    for ticket in (await db.execute(stmt)).scalars().all():
         minutes_open = (now - ticket.created_at).total_seconds() / 60
+        def render(waiting: str) -> str:
+            return (
+                f"安灯工单超时未响应预警：\n"
+                f"- 工单号：{ticket.ticket_code}\n"
+                f"- 类别：{ticket.category_code}\n"
+                f"- 标题：{ticket.title}\n"
+                f"- {waiting}\n"
+                f"- 优先级：{ticket.priority}\n"
+                f"- 描述：{(ticket.description or '无')[:200]}"
+            )
+        context = render(f"已开放 {minutes_open:.0f} 分钟无人响应")
+        stable = render("超过 30 分钟无人响应")
+        candidates.append(AlertCandidate("andon", str(ticket.id), ticket.ticket_code, context, stable))
+    return candidates
+
+
+async def _scan_breakdowns(db: AsyncSession, factory_id: str, now: datetime) -> List[AlertCandidate]:
+    """设备故障停机（近 24h 内 breakdown 且无对应审查）"""
+    rows = (await db.execute(text(f"""
+        SELECT d.id, d.equipment_id, e.equipment_code, e.equipment_name,
+               d.duration_minutes, d.reason_code, d.start_time
+        FROM equipment_downtime d
+        LEFT JOIN equipment e ON e.id = d.equipment_id
+        WHERE d.factory_id = :fid AND d.downtime_category = 'breakdown'
+          AND d.start_time >= now() - interval '24 hours'
+          AND {_no_pending_review_sql("equipment", "d.id")}
+        ORDER BY d.start_time DESC LIMIT 10
+    """), {"fid": factory_id})).fetchall()
+    return [
+        AlertCandidate("equipment", str(r[0]), r[2] or "", (
+            f"设备故障停机预警：\n"
+            f"- 设备：{r[2]} ({r[3]})\n"
+            f"- 停机时长：{r[4] or '未知'} 分钟\n"
+            f"- 原因代码：{r[5] or '未填写'}\n"
+            f"- 发生时间：{r[6]}"
+        ))
+        for r in rows
+    ]
+
+
+async def _scan_shortages(db: AsyncSession, factory_id: str, now: datetime) -> List[AlertCandidate]:
+    """缺料预警（库存 < 安全库存）"""
+    rows = (await db.execute(text(f"""
+        SELECT rt.id, rt.material_id, rt.min_level, rt.safety_stock,
+               COALESCE(inv.total_qty, 0) as cur_qty
+        FROM replenishment_thresholds rt
+        LEFT JOIN (
+            SELECT material_id, sum(total_qty) as total_qty
+            FROM inventory WHERE factory_id = :fid GROUP BY material_id
+        ) inv ON inv.material_id = rt.material_id
+        WHERE rt.factory_id = :fid AND rt.active = true
+          AND COALESCE(inv.total_qty, 0) < rt.safety_stock
+          AND {_no_pending_review_sql("inventory", "rt.id")}
+        LIMIT 10
+    """), {"fid": factory_id})).fetchall()
+    return [
+        AlertCandidate("inventory", str(r[0]), r[1], (
+            f"缺料预警（低于安全库存）：\n"
+            f"- 物料：{r[1]}\n"
+            f"- 当前库存：{r[4]}\n"
+            f"- 安全库存：{r[3]}，最低水位：{r[2]}\n"
+            f"- 缺口：{r[2] - r[4]}"
+        ))
+        for r in rows
+    ]
+
+
+async def _scan_spc_hits(db: AsyncSession, factory_id: str, now: datetime) -> List[AlertCandidate]:
+    """SPC 失控（近 24h 新增越限点）"""
+    from api.services.spc_rules import RULE_LABELS
+
+    rows = (await db.execute(text(f"""
+        SELECT id, characteristic_code, characteristic_name,
+               measured_value, ucl, lcl, station_id, ooc_rules
+        FROM qms_spc_points p
+        WHERE factory_id = :fid AND is_out_of_control = true
+          AND measured_at >= now() - interval '24 hours'
+          AND {_no_pending_review_sql("defect", "p.id")}
+        LIMIT 10
+    """), {"fid": factory_id})).fetchall()
+    candidates = []
+    for r in rows:
+        rules = [RULE_LABELS.get(c, c) for c in (r[7] or "").split(",") if c]
         context = (
-            f"安灯工单超时未响应预警：\n"
-            f"- 工单号：{ticket.ticket_code}\n"
-            f"- 类别：{ticket.category_code}\n"
-            f"- 标题：{ticket.title}\n"
-            f"- 已开放 {minutes_open:.0f} 分钟无人响应\n"
-            f"- 优先级：{ticket.priority}\n"
-            f"- 描述：{(ticket.description or '无')[:200]}"
+            f"SPC过程失控预警：\n"
+            f"- 特性：{r[2] or r[1]}\n"
+            f"- 测量值：{r[3]}，UCL={r[4]}，LCL={r[5]}\n"
+            f"- 判异规则：{'、'.join(rules) or '超出控制限'}\n"
+            f"- 工位：{r[6] or '未知'}"
         )
-        await review_alert(db, factory_id, "andon", ticket.id, ticket.ticket_code, context)
-        alerts_found += 1
-        reviews_created += 1
+        candidates.append(AlertCandidate("defect", str(r[0]), r[1], context))
+    return candidates
+
+
+async def _scan_environment(db: AsyncSession, factory_id: str, now: datetime) -> List[AlertCandidate]:
+    """环境异常（公共气象 API 检测高温/高湿/大风）"""
+    lat, lon = 10.8231, 106.6297  # 默认胡志明市工业区
+    url = (
+        f"https://api.open-meteo.com/v1/forecast"
+        f"?latitude={lat}&longitude={lon}"
+        f"&current=temperature_2m,relative_humidity_2m,wind_speed_10m"
+        f"&timezone=Asia/Ho_Chi_Minh"
+    )
+    async with httpx.AsyncClient(timeout=8) as client:
+        resp = await client.get(url)
+        cur = resp.json().get("current", {})
+    temp = cur.get("temperature_2m")
+    hum = cur.get("relative_humidity_2m")
+    wind = cur.get("wind_speed_10m")
+    env_alerts = []
+    if temp is not None and temp > 35:
+        env_alerts.append(f"高温 {temp}°C（阈值35°C）")
+    if hum is not None and hum > 85:
+        env_alerts.append(f"高湿 {hum}%（阈值85%）")
+    if wind is not None and wind > 40:
+        env_alerts.append(f"大风 {wind}km/h（阈值40）")
+    if not env_alerts:
+        return []
+
+    ref_id = f"env_{now.strftime('%Y%m%d%H')}"
+    exists = (await db.execute(
+        select(_pending_review_exists("environment", literal(ref_id)))
+    )).scalar()
+    if exists:
+        return []
+    context = f"车间环境异常预警：\n" + "\n".join(f"- {a}" for a in env_alerts)
+    return [AlertCandidate("environment", ref_id, "环境异常", context)]
+
+
+# 巡检来源（并发扫描，各自独立会话；单个来源失败不影响其他来源）
+PATROL_SCANNERS = (
+    _scan_overdue_work_orders,
+    _scan_stale_andon,
+    _scan_breakdowns,
+    _scan_shortages,
+    _scan_spc_hits,
+    _scan_environment,
+)
 
-    # 3. 设备故障停机（近 24h 内 breakdown 且无对应审查）
-    try:
-        from sqlalchemy import text as sa_text
-        dt_rows = (await db.execute(sa_text("""
-            SELECT d.id, d.equipment_id, e.equipment_code, e.equipment_name,
-                   d.duration_minutes, d.reason_code, d.start_time
-            FROM equipment_downtime d
-            LEFT JOIN equipment e ON e.id = d.equipment_id
-            WHERE d.factory_id = :fid AND d.downtime_category = 'breakdown'
-              AND d.start_time >= now() - interval '24 hours'
-            ORDER BY d.start_time DESC LIMIT 10
-        """), {"fid": factory_id})).fetchall()
-        for r in dt_rows:
-            existing = await db.execute(
-                select(AlertIntelligenceReview).where(
-                    AlertIntelligenceReview.alert_source == "equipment",
-                    AlertIntelligenceReview.alert_ref_id == r[0],
-                    AlertIntelligenceReview.status == "pending",
-                )
-            )
-            if existing.scalar_one_or_none():
-                continue
-            context = (
-                f"设备故障停机预警：\n"
-                f"- 设备：{r[2]} ({r[3]})\n"
-                f"- 停机时长：{r[4] or '未知'} 分钟\n"
-                f"- 原因代码：{r[5] or '未填写'}\n"
-                f"- 发生时间：{r[6]}"
-            )
-            await review_alert(db, factory_id, "equipment", r[0], r[2] or "", context)
-            alerts_found += 1
-            reviews_created += 1
-    except Exception:  # noqa: BLE001
-        await db.rollback()
 
-    # 4. 缺料预警（库存 < 补货阈值 min_level）
-    try:
-        from sqlalchemy import text as sa_text
-        short_rows = (await db.execute(sa_text("""
-            SELECT rt.id, rt.material_id, rt.min_level, rt.safety_stock,
-                   COALESCE(inv.total_qty, 0) as cur_qty
-            FROM replenishment_thresholds rt
-            LEFT JOIN (
-                SELECT material_id, sum(total_qty) as total_qty
-                FROM inventory WHERE factory_id = :fid GROUP BY material_id
-            ) inv ON inv.material_id = rt.material_id
-            WHERE rt.factory_id = :fid AND rt.active = true
-              AND COALESCE(inv.total_qty, 0) < rt.safety_stock
-            LIMIT 10
-        """), {"fid": factory_id})).fetchall()
-        for r in short_rows:
-            existing = await db.execute(
-                select(AlertIntelligenceReview).where(
-                    AlertIntelligenceReview.alert_source == "inventory",
-                    AlertIntelligenceReview.alert_ref_id == r[0],
-                    AlertIntelligenceReview.status == "pending",
-                )
-            )
-            if existing.scalar_one_or_none():
-                continue
-            context = (
-                f"缺料预警（低于安全库存）：\n"
-                f"- 物料：{r[1]}\n"
-                f"- 当前库存：{r[4]}\n"
-                f"- 安全库存：{r[3]}，最低水位：{r[2]}\n"
-                f"- 缺口：{r[2] - r[4]}"
-            )
-            await review_alert(db, factory_id, "inventory", r[0], r[1], context)
-            alerts_found += 1
-            reviews_created += 1
-    except Exception:  # noqa: BLE001
-        await db.rollback()
+async def patrol(
+    db: AsyncSession,
+    factory_id: str,
+    session_factory: Optional[Callable[[], Any]] = None,
+) -> Dict[str, Any]:
+    """主动巡检：并发扫描各来源 → 生成预警 → 批量审查 → 按来源写入
 
-    # 5. SPC 失控（近 24h 新增越限点）
-    try:
-        from sqlalchemy import text as sa_text
-        spc_rows = (await db.execute(sa_text("""
-            SELECT id, characteristic_code, characteristic_name,
-                   measured_value, ucl, lcl, station_id
-            FROM qms_spc_points
-            WHERE factory_id = :fid AND is_out_of_control = true
-              AND measured_at >= now() - interval '24 hours'
-            LIMIT 10
-        """), {"fid": factory_id})).fetchall()
-        for r in spc_rows:
-            existing = await db.execute(
-                select(AlertIntelligenceReview).where(
-                    AlertIntelligenceReview.alert_source == "defect",
-                    AlertIntelligenceReview.alert_ref_id == r[0],
-                    AlertIntelligenceReview.status == "pending",
-                )
-            )
-            if existing.scalar_one_or_none():
-                continue
-            context = (
-                f"SPC过程失控预警：\n"
-                f"- 特性：{r[2] or r[1]}\n"
-                f"- 测量值：{r[3]}，UCL={r[4]}，LCL={r[5]}\n"
-                f"- 工位：{r[6] or '未知'}"
-            )
-            await review_alert(db, factory_id, "defect", r[0], r[1], context)
-            alerts_found += 1
-            reviews_created += 1
-    except Exception:  # noqa: BLE001
-        await db.rollback()
+    session_factory: 扫描用的会话工厂（每个来源一个会话以便并发），默认 db_config.session_factory；
+    审查结果写入调用方的 db，每个来源一个 SAVEPOINT：某来源写入失败只回滚该来源，其余照常提交。
+    """
+    now = datetime.utcnow()
+    if session_factory is None:
+        from database.db_config import db_config
+        session_factory = db_config.session_factory
 
-    # 6. 环境异常（公共气象 API 检测高温/高湿/大风）
-    try:
-        import httpx
-        lat, lon = 10.8231, 106.6297  # 默认胡志明市工业区
-        url = (
-            f"https://api.open-meteo.com/v1/forecast"
-            f"?latitude={lat}&longitude={lon}"
-            f"&current=temperature_2m,relative_humidity_2m,wind_speed_10m"
-            f"&timezone=Asia/Ho_Chi_Minh"
-        )
-        async with httpx.AsyncClient(timeout=8) as client:
-            resp = await client.get(url)
-            cur = resp.json().get("current", {})
-        temp = cur.get("temperature_2m")
-        hum = cur.get("relative_humidity_2m")
-        wind = cur.get("wind_speed_10m")
-        env_alerts = []
-        if temp is not None and temp > 35:
-            env_alerts.append(f"高温 {temp}°C（阈值35°C）")
-        if hum is not None and hum > 85:
-            env_alerts.append(f"高湿 {hum}%（阈值85%）")
-        if wind is not None and wind > 40:
-            env_alerts.append(f"大风 {wind}km/h（阈值40）")
-        if env_alerts:
-            ref_id = f"env_{now.strftime('%Y%m%d%H')}"
-            existing = await db.execute(
-                select(AlertIntelligenceReview).where(
-                    AlertIntelligenceReview.alert_source == "environment",
-                    AlertIntelligenceReview.alert_ref_id == ref_id,
-                    AlertIntelligenceReview.status == "pending",
-                )
-            )
-            if not existing.scalar_one_or_none():
-                context = f"车间环境异常预警：\n" + "\n".join(f"- {a}" for a in env_alerts)
-                await review_alert(db, factory_id, "environment", ref_id, "环境异常", context)
-                alerts_found += 1
-                reviews_created += 1
-    except Exception:  # noqa: BLE001
-        await db.rollback()
+    async def scan(scanner) -> List[AlertCandidate]:
+        try:
+            async with session_factory() as scan_db:
+                return await scanner(scan_db, factory_id, now)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("[patrol] %s 扫描失败: %s", scanner.__name__, e)
+            return []
+
+    batches = await asyncio.gather(*(scan(s) for s in PATROL_SCANNERS))
+    candidates = [c for batch in batches for c in batch]
+
+    stats = {"cached_verdicts": 0, "llm_reviews": 0}
+    created, failed_sources = 0, []
+    if candidates:
+        verdicts, stats = await _review_candidates(db, factory_id, candidates)
+        by_source_rows: Dict[str, List[AlertIntelligenceReview]] = {}
+        for c, v in zip(candidates, verdicts):
+            by_source_rows.setdefault(c.source, []).append(_new_review(factory_id, c, v))
+        for source, rows in by_source_rows.items():
+            try:
+                async with db.begin_nested():
+                    db.add_all(rows)
+                created += len(rows)
+            except Exception as e:  # noqa: BLE001
+                logger.warning("[patrol] %s 审查写入失败: %s", source, e)
+                failed_sources.append(source)
+        await db.commit()
 
+    by_source: Dict[str, int] = {}
+    for c in candidates:
+        by_source[c.source] = by_source.get(c.source, 0) + 1
     return {
         "patrol_time": now.strftime("%Y-%m-%d %H:%M:%S"),
-        "alerts_found": alerts_found,
-        "reviews_created": reviews_created,
-        "overdue_work_orders": len(overdue_wos),
-        "stale_andon_tickets": len(stale_tickets),
+        "alerts_found": len(candidates),
+        "reviews_created": created,
+        "failed_sources": failed_sources,
+        "overdue_work_orders": by_source.get("wo_timeout", 0),
+        "stale_andon_tickets": by_source.get("andon", 0),
+        "by_source": by_source,
+        **stats,
     }
 
 
@@ -589,20 +934,20 @@ async def acknowledge_review(
 
 # ==================== 工具函数 ====================
 
+def _json_list(raw: Optional[str]) -> List[Any]:
+    """解析存为 JSON 数组的文本字段（非 JSON 时整体当一项）"""
+    if not raw:
+        return []
+    try:
+        return json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        return [raw]
+
+
 def _review_to_dict(r: AlertIntelligenceReview) -> Dict[str, Any]:
     """序列化审查记录"""
-    actions = []
-    if r.recommended_actions:
-        try:
-            actions = json.loads(r.recommended_actions)
-        except (json.JSONDecodeError, TypeError):
-            actions = [r.recommended_actions]
-    root_causes = []
-    if r.root_cause_hypothesis:
-        try:
-            root_causes = json.loads(r.root_cause_hypothesis)
-        except (json.JSONDecodeError, TypeError):
-            root_causes = [r.root_cause_hypothesis]
+    actions = _json_list(r.recommended_actions)
+    root_causes = _json_list(r.root_cause_hypothesis)
 
     return {
         "id": r.id,
@@ -0,0 +1,109 @@
+"""
+Attachment Image Service - 多模态对话图片附件预处理
+=============================================
+- 原图在线程里解码、按 EXIF 摆正并缩到长边 CHAT_IMAGE_MAX_EDGE，转 JPEG 落盘到原图旁
+  （<原路径>.<长边>.jpg），之后各轮对话直接读派生图
+- 编码好的 data URL 按 (file_id, 长边) 进 LRU，同一会话后续轮次不再读盘/编码
+- 未安装 Pillow 或无法解码（SVG/HEIC 等）时退回原图
+"""
+
+import asyncio
+import base64
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 精简镜像未装 Pillow：发原图
+    Image = None
+    ImageOps = None
+
+from database.models import FileRecord
+
+logger = logging.getLogger(__name__)
+
+CHAT_IMAGE_MAX_EDGE = int(os.getenv("CHAT_IMAGE_MAX_EDGE", "1568"))   # 视觉模型有效分辨率上限附近
+CHAT_IMAGE_QUALITY = int(os.getenv("CHAT_IMAGE_QUALITY", "85"))
+PASSTHROUGH_MAX_BYTES = 512 * 1024     # 尺寸已达标且不大于此的原图直接发送，不重新压缩
+DATA_URL_CACHE_SIZE = int(os.getenv("CHAT_IMAGE_CACHE_SIZE", "128"))
+
+_data_url_cache: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def derived_path(original: Path, max_edge: int) -> Path:
+    return original.with_name(f"{original.name}.{max_edge}.jpg")
+
+
+async def image_data_url(rec: FileRecord, max_edge: Optional[int] = None) -> Optional[str]:
+    """图片附件 → data URL（先查 LRU，未命中在线程里读盘/缩图/编码）；实体缺失返回 None"""
+    edge = max_edge or CHAT_IMAGE_MAX_EDGE
+    key = (rec.id, edge)
+    with _cache_lock:
+        url = _data_url_cache.get(key)
+        if url is not None:
+            _data_url_cache.move_to_end(key)
+            return url
+
+    url = await asyncio.to_thread(_encode, Path(rec.storage_path), rec.content_type or "image/png", edge)
+    if url is None:
+        return None
+    with _cache_lock:
+        _data_url_cache[key] = url
+        while len(_data_url_cache) > DATA_URL_CACHE_SIZE:
+            _data_url_cache.popitem(last=False)
+    return url
+
+
+async def build_image_parts(records: List[FileRecord]) -> List[Dict[str, Any]]:
+    """多张图片并发预处理，按附件顺序返回 OpenAI image_url 片段（跳过实体缺失的）"""
+    urls = await asyncio.gather(*(image_data_url(rec) for rec in records))
+    return [{"type": "image_url", "image_url": {"url": url}} for url in urls if url]
+
+
+def _encode(original: Path, content_type: str, max_edge: int) -> Optional[str]:
+    try:
+        data, ctype = _load_downscaled(original, content_type, max_edge)
+    except OSError:
+        return None
+    return f"data:{ctype};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def _load_downscaled(original: Path, content_type: str, max_edge: int) -> Tuple[bytes, str]:
+    """读派生图；没有（或比原图旧）则生成。不需要/无法缩图时返回原图字节"""
+    derived = derived_path(original, max_edge)
+    source_mtime = original.stat().st_mtime
+    if derived.is_file() and derived.stat().st_mtime >= source_mtime:
+        return derived.read_bytes(), "image/jpeg"
+
+    raw = original.read_bytes()
+    if Image is None:
+        return raw, content_type
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            if max(img.size) <= max_edge and len(raw) <= PASSTHROUGH_MAX_BYTES:
+                return raw, content_type
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_edge, max_edge))
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=CHAT_IMAGE_QUALITY, optimize=True)
+    except Exception as e:  # noqa: BLE001  无法解码的格式发原图
+        logger.info(f"Image downscale skipped for {original.name}: {e}")
+        return raw, content_type
+
+    data = buf.getvalue()
+    tmp = derived.with_name(f"{derived.name}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, derived)
+    except OSError as e:  # 上传目录只读时仍可发送，只是不缓存
+        logger.warning(f"Image derivative not cached for {original.name}: {e}")
+        tmp.unlink(missing_ok=True)
+    return data, "image/jpeg"
@@ -0,0 +1,235 @@
+"""
+Attachment Table Service - 对话 Excel/CSV 附件解析
+=============================================
+- 对话关键路径只读样本：流式遍历（openpyxl 只读模式 / csv 逐行）到第 max_rows 行即停，
+  前 max_rows 行组成 TableData，列统计暂只覆盖样本
+- 全表行数与逐列统计（非空数、数值 min/max/均值、取值频次）在后台线程里另跑一遍，
+  算完替换缓存条目，之后的对话轮次用全表统计；不把整表读进内存
+- 结果按 (file_id, max_rows, max_cols) 进 LRU，同一附件多轮对话只解析一次
+"""
+
+import asyncio
+import csv
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from database.models import FileRecord
+
+logger = logging.getLogger(__name__)
+
+TABLE_CACHE_SIZE = int(os.getenv("CHAT_TABLE_CACHE_SIZE", "64"))
+STATS_MAX_ROWS = int(os.getenv("CHAT_SHEET_STATS_MAX_ROWS", "1000000"))   # 超大表只统计前 N 行
+DISTINCT_CAP = 1000          # 每列最多跟踪的不同取值数
+
+_table_cache: "OrderedDict[Tuple[str, int, int], ParsedSheet]" = OrderedDict()
+_cache_lock = threading.Lock()
+_full_scans: "Dict[Tuple[str, int, int], asyncio.Task]" = {}   # 后台全表统计任务（按缓存键去重）
+
+
+class ColumnStats:
+    """单列流式统计"""
+
+    __slots__ = ("non_empty", "numeric", "total", "min", "max", "counts", "overflow")
+
+    def __init__(self):
+        self.non_empty = 0
+        self.numeric = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.counts: Dict[str, int] = {}
+        self.overflow = False           # 不同取值超过 DISTINCT_CAP
+
+    def add(self, value: Any) -> None:
+        if value is None:
+            return
+        text = str(value).strip()
+        if not text:
+            return
+        self.non_empty += 1
+        number = _as_number(value, text)
+        if number is not None:
+            self.numeric += 1
+            self.total += number
+            self.min = number if self.min is None else min(self.min, number)
+            self.max = number if self.max is None else max(self.max, number)
+        if text in self.counts:
+            self.counts[text] += 1
+        elif len(self.counts) < DISTINCT_CAP:
+            self.counts[text] = 1
+        else:
+            self.overflow = True
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.non_empty > 0 and self.numeric == self.non_empty
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.numeric if self.numeric else None
+
+    def top(self, n: int = 5) -> List[str]:
+        return [v for v, _ in sorted(self.counts.items(), key=lambda kv: -kv[1])[:n]]
+
+
+@dataclass
+class ParsedSheet:
+    table: Dict[str, Any]                       # TableData：{title, columns, rows}（前 max_rows 行）
+    total_rows: int                             # 数据行总数（不含表头）；complete=False 时为样本行数
+    stats: List[ColumnStats] = field(default_factory=list)
+    stats_truncated: bool = False               # 超过 STATS_MAX_ROWS，只统计了前面部分
+    complete: bool = True                       # False：表比样本大，行数/统计只覆盖样本，全表统计在后台计算
+
+
+def spreadsheet_kind(rec: FileRecord) -> Optional[str]:
+    """csv / xlsx；其他（含 .xls）返回 None"""
+    fn = (rec.filename or "").lower()
+    ct = (rec.content_type or "").lower()
+    if fn.endswith(".csv") or ct in ("text/csv", "application/csv"):
+        return "csv"
+    if fn.endswith((".xlsx", ".xlsm")) or "spreadsheetml" in ct:
+        return "xlsx"
+    return None
+
+
+async def parse_sheet(rec: FileRecord, max_rows: int = 100, max_cols: int = 20) -> Optional[ParsedSheet]:
+    """解析 Excel/CSV 附件；失败返回 None
+
+    命中缓存直接返回（全表统计算完后即为全表结果）；未命中在线程池里只读样本，
+    表比样本大时另起后台任务统计全表，本次返回样本结果（complete=False）。
+    """
+    key = (rec.id, max_rows, max_cols)
+    with _cache_lock:
+        parsed = _table_cache.get(key)
+        if parsed is not None:
+            _table_cache.move_to_end(key)
+            return parsed
+
+    kind = spreadsheet_kind(rec)
+    if kind is None:
+        return None  # .xls 等暂不支持的格式 → 退化为普通文件提示
+    path, title = Path(rec.storage_path), rec.filename or "上传表格"
+    parsed = await asyncio.to_thread(_scan_safely, path, kind, title, max_rows, max_cols, True)
+    if parsed is None:
+        return None
+    _cache_put(key, parsed)
+    if not parsed.complete and key not in _full_scans:
+        task = asyncio.get_running_loop().create_task(_scan_full_table(key, path, kind, title))
+        _full_scans[key] = task
+        task.add_done_callback(lambda _: _full_scans.pop(key, None))
+    return parsed
+
+
+async def _scan_full_table(key: Tuple[str, int, int], path: Path, kind: str, title: str) -> None:
+    """后台全表统计，算完替换缓存里的样本结果"""
+    _, max_rows, max_cols = key
+    parsed = await asyncio.to_thread(_scan_safely, path, kind, title, max_rows, max_cols, False)
+    if parsed is None:
+        logger.warning(f"Full sheet scan failed: {path}")
+        return
+    _cache_put(key, parsed)
+
+
+def _cache_put(key: Tuple[str, int, int], parsed: ParsedSheet) -> None:
+    with _cache_lock:
+        _table_cache[key] = parsed
+        _table_cache.move_to_end(key)
+        while len(_table_cache) > TABLE_CACHE_SIZE:
+            _table_cache.popitem(last=False)
+
+
+def _scan_safely(
+    path: Path, kind: str, title: str, max_rows: int, max_cols: int, sample_only: bool,
+) -> Optional[ParsedSheet]:
+    try:
+        if not path.is_file():
+            return None
+        with closing(_iter_rows(path, kind, max_cols)) as rows:
+            return scan_sheet(rows, title, max_rows, max_cols, sample_only)
+    except Exception:  # noqa: BLE001  损坏/加密的文件按无法解析处理
+        return None
+
+
+def scan_sheet(
+    rows: Iterator[List[Any]], title: str, max_rows: int, max_cols: int, sample_only: bool = False,
+) -> Optional[ParsedSheet]:
+    """一遍遍历：首个非空行为表头，前 max_rows 行留作样本并累计列统计
+
+    sample_only 时读到样本之后的第一行即停（complete=False），否则继续统计全表（至多 STATS_MAX_ROWS 行）。
+    """
+    header: Optional[List[str]] = None
+    stats: List[ColumnStats] = []
+    sample: List[Dict[str, str]] = []
+    total = 0
+    truncated = False
+    complete = True
+    for raw in rows:
+        if not any(c is not None and str(c).strip() != "" for c in raw):
+            continue  # 去掉全空行
+        if header is None:
+            header = [
+                str(c).strip() if c is not None and str(c).strip() else f"列{i + 1}"
+                for i, c in enumerate(raw[:max_cols])
+            ]
+            stats = [ColumnStats() for _ in header]
+            continue
+        if sample_only and total >= max_rows:
+            complete = False
+            break
+        if total >= STATS_MAX_ROWS:
+            truncated = True
+            break
+        total += 1
+        width = len(raw)
+        if len(sample) < max_rows:
+            sample.append({
+                f"c{i}": ("" if i >= width or raw[i] is None else str(raw[i]))
+                for i in range(len(header))
+            })
+        for i, col in enumerate(stats):
+            if i < width:
+                col.add(raw[i])
+    if header is None:
+        return None
+    columns = [{"key": f"c{i}", "label": h} for i, h in enumerate(header)]
+    return ParsedSheet(
+        table={"title": title, "columns": columns, "rows": sample},
+        total_rows=total,
+        stats=stats,
+        stats_truncated=truncated,
+        complete=complete,
+    )
+
+
+def _iter_rows(path: Path, kind: str, max_cols: int) -> Iterator[List[Any]]:
+    if kind == "csv":
+        with path.open("r", encoding="utf-8-sig", errors="replace", newline="") as f:
+            for row in csv.reader(f):
+                yield row[:max_cols]
+        return
+    from openpyxl import load_workbook
+    # 按文件对象打开：内容寻址落盘的实体没有扩展名，openpyxl 按路径打开会拒绝
+    with path.open("rb") as fh:
+        wb = load_workbook(fh, read_only=True, data_only=True)
+        try:
+            for row in wb.active.iter_rows(values_only=True):
+                yield list(row[:max_cols])
+        finally:
+            wb.close()
+
+
+def _as_number(value: Any, text: str) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return None
@@ -1,17 +1,84 @@
 """
 BOM Query Service - BOM 树形浏览、物料搜索、工单关联、版本对比
+
+- 多级展开 / 反查（where-used）/ 展开用量走闭包表 enghub_bom_closure（同步后重建）
+- 树形结果按 (型号, 最近一次成功同步) 缓存序列化后的 JSON，同步前不重复组树
+- 版本对比基于版本历史 enghub_bom_history，按时间点取版本后一条 FULL OUTER JOIN 出全量差异
+- 物料搜索：PostgreSQL 走 pg_trgm 索引的 ILIKE（迁移 070），SQLite 走 FTS5 trigram 表
+  （启动时 ensure_search_index 建好，请求路径不做 DDL，未建好时退回 LIKE）；按 id 键集分页，
+  总数封顶计数，同一响应带分类/组件类型分面
 """
+import json
 import logging
-from datetime import datetime
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 
-from sqlalchemy import select, func, or_, distinct
+from sqlalchemy import select, func, or_, distinct, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import EngHubBomItem
+from database.models import EngHubBomClosure, EngHubBomItem, EngHubBomSyncLog
 
 logger = logging.getLogger(__name__)
 
+MODEL_ROOT = ""             # 闭包表中代表型号本身的祖先
+TREE_CACHE_SIZE = 64
+SEARCH_COUNT_CAP = 1000     # 搜索总数超过即只报"1000+"
+FACET_LIMIT = 20
+TRIGRAM_MIN_LEN = 3         # 短于 3 个字符的关键词无法走 trigram 索引，退回顺序扫描
+
+# SQLite：外部内容 FTS5 trigram 表 + 触发器随 enghub_bom_items 同步
+_SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS enghub_bom_items_fts USING fts5("
+    "part_number, description, content='enghub_bom_items', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS enghub_bom_items_fts_ai AFTER INSERT ON enghub_bom_items BEGIN "
+    "INSERT INTO enghub_bom_items_fts(rowid, part_number, description) "
+    "VALUES (new.id, new.part_number, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS enghub_bom_items_fts_ad AFTER DELETE ON enghub_bom_items BEGIN "
+    "INSERT INTO enghub_bom_items_fts(enghub_bom_items_fts, rowid, part_number, description) "
+    "VALUES ('delete', old.id, old.part_number, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS enghub_bom_items_fts_au AFTER UPDATE ON enghub_bom_items BEGIN "
+    "INSERT INTO enghub_bom_items_fts(enghub_bom_items_fts, rowid, part_number, description) "
+    "VALUES ('delete', old.id, old.part_number, old.description); "
+    "INSERT INTO enghub_bom_items_fts(rowid, part_number, description) "
+    "VALUES (new.id, new.part_number, new.description); END",
+)
+_SQLITE_FTS_REBUILD = "INSERT INTO enghub_bom_items_fts(enghub_bom_items_fts) VALUES ('rebuild')"
+_fts_ready: set = set()     # 已确认建好 FTS 表的 SQLite 库 URL
+
+_tree_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+_tree_cache_lock = threading.Lock()
+
+# 时间点 :ta / :tb 的 BOM（同一物料多行时数量求和），一次 FULL OUTER JOIN 出差异
+_BOM_DIFF_SQL = """
+    WITH a AS (
+        SELECT part_number, SUM(quantity) AS quantity, MAX(unit_price) AS unit_price,
+               MAX(description) AS description
+          FROM enghub_bom_history
+         WHERE product_model = :model AND part_number IS NOT NULL
+           AND valid_from <= :ta AND (valid_to IS NULL OR valid_to > :ta)
+         GROUP BY part_number
+    ), b AS (
+        SELECT part_number, SUM(quantity) AS quantity, MAX(unit_price) AS unit_price,
+               MAX(description) AS description
+          FROM enghub_bom_history
+         WHERE product_model = :model AND part_number IS NOT NULL
+           AND valid_from <= :tb AND (valid_to IS NULL OR valid_to > :tb)
+         GROUP BY part_number
+    )
+    SELECT COALESCE(a.part_number, b.part_number) AS part_number,
+           COALESCE(b.description, a.description) AS description,
+           a.quantity AS qty_a, a.unit_price AS price_a, b.quantity AS qty_b, b.unit_price AS price_b,
+           CASE WHEN a.part_number IS NULL THEN 'added'
+                WHEN b.part_number IS NULL THEN 'removed'
+                ELSE 'changed' END AS diff
+      FROM a FULL OUTER JOIN b ON a.part_number = b.part_number
+     WHERE a.part_number IS NULL OR b.part_number IS NULL
+        OR a.quantity IS DISTINCT FROM b.quantity OR a.unit_price IS DISTINCT FROM b.unit_price
+     ORDER BY 1
+"""
+
 
 class BomService:
     """BOM 查询服务"""
@@ -43,6 +110,17 @@ class BomService:
 
     async def get_bom_tree(self, model_name: str, max_level: int = 10) -> Dict[str, Any]:
         """递归展开多级 BOM 树"""
+        return json.loads(await self.get_bom_tree_json(model_name, max_level))
+
+    async def get_bom_tree_json(self, model_name: str, max_level: int = 10) -> bytes:
+        """BOM 树的序列化结果，按 (型号, 最近一次成功同步) 缓存"""
+        key = (model_name, max_level, await self._sync_generation())
+        with _tree_cache_lock:
+            payload = _tree_cache.get(key)
+            if payload is not None:
+                _tree_cache.move_to_end(key)
+                return payload
+
         result = await self.db.execute(
             select(EngHubBomItem)
             .where(EngHubBomItem.product_model == model_name)
@@ -51,19 +129,101 @@ class BomService:
         items = result.scalars().all()
 
         if not items:
-            return {"model_name": model_name, "tree": [], "total_items": 0}
+            data = {"model_name": model_name, "tree": [], "total_items": 0}
+        else:
+            # 构建树结构
+            item_dicts = [self._item_to_dict(item) for item in items]
+            data = {
+                "model_name": model_name,
+                "tree": self._build_tree(item_dicts),
+                "total_items": len(item_dicts),
+                "max_level": max(i["level"] or 0 for i in item_dicts),
+            }
+        payload = json.dumps(data, ensure_ascii=False, default=str).encode()
 
-        # 构建树结构
-        item_dicts = [self._item_to_dict(item) for item in items]
-        tree = self._build_tree(item_dicts)
+        with _tree_cache_lock:
+            _tree_cache[key] = payload
+            while len(_tree_cache) > TREE_CACHE_SIZE:
+                _tree_cache.popitem(last=False)
+        return payload
 
+    async def explode(
+        self, model_name: str, part_number: Optional[str] = None, max_depth: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """多级展开：型号（或其中某组件）下的全部后代物料，含层数与展开用量"""
+        ancestor = part_number or MODEL_ROOT
+        stmt = select(EngHubBomClosure).where(
+            EngHubBomClosure.product_model == model_name,
+            EngHubBomClosure.ancestor_part == ancestor,
+        )
+        if max_depth:
+            stmt = stmt.where(EngHubBomClosure.depth <= max_depth)
+        rows = (await self.db.execute(
+            stmt.order_by(EngHubBomClosure.depth, EngHubBomClosure.descendant_part)
+        )).scalars().all()
+
+        details = await self._part_details(model_name, [r.descendant_part for r in rows])
+        items = []
+        for r in rows:
+            info = details.get(r.descendant_part, {})
+            unit_price = info.get("unit_price")
+            items.append({
+                "part_number": r.descendant_part,
+                "depth": r.depth,
+                "extended_qty": r.extended_qty,
+                "description": info.get("description"),
+                "unit": info.get("unit"),
+                "unit_price": unit_price,
+                "extended_cost": round(r.extended_qty * unit_price, 4) if unit_price is not None else None,
+            })
         return {
             "model_name": model_name,
-            "tree": tree,
-            "total_items": len(item_dicts),
-            "max_level": max(i["level"] or 0 for i in item_dicts),
+            "part_number": part_number,
+            "items": items,
+            "total_items": len(items),
+            "total_cost": round(sum(i["extended_cost"] or 0 for i in items), 2),
+        }
+
+    async def where_used(self, part_number: str) -> Dict[str, Any]:
+        """反查：物料被哪些型号使用（跨全部型号），含每台用量与直接上级"""
+        rows = (await self.db.execute(
+            select(EngHubBomClosure)
+            .where(EngHubBomClosure.descendant_part == part_number)
+            .order_by(EngHubBomClosure.product_model, EngHubBomClosure.depth)
+        )).scalars().all()
+
+        models: Dict[str, Dict[str, Any]] = {}
+        for r in rows:
+            usage = models.setdefault(r.product_model, {
+                "model_name": r.product_model, "extended_qty": None, "depth": None,
+                "parents": [], "assemblies": [],
+            })
+            if r.ancestor_part == MODEL_ROOT:
+                usage["extended_qty"] = r.extended_qty
+                usage["depth"] = r.depth
+            else:
+                usage["assemblies"].append({"part_number": r.ancestor_part, "depth": r.depth,
+                                            "extended_qty": r.extended_qty})
+                if r.depth == 1:
+                    usage["parents"].append(r.ancestor_part)
+        return {
+            "part_number": part_number,
+            "usages": list(models.values()),
+            "usage_count": len(models),
         }
 
+    async def get_extended_quantity(
+        self, model_name: str, part_number: str, ancestor_part: Optional[str] = None
+    ) -> Optional[float]:
+        """展开用量：1 个型号（或组件 ancestor_part）需要多少个 part_number"""
+        return (await self.db.execute(
+            select(EngHubBomClosure.extended_qty).where(
+                EngHubBomClosure.product_model == model_name,
+                EngHubBomClosure.ancestor_part == (ancestor_part or MODEL_ROOT),
+                EngHubBomClosure.descendant_part == part_number,
+            )
+        )).scalar_one_or_none()
+
     async def search_materials(
         self,
         keyword: str,
@@ -72,59 +232,103 @@ class BomService:
         component_type: Optional[str] = None,
         limit: int = 50,
         offset: int = 0,
+        cursor: Optional[int] = None,
     ) -> Dict[str, Any]:
-        """物料搜索"""
-        conditions = [
-            or_(
-                EngHubBomItem.part_number.ilike(f"%{keyword}%"),
-                EngHubBomItem.description.ilike(f"%{keyword}%"),
-            )
-        ]
-        if model_name:
-            conditions.append(EngHubBomItem.product_model == model_name)
-        if category_l1:
-            conditions.append(EngHubBomItem.category_l1 == category_l1)
-        if component_type:
-            conditions.append(EngHubBomItem.component_type == component_type)
-
-        # 总数
-        count_result = await self.db.execute(
-            select(func.count(EngHubBomItem.id)).where(*conditions)
-        )
-        total = count_result.scalar() or 0
+        """物料搜索（子串匹配物料号/描述；cursor 为上一页 next_cursor，键集分页）
 
-        # 分页查询
-        result = await self.db.execute(
-            select(EngHubBomItem)
-            .where(*conditions)
-            .order_by(EngHubBomItem.product_model, EngHubBomItem.level)
-            .limit(limit)
-            .offset(offset)
-        )
+        总数与分面只在首页（不带 cursor）计算，后续页返回 None。
+        """
+        base = [await self._keyword_condition(keyword)]
+        if model_name:
+            base.append(EngHubBomItem.product_model == model_name)
+        category_cond = [EngHubBomItem.category_l1 == category_l1] if category_l1 else []
+        type_cond = [EngHubBomItem.component_type == component_type] if component_type else []
+        conditions = base + category_cond + type_cond
+
+        # 分页查询：按 id 键集翻页（兼容旧的 offset）
+        stmt = select(EngHubBomItem).where(*conditions)
+        if cursor is not None:
+            stmt = stmt.where(EngHubBomItem.id > cursor)
+        elif offset:
+            stmt = stmt.offset(offset)
+        result = await self.db.execute(stmt.order_by(EngHubBomItem.id).limit(limit + 1))
         items = result.scalars().all()
+        has_more = len(items) > limit
+        items = items[:limit]
 
-        return {
-            "total": total,
+        response = {
+            "total": None,
+            "total_exact": None,
             "items": [self._item_to_dict(i) for i in items],
             "limit": limit,
             "offset": offset,
+            "next_cursor": items[-1].id if has_more else None,
+            "facets": None,
         }
+        if cursor is None:
+            # 封顶计数：最多数到 SEARCH_COUNT_CAP + 1 行
+            capped = select(EngHubBomItem.id).where(*conditions).limit(SEARCH_COUNT_CAP + 1).subquery()
+            counted = (await self.db.execute(select(func.count()).select_from(capped))).scalar() or 0
+            response["total"] = min(counted, SEARCH_COUNT_CAP)
+            response["total_exact"] = counted <= SEARCH_COUNT_CAP
+            # 分面：各自排除本维度的筛选，便于切换
+            response["facets"] = {
+                "category_l1": await self._facet(EngHubBomItem.category_l1, base + type_cond),
+                "component_type": await self._facet(EngHubBomItem.component_type, base + category_cond),
+            }
+        return response
+
+    async def _keyword_condition(self, keyword: str):
+        """关键词条件：SQLite 且关键词够长时走 FTS5 trigram，其余走 ILIKE（PG 上由 pg_trgm 索引支撑）"""
+        bind = self.db.get_bind()
+        if bind.dialect.name == "sqlite" and len(keyword) >= TRIGRAM_MIN_LEN and str(bind.url) in _fts_ready:
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            matches = select(text("rowid")).select_from(text("enghub_bom_items_fts")).where(
+                text("enghub_bom_items_fts MATCH :fts_phrase").bindparams(fts_phrase=phrase)
+            )
+            return EngHubBomItem.id.in_(matches)
+        pattern = "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return or_(
+            EngHubBomItem.part_number.ilike(pattern, escape="\\"),
+            EngHubBomItem.description.ilike(pattern, escape="\\"),
+        )
+
+    async def _facet(self, column, conditions) -> List[Dict[str, Any]]:
+        count = func.count(EngHubBomItem.id)
+        result = await self.db.execute(
+            select(column, count)
+            .where(*conditions, column.isnot(None))
+            .group_by(column)
+            .order_by(count.desc(), column)
+            .limit(FACET_LIMIT)
+        )
+        return [{"value": value, "count": n} for value, n in result.all()]
 
     async def get_material_detail(self, part_number: str) -> Dict[str, Any]:
-        """物料详情（含使用该物料的所有产品）"""
+        """物料详情（含使用该物料的所有产品，型号与用量取自闭包表）"""
         result = await self.db.execute(
             select(EngHubBomItem)
             .where(EngHubBomItem.part_number == part_number)
             .order_by(EngHubBomItem.product_model)
+            .limit(1)
         )
-        items = result.scalars().all()
+        primary = result.scalar_one_or_none()
 
-        if not items:
+        if not primary:
             return {"part_number": part_number, "found": False, "usages": []}
 
-        # 取第一条作为主信息
-        primary = items[0]
-        used_in_models = list(set(i.product_model for i in items if i.product_model))
+        usages = [
+            {"model_name": u["model_name"], "extended_qty": u["extended_qty"]}
+            for u in (await self.where_used(part_number))["usages"]
+        ]
+        if usages:
+            used_in_models = [u["model_name"] for u in usages]
+        else:
+            # 闭包表尚未重建（迁移后首次同步前）时退回按物料号取型号
+            used_in_models = [m for m in (await self.db.execute(
+                select(distinct(EngHubBomItem.product_model))
+                .where(EngHubBomItem.part_number == part_number, EngHubBomItem.product_model.isnot(None))
+            )).scalars()]
 
         return {
             "part_number": part_number,
@@ -140,6 +344,7 @@ class BomService:
             "vendor_name": primary.vendor_name,
             "used_in_models": used_in_models,
             "usage_count": len(used_in_models),
+            "usages": usages,
         }
 
     async def get_bom_for_work_order(self, work_order_id: str) -> Dict[str, Any]:
@@ -183,61 +388,71 @@ class BomService:
     async def compare_bom(
         self, model_name: str, date_a: str, date_b: str
     ) -> Dict[str, Any]:
-        """对比两个时间点的 BOM 快照差异"""
-        from datetime import date as date_type
-
+        """对比两个版本的 BOM 差异（版本 = ISO 时间点，或同步记录 ID；只给日期时取当天结束时）"""
         try:
-            da = datetime.fromisoformat(date_a)
-            db_date = datetime.fromisoformat(date_b)
-        except ValueError:
-            return {"error": "Invalid date format. Use ISO format: YYYY-MM-DD"}
-
-        # 获取两个时间点存在的物料
-        result_a = await self.db.execute(
-            select(EngHubBomItem.part_number, EngHubBomItem.quantity, EngHubBomItem.unit_price)
-            .where(
-                EngHubBomItem.product_model == model_name,
-                EngHubBomItem.synced_at <= da,
-            )
-        )
-        items_a = {row[0]: {"quantity": row[1], "unit_price": row[2]} for row in result_a.all()}
-
-        result_b = await self.db.execute(
-            select(EngHubBomItem.part_number, EngHubBomItem.quantity, EngHubBomItem.unit_price)
-            .where(
-                EngHubBomItem.product_model == model_name,
-                EngHubBomItem.synced_at <= db_date,
-            )
-        )
-        items_b = {row[0]: {"quantity": row[1], "unit_price": row[2]} for row in result_b.all()}
-
-        # 计算差异
-        added = [pn for pn in items_b if pn not in items_a]
-        removed = [pn for pn in items_a if pn not in items_b]
-        changed = []
-        for pn in items_a:
-            if pn in items_b:
-                if items_a[pn]["quantity"] != items_b[pn]["quantity"] or items_a[pn]["unit_price"] != items_b[pn]["unit_price"]:
-                    changed.append({
-                        "part_number": pn,
-                        "before": items_a[pn],
-                        "after": items_b[pn],
-                    })
+            ta = await self._resolve_version(date_a)
+            tb = await self._resolve_version(date_b)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        result = await self.db.execute(text(_BOM_DIFF_SQL), {"model": model_name, "ta": ta, "tb": tb})
+        differences = []
+        added, removed, changed = [], [], []
+        for row in result.all():
+            diff = row.diff
+            differences.append({
+                "part_number": row.part_number,
+                "name": row.description,
+                "qty_a": row.qty_a,
+                "qty_b": row.qty_b,
+                "price_a": row.price_a,
+                "price_b": row.price_b,
+                "diff": diff,
+            })
+            if diff == "added":
+                added.append(row.part_number)
+            elif diff == "removed":
+                removed.append(row.part_number)
+            else:
+                changed.append({
+                    "part_number": row.part_number,
+                    "before": {"quantity": row.qty_a, "unit_price": row.price_a},
+                    "after": {"quantity": row.qty_b, "unit_price": row.price_b},
+                })
 
         return {
             "model_name": model_name,
             "date_a": date_a,
             "date_b": date_b,
+            "as_of_a": ta.isoformat(),
+            "as_of_b": tb.isoformat(),
             "summary": {
                 "added_count": len(added),
                 "removed_count": len(removed),
                 "changed_count": len(changed),
             },
-            "added": added[:100],
-            "removed": removed[:100],
-            "changed": changed[:100],
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "differences": differences,
         }
 
+    async def _resolve_version(self, version: str) -> datetime:
+        """版本号（同步记录 ID）→ 该次同步完成时刻；ISO 日期 → 当天结束；ISO 时间 → 原样"""
+        version = version.strip()
+        if version.isdigit():
+            log = await self.db.get(EngHubBomSyncLog, int(version))
+            if not log or log.status != "success" or not log.finished_at:
+                raise ValueError(f"同步版本不存在或未成功: {version}")
+            return log.finished_at
+        try:
+            point = datetime.fromisoformat(version)
+        except ValueError:
+            raise ValueError("Invalid date format. Use ISO format: YYYY-MM-DD")
+        if len(version) == 10:
+            point += timedelta(days=1) - timedelta(microseconds=1)
+        return point
+
     def _build_tree(self, items: List[Dict]) -> List[Dict]:
         """将扁平 BOM 列表构建为树结构"""
         # 按 parent_part 分组
@@ -256,18 +471,41 @@ class BomService:
             min_level = min((i["level"] or 0) for i in items)
             roots = [i for i in items if (i["level"] or 0) == min_level]
 
-        # 递归挂载子节点
-        def attach_children(node):
+        # 递归挂载子节点（每处挂载各自复制一份；源数据父子成环时在环上截断）
+        def attach_children(node, path):
             pn = node["part_number"]
-            if pn in children_map:
-                node["children"] = children_map[pn]
-                for child in node["children"]:
-                    attach_children(child)
-            else:
-                node["children"] = []
-            return node
-
-        return [attach_children(r) for r in roots[:200]]  # 限制根节点数量
+            if pn in path:
+                return {**node, "children": []}
+            path = path | {pn}
+            return {**node, "children": [attach_children(c, path) for c in children_map.get(pn, [])]}
+
+        return [attach_children(r, frozenset()) for r in roots[:200]]  # 限制根节点数量
+
+    async def _sync_generation(self):
+        """最近一次成功同步（id, 水位）；树缓存以此区分版本"""
+        row = (await self.db.execute(
+            select(EngHubBomSyncLog.id, EngHubBomSyncLog.watermark)
+            .where(EngHubBomSyncLog.status == "success")
+            .order_by(EngHubBomSyncLog.id.desc())
+            .limit(1)
+        )).first()
+        return (row.id, row.watermark) if row else None
+
+    async def _part_details(self, model_name: str, part_numbers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """一次 IN 查询取型号内物料的描述/单位/单价（同一物料多行取第一行）"""
+        if not part_numbers:
+            return {}
+        result = await self.db.execute(
+            select(EngHubBomItem.part_number, EngHubBomItem.description, EngHubBomItem.unit,
+                   EngHubBomItem.unit_price)
+            .where(EngHubBomItem.product_model == model_name,
+                   EngHubBomItem.part_number.in_(set(part_numbers)))
+            .order_by(EngHubBomItem.id)
+        )
+        details: Dict[str, Dict[str, Any]] = {}
+        for row in result.all():
+            details.setdefault(row.part_number, dict(row._mapping))
+        return details
 
     @staticmethod
     def _item_to_dict(item: EngHubBomItem) -> Dict[str, Any]:
@@ -290,3 +528,31 @@ class BomService:
             "material_family": item.material_family,
             "component_type": item.component_type,
         }
+
+
+async def ensure_search_index(engine=None) -> bool:
+    """启动时为 SQLite 库建好物料搜索用的 FTS5 trigram 表与触发器（PostgreSQL 由迁移 070 负责）
+
+    独立连接、独立事务执行，不碰任何请求会话；返回 SQLite 上 FTS 是否可用。
+    """
+    if engine is None:
+        from database.db_config import db_config
+        engine = db_config.engine
+    if engine.dialect.name != "sqlite":
+        return False
+    try:
+        async with engine.begin() as conn:
+            tables = {r[0] for r in await conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name IN ('enghub_bom_items', 'enghub_bom_items_fts')"))}
+            if "enghub_bom_items" not in tables:
+                return False
+            for ddl in _SQLITE_FTS_DDL:
+                await conn.execute(text(ddl))
+            if "enghub_bom_items_fts" not in tables:
+                await conn.execute(text(_SQLITE_FTS_REBUILD))
+    except Exception as e:  # noqa: BLE001 — 建不了就一直走 LIKE，不影响启动
+        logger.warning(f"BOM search FTS setup skipped: {e}")
+        return False
+    _fts_ready.add(str(engine.url))
+    return True
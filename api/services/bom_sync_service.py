@@ -1,19 +1,190 @@
 """
 BOM Sync Service - 从 EngFlow bom_items 同步到 EngHub 本地缓存表
 支持全量同步和增量同步（基于 updated_at 水位线）
+
+- 源表按 (updated_at, row_id) 键集分页，参数全部绑定；updated_at 为空的行先按 row_id 单独翻一轮
+- 写入按批 executemany 的 ON CONFLICT (source_row_id) 批量 upsert，不再逐行 SELECT
+- 全量同步（PostgreSQL）先灌影子表，再在一个事务内改名交换，同步期间 BOM 页面照常读旧数据；
+  交换与增量写入争同一把事务级 advisory 锁：交换前把灌表期间增量已提交的行并入影子表，
+  交换后把索引/约束改回原名（后续迁移按原名引用）；其他方言在单事务内替换
+- 返回/日志带吞吐（行/秒）
+- 同步后重建 BOM 闭包表 enghub_bom_closure（全量重建全部型号，增量只重建受影响型号）
+- 同步后写版本历史 enghub_bom_history：内容变化/源行消失的当前版本关闭，新内容追加为新版本
 """
 import logging
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from sqlalchemy import text, func, select
+from sqlalchemy import DateTime, bindparam, text, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import EngHubBomItem, EngHubBomSyncLog
+from database.models import EngHubBomSyncLog
 
 logger = logging.getLogger(__name__)
 
 BATCH_SIZE = 5000
+LIVE_TABLE = "enghub_bom_items"
+SHADOW_TABLE = "enghub_bom_items_shadow"
+RETIRED_TABLE = "enghub_bom_items_old"
+CLOSURE_MAX_DEPTH = 32      # 防止源数据父子成环时无限展开
+SYNC_LOCK_KEY = "bom_sync:enghub_bom_items"  # 影子表交换与增量写入串行（pg_advisory_xact_lock）
+
+_SOURCE_COLUMNS = """
+    SELECT
+        bi.row_id,
+        bi.model_name,
+        bi.part_number,
+        bi.description,
+        bi.level,
+        bi.quantity,
+        bi.unit,
+        bi.unit_price,
+        bi.total_cost,
+        bi.vendor_code,
+        bi.vendor_name,
+        bi.parent_sap,
+        bi.category_l1,
+        bi.category_l2,
+        pm.material_family,
+        pm.component_type,
+        bi.updated_at
+    FROM bom_items bi
+    LEFT JOIN part_master pm
+        ON pm.part_number = bi.part_number
+        AND pm.company_id = bi.company_id
+"""
+
+# 键集分页条件（固定片段，值一律走绑定参数）
+_UNDATED_PAGE = "WHERE bi.updated_at IS NULL AND bi.row_id > :after_id ORDER BY bi.row_id LIMIT :limit"
+_DATED_FIRST_PAGE = "WHERE bi.updated_at IS NOT NULL ORDER BY bi.updated_at, bi.row_id LIMIT :limit"
+_DATED_AFTER_TS = "WHERE bi.updated_at > :after_ts ORDER BY bi.updated_at, bi.row_id LIMIT :limit"
+_DATED_PAGE = (
+    "WHERE (bi.updated_at, bi.row_id) > (:after_ts, :after_id) "
+    "ORDER BY bi.updated_at, bi.row_id LIMIT :limit"
+)
+
+_UPSERT_SQL = """
+    INSERT INTO {table} (
+        source_row_id, product_model, part_number, description, level, quantity, unit,
+        unit_price, total_cost, vendor_code, vendor_name, parent_part, category_l1, category_l2,
+        material_family, component_type, synced_at, source_updated_at
+    ) VALUES (
+        :row_id, :model_name, :part_number, :description, :level, :quantity, :unit,
+        :unit_price, :total_cost, :vendor_code, :vendor_name, :parent_sap, :category_l1, :category_l2,
+        :material_family, :component_type, :synced_at, :updated_at
+    )
+    ON CONFLICT (source_row_id) DO UPDATE SET
+        product_model = excluded.product_model,
+        part_number = excluded.part_number,
+        description = excluded.description,
+        level = excluded.level,
+        quantity = excluded.quantity,
+        unit = excluded.unit,
+        unit_price = excluded.unit_price,
+        total_cost = excluded.total_cost,
+        vendor_code = excluded.vendor_code,
+        vendor_name = excluded.vendor_name,
+        parent_part = excluded.parent_part,
+        category_l1 = excluded.category_l1,
+        category_l2 = excluded.category_l2,
+        material_family = excluded.material_family,
+        component_type = excluded.component_type,
+        synced_at = excluded.synced_at,
+        source_updated_at = excluded.source_updated_at
+"""
+
+
+# 灌影子表期间增量同步写进正式表的行：交换前并入影子表（只覆盖比影子表更新的版本）
+_ITEM_COLUMNS = ("source_row_id", "product_model", "part_number", "description", "level", "quantity",
+                 "unit", "unit_price", "total_cost", "vendor_code", "vendor_name", "parent_part",
+                 "category_l1", "category_l2", "material_family", "component_type", "synced_at",
+                 "source_updated_at")
+
+_CATCH_UP_SQL = """
+    INSERT INTO {shadow} ({columns})
+    SELECT {columns} FROM {live} WHERE synced_at >= :since
+    ON CONFLICT (source_row_id) DO UPDATE SET {updates}
+    WHERE {shadow}.source_updated_at IS NULL OR excluded.source_updated_at > {shadow}.source_updated_at
+""".format(
+    shadow=SHADOW_TABLE, live=LIVE_TABLE, columns=", ".join(_ITEM_COLUMNS),
+    updates=", ".join(f"{c} = excluded.{c}" for c in _ITEM_COLUMNS[1:]),
+)
+
+# 表上的索引（及其背后的主键/唯一约束）与 CHECK 约束；按定义配对影子表与正式表的同名对象
+_INDEX_NAMES_SQL = """
+    SELECT c.relname AS name, con.conname AS constraint_name,
+           i.indisunique AS is_unique, split_part(pg_get_indexdef(i.indexrelid), ' USING ', 2) AS definition
+      FROM pg_index i
+      JOIN pg_class c ON c.oid = i.indexrelid
+      LEFT JOIN pg_constraint con ON con.conindid = i.indexrelid AND con.conrelid = i.indrelid
+     WHERE i.indrelid = CAST(:t AS regclass)
+     ORDER BY c.relname
+"""
+
+_CHECK_NAMES_SQL = """
+    SELECT conname AS name, pg_get_constraintdef(oid) AS definition
+      FROM pg_constraint
+     WHERE conrelid = CAST(:t AS regclass) AND contype = 'c'
+     ORDER BY conname
+"""
+
+
+# 闭包重建：父件不存在/为空/指向自身的物料挂到型号根（ancestor_part = ''），
+# 递归连乘用量，同一 (型号, 祖先, 后代) 多条路径取最短层数、用量求和
+_CLOSURE_INSERT_SQL = """
+    INSERT INTO enghub_bom_closure (product_model, ancestor_part, descendant_part, depth, extended_qty)
+    WITH RECURSIVE edges(product_model, parent, child, qty) AS (
+        SELECT i.product_model,
+               CASE WHEN i.parent_part IS NULL OR i.parent_part = '' OR i.parent_part = i.part_number
+                         OR NOT EXISTS (
+                             SELECT 1 FROM enghub_bom_items p
+                              WHERE p.product_model = i.product_model AND p.part_number = i.parent_part)
+                    THEN '' ELSE i.parent_part END,
+               i.part_number,
+               COALESCE(i.quantity, 1)
+          FROM enghub_bom_items i
+         WHERE i.product_model IS NOT NULL AND i.part_number IS NOT NULL {model_filter}
+    ),
+    walk(product_model, ancestor_part, descendant_part, depth, extended_qty) AS (
+        SELECT product_model, parent, child, 1, qty FROM edges
+        UNION ALL
+        SELECT w.product_model, w.ancestor_part, e.child, w.depth + 1, w.extended_qty * e.qty
+          FROM walk w
+          JOIN edges e ON e.product_model = w.product_model AND e.parent = w.descendant_part
+         WHERE w.depth < :max_depth
+    )
+    SELECT product_model, ancestor_part, descendant_part, MIN(depth), SUM(extended_qty)
+      FROM walk
+     GROUP BY product_model, ancestor_part, descendant_part
+"""
+
+
+# 版本历史：这些列任一变化即视为新版本
+_HISTORY_COLUMNS = ("product_model", "part_number", "parent_part", "description", "level",
+                    "quantity", "unit", "unit_price")
+
+_HISTORY_CLOSE_SQL = """
+    UPDATE enghub_bom_history SET valid_to = :now
+     WHERE valid_to IS NULL {row_filter}
+       AND NOT EXISTS (
+           SELECT 1 FROM enghub_bom_items i
+            WHERE i.source_row_id = enghub_bom_history.source_row_id AND {same}
+       )
+""".format(
+    row_filter="{row_filter}",
+    same=" AND ".join(f"i.{c} IS NOT DISTINCT FROM enghub_bom_history.{c}" for c in _HISTORY_COLUMNS),
+)
+
+_HISTORY_OPEN_SQL = """
+    INSERT INTO enghub_bom_history (source_row_id, {columns}, valid_from, sync_log_id)
+    SELECT i.source_row_id, {i_columns}, :now, :sync_log_id
+      FROM enghub_bom_items i
+     WHERE i.source_row_id IS NOT NULL {{row_filter}}
+       AND NOT EXISTS (
+           SELECT 1 FROM enghub_bom_history h WHERE h.source_row_id = i.source_row_id AND h.valid_to IS NULL
+       )
+""".format(columns=", ".join(_HISTORY_COLUMNS), i_columns=", ".join(f"i.{c}" for c in _HISTORY_COLUMNS))
 
 
 class BomSyncService:
@@ -23,82 +194,49 @@ class BomSyncService:
         self.db = db
 
     async def full_sync(self) -> dict:
-        """全量同步：从 bom_items LEFT JOIN part_master 拉取全部数据"""
-        sync_log = EngHubBomSyncLog(
-            sync_type="full",
-            status="running",
-            started_at=datetime.utcnow(),
-        )
-        self.db.add(sync_log)
-        await self.db.commit()
-        await self.db.refresh(sync_log)
+        """全量同步：从 bom_items LEFT JOIN part_master 拉取全部数据，影子表加载后原子交换"""
+        sync_log = await self._start_log("full")
+        started = time.monotonic()
+        use_shadow = self.db.get_bind().dialect.name == "postgresql"
 
         try:
-            # 清空本地缓存
-            await self.db.execute(text("DELETE FROM enghub_bom_items"))
-            await self.db.commit()
+            if use_shadow:
+                await self._create_shadow()
+                target = SHADOW_TABLE
+            else:
+                # 非 PG：单事务内先删后灌，提交前读者仍看到旧数据
+                await self.db.execute(text(f"DELETE FROM {LIVE_TABLE}"))
+                target = LIVE_TABLE
 
             total_synced = 0
             max_updated_at = None
-            offset = 0
-
-            while True:
-                rows = await self._fetch_source_batch(offset, BATCH_SIZE)
-                if not rows:
-                    break
+            load_started = datetime.utcnow()
+            async for rows in self._iter_source():
+                await self._upsert(target, rows)
+                if use_shadow:
+                    await self.db.commit()
+                total_synced += len(rows)
+                max_updated_at = _max_updated_at(rows, max_updated_at)
+                logger.info(f"BOM full_sync progress: {total_synced} records "
+                            f"({_rate(total_synced, started)} rows/s)")
 
-                items = []
-                for row in rows:
-                    item = EngHubBomItem(
-                        source_row_id=row["row_id"],
-                        product_model=row["model_name"],
-                        part_number=row["part_number"],
-                        description=row["description"],
-                        level=row["level"],
-                        quantity=row["quantity"],
-                        unit=row["unit"],
-                        unit_price=row["unit_price"],
-                        total_cost=row["total_cost"],
-                        vendor_code=row["vendor_code"],
-                        vendor_name=row["vendor_name"],
-                        parent_part=row["parent_sap"],
-                        category_l1=row["category_l1"],
-                        category_l2=row["category_l2"],
-                        material_family=row["material_family"],
-                        component_type=row["component_type"],
-                        synced_at=datetime.utcnow(),
-                        source_updated_at=row["updated_at"],
-                    )
-                    items.append(item)
-                    if row["updated_at"] and (max_updated_at is None or row["updated_at"] > max_updated_at):
-                        max_updated_at = row["updated_at"]
-
-                self.db.add_all(items)
+            if use_shadow:
+                await self._swap_shadow(load_started)
+            else:
                 await self.db.commit()
-                total_synced += len(items)
-                offset += BATCH_SIZE
-                logger.info(f"BOM full_sync progress: {total_synced} records")
-
-            # 更新同步日志
-            sync_log.status = "success"
-            sync_log.records_synced = total_synced
-            sync_log.watermark = max_updated_at
-            sync_log.finished_at = datetime.utcnow()
-            await self.db.commit()
+            await self.rebuild_closure()
+            await self.record_history(sync_log.id)
 
-            return {"status": "success", "records_synced": total_synced, "watermark": str(max_updated_at)}
+            return await self._finish_log(sync_log, total_synced, max_updated_at, started)
 
         except Exception as e:
             await self.db.rollback()
-            sync_log.status = "failed"
-            sync_log.error_message = str(e)
-            sync_log.finished_at = datetime.utcnow()
-            await self.db.commit()
-            logger.error(f"BOM full_sync failed: {e}")
-            return {"status": "failed", "error": str(e)}
+            if use_shadow:
+                await self._drop_shadow()
+            return await self._fail_log(sync_log, e, "full_sync")
 
     async def incremental_sync(self) -> dict:
-        """增量同步：只拉取 watermark 之后变更的记录"""
+        """增量同步：只拉取 watermark 之后变更的记录，按 source_row_id 批量 upsert"""
         # 获取上次水位线
         result = await self.db.execute(
             select(EngHubBomSyncLog)
@@ -109,94 +247,32 @@ class BomSyncService:
         last_log = result.scalar_one_or_none()
         watermark = last_log.watermark if last_log and last_log.watermark else datetime(2000, 1, 1)
 
-        sync_log = EngHubBomSyncLog(
-            sync_type="incremental",
-            status="running",
-            started_at=datetime.utcnow(),
-            watermark=watermark,
-        )
-        self.db.add(sync_log)
-        await self.db.commit()
-        await self.db.refresh(sync_log)
+        sync_log = await self._start_log("incremental", watermark)
+        started = time.monotonic()
 
         try:
             total_synced = 0
             max_updated_at = watermark
-            offset = 0
-
-            while True:
-                rows = await self._fetch_source_batch(offset, BATCH_SIZE, after=watermark)
-                if not rows:
-                    break
-
-                for row in rows:
-                    # UPSERT: 按 source_row_id 查找已有记录
-                    existing = await self.db.execute(
-                        select(EngHubBomItem).where(EngHubBomItem.source_row_id == row["row_id"])
-                    )
-                    item = existing.scalar_one_or_none()
-
-                    if item:
-                        item.part_number = row["part_number"]
-                        item.description = row["description"]
-                        item.level = row["level"]
-                        item.quantity = row["quantity"]
-                        item.unit_price = row["unit_price"]
-                        item.total_cost = row["total_cost"]
-                        item.vendor_code = row["vendor_code"]
-                        item.vendor_name = row["vendor_name"]
-                        item.category_l1 = row["category_l1"]
-                        item.category_l2 = row["category_l2"]
-                        item.material_family = row["material_family"]
-                        item.component_type = row["component_type"]
-                        item.synced_at = datetime.utcnow()
-                        item.source_updated_at = row["updated_at"]
-                    else:
-                        item = EngHubBomItem(
-                            source_row_id=row["row_id"],
-                            product_model=row["model_name"],
-                            part_number=row["part_number"],
-                            description=row["description"],
-                            level=row["level"],
-                            quantity=row["quantity"],
-                            unit=row["unit"],
-                            unit_price=row["unit_price"],
-                            total_cost=row["total_cost"],
-                            vendor_code=row["vendor_code"],
-                            vendor_name=row["vendor_name"],
-                            parent_part=row["parent_sap"],
-                            category_l1=row["category_l1"],
-                            category_l2=row["category_l2"],
-                            material_family=row["material_family"],
-                            component_type=row["component_type"],
-                            synced_at=datetime.utcnow(),
-                            source_updated_at=row["updated_at"],
-                        )
-                        self.db.add(item)
-
-                    if row["updated_at"] and row["updated_at"] > max_updated_at:
-                        max_updated_at = row["updated_at"]
-
+            touched_models = set()
+            async for rows in self._iter_source(after=watermark):
+                # 先取锁再碰正式表：交换进行中则等它完成，本批写进新表
+                await self._lock_live()
+                # 行可能换了型号：新旧型号的闭包都要重建
+                touched_models |= await self._current_models([r["row_id"] for r in rows])
+                touched_models |= {r["model_name"] for r in rows if r["model_name"]}
+                await self._upsert(LIVE_TABLE, rows)
                 await self.db.commit()
                 total_synced += len(rows)
-                offset += BATCH_SIZE
+                max_updated_at = _max_updated_at(rows, max_updated_at)
+            if touched_models:
+                await self.rebuild_closure(touched_models)
+                await self.record_history(sync_log.id, since=watermark)
 
-            sync_log.status = "success"
-            sync_log.records_synced = total_synced
-            sync_log.watermark = max_updated_at
-            sync_log.finished_at = datetime.utcnow()
-            await self.db.commit()
-
-            return {"status": "success", "records_synced": total_synced, "watermark": str(max_updated_at)}
+            return await self._finish_log(sync_log, total_synced, max_updated_at, started)
 
         except Exception as e:
             await self.db.rollback()
-            sync_log.status = "failed"
-            sync_log.error_message = str(e)
-            sync_log.finished_at = datetime.utcnow()
-            await self.db.commit()
-            logger.error(f"BOM incremental_sync failed: {e}")
-            return {"status": "failed", "error": str(e)}
+            return await self._fail_log(sync_log, e, "incremental_sync")
 
     async def get_sync_status(self) -> list:
         """获取最近的同步记录"""
@@ -218,39 +294,225 @@ class BomSyncService:
             for log in logs
         ]
 
-    async def _fetch_source_batch(self, offset: int, limit: int, after: Optional[datetime] = None) -> list:
-        """从源表 bom_items LEFT JOIN part_master 拉取一批数据"""
-        where_clause = ""
-        if after:
-            where_clause = f"WHERE bi.updated_at > '{after.isoformat()}'"
-
-        sql = f"""
-            SELECT
-                bi.row_id,
-                bi.model_name,
-                bi.part_number,
-                bi.description,
-                bi.level,
-                bi.quantity,
-                bi.unit,
-                bi.unit_price,
-                bi.total_cost,
-                bi.vendor_code,
-                bi.vendor_name,
-                bi.parent_sap,
-                bi.category_l1,
-                bi.category_l2,
-                pm.material_family,
-                pm.component_type,
-                bi.updated_at
-            FROM bom_items bi
-            LEFT JOIN part_master pm
-                ON pm.part_number = bi.part_number
-                AND pm.company_id = bi.company_id
-            {where_clause}
-            ORDER BY bi.row_id
-            LIMIT :limit OFFSET :offset
+    async def rebuild_closure(self, models: Optional[set] = None) -> int:
+        """重建 BOM 闭包表（models 为空时全部型号），单事务替换，返回闭包行数"""
+        params: Dict[str, Any] = {"max_depth": CLOSURE_MAX_DEPTH}
+        if models:
+            delete = text("DELETE FROM enghub_bom_closure WHERE product_model IN :models")
+            insert = text(_CLOSURE_INSERT_SQL.format(model_filter="AND i.product_model IN :models"))
+            delete, insert = (stmt.bindparams(bindparam("models", expanding=True)) for stmt in (delete, insert))
+            params["models"] = sorted(models)
+        else:
+            delete = text("DELETE FROM enghub_bom_closure")
+            insert = text(_CLOSURE_INSERT_SQL.format(model_filter=""))
+        await self.db.execute(delete, {k: v for k, v in params.items() if k == "models"})
+        result = await self.db.execute(insert, params)
+        await self.db.commit()
+        logger.info(f"BOM closure rebuilt: {result.rowcount} rows ({len(models) if models else 'all'} models)")
+        return result.rowcount or 0
+
+    async def record_history(self, sync_log_id: Optional[int], since: Optional[datetime] = None) -> dict:
+        """缓存表与当前版本对比，关闭变化/消失的版本并追加新版本（since 给定时只对比其后变更的源行）"""
+        params: Dict[str, Any] = {"now": datetime.utcnow()}
+        close_filter = open_filter = ""
+        if since is not None:
+            close_filter = ("AND source_row_id IN "
+                            "(SELECT source_row_id FROM enghub_bom_items WHERE source_updated_at > :since)")
+            open_filter = "AND i.source_updated_at > :since"
+            params["since"] = since
+        closed = await self.db.execute(text(_HISTORY_CLOSE_SQL.format(row_filter=close_filter)), params)
+        opened = await self.db.execute(
+            text(_HISTORY_OPEN_SQL.format(row_filter=open_filter)), {**params, "sync_log_id": sync_log_id})
+        await self.db.commit()
+        logger.info(f"BOM history: {closed.rowcount} versions closed, {opened.rowcount} opened")
+        return {"closed": closed.rowcount or 0, "opened": opened.rowcount or 0}
+
+    async def _current_models(self, row_ids: List[int]) -> set:
+        result = await self.db.execute(
+            text("SELECT DISTINCT product_model FROM enghub_bom_items WHERE source_row_id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": row_ids},
+        )
+        return {m for m in result.scalars() if m}
+
+    # ---------- 同步日志 ----------
+
+    async def _start_log(self, sync_type: str, watermark: Optional[datetime] = None) -> EngHubBomSyncLog:
+        sync_log = EngHubBomSyncLog(
+            sync_type=sync_type,
+            status="running",
+            started_at=datetime.utcnow(),
+            watermark=watermark,
+        )
+        self.db.add(sync_log)
+        await self.db.commit()
+        await self.db.refresh(sync_log)
+        return sync_log
+
+    async def _finish_log(self, sync_log, total_synced: int, max_updated_at, started: float) -> dict:
+        elapsed = time.monotonic() - started
+        sync_log.status = "success"
+        sync_log.records_synced = total_synced
+        sync_log.watermark = max_updated_at
+        sync_log.finished_at = datetime.utcnow()
+        await self.db.commit()
+        rate = _rate(total_synced, started)
+        logger.info(f"BOM {sync_log.sync_type} sync done: {total_synced} records in {elapsed:.1f}s ({rate} rows/s)")
+        return {
+            "status": "success",
+            "records_synced": total_synced,
+            "watermark": str(max_updated_at),
+            "elapsed_seconds": round(elapsed, 2),
+            "rows_per_second": rate,
+        }
+
+    async def _fail_log(self, sync_log, error: Exception, label: str) -> dict:
+        sync_log.status = "failed"
+        sync_log.error_message = str(error)
+        sync_log.finished_at = datetime.utcnow()
+        await self.db.commit()
+        logger.error(f"BOM {label} failed: {error}")
+        return {"status": "failed", "error": str(error)}
+
+    # ---------- 源表读取 ----------
+
+    async def _iter_source(self, after: Optional[datetime] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """按 (updated_at, row_id) 键集分页遍历源表；全量时先遍历 updated_at 为空的行"""
+        if after is None:
+            last_id = None
+            while True:
+                rows = await self._fetch_source_batch(BATCH_SIZE, after_id=last_id, undated=True)
+                if not rows:
+                    break
+                yield rows
+                if len(rows) < BATCH_SIZE:
+                    break
+                last_id = rows[-1]["row_id"]
+
+        last_ts, last_id = after, None
+        while True:
+            rows = await self._fetch_source_batch(BATCH_SIZE, after_ts=last_ts, after_id=last_id)
+            if not rows:
+                break
+            yield rows
+            if len(rows) < BATCH_SIZE:
+                break
+            last_ts, last_id = rows[-1]["updated_at"], rows[-1]["row_id"]
+
+    async def _fetch_source_batch(
+        self,
+        limit: int,
+        after_ts: Optional[datetime] = None,
+        after_id: Optional[int] = None,
+        undated: bool = False,
+    ) -> list:
+        """从源表 bom_items LEFT JOIN part_master 拉取键集 (after_ts, after_id) 之后的一批数据"""
+        params: Dict[str, Any] = {"limit": limit}
+        if undated:
+            page = _UNDATED_PAGE
+            params["after_id"] = after_id if after_id is not None else -1
+        elif after_id is not None:
+            page = _DATED_PAGE
+            params.update(after_ts=after_ts, after_id=after_id)
+        elif after_ts is not None:
+            page = _DATED_AFTER_TS
+            params["after_ts"] = after_ts
+        else:
+            page = _DATED_FIRST_PAGE
+        stmt = text(_SOURCE_COLUMNS + page).columns(updated_at=DateTime)
+        result = await self.db.execute(stmt, params)
+        return [dict(r) for r in result.mappings().all()]
+
+    # ---------- 写入 ----------
+
+    async def _upsert(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """一批源行按 source_row_id 批量 upsert（executemany）"""
+        now = datetime.utcnow()
+        await self.db.execute(text(_UPSERT_SQL.format(table=table)), [{**r, "synced_at": now} for r in rows])
+
+    async def _lock_live(self) -> None:
+        """PostgreSQL 上取 BOM 同步 advisory 锁（事务级，提交即释放）：增量批次不会落在影子表交换的窗口里"""
+        if self.db.get_bind().dialect.name == "postgresql":
+            await self.db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": SYNC_LOCK_KEY})
+
+    async def _create_shadow(self) -> None:
+        await self.db.execute(text(f"DROP TABLE IF EXISTS {SHADOW_TABLE}"))
+        await self.db.execute(text(f"CREATE TABLE {SHADOW_TABLE} (LIKE {LIVE_TABLE} INCLUDING ALL)"))
+        await self.db.commit()
+
+    async def _drop_shadow(self) -> None:
+        try:
+            await self.db.execute(text(f"DROP TABLE IF EXISTS {SHADOW_TABLE}"))
+            await self.db.commit()
+        except Exception as e:  # noqa: BLE001 — 清理失败不掩盖同步失败本身
+            await self.db.rollback()
+            logger.warning(f"BOM shadow table cleanup failed: {e}")
+
+    async def _object_names(self, table: str):
+        indexes = (await self.db.execute(text(_INDEX_NAMES_SQL), {"t": table})).mappings().all()
+        checks = (await self.db.execute(text(_CHECK_NAMES_SQL), {"t": table})).mappings().all()
+        return indexes, checks
+
+    async def _restore_names(self, live_names, shadow_names) -> None:
+        """交换后把新正式表（原影子表）的索引/约束改回旧表的名字，按定义一一配对"""
+        live_indexes, live_checks = live_names
+        shadow_indexes, shadow_checks = shadow_names
+        pending = {}
+        for idx in live_indexes:
+            pending.setdefault((idx["is_unique"], idx["definition"]), []).append(idx)
+        for idx in shadow_indexes:
+            matches = pending.get((idx["is_unique"], idx["definition"]))
+            if not matches:
+                continue
+            original = matches.pop(0)
+            if idx["constraint_name"] and original["constraint_name"]:
+                # 主键/唯一约束：改约束名会连带改其背后的索引名
+                if idx["constraint_name"] != original["constraint_name"]:
+                    await self.db.execute(text(
+                        f'ALTER TABLE {LIVE_TABLE} RENAME CONSTRAINT "{idx["constraint_name"]}" '
+                        f'TO "{original["constraint_name"]}"'))
+            elif idx["name"] != original["name"]:
+                await self.db.execute(text(f'ALTER INDEX "{idx["name"]}" RENAME TO "{original["name"]}"'))
+        originals = {c["definition"]: c["name"] for c in live_checks}
+        for check in shadow_checks:
+            name = originals.pop(check["definition"], None)
+            if name and name != check["name"]:
+                await self.db.execute(text(
+                    f'ALTER TABLE {LIVE_TABLE} RENAME CONSTRAINT "{check["name"]}" TO "{name}"'))
+
+    async def _swap_shadow(self, load_started: datetime) -> None:
+        """一个事务内：并入灌表期间的增量 → 旧表改名 → 影子表改名为正式表 → 删旧表 → 索引/约束改回原名
+
+        持 SYNC_LOCK_KEY 锁进行，增量同步批次要么在此之前提交（被并入），要么等交换完成后写新表。
         """
-        result = await self.db.execute(text(sql), {"limit": limit, "offset": offset})
-        rows = result.mappings().all()
-        return [dict(r) for r in rows]
+        await self._lock_live()
+        await self.db.execute(text(_CATCH_UP_SQL), {"since": load_started})
+        live_names = await self._object_names(LIVE_TABLE)
+        shadow_names = await self._object_names(SHADOW_TABLE)
+        live_seq = (await self.db.execute(
+            text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": LIVE_TABLE})).scalar()
+        shadow_seq = (await self.db.execute(
+            text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": SHADOW_TABLE})).scalar()
+        await self.db.execute(text(f"DROP TABLE IF EXISTS {RETIRED_TABLE}"))
+        await self.db.execute(text(f"ALTER TABLE {LIVE_TABLE} RENAME TO {RETIRED_TABLE}"))
+        await self.db.execute(text(f"ALTER TABLE {SHADOW_TABLE} RENAME TO {LIVE_TABLE}"))
+        if live_seq and not shadow_seq:
+            # SERIAL 主键：影子表与旧表共用序列，删旧表前把序列归属转给新表
+            await self.db.execute(text(f"ALTER SEQUENCE {live_seq} OWNED BY {LIVE_TABLE}.id"))
+        await self.db.execute(text(f"DROP TABLE {RETIRED_TABLE}"))
+        await self._restore_names(live_names, shadow_names)
+        await self.db.commit()
+        await self.db.execute(text(f"ANALYZE {LIVE_TABLE}"))
+        await self.db.commit()
+
+
+def _max_updated_at(rows: List[Dict[str, Any]], current):
+    for row in rows:
+        if row["updated_at"] and (current is None or row["updated_at"] > current):
+            current = row["updated_at"]
+    return current
+
+
+def _rate(count: int, started: float) -> float:
+    elapsed = time.monotonic() - started
+    return round(count / elapsed, 1) if elapsed > 0 else float(count)
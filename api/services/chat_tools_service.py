@@ -11,20 +11,19 @@ Chatbot MES 工具服务（Tool Calling）
 
 from __future__ import annotations
 
-import csv
-import io
+import asyncio
 import json
 import re
 import uuid
 from datetime import datetime, date
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 
 from database.models import (
     WorkOrder, ProductionReport, Station, Equipment, Product,
-    Inventory, DefectRecord, User, Routing, FileRecord, QualityInspection,
+    Inventory, DefectRecord, User, Routing, QualityInspection,
 )
 from core.mes.work_order_coding import (
     generate_master_work_order_code,
@@ -381,18 +380,23 @@ TOOL_DEFINITIONS: List[Dict[str, Any]] = [
         "type": "function",
         "function": {
             "name": "export_report_file",
-            "description": "把生产汇总或工单表单导出为文件（JSON/CSV），写入系统文件表并返回下载链接。用于「导出报告/生成报表」类请求。",
+            "description": "把生产汇总或工单表单导出为文件（JSON/CSV/XLSX），写入系统文件表并返回下载链接；工单明细/报工明细/标准工时表等大报表在后台导出，返回任务进度地址。用于「导出报告/生成报表」类请求。",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "report_type": {
                         "type": "string",
-                        "enum": ["production_summary", "work_order"],
-                        "description": "报告类型：production_summary生产汇总（默认）/ work_order工单表单",
+                        "enum": ["production_summary", "work_order", "work_orders", "production_reports", "standard_times"],
+                        "description": "报告类型：production_summary生产汇总（默认）/ work_order单个工单表单 / "
+                                       "work_orders工单明细 / production_reports报工明细 / standard_times标准工时表（后三者为后台导出）",
                         "default": "production_summary",
                     },
                     "work_order_code": {"type": "string", "description": "工单号（report_type=work_order 时必填）"},
-                    "format": {"type": "string", "enum": ["json", "csv"], "description": "文件格式，默认json", "default": "json"},
+                    "format": {"type": "string", "enum": ["json", "csv", "xlsx"], "description": "文件格式，默认json（后台导出仅 csv/xlsx）", "default": "json"},
+                    "params": {
+                        "type": "object",
+                        "description": "后台导出的过滤条件：status / station_id / product_id / date_from / date_to（YYYY-MM-DD）",
+                    },
                 },
             },
         },
@@ -1294,42 +1298,48 @@ async def _tool_get_inspection_form(db: AsyncSession, args: Dict[str, Any], fact
     return {"count": len(items), "inspections": items}
 
 
-def _to_csv(rows: Any) -> str:
-    """把平坦 dict 或 dict 列表转为 CSV 文本（嵌套值 JSON 编码）。"""
+def _table_rows(rows: Any) -> Tuple[List[str], List[List[Any]]]:
+    """把平坦 dict 或 dict 列表转为 (表头, 行)，列按首次出现顺序合并。"""
     if isinstance(rows, dict):
         rows = [rows]
-    if not rows:
-        return ""
     keys: List[str] = []
-    for r in rows:
+    for r in rows or []:
         for k in r.keys():
             if k not in keys:
                 keys.append(k)
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(keys)
-    for r in rows:
-        out = []
-        for k in keys:
-            v = r.get(k)
-            if isinstance(v, (dict, list)):
-                v = json.dumps(v, ensure_ascii=False, default=str)
-            out.append(v)
-        writer.writerow(out)
-    return buf.getvalue()
+    return keys, [[r.get(k) for k in keys] for r in rows or []]
 
 
 async def _tool_export_report_file(db: AsyncSession, args: Dict[str, Any], operator: str) -> Dict[str, Any]:
-    """把生产汇总/工单表单导出为文件（JSON/CSV），写入 files 表并返回下载链接。"""
-    from api.routes.file_routes import UPLOAD_DIR  # 懒加载，复用落盘目录
+    """把生产汇总/工单表单导出为文件（JSON/CSV/XLSX），写入 files 表并返回下载链接；
+    工单/报工明细、标准工时表等大报表提交后台导出任务，返回任务进度查询地址。"""
+    from api.services.export_job_service import (
+        EXPORT_SOURCES, ExportError, ExportJobService, save_rows_file, temp_export_path,
+    )
+    from api.services.file_storage_service import FileStorageService
 
     report_type = args.get("report_type") or "production_summary"
     fmt = (args.get("format") or "json").lower()
-    if fmt not in ("json", "csv"):
+    if fmt not in ("json", "csv", "xlsx"):
         fmt = "json"
     user = await _get_user_by_name(db, operator)
     factory_id = user.factory_id if user else None
 
+    if report_type in EXPORT_SOURCES:
+        try:
+            job = await ExportJobService(db).submit(
+                report_type, "csv" if fmt == "csv" else "xlsx", args.get("params") or {}, operator, factory_id,
+            )
+        except ExportError as e:
+            return {"error": str(e)}
+        return {
+            "success": True,
+            "message": f"{EXPORT_SOURCES[report_type].title}导出已在后台开始，完成后可在任务中下载",
+            "job_id": job.id,
+            "status_url": f"/api/v1/exports/{job.id}",
+            "format": job.format,
+        }
+
     if report_type == "work_order":
         ref = args.get("work_order_code") or ""
         wo = await _resolve_work_order(db, ref, factory_id)
@@ -1341,50 +1351,38 @@ async def _tool_export_report_file(db: AsyncSession, args: Dict[str, Any], opera
             "children": await svc.get_children_detail(wo.id),
             "status_logs": await svc.get_status_logs(wo.id),
         }
-        csv_rows = data["work_order"]
+        table_rows = data["work_order"]
         filename_base = f"work_order_{wo.work_order_code}"
         related_type, related_id = "work_order", wo.id
     else:
         data = await _tool_get_production_summary(db, {}, factory_id)
-        csv_rows = data
+        table_rows = data
         filename_base = f"production_summary_{date.today().strftime('%Y%m%d')}"
         related_type, related_id = "report", "production_summary"
 
     ts = datetime.now().strftime("%Y%m%d%H%M%S")
-    if fmt == "csv":
-        content = _to_csv(csv_rows)
-        ext, content_type = "csv", "text/csv"
+    filename = f"{filename_base}_{ts}.{fmt}"
+    if fmt == "json":
+        content = json.dumps(data, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+        path = temp_export_path("json")
+        await asyncio.to_thread(path.write_bytes, content)
+        record = await FileStorageService(db).save_file(
+            path, filename, "application/json", operator, factory_id, related_type, related_id,
+        )
     else:
-        content = json.dumps(data, ensure_ascii=False, indent=2, default=str)
-        ext, content_type = "json", "application/json"
-
-    file_id = str(uuid.uuid4())
-    filename = f"{filename_base}_{ts}.{ext}"
-    storage_path = UPLOAD_DIR / f"{file_id}_{filename}"
-    storage_path.write_text(content, encoding="utf-8")
-
-    record = FileRecord(
-        id=file_id,
-        filename=filename,
-        content_type=content_type,
-        size=len(content.encode("utf-8")),
-        storage_path=str(storage_path),
-        uploaded_by=operator,
-        factory_id=factory_id,
-        related_type=related_type,
-        related_id=related_id,
-    )
-    db.add(record)
-    await db.commit()
+        headers, values = _table_rows(table_rows)
+        record = await save_rows_file(
+            db, headers, values, fmt, filename, operator, factory_id, related_type, related_id,
+        )
 
     return {
         "success": True,
         "message": f"报告已导出：{filename}",
-        "file_id": file_id,
+        "file_id": record.id,
         "filename": filename,
-        "download_url": f"/api/v1/files/{file_id}",
+        "download_url": f"/api/v1/files/{record.id}",
         "format": fmt,
-        "size": len(content.encode("utf-8")),
+        "size": record.size,
     }
 
 
@@ -2207,7 +2205,10 @@ def resolve_intent(message: str) -> Optional[Dict[str, Any]]:
             args["work_order_code"] = wo_code
         else:
             args["report_type"] = "production_summary"
-        args["format"] = "csv" if any(k in message for k in ["csv", "CSV", "表格"]) else "json"
+        if any(k in message for k in ["excel", "Excel", "EXCEL", "xlsx"]):
+            args["format"] = "xlsx"
+        else:
+            args["format"] = "csv" if any(k in message for k in ["csv", "CSV", "表格"]) else "json"
     elif tool == "query_process_knowledge":
         # 轻量提取 topic 与 keyword：
         # 1) 责任归属类："该找谁/谁负责/卡在/超时找谁" → who_handles + 阶段关键词
@@ -13,6 +13,7 @@ from database.models import (
     ProductionReport, WorkOrder, Station, Equipment,
     ShiftSummary, ProductionAlert, HourlyOutputSnapshot,
 )
+from api.services.report_rollup_service import rollup_today
 
 
 def _gen_id() -> str:
@@ -27,7 +28,7 @@ class DashboardService:
 
     async def get_live_dashboard(self, factory_id: str) -> Dict[str, Any]:
         """实时看板主数据"""
-        today = date.today()
+        today = rollup_today()
 
         # 今日产出汇总
         stmt = select(
@@ -96,8 +97,8 @@ class DashboardService:
         }
 
     async def get_hourly_trend(self, factory_id: str, target_date: Optional[str] = None) -> Dict[str, Any]:
-        """小时产出趋势（今日 vs 昨日）"""
-        today = date.fromisoformat(target_date) if target_date else date.today()
+        """小时产出趋势（今日 vs 昨日，小时快照按 UTC 日期分桶）"""
+        today = date.fromisoformat(target_date) if target_date else rollup_today()
         yesterday = today - timedelta(days=1)
 
         async def _get_hourly(d: date) -> List[Dict]:
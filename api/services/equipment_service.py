@@ -13,6 +13,7 @@ from database.models import (
     Equipment, EquipmentDowntime, MaintenanceOrder, MaintenancePlan,
     ProductionReport,
 )
+from api.services.oee_service import on_downtime_event
 
 logger = logging.getLogger(__name__)
 
@@ -62,6 +63,7 @@ class EquipmentTpmService:
             eq.updated_at = datetime.utcnow()
 
         await self.db.commit()
+        on_downtime_event(factory_id, equipment_id, record.id, start_time, end_time)
         return {"success": True, "downtime_id": record.id}
 
     async def end_downtime(self, downtime_id: str) -> Dict[str, Any]:
@@ -79,6 +81,8 @@ class EquipmentTpmService:
             eq.updated_at = datetime.utcnow()
 
         await self.db.commit()
+        on_downtime_event(record.factory_id, record.equipment_id, record.id,
+                          record.start_time, record.end_time)
         return {"success": True, "duration_minutes": record.duration_minutes}
 
     # ============== OEE 计算 ==============
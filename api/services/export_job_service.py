@@ -0,0 +1,548 @@
+"""
+Export Job Service - 大报表流式导出（CSV/XLSX）
+=============================================
+- 查询走服务端游标（stream + yield_per）按批取行，批次在线程里追加写盘：
+  CSV 用 csv.writer，XLSX 用 openpyxl write_only（超过单表行数上限自动续到新工作表），
+  内存占用与导出行数无关
+- 导出作为后台任务执行：export_jobs 记录状态与进度，完成后文件归档到内容寻址存储并登记 FileRecord
+- 读游标与写进度用两个会话，提交进度不会打断游标所在事务
+- 租约：认领任务用条件 UPDATE（pending → running，多实例只有一个执行），执行中另起会话定时刷新
+  heartbeat_at；启动时及之后定期把心跳过期的 running 任务重新排队（attempts 达上限记为失败），
+  并接手没有执行者的 pending 任务
+"""
+
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import ExportJob
+from api.services.file_storage_service import PARTIAL_DIR, FileStorageService
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))           # 游标每批行数
+EXPORT_MAX_CONCURRENCY = int(os.getenv("EXPORT_MAX_CONCURRENCY", "2"))    # 同时执行的导出任务数
+PROGRESS_INTERVAL_SECONDS = 1.0                                             # 进度落库最小间隔
+EXPORT_LEASE_SECONDS = int(os.getenv("EXPORT_LEASE_SECONDS", "300"))      # 心跳超过该时长未刷新视为执行进程已死
+EXPORT_HEARTBEAT_SECONDS = max(1, EXPORT_LEASE_SECONDS // 5)               # 心跳间隔
+EXPORT_MAX_ATTEMPTS = int(os.getenv("EXPORT_MAX_ATTEMPTS", "3"))          # 进程中断后最多执行几次
+XLSX_MAX_ROWS = 1_048_576 - 1                                               # 单个工作表数据行上限（扣表头）
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+_ILLEGAL_XLSX_CHARS = re.compile(r"[\000-\010]|[\013-\014]|[\016-\037]")
+_SHEET_NAME_CHARS = re.compile(r"[\[\]:*?/\\]")
+
+
+@dataclass(frozen=True)
+class ExportSource:
+    """导出数据源：列定义即 SELECT 列表（SQL 表达式, 表头）"""
+    title: str
+    from_sql: str
+    columns: Tuple[Tuple[str, str], ...]
+    order_by: str
+    factory_column: str = "factory_id"
+    where: Tuple[str, ...] = ()
+    filters: Dict[str, str] = field(default_factory=dict)   # 参数名 → 追加条件（参数非空时生效）
+
+
+EXPORT_SOURCES: Dict[str, ExportSource] = {
+    "work_orders": ExportSource(
+        title="工单明细",
+        from_sql="work_orders",
+        columns=(
+            ("work_order_code", "工单号"),
+            ("wo_type", "工单类型"),
+            ("product_id", "产品"),
+            ("status", "状态"),
+            ("priority", "优先级"),
+            ("planned_qty", "计划数量"),
+            ("completed_qty", "完工数量"),
+            ("good_qty", "良品数"),
+            ("defect_qty", "不良数"),
+            ("scrap_qty", "报废数"),
+            ("planned_start", "计划开始"),
+            ("planned_due", "计划完成"),
+            ("actual_start", "实际开始"),
+            ("actual_complete", "实际完成"),
+            ("created_at", "创建时间"),
+        ),
+        order_by="created_at, id",
+        filters={
+            "status": "status = :status",
+            "date_from": "created_at >= :date_from",
+            "date_to": "created_at < :date_to",
+        },
+    ),
+    "production_reports": ExportSource(
+        title="报工明细",
+        from_sql="production_reports pr LEFT JOIN work_orders wo ON wo.id = pr.work_order_id",
+        columns=(
+            ("pr.report_code", "报工单号"),
+            ("wo.work_order_code", "工单号"),
+            ("pr.station_id", "工位"),
+            ("pr.operation_seq", "工序号"),
+            ("pr.operation_name", "工序名称"),
+            ("pr.shift", "班次"),
+            ("pr.operator_id", "操作人"),
+            ("pr.good_qty", "良品数"),
+            ("pr.defect_qty", "不良数"),
+            ("pr.scrap_qty", "报废数"),
+            ("pr.cycle_time_sec", "节拍(秒)"),
+            ("pr.start_time", "开始时间"),
+            ("pr.end_time", "结束时间"),
+            ("pr.created_at", "报工时间"),
+        ),
+        order_by="pr.created_at, pr.id",
+        factory_column="pr.factory_id",
+        where=("pr.is_undone IS NOT TRUE",),
+        filters={
+            "station_id": "pr.station_id = :station_id",
+            "date_from": "pr.created_at >= :date_from",
+            "date_to": "pr.created_at < :date_to",
+        },
+    ),
+    "standard_times": ExportSource(
+        title="标准工时表",
+        from_sql="standard_operation_times",
+        columns=(
+            ("product_id", "产品"),
+            ("routing_step", "工艺步骤"),
+            ("operation_seq", "工序号"),
+            ("operation_name", "工序名称"),
+            ("station_id", "工位编号"),
+            ("work_center", "加工中心"),
+            ("standard_time_min", "标准工时(min)"),
+            ("effective_standard_time", "有效标准时间(min)"),
+            ("setup_time_min", "设定时间(min)"),
+            ("batch_size", "批量大小"),
+            ("rating_factor", "评定系数"),
+            ("allowance_rate * 100", "宽放率(%)"),
+            ("version", "版本号"),
+            ("validity_start", "生效日期"),
+            ("validity_end", "失效日期"),
+        ),
+        order_by="product_id, operation_seq, routing_step, id",
+        where=("is_active = TRUE", "(validity_end IS NULL OR validity_end > :now)"),
+        filters={"product_id": "product_id = :product_id"},
+    ),
+}
+
+
+class ExportError(ValueError):
+    """导出类型/格式/参数不合法"""
+
+
+def build_query(source: ExportSource, factory_id: Optional[str], params: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+    """返回 (SELECT 语句, COUNT 语句, 绑定参数)"""
+    conditions = list(source.where)
+    binds: Dict[str, Any] = {}
+    if ":now" in " ".join(conditions):
+        binds["now"] = datetime.utcnow()
+    if factory_id:
+        conditions.append(f"{source.factory_column} = :factory_id")
+        binds["factory_id"] = factory_id
+    for name, condition in source.filters.items():
+        value = params.get(name)
+        if value is None or value == "":
+            continue
+        conditions.append(condition)
+        binds[name] = _coerce_param(name, value)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    select_list = ", ".join(expr for expr, _ in source.columns)
+    return (
+        f"SELECT {select_list} FROM {source.from_sql}{where} ORDER BY {source.order_by}",
+        f"SELECT COUNT(*) FROM {source.from_sql}{where}",
+        binds,
+    )
+
+
+def _coerce_param(name: str, value: Any) -> Any:
+    """日期区间参数转 datetime；date_to 只给日期时含当天"""
+    if name not in ("date_from", "date_to") or isinstance(value, datetime):
+        return value
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ExportError(f"日期格式错误：{name}={value}")
+    if name == "date_to" and len(str(value)) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+# ---------- 文件写入（同步，在线程里调用） ----------
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _xlsx_cell(value: Any) -> Any:
+    value = _cell(value)
+    if isinstance(value, str):
+        return _ILLEGAL_XLSX_CHARS.sub("", value)
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)   # Excel 不支持带时区的时间
+    return value
+
+
+class _CsvWriter:
+    def __init__(self, path: Path, headers: Sequence[str], title: str):
+        # utf-8-sig：Excel 直接打开中文不乱码
+        self._fh = open(path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._fh)
+        self._writer.writerow(headers)
+
+    def write(self, rows) -> None:
+        self._writer.writerows([_cell(v) for v in row] for row in rows)
+
+    def close(self, save: bool = True) -> None:
+        self._fh.close()
+
+
+class _XlsxWriter:
+    def __init__(self, path: Path, headers: Sequence[str], title: str):
+        from openpyxl import Workbook
+        self._path = path
+        self._headers = list(headers)
+        self._title = _SHEET_NAME_CHARS.sub("_", title)[:28] or "Sheet"
+        self._wb = Workbook(write_only=True)
+        self._ws = None
+        self._sheets = 0
+        self._rows = 0
+
+    def _next_sheet(self) -> None:
+        self._sheets += 1
+        name = self._title if self._sheets == 1 else f"{self._title}_{self._sheets}"
+        self._ws = self._wb.create_sheet(name)
+        self._ws.append(self._headers)
+        self._rows = 0
+
+    def write(self, rows) -> None:
+        for row in rows:
+            if self._ws is None or self._rows >= XLSX_MAX_ROWS:
+                self._next_sheet()
+            self._ws.append([_xlsx_cell(v) for v in row])
+            self._rows += 1
+
+    def close(self, save: bool = True) -> None:
+        if not save:
+            return
+        if self._ws is None:
+            self._next_sheet()
+        self._wb.save(self._path)
+
+
+def open_writer(fmt: str, path: Path, headers: Sequence[str], title: str):
+    if fmt == "csv":
+        return _CsvWriter(path, headers, title)
+    if fmt == "xlsx":
+        return _XlsxWriter(path, headers, title)
+    raise ExportError(f"不支持的导出格式：{fmt}")
+
+
+def temp_export_path(fmt: str, name: Optional[str] = None) -> Path:
+    """导出临时文件；后台任务按任务 ID 命名，进程中断后恢复时能找到并清理"""
+    PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+    return PARTIAL_DIR / f"export-{name or uuid.uuid4().hex}.{fmt}"
+
+
+def export_filename(title: str, fmt: str) -> str:
+    return f"{title}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+
+
+async def save_rows_file(
+    db: AsyncSession,
+    headers: Sequence[str],
+    rows: List[Sequence[Any]],
+    fmt: str,
+    filename: str,
+    uploaded_by: Optional[str],
+    factory_id: Optional[str],
+    related_type: Optional[str] = None,
+    related_id: Optional[str] = None,
+):
+    """已在内存里的小数据集（表单/汇总）写成 CSV/XLSX 并登记 FileRecord"""
+    path = temp_export_path(fmt)
+    title = filename.rsplit(".", 1)[0]
+
+    def _write() -> None:
+        writer = open_writer(fmt, path, headers, title)
+        try:
+            writer.write(rows)
+        except BaseException:
+            writer.close(save=False)
+            path.unlink(missing_ok=True)
+            raise
+        writer.close()
+
+    await asyncio.to_thread(_write)
+    return await FileStorageService(db).save_file(
+        path, filename, EXPORT_FORMATS[fmt], uploaded_by, factory_id, related_type, related_id,
+    )
+
+
+async def stream_to_file(
+    session_factory,
+    source: ExportSource,
+    fmt: str,
+    factory_id: Optional[str],
+    params: Dict[str, Any],
+    path: Path,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> int:
+    """服务端游标按批读取并写入 path，返回写入行数"""
+    sql, _, binds = build_query(source, factory_id, params)
+    headers = [label for _, label in source.columns]
+    writer = await asyncio.to_thread(open_writer, fmt, path, headers, source.title)
+    written = 0
+    saved = False
+    try:
+        async with session_factory() as reader:
+            result = await reader.stream(
+                text(sql), binds, execution_options={"yield_per": EXPORT_BATCH_SIZE},
+            )
+            async for batch in result.partitions(EXPORT_BATCH_SIZE):
+                await asyncio.to_thread(writer.write, batch)
+                written += len(batch)
+                if on_progress is not None:
+                    await on_progress(written)
+        saved = True
+    finally:
+        await asyncio.to_thread(writer.close, saved)
+    return written
+
+
+# ---------- 后台任务 ----------
+
+_job_tasks: Dict[str, asyncio.Task] = {}
+_job_slots: Optional[asyncio.Semaphore] = None
+
+
+def _slots() -> asyncio.Semaphore:
+    global _job_slots
+    if _job_slots is None:
+        _job_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENCY)
+    return _job_slots
+
+
+def start_export_job(job_id: str, session_factory=None) -> asyncio.Task:
+    task = asyncio.create_task(run_export_job(job_id, session_factory))
+    _job_tasks[job_id] = task
+    task.add_done_callback(lambda _: _job_tasks.pop(job_id, None))
+    return task
+
+
+async def run_export_job(job_id: str, session_factory=None) -> None:
+    """认领并执行一个待处理的导出任务；失败时记录错误并清理临时文件"""
+    if session_factory is None:
+        from database.db_config import db_config
+        session_factory = db_config.session_factory
+    async with _slots():
+        async with session_factory() as db:
+            now = datetime.utcnow()
+            claimed = await db.execute(
+                update(ExportJob)
+                .where(ExportJob.id == job_id, ExportJob.status == "pending")
+                .values(status="running", started_at=now, heartbeat_at=now,
+                        attempts=func.coalesce(ExportJob.attempts, 0) + 1)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            if claimed.rowcount != 1:
+                return  # 不存在或已被其他执行者认领
+            job = await db.get(ExportJob, job_id)
+            source = EXPORT_SOURCES[job.export_type]
+            params = job.params or {}
+            heartbeat = asyncio.create_task(_heartbeat(session_factory, job_id))
+
+            path = temp_export_path(job.format, f"job-{job.id}")
+            last_flush = time.monotonic()
+            # SQLite 读游标持有共享锁，期间无法提交，进度只在结束时落库
+            live_progress = db.bind.dialect.name != "sqlite"
+
+            async def progress(rows: int) -> None:
+                nonlocal last_flush
+                if live_progress and time.monotonic() - last_flush >= PROGRESS_INTERVAL_SECONDS:
+                    last_flush = time.monotonic()
+                    job.rows_written = rows
+                    await db.commit()
+
+            try:
+                _, count_sql, binds = build_query(source, job.factory_id, params)
+                job.total_rows = (await db.execute(text(count_sql), binds)).scalar() or 0
+                await db.commit()
+                job.rows_written = await stream_to_file(
+                    session_factory, source, job.format, job.factory_id, params, path, progress,
+                )
+                record = await FileStorageService(db).save_file(
+                    path, export_filename(source.title, job.format), EXPORT_FORMATS[job.format],
+                    job.requested_by, job.factory_id, "export", job.id,
+                )
+                job.file_id = record.id
+                job.status = "success"
+                logger.info(f"Export {job.id} ({job.export_type}/{job.format}) done: {job.rows_written} rows")
+            except Exception as e:  # noqa: BLE001  任务失败记入 export_jobs，不向外抛
+                logger.exception(f"Export {job_id} failed")
+                await db.rollback()
+                await asyncio.to_thread(path.unlink, True)
+                job = await db.get(ExportJob, job_id)
+                job.status = "failed"
+                job.error_message = str(e)[:1000]
+            finally:
+                heartbeat.cancel()
+            job.finished_at = datetime.utcnow()
+            await db.commit()
+
+
+async def _heartbeat(session_factory, job_id: str) -> None:
+    """执行期间定时刷新 heartbeat_at（独立会话，不受读游标事务影响）"""
+    while True:
+        await asyncio.sleep(EXPORT_HEARTBEAT_SECONDS)
+        try:
+            async with session_factory() as db:
+                await db.execute(
+                    update(ExportJob)
+                    .where(ExportJob.id == job_id, ExportJob.status == "running")
+                    .values(heartbeat_at=datetime.utcnow())
+                )
+                await db.commit()
+        except Exception as e:  # noqa: BLE001  心跳失败只记日志，过期后由恢复逻辑接手
+            logger.warning(f"Export {job_id} heartbeat failed: {e}")
+
+
+async def recover_export_jobs(session_factory=None, startup: bool = False) -> Dict[str, int]:
+    """接手执行者已死的导出任务
+
+    - 心跳过期的 running：attempts 未达 EXPORT_MAX_ATTEMPTS 重新排队，否则记为失败；清理其临时文件
+    - 本进程未在执行的 pending（启动时全部，之后只看提交超过一个租约期的）：重新启动
+    """
+    if session_factory is None:
+        from database.db_config import db_config
+        session_factory = db_config.session_factory
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=EXPORT_LEASE_SECONDS)
+    stale = [
+        ExportJob.status == "running",
+        func.coalesce(ExportJob.heartbeat_at, ExportJob.started_at, ExportJob.created_at) < cutoff,
+    ]
+    async with session_factory() as db:
+        dead = (await db.execute(select(ExportJob.id, ExportJob.format).where(*stale))).all()
+        failed = await db.execute(
+            update(ExportJob)
+            .where(*stale, ExportJob.attempts >= EXPORT_MAX_ATTEMPTS)
+            .values(status="failed", finished_at=now,
+                    error_message=f"导出进程中断，已执行 {EXPORT_MAX_ATTEMPTS} 次仍未完成")
+            .execution_options(synchronize_session=False)
+        )
+        requeued = await db.execute(
+            update(ExportJob)
+            .where(*stale)
+            .values(status="pending", rows_written=0, total_rows=None, heartbeat_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        pending = (await db.execute(
+            select(ExportJob.id)
+            .where(ExportJob.status == "pending", ExportJob.created_at <= (now if startup else cutoff))
+            .order_by(ExportJob.created_at)
+        )).scalars().all()
+
+    for job_id, fmt in dead:
+        await asyncio.to_thread((PARTIAL_DIR / f"export-job-{job_id}.{fmt}").unlink, True)
+    started = 0
+    for job_id in pending:
+        if job_id not in _job_tasks:
+            start_export_job(job_id, session_factory)
+            started += 1
+    result = {"failed": failed.rowcount, "requeued": requeued.rowcount, "started": started}
+    if any(result.values()):
+        logger.info(f"Export jobs recovered: {result}")
+    return result
+
+
+async def export_recovery_loop() -> None:
+    """导出任务恢复循环（main.py startup 启动，EXPORT_RECOVERY_ENABLED=0 可关）：启动时接手遗留任务，之后每个租约期巡检一次"""
+    if os.getenv("EXPORT_RECOVERY_ENABLED", "1").strip().lower() in {"0", "false", "no", "off"}:
+        logger.info("Export job recovery disabled (EXPORT_RECOVERY_ENABLED=0)")
+        return
+    startup = True
+    while True:
+        try:
+            await recover_export_jobs(startup=startup)
+            startup = False
+        except Exception as e:  # noqa: BLE001
+            logger.warning(f"Export job recovery error: {e}")
+        await asyncio.sleep(EXPORT_LEASE_SECONDS)
+
+
+class ExportJobService:
+    """报表导出任务：提交 / 查询"""
+
+    def __init__(self, db: AsyncSession, session_factory=None):
+        self.db = db
+        self.session_factory = session_factory
+
+    async def submit(
+        self,
+        export_type: str,
+        fmt: str,
+        params: Optional[Dict[str, Any]],
+        requested_by: Optional[str],
+        factory_id: Optional[str],
+    ) -> ExportJob:
+        """校验后建任务并在后台开始执行，立即返回（status=pending）"""
+        source = EXPORT_SOURCES.get(export_type)
+        if source is None:
+            raise ExportError(f"未知的导出类型：{export_type}（可选 {', '.join(EXPORT_SOURCES)}）")
+        fmt = (fmt or "xlsx").lower()
+        if fmt not in EXPORT_FORMATS:
+            raise ExportError(f"不支持的导出格式：{fmt}（可选 {', '.join(EXPORT_FORMATS)}）")
+        params = {k: v for k, v in (params or {}).items() if k in source.filters}
+        build_query(source, factory_id, params)   # 提前校验参数格式
+        job = ExportJob(
+            id=str(uuid.uuid4()),
+            export_type=export_type,
+            format=fmt,
+            params=params,
+            status="pending",
+            rows_written=0,
+            requested_by=requested_by,
+            factory_id=factory_id,
+        )
+        self.db.add(job)
+        await self.db.commit()
+        start_export_job(job.id, self.session_factory)
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[ExportJob]:
+        return (await self.db.execute(
+            select(ExportJob).where(ExportJob.id == job_id)
+        )).scalar_one_or_none()
+
+    async def list_jobs(self, requested_by: Optional[str], limit: int = 20) -> List[ExportJob]:
+        stmt = select(ExportJob).order_by(ExportJob.created_at.desc()).limit(limit)
+        if requested_by:
+            stmt = stmt.where(ExportJob.requested_by == requested_by)
+        return list((await self.db.execute(stmt)).scalars().all())
@@ -0,0 +1,360 @@
+"""
+File Storage Service - 附件内容寻址存储
+=============================================
+- 按 SHA-256 内容寻址落盘：UPLOAD_DIR/sha256/ab/cd/<digest>，相同内容只存一份，
+  每次上传仍各自一条 FileRecord（文件名/关联对象不同）
+- 流式写入：直接从请求体边收边解析 multipart，文件部分分块写盘（不先落 UploadFile 临时文件），
+  写盘与哈希放到线程里做，不阻塞事件循环；按已接收字节数边收边校验大小上限
+- 断点续传：先建上传会话，按偏移写入分块（同一偏移重发幂等），完成时计算哈希并归档
+- 服务端生成的文件（报表导出）写到 PARTIAL_DIR 后同样归档登记
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+from multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import FileRecord, FileUploadSession
+
+logger = logging.getLogger(__name__)
+
+# 落盘目录：容器内 /app/uploads，本地 项目根/uploads
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", str(Path(__file__).resolve().parents[2] / "uploads")))
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+# 上传大小上限（默认 100MB），支持视频文件
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))
+
+CHUNK_SIZE = 1024 * 1024                 # 流式读写块大小
+MULTIPART_OVERHEAD = 64 * 1024           # multipart 边界与普通字段的余量（请求体上限 = 文件上限 + 余量）
+UPLOAD_SESSION_TTL = timedelta(hours=int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24")))  # 续传会话保留时长
+
+BLOB_DIR = UPLOAD_DIR / "sha256"
+PARTIAL_DIR = UPLOAD_DIR / "partial"
+
+
+class UploadTooLarge(Exception):
+    """上传超过 MAX_UPLOAD_SIZE"""
+
+
+class UploadOffsetMismatch(Exception):
+    """续传分块偏移超出已接收长度（中间有缺口）"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"偏移不连续，已接收 {offset} 字节")
+        self.offset = offset
+
+
+@dataclass
+class StoredBlob:
+    sha256: str
+    size: int
+    path: Path
+
+
+def blob_path(digest: str) -> Path:
+    return BLOB_DIR / digest[:2] / digest[2:4] / digest
+
+
+class MultipartUpload:
+    """边收边解析 multipart/form-data 请求体
+
+    file_chunks() 读请求体、按累计字节数校验上限，并把文件字段的数据按块交出；
+    其余字段收进 fields。文件名、关联字段在 file_chunks() 读完后可用（字段顺序不限）。
+    """
+
+    def __init__(self, content_type: str, body: AsyncIterator[bytes], file_field: str = "file"):
+        ctype, params = parse_options_header(content_type or "")
+        if ctype != b"multipart/form-data" or not params.get(b"boundary"):
+            raise ValueError("请求体须为 multipart/form-data")
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._body = body
+        self._file_field = file_field
+        self._pending: List[bytes] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._in_file = False
+        self._field_name: Optional[str] = None
+        self._field_value = bytearray()
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    async def file_chunks(self) -> AsyncIterator[bytes]:
+        limit = MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+        received = 0
+        async for chunk in self._body:
+            received += len(chunk)
+            if received > limit:
+                raise UploadTooLarge(f"文件过大（上限 {MAX_UPLOAD_SIZE // 1024 // 1024}MB）")
+            self._parser.write(chunk)
+            pending, self._pending = self._pending, []
+            for piece in pending:
+                yield piece
+        self._parser.finalize()
+        if self.filename is None:
+            raise ValueError(f"缺少文件字段 {self._file_field}")
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._in_file = False
+        self._field_name = None
+        self._field_value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name == self._file_field and b"filename" in options and self.filename is None:
+            self._in_file = True
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+        else:
+            self._field_name = name
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if start == end:
+            return
+        if self._in_file:
+            self._pending.append(bytes(data[start:end]))
+        elif self._field_name is not None:
+            self._field_value += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if not self._in_file and self._field_name:
+            self.fields[self._field_name] = self._field_value.decode("utf-8", "replace")
+
+
+async def store_stream(chunks: AsyncIterator[bytes], max_size: Optional[int] = None) -> StoredBlob:
+    """流式写入临时文件并同时算 SHA-256，超限即中止；完成后归档到内容地址（已存在则复用）"""
+    limit = MAX_UPLOAD_SIZE if max_size is None else max_size
+    PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = PARTIAL_DIR / f"stream-{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    size = 0
+    fh = await asyncio.to_thread(open, tmp, "wb")
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > limit:
+                raise UploadTooLarge(f"文件过大（上限 {limit // 1024 // 1024}MB）")
+            await asyncio.to_thread(_write_and_hash, fh, digest, chunk)
+        await asyncio.to_thread(fh.close)
+        return await asyncio.to_thread(_promote, tmp, digest.hexdigest(), size)
+    except BaseException:
+        await asyncio.to_thread(_discard, fh, tmp)
+        raise
+
+
+def _write_and_hash(fh, digest, chunk: bytes) -> None:
+    fh.write(chunk)
+    digest.update(chunk)
+
+
+def _discard(fh, path: Path) -> None:
+    fh.close()
+    path.unlink(missing_ok=True)
+
+
+def _promote(tmp: Path, digest: str, size: int) -> StoredBlob:
+    """临时文件归档到内容地址；同内容已存在则丢弃临时文件"""
+    target = blob_path(digest)
+    if target.is_file():
+        tmp.unlink(missing_ok=True)
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, target)
+    return StoredBlob(sha256=digest, size=size, path=target)
+
+
+def store_local_file(path: Path) -> StoredBlob:
+    """本地生成的文件（导出报表等）计算哈希后归档到内容地址；同步函数，需在线程里调用"""
+    return _promote(path, _hash_file(path), path.stat().st_size)
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _pwrite_at(path: Path, offset: int, chunk: bytes) -> int:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        written = 0
+        while written < len(chunk):
+            written += os.pwrite(fd, chunk[written:], offset + written)
+        return offset + written
+    finally:
+        os.close(fd)
+
+
+def _file_size(path: Path) -> int:
+    return path.stat().st_size if path.is_file() else 0
+
+
+class FileStorageService:
+    """附件存储：直传与断点续传两种入口，最终都落到内容地址 + FileRecord"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def save_upload(
+        self,
+        upload: MultipartUpload,
+        uploaded_by: Optional[str],
+        factory_id: Optional[str],
+    ) -> FileRecord:
+        """直传：请求体边收边落盘后写 FileRecord（文件名清洗路径分隔符，原名只存库，实体按内容哈希落盘）"""
+        blob = await store_stream(upload.file_chunks())
+        filename = (upload.filename or "file").replace("/", "_").replace("\\", "_")
+        return await self._record(blob, filename, upload.content_type, uploaded_by, factory_id,
+                                  upload.fields.get("related_type"), upload.fields.get("related_id"))
+
+    async def save_file(
+        self,
+        path: Path,
+        filename: str,
+        content_type: Optional[str],
+        uploaded_by: Optional[str],
+        factory_id: Optional[str],
+        related_type: Optional[str] = None,
+        related_id: Optional[str] = None,
+    ) -> FileRecord:
+        """服务端生成的文件：归档（移走 path）后写 FileRecord"""
+        blob = await asyncio.to_thread(store_local_file, path)
+        return await self._record(blob, filename, content_type, uploaded_by, factory_id, related_type, related_id)
+
+    # ---------- 断点续传 ----------
+
+    async def create_session(
+        self,
+        filename: str,
+        content_type: Optional[str],
+        total_size: Optional[int],
+        uploaded_by: Optional[str],
+        factory_id: Optional[str],
+        related_type: Optional[str] = None,
+        related_id: Optional[str] = None,
+    ) -> FileUploadSession:
+        if total_size is not None and total_size > MAX_UPLOAD_SIZE:
+            raise UploadTooLarge(f"文件过大（上限 {MAX_UPLOAD_SIZE // 1024 // 1024}MB）")
+        await self.purge_stale_sessions()
+        session = FileUploadSession(
+            id=str(uuid.uuid4()),
+            filename=filename,
+            content_type=content_type,
+            total_size=total_size,
+            uploaded_by=uploaded_by,
+            factory_id=factory_id,
+            related_type=related_type,
+            related_id=related_id,
+        )
+        self.db.add(session)
+        await self.db.commit()
+        return session
+
+    async def get_session(self, session_id: str) -> Optional[FileUploadSession]:
+        return (await self.db.execute(
+            select(FileUploadSession).where(FileUploadSession.id == session_id)
+        )).scalar_one_or_none()
+
+    async def received(self, session: FileUploadSession) -> int:
+        """已接收字节数（以磁盘上的分片文件为准）"""
+        return await asyncio.to_thread(_file_size, PARTIAL_DIR / session.id)
+
+    async def append_chunks(self, session: FileUploadSession, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """从 offset 起写入分块，返回写入后的已接收长度
+
+        offset 可以小于已接收长度（客户端重发），但不能越过它留下缺口。
+        """
+        path = PARTIAL_DIR / session.id
+        received = await self.received(session)
+        if offset > received:
+            raise UploadOffsetMismatch(received)
+        limit = min(session.total_size or MAX_UPLOAD_SIZE, MAX_UPLOAD_SIZE)
+        PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+        position = offset
+        async for chunk in chunks:
+            if position + len(chunk) > limit:
+                raise UploadTooLarge(f"超出声明大小或上限（{limit} 字节）")
+            position = await asyncio.to_thread(_pwrite_at, path, position, chunk)
+        session.updated_at = datetime.utcnow()
+        await self.db.commit()
+        return max(received, position)
+
+    async def complete_session(self, session: FileUploadSession, expected_sha256: Optional[str] = None) -> FileRecord:
+        """校验长度/哈希后归档分片文件，写 FileRecord 并结束会话"""
+        path = PARTIAL_DIR / session.id
+        size = await self.received(session)
+        if session.total_size is not None and size != session.total_size:
+            raise UploadOffsetMismatch(size)
+        digest = await asyncio.to_thread(_hash_file, path)
+        if expected_sha256 and expected_sha256.lower() != digest:
+            raise ValueError(f"SHA-256 不一致：服务端 {digest}")
+        blob = await asyncio.to_thread(_promote, path, digest, size)
+        await self.db.delete(session)
+        return await self._record(blob, session.filename, session.content_type, session.uploaded_by,
+                                  session.factory_id, session.related_type, session.related_id)
+
+    async def purge_stale_sessions(self) -> int:
+        """清理超过 UPLOAD_SESSION_TTL 未活动的续传会话及其分片"""
+        cutoff = datetime.utcnow() - UPLOAD_SESSION_TTL
+        stale = (await self.db.execute(
+            select(FileUploadSession).where(FileUploadSession.updated_at < cutoff)
+        )).scalars().all()
+        for session in stale:
+            await asyncio.to_thread((PARTIAL_DIR / session.id).unlink, True)
+            await self.db.delete(session)
+        if stale:
+            await self.db.commit()
+            logger.info(f"Purged {len(stale)} stale upload sessions")
+        return len(stale)
+
+    async def _record(self, blob: StoredBlob, filename, content_type, uploaded_by, factory_id,
+                      related_type, related_id) -> FileRecord:
+        record = FileRecord(
+            id=str(uuid.uuid4()),
+            filename=filename or "file",
+            content_type=content_type,
+            size=blob.size,
+            sha256=blob.sha256,
+            storage_path=str(blob.path),
+            uploaded_by=uploaded_by,
+            factory_id=factory_id,
+            related_type=related_type,
+            related_id=related_id,
+        )
+        self.db.add(record)
+        await self.db.commit()
+        await self.db.refresh(record)
+        return record
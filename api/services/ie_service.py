@@ -2,6 +2,7 @@
 IE Service Layer - Industrial Engineering Services
 精益生产工程服务：标准工时、时间研究、线平衡分析、工序价值分析
 """
+import asyncio
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -21,6 +22,7 @@ from database.models import (
     Station,
     Product,
 )
+from core.ie.line_balancing import BalanceTask, precedence_from_steps, solve_salbp1, solve_salbp2
 
 
 class StandardTimeService:
@@ -403,7 +405,7 @@ class LineBalanceService:
             StandardOperationTime.is_active == True
         )
         
-        sot_result = (await self.db.execute(sot_query)).scalars().all()
+        sot_result = (await self.db.execute(sot_query)).all()
         
         if not sot_result:
             raise ValueError("No standard times found for this product")
@@ -458,7 +460,7 @@ class LineBalanceService:
             idle_time_total=idle_time_total,
             workstation_count=workstation_count,
             is_balanced=is_balanced,
-            station_details=station_details,
+            workstation_details=station_details,
             bottleneck_station=bottleneck_station,
             bottleneck_time=bottleneck_time,
             recommendations=recommendations,
@@ -499,10 +501,98 @@ class LineBalanceService:
         
         return recommendations
     
+    async def optimize_line_balance(
+        self,
+        factory_id: str,
+        product_id: str,
+        routing_template_id: Optional[str] = None,
+        takt_time: Optional[float] = None,
+        station_count: Optional[int] = None,
+        time_limit: float = 2.0,
+    ) -> Dict[str, Any]:
+        """按工艺路线重新分配工站（SALBP）
+
+        给定节拍 takt_time 求最少工站数（SALBP-1），或给定工站数 station_count 求最小节拍（SALBP-2），二选一。
+        作业 = 工艺路线步骤，先后关系取自步骤顺序与 is_parallel；作业时间优先取 SOT 有效标准工时，
+        没有 SOT 时用步骤 standard_hours 折算分钟。
+        """
+        if (takt_time is None) == (station_count is None):
+            raise ValueError("takt_time 与 station_count 需且仅需指定一个")
+
+        if routing_template_id is None:
+            routing_template_id = (await self.db.execute(
+                select(WorkOrder.routing_template_id).where(
+                    WorkOrder.factory_id == factory_id,
+                    WorkOrder.product_id == product_id,
+                    WorkOrder.routing_template_id.isnot(None),
+                ).order_by(WorkOrder.created_at.desc()).limit(1)
+            )).scalar_one_or_none()
+            if routing_template_id is None:
+                raise ValueError("该产品没有绑定工艺路线，请指定 routing_template_id")
+
+        # 工艺路线限定本工厂（显式传入的 routing_template_id 也不能跨工厂）
+        steps = (await self.db.execute(
+            select(RoutingTemplateStep)
+            .join(RoutingTemplate, RoutingTemplate.id == RoutingTemplateStep.template_id)
+            .where(RoutingTemplateStep.template_id == routing_template_id,
+                   RoutingTemplate.factory_id == factory_id)
+            .order_by(RoutingTemplateStep.seq)
+        )).scalars().all()
+        if not steps:
+            raise ValueError("工艺路线没有步骤")
+
+        sots = (await self.db.execute(
+            select(StandardOperationTime).where(
+                StandardOperationTime.factory_id == factory_id,
+                StandardOperationTime.product_id == product_id,
+                StandardOperationTime.is_active == True
+            )
+        )).scalars().all()
+        sot_by_seq = {s.operation_seq: s for s in sots if s.operation_seq is not None}
+        sot_by_step = {s.routing_step: s for s in sots if s.routing_step}
+
+        preds = precedence_from_steps((step.id, step.seq, bool(step.is_parallel)) for step in steps)
+        tasks, meta = [], {}
+        for step in steps:
+            sot = sot_by_seq.get(step.seq) or sot_by_step.get(step.process_code)
+            if sot is not None:
+                minutes = sot.effective_standard_time or sot.standard_time_min or 0.0
+                source = "sot"
+            else:
+                minutes = float(step.standard_hours or 0) * 60
+                source = "routing"
+            tasks.append(BalanceTask(step.id, round(float(minutes), 4), preds[step.id]))
+            meta[step.id] = {
+                "seq": step.seq,
+                "process_code": step.process_code,
+                "operation_name": step.operation_name,
+                "time_min": round(float(minutes), 4),
+                "time_source": source,
+            }
+
+        if takt_time is not None:
+            result = await asyncio.to_thread(solve_salbp1, tasks, takt_time, time_limit)
+            problem = "SALBP-1"
+        else:
+            result = await asyncio.to_thread(solve_salbp2, tasks, station_count, time_limit)
+            problem = "SALBP-2"
+
+        data = result.to_dict()
+        for station in data["stations"]:
+            station["tasks"] = [meta[key] for key in station["tasks"]]
+        data.update({
+            "problem": problem,
+            "factory_id": factory_id,
+            "product_id": product_id,
+            "routing_template_id": routing_template_id,
+            "total_work_content": round(sum(t.time for t in tasks), 4),
+        })
+        return data
+
     async def get_line_balance_report(self, lba_id: str) -> Optional[LineBalanceAnalysis]:
         """获取平衡分析报告"""
-        result = select(LineBalanceAnalysis).where(LineBalanceAnalysis.id == lba_id)
-        return result.scalar_one_or_none()
+        query = select(LineBalanceAnalysis).where(LineBalanceAnalysis.id == lba_id)
+        return (await self.db.execute(query)).scalar_one_or_none()
     
     async def list_line_balances(
         self,
@@ -709,42 +799,15 @@ class ReportExportService:
         self,
         factory_id: str,
         product_id: Optional[str] = None,
-        output_format: str = "xlsx"
+        output_format: str = "xlsx",
+        requested_by: Optional[str] = None,
     ) -> Dict[str, Any]:
-        """导出标准工时表到 Excel"""
-        from services.ie_service import StandardTimeService
-        sot_service = StandardTimeService(self.db)
-        
-        sots = await sot_service.get_active_sots(
-            factory_id=factory_id,
-            product_id=product_id
+        """导出标准工时表：提交后台流式导出任务（CSV/XLSX），完成后按 status_url 取下载地址"""
+        from api.services.export_job_service import ExportJobService
+
+        job = await ExportJobService(self.db).submit(
+            "standard_times", output_format, {"product_id": product_id}, requested_by, factory_id,
         )
-        
-        # 准备导出数据
-        export_data = []
-        for sot in sots:
-            export_data.append({
-                "工单编号": sot.routing_step,
-                "工序名称": sot.operation_name,
-                "工位编号": sot.station_id,
-                "标准工时(min)": sot.standard_time_min,
-                "有效标准时间(min)": sot.effective_standard_time,
-                "设定时间(min)": sot.setup_time_min,
-                "批量大小": sot.batch_size,
-                "评定系数": sot.rating_factor,
-                "宽放率(%)": round(sot.allowance_rate * 100, 1),
-                "版本号": sot.version,
-                "生效日期": sot.validity_start.isoformat() if sot.validity_start else "",
-                "失效日期": sot.validity_end.isoformat() if sot.validity_end else "",
-            })
-        
-        file_path = f"/app/reports/standard_times_{factory_id}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{output_format}"
-        
-        return {
-            "file_path": file_path,
-            "file_name": f"标准工时表_{factory_id}_{datetime.utcnow().strftime('%Y%m%d')}.{output_format}",
-            "record_count": len(export_data),
-            "format": output_format,
-            "export_date": datetime.utcnow().isoformat(),
-            "data": export_data,
-        }
+        result = job.to_dict()
+        result["status_url"] = f"/api/v1/exports/{job.id}"
+        return result
@@ -412,46 +412,18 @@ class ReportExportService:
         self,
         factory_id: str,
         product_id: Optional[str] = None,
-        output_format: str = "xlsx"
+        output_format: str = "xlsx",
+        requested_by: Optional[str] = None,
     ) -> Dict[str, Any]:
-        """导出标准工时表到 Excel"""
-        from services.ie_service import StandardTimeService
-        sot_service = StandardTimeService(self.db)
-        
-        sots = await sot_service.get_active_sots(
-            factory_id=factory_id,
-            product_id=product_id
+        """导出标准工时表：提交后台流式导出任务（CSV/XLSX），完成后按 status_url 取下载地址"""
+        from api.services.export_job_service import ExportJobService
+
+        job = await ExportJobService(self.db).submit(
+            "standard_times", output_format, {"product_id": product_id}, requested_by, factory_id,
         )
-        
-        # 准备导出数据
-        export_data = []
-        for sot in sots:
-            export_data.append({
-                "工单编号": sot.routing_step,
-                "工序名称": sot.operation_name,
-                "工位编号": sot.station_id,
-                "标准工时(min)": sot.standard_time_min,
-                "有效标准时间(min)": sot.effective_standard_time,
-                "设定时间(min)": sot.setup_time_min,
-                "批量大小": sot.batch_size,
-                "评定系数": sot.rating_factor,
-                "宽放率(%)": round(sot.allowance_rate * 100, 1),
-                "版本号": sot.version,
-                "生效日期": sot.validity_start.isoformat() if sot.validity_start else "",
-                "失效日期": sot.validity_end.isoformat() if sot.validity_end else "",
-            })
-        
-        # 保存文件路径（实际实现需要写入文件系统）
-        file_path = f"/app/reports/standard_times_{factory_id}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{output_format}"
-        
-        return {
-            "file_path": file_path,
-            "file_name": f"标准工时表_{factory_id}_{datetime.utcnow().strftime('%Y%m%d')}.{output_format}",
-            "record_count": len(export_data),
-            "format": output_format,
-            "export_date": datetime.utcnow().isoformat(),
-            "data": export_data,
-        }
+        result = job.to_dict()
+        result["status_url"] = f"/api/v1/exports/{job.id}"
+        return result
     
     async def export_time_study_report(
         self,
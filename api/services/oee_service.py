@@ -1,19 +1,192 @@
 """
 OEE 服务 - 岗位替代 Phase 5
 OEE 计算 + 日快照 + 趋势分析
+
+整厂日 OEE 为集合式计算：停机、报工各按 (设备, 日) 分组聚合一次，
+与设备表关联后在 SQL 内算出三大率，单条 INSERT ... ON CONFLICT 批量落 oee_daily。
+当日实时 OEE 由进程内累加器维护，停机/报工事件到达时增量更新；累加器每
+OEE_INTRADAY_TTL 秒按库中当日数据重建，多 worker 下别的进程处理的事件最多延迟这么久可见。
+日期一律按 UTC 取（库中时间戳均为 utcnow），快照日、汇总周期与实时累加器同一口径。
 """
+import asyncio
+import logging
+import os
+import time
 import uuid
 from datetime import datetime, date, timedelta
 from typing import Optional, Dict, Any, List
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
+
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_DAYS = 31   # 回填按月分块提交，避免长事务
+ROLLUP_PERIODS = ("week", "month")
+ROLLUP_SCOPES = ("equipment", "line", "factory")
+# 当日实时累加器从库重建的间隔（秒）
+OEE_INTRADAY_TTL = int(os.getenv("OEE_INTRADAY_TTL", "30"))
 
 
 def _gen_id() -> str:
     return str(uuid.uuid4())
 
 
+# 停机 / 报工按 (设备, 日) 聚合；时间条件用半开区间，保证走 (factory_id, start_time) 索引
+_AGG_CTES = """
+    eq AS (
+        SELECT id, equipment_code,
+            COALESCE(NULLIF(spec->>'ideal_cycle_minutes', '')::float, :ideal) AS ideal_cycle
+        FROM equipment WHERE factory_id = :fid
+    ),
+    dt AS (
+        SELECT equipment_id, CAST(start_time AS DATE) AS d,
+            SUM(EXTRACT(EPOCH FROM (COALESCE(end_time, :now) - start_time)) / 60) AS total_min,
+            SUM(CASE WHEN downtime_category = 'breakdown'
+                THEN EXTRACT(EPOCH FROM (COALESCE(end_time, :now) - start_time)) / 60 ELSE 0 END) AS breakdown_min,
+            SUM(CASE WHEN downtime_category = 'setup'
+                THEN EXTRACT(EPOCH FROM (COALESCE(end_time, :now) - start_time)) / 60 ELSE 0 END) AS setup_min
+        FROM equipment_downtime
+        WHERE factory_id = :fid AND start_time >= :start AND start_time < :end
+        GROUP BY equipment_id, CAST(start_time AS DATE)
+    ),
+    eq_key AS (
+        SELECT id AS machine_key, id FROM eq
+        UNION SELECT equipment_code, id FROM eq WHERE equipment_code IS NOT NULL
+    ),
+    pr AS (
+        SELECT k.id AS equipment_id, CAST(p.created_at AS DATE) AS d,
+            SUM(p.good_qty + COALESCE(p.defect_qty, 0) + COALESCE(p.scrap_qty, 0)) AS actual_output,
+            SUM(p.good_qty) AS good_output
+        FROM production_reports p
+        JOIN eq_key k ON k.machine_key = p.machine_id
+        WHERE p.factory_id = :fid AND p.created_at >= :start AND p.created_at < :end
+            AND p.machine_id IS NOT NULL AND COALESCE(p.is_undone, FALSE) = FALSE
+        GROUP BY k.id, CAST(p.created_at AS DATE)
+    )
+"""
+
+# 有停机或报工的 (设备, 日)；include_idle 时改为 设备 × 日期 全量
+_KEYS_ACTIVE = "SELECT equipment_id, d FROM dt UNION SELECT equipment_id, d FROM pr"
+_KEYS_ALL = """
+    SELECT e.id AS equipment_id, CAST(g AS DATE) AS d
+    FROM eq e CROSS JOIN generate_series(CAST(:start AS DATE), CAST(:end AS DATE) - 1, INTERVAL '1 day') g
+"""
+
+_CALC_SQL = """
+    WITH {ctes},
+    base AS (
+        SELECT k.equipment_id, k.d,
+            LEAST(COALESCE(dt.total_min, 0), :planned) AS down,
+            COALESCE(dt.breakdown_min, 0) AS bd, COALESCE(dt.setup_min, 0) AS su,
+            COALESCE(pr.actual_output, 0) AS ao, COALESCE(pr.good_output, 0) AS go,
+            e.ideal_cycle
+        FROM ({keys}) k
+        JOIN eq e ON e.id = k.equipment_id
+        LEFT JOIN dt ON dt.equipment_id = k.equipment_id AND dt.d = k.d
+        LEFT JOIN pr ON pr.equipment_id = k.equipment_id AND pr.d = k.d
+    ),
+    rates AS (
+        SELECT *, :planned - down AS run,
+            CASE WHEN :planned > 0 THEN ROUND(CAST((:planned - down) / :planned * 100 AS NUMERIC), 2) ELSE 0 END AS avail,
+            CASE WHEN :planned - down > 0
+                THEN LEAST(ROUND(CAST(ao * ideal_cycle / (:planned - down) * 100 AS NUMERIC), 2), 100) ELSE 0 END AS perf,
+            CASE WHEN ao > 0 THEN ROUND(CAST(go * 100.0 / ao AS NUMERIC), 2) ELSE 100 END AS qual
+        FROM base
+    )
+    INSERT INTO oee_daily (id, factory_id, equipment_id, snapshot_date,
+        planned_production_minutes, actual_run_minutes, downtime_minutes,
+        availability, performance, quality, oee,
+        planned_output, actual_output, good_output,
+        breakdown_minutes, setup_minutes, idle_minutes, created_at)
+    SELECT md5(:fid || equipment_id || d::text || random()::text), :fid, equipment_id, d,
+        :planned, run, down,
+        avail, perf, qual, ROUND(avail * perf * qual / 10000, 2),
+        0, ao, go,
+        bd, su, GREATEST(down - bd - su, 0), :now
+    FROM rates
+    ON CONFLICT (factory_id, equipment_id, snapshot_date) DO UPDATE SET
+        planned_production_minutes = EXCLUDED.planned_production_minutes,
+        actual_run_minutes = EXCLUDED.actual_run_minutes,
+        downtime_minutes = EXCLUDED.downtime_minutes,
+        availability = EXCLUDED.availability, performance = EXCLUDED.performance,
+        quality = EXCLUDED.quality, oee = EXCLUDED.oee,
+        actual_output = EXCLUDED.actual_output, good_output = EXCLUDED.good_output,
+        breakdown_minutes = EXCLUDED.breakdown_minutes, setup_minutes = EXCLUDED.setup_minutes,
+        idle_minutes = EXCLUDED.idle_minutes
+    RETURNING equipment_id, snapshot_date, availability, performance, quality, oee, downtime_minutes
+"""
+
+# 周/月汇总刷新：只重算受影响的 (周期, 级别, 对象) —— 本次写入的设备、这些设备所属产线、工厂，
+# 每个键按该周期内 oee_daily 全量聚合后 upsert，不删行（oee_daily 只增改不删，键不会消失）
+_ROLLUP_UPSERT_SQL = """
+    WITH src AS (
+        SELECT o.*, COALESCE(e.station_id, '-') AS line_id, p.period,
+            CAST(date_trunc(p.period, o.snapshot_date) AS DATE) AS period_start
+        FROM oee_daily o
+        LEFT JOIN equipment e ON e.id = o.equipment_id
+        CROSS JOIN (VALUES ('week'), ('month')) AS p(period)
+        WHERE o.factory_id = :fid AND o.snapshot_date >= :lo AND o.snapshot_date < :hi
+    ),
+    scoped AS (
+        SELECT * FROM src
+        WHERE (period = 'week' AND period_start BETWEEN :wk_lo AND :wk_hi)
+           OR (period = 'month' AND period_start BETWEEN :mo_lo AND :mo_hi)
+    ),
+    touched AS (
+        SELECT * FROM scoped WHERE {equipment_filter}
+    ),
+    agg AS (
+        SELECT period, period_start, 'equipment' AS scope, equipment_id AS scope_id,
+            {measures} FROM touched GROUP BY period, period_start, equipment_id
+        UNION ALL
+        SELECT period, period_start, 'line', line_id,
+            {measures} FROM scoped
+        WHERE line_id IN (SELECT line_id FROM touched)
+        GROUP BY period, period_start, line_id
+        UNION ALL
+        SELECT period, period_start, 'factory', :fid,
+            {measures} FROM scoped GROUP BY period, period_start
+    )
+    INSERT INTO oee_rollup (factory_id, period, period_start, scope, scope_id, day_count,
+        availability_sum, performance_sum, quality_sum, oee_sum,
+        planned_minutes, run_minutes, downtime_minutes, actual_output, good_output, updated_at)
+    SELECT :fid, period, period_start, scope, scope_id, day_count,
+        availability_sum, performance_sum, quality_sum, oee_sum,
+        planned_minutes, run_minutes, downtime_minutes, actual_output, good_output, :now
+    FROM agg
+    ON CONFLICT (factory_id, period, scope, scope_id, period_start) DO UPDATE SET
+        day_count = EXCLUDED.day_count,
+        availability_sum = EXCLUDED.availability_sum, performance_sum = EXCLUDED.performance_sum,
+        quality_sum = EXCLUDED.quality_sum, oee_sum = EXCLUDED.oee_sum,
+        planned_minutes = EXCLUDED.planned_minutes, run_minutes = EXCLUDED.run_minutes,
+        downtime_minutes = EXCLUDED.downtime_minutes,
+        actual_output = EXCLUDED.actual_output, good_output = EXCLUDED.good_output,
+        updated_at = EXCLUDED.updated_at
+""".replace("{measures}", """COUNT(*) AS day_count, SUM(availability) AS availability_sum,
+            SUM(performance) AS performance_sum, SUM(quality) AS quality_sum, SUM(oee) AS oee_sum,
+            SUM(planned_production_minutes) AS planned_minutes, SUM(actual_run_minutes) AS run_minutes,
+            SUM(downtime_minutes) AS downtime_minutes, SUM(actual_output) AS actual_output,
+            SUM(good_output) AS good_output""")
+
+
+def _utc_today() -> date:
+    return datetime.utcnow().date()
+
+
+def _week_start(d: date) -> date:
+    return d - timedelta(days=d.weekday())
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _next_month(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
 class OeeService:
     """OEE 综合设备效率"""
 
@@ -30,22 +203,24 @@ class OeeService:
         ideal_cycle_minutes: float = 1.0,
     ) -> Dict[str, Any]:
         """计算并保存日 OEE"""
-        target_date = date.fromisoformat(snapshot_date) if snapshot_date else date.today()
+        target_date = date.fromisoformat(snapshot_date) if snapshot_date else _utc_today()
+        day_start = datetime.combine(target_date, datetime.min.time())
 
-        # 获取停机时间
+        # 获取停机时间（半开区间，可走 idx_downtime_eq）
         downtime_result = await self.db.execute(text("""
             SELECT COALESCE(SUM(EXTRACT(EPOCH FROM (COALESCE(end_time, NOW()) - start_time)) / 60), 0) as total_min,
-                COALESCE(SUM(CASE WHEN reason_category = 'breakdown' THEN EXTRACT(EPOCH FROM (COALESCE(end_time, NOW()) - start_time)) / 60 ELSE 0 END), 0) as breakdown_min,
-                COALESCE(SUM(CASE WHEN reason_category = 'setup' THEN EXTRACT(EPOCH FROM (COALESCE(end_time, NOW()) - start_time)) / 60 ELSE 0 END), 0) as setup_min
+                COALESCE(SUM(CASE WHEN downtime_category = 'breakdown' THEN EXTRACT(EPOCH FROM (COALESCE(end_time, NOW()) - start_time)) / 60 ELSE 0 END), 0) as breakdown_min,
+                COALESCE(SUM(CASE WHEN downtime_category = 'setup' THEN EXTRACT(EPOCH FROM (COALESCE(end_time, NOW()) - start_time)) / 60 ELSE 0 END), 0) as setup_min
             FROM equipment_downtime
             WHERE factory_id = :fid AND equipment_id = :eid
-                AND start_time::date = :dt
-        """), {"fid": factory_id, "eid": equipment_id, "dt": target_date})
+                AND start_time >= :start AND start_time < :end
+        """), {"fid": factory_id, "eid": equipment_id,
+               "start": day_start, "end": day_start + timedelta(days=1)})
         dt_stats = downtime_result.mappings().first()
 
-        downtime_min = dt_stats["total_min"] if dt_stats else 0
-        breakdown_min = dt_stats["breakdown_min"] if dt_stats else 0
-        setup_min = dt_stats["setup_min"] if dt_stats else 0
+        downtime_min = float(dt_stats["total_min"]) if dt_stats else 0
+        breakdown_min = float(dt_stats["breakdown_min"]) if dt_stats else 0
+        setup_min = float(dt_stats["setup_min"]) if dt_stats else 0
         idle_min = max(0, downtime_min - breakdown_min - setup_min)
 
         if actual_run_minutes is None:
@@ -78,6 +253,7 @@ class OeeService:
             "po": planned_output, "ao": actual_output, "go": good_output,
             "bd": breakdown_min, "su": setup_min, "idle": idle_min, "now": datetime.utcnow(),
         })
+        await self.refresh_rollups(factory_id, target_date, equipment_ids=[equipment_id])
         await self.db.commit()
 
         return {
@@ -90,45 +266,358 @@ class OeeService:
             "downtime_minutes": round(downtime_min, 1),
         }
 
-    async def get_oee_trend(self, factory_id: str, equipment_id: Optional[str] = None, days: int = 7) -> Dict[str, Any]:
-        """OEE 趋势"""
-        query = """
-            SELECT snapshot_date, AVG(availability) as availability, AVG(performance) as performance,
-                AVG(quality) as quality, AVG(oee) as oee, SUM(downtime_minutes) as downtime
-            FROM oee_daily WHERE factory_id = :fid
+    async def calculate_factory_oee(
+        self, factory_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+        planned_minutes: float = 960,
+        ideal_cycle_minutes: float = 1.0,
+        include_idle: bool = False,
+        commit: bool = True,
+    ) -> Dict[str, Any]:
+        """整厂批量计算日 OEE（日期区间含首尾）
+
+        停机与报工按 (设备, 日) 各聚合一次，单条语句批量 upsert。
+        报工 machine_id 可为设备 id 或设备编码；理想节拍优先取 equipment.spec.ideal_cycle_minutes。
+        include_idle=True 时无停机无报工的设备也写入（可用率 100%、性能 0）。
+        """
+        first = date.fromisoformat(start_date) if start_date else _utc_today()
+        last = date.fromisoformat(end_date) if end_date else first
+        if last < first:
+            first, last = last, first
+        start = datetime.combine(first, datetime.min.time())
+        end = datetime.combine(last + timedelta(days=1), datetime.min.time())
+
+        sql = _CALC_SQL.format(ctes=_AGG_CTES, keys=_KEYS_ALL if include_idle else _KEYS_ACTIVE)
+        result = await self.db.execute(text(sql), {
+            "fid": factory_id, "start": start, "end": end, "now": datetime.utcnow(),
+            "planned": float(planned_minutes), "ideal": float(ideal_cycle_minutes),
+        })
+        rows = [dict(r) for r in result.mappings().all()]
+        if rows:
+            await self.refresh_rollups(factory_id, first, last, equipment_ids=[r["equipment_id"] for r in rows])
+        if commit:
+            await self.db.commit()
+
+        for r in rows:
+            r["date"] = r.pop("snapshot_date").isoformat()
+            r["downtime_minutes"] = round(r["downtime_minutes"] or 0, 1)
+        rows.sort(key=lambda r: (r["date"], r["equipment_id"]))
+        avg_oee = round(sum(r["oee"] for r in rows) / len(rows), 2) if rows else 0
+        return {
+            "factory_id": factory_id,
+            "start_date": first.isoformat(),
+            "end_date": last.isoformat(),
+            "count": len(rows),
+            "avg_oee": avg_oee,
+            "items": rows,
+        }
+
+    async def backfill_oee(
+        self, factory_id: str, start_date: str, end_date: Optional[str] = None,
+        planned_minutes: float = 960,
+        ideal_cycle_minutes: float = 1.0,
+        chunk_days: int = BACKFILL_CHUNK_DAYS,
+    ) -> Dict[str, Any]:
+        """历史 OEE 回填：按 chunk_days 分块集合计算，每块单独提交"""
+        first = date.fromisoformat(start_date)
+        last = date.fromisoformat(end_date) if end_date else _utc_today() - timedelta(days=1)
+        chunk_days = max(1, chunk_days)
+
+        written, chunks = 0, 0
+        cursor = first
+        while cursor <= last:
+            chunk_end = min(cursor + timedelta(days=chunk_days - 1), last)
+            res = await self.calculate_factory_oee(
+                factory_id, cursor.isoformat(), chunk_end.isoformat(),
+                planned_minutes=planned_minutes, ideal_cycle_minutes=ideal_cycle_minutes,
+            )
+            written += res["count"]
+            chunks += 1
+            cursor = chunk_end + timedelta(days=1)
+
+        return {
+            "factory_id": factory_id,
+            "start_date": first.isoformat(),
+            "end_date": last.isoformat(),
+            "chunks": chunks,
+            "rows_written": written,
+        }
+
+    async def get_intraday_oee(
+        self, factory_id: str, planned_minutes: float = 960, ideal_cycle_minutes: float = 1.0,
+    ) -> Dict[str, Any]:
+        """当日实时 OEE（进程内累加器，首次访问时用一次聚合查询播种）"""
+        tracker = await _intraday_tracker(self.db, factory_id, ideal_cycle_minutes)
+        now = datetime.utcnow()
+        elapsed = min((now - datetime.combine(tracker.day, datetime.min.time())).total_seconds() / 60,
+                      planned_minutes)
+
+        items = []
+        for eid, acc in tracker.equipment.items():
+            down = min(acc.downtime_minutes(now), elapsed)
+            run = elapsed - down
+            availability = round(run / elapsed * 100, 2) if elapsed > 0 else 0
+            performance = min(round(acc.actual * acc.ideal_cycle / run * 100, 2), 100) if run > 0 else 0
+            quality = round(acc.good / acc.actual * 100, 2) if acc.actual > 0 else 100
+            items.append({
+                "equipment_id": eid,
+                "availability": availability,
+                "performance": performance,
+                "quality": quality,
+                "oee": round(availability * performance * quality / 10000, 2),
+                "downtime_minutes": round(down, 1),
+                "actual_output": acc.actual,
+                "good_output": acc.good,
+                "in_downtime": bool(acc.open),
+            })
+        items.sort(key=lambda i: i["oee"], reverse=True)
+        avg_oee = round(sum(i["oee"] for i in items) / len(items), 2) if items else 0
+        return {
+            "date": tracker.day.isoformat(),
+            "elapsed_minutes": round(elapsed, 1),
+            "equipment_count": len(items),
+            "avg_oee": avg_oee,
+            "items": items,
+        }
+
+    async def refresh_rollups(
+        self, factory_id: str, first: date, last: Optional[date] = None,
+        equipment_ids: Optional[List[str]] = None,
+    ) -> None:
+        """重算 [first, last] 覆盖到的周/月里受影响设备、所属产线与工厂的汇总
+
+        不提交，随 oee_daily 写入同一事务。equipment_ids 为 None 时视为全部设备。
+        同一工厂的刷新用事务级 advisory 锁串行：后到的事务在先到者提交后才聚合，能读到其日快照。
         """
-        params: Dict[str, Any] = {"fid": factory_id}
-        if equipment_id:
-            query += " AND equipment_id = :eid"
-            params["eid"] = equipment_id
-        query += " AND snapshot_date >= CURRENT_DATE - INTERVAL ':days days' GROUP BY snapshot_date ORDER BY snapshot_date"
-        query = query.replace(":days", str(days))
+        last = last or first
+        wk_lo, wk_hi = _week_start(first), _week_start(last)
+        mo_lo, mo_hi = _month_start(first), _month_start(last)
+        params: Dict[str, Any] = {
+            "fid": factory_id, "now": datetime.utcnow(),
+            "wk_lo": wk_lo, "wk_hi": wk_hi, "mo_lo": mo_lo, "mo_hi": mo_hi,
+            "lo": min(wk_lo, mo_lo),
+            "hi": max(wk_hi + timedelta(days=7), _next_month(mo_hi)),
+        }
+        if equipment_ids is None:
+            stmt = text(_ROLLUP_UPSERT_SQL.format(equipment_filter="TRUE"))
+        else:
+            stmt = text(_ROLLUP_UPSERT_SQL.format(equipment_filter="equipment_id IN :eids")).bindparams(
+                bindparam("eids", expanding=True))
+            params["eids"] = sorted(set(equipment_ids))
+        await self.db.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext('oee_rollup:' || :fid))"), {"fid": factory_id})
+        await self.db.execute(stmt, params)
 
-        result = await self.db.execute(text(query), params)
-        trend = [dict(r) for r in result.mappings().all()]
+    async def get_oee_trend(
+        self, factory_id: str, equipment_id: Optional[str] = None, days: int = 7,
+        granularity: str = "day", line_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """OEE 趋势
+
+        granularity=day 读 oee_daily；week/month 读 oee_rollup 预聚合，1~3 年跨度也只是一次主键区间读。
+        line_id 为设备所属工位。
+        """
+        since = _utc_today() - timedelta(days=days)
 
-        # 平均 OEE
-        avg_oee = round(sum(t["oee"] for t in trend) / len(trend), 2) if trend else 0
+        if granularity in ROLLUP_PERIODS:
+            if equipment_id:
+                scope, scope_id = "equipment", equipment_id
+            elif line_id:
+                scope, scope_id = "line", line_id
+            else:
+                scope, scope_id = "factory", factory_id
+            since = _week_start(since) if granularity == "week" else _month_start(since)
+            result = await self.db.execute(text("""
+                SELECT period_start AS snapshot_date,
+                    availability_sum / day_count AS availability,
+                    performance_sum / day_count AS performance,
+                    quality_sum / day_count AS quality,
+                    oee_sum / day_count AS oee,
+                    downtime_minutes AS downtime, day_count
+                FROM oee_rollup
+                WHERE factory_id = :fid AND period = :period AND scope = :scope AND scope_id = :sid
+                    AND period_start >= :since AND day_count > 0
+                ORDER BY period_start
+            """), {"fid": factory_id, "period": granularity, "scope": scope, "sid": scope_id, "since": since})
+            trend = [dict(r) for r in result.mappings().all()]
+            days_total = sum(t["day_count"] for t in trend)
+            avg_oee = round(sum(t["oee"] * t["day_count"] for t in trend) / days_total, 2) if days_total else 0
+        else:
+            query = """
+                SELECT o.snapshot_date, AVG(o.availability) as availability, AVG(o.performance) as performance,
+                    AVG(o.quality) as quality, AVG(o.oee) as oee, SUM(o.downtime_minutes) as downtime
+                FROM oee_daily o
+            """
+            params: Dict[str, Any] = {"fid": factory_id, "since": since}
+            if line_id and not equipment_id:
+                query += " JOIN equipment e ON e.id = o.equipment_id AND e.station_id = :lid"
+                params["lid"] = line_id
+            query += " WHERE o.factory_id = :fid"
+            if equipment_id:
+                query += " AND o.equipment_id = :eid"
+                params["eid"] = equipment_id
+            query += " AND o.snapshot_date >= :since GROUP BY o.snapshot_date ORDER BY o.snapshot_date"
 
-        return {"trend": trend, "avg_oee": avg_oee, "days": days, "equipment_id": equipment_id}
+            result = await self.db.execute(text(query), params)
+            trend = [dict(r) for r in result.mappings().all()]
+
+            # 平均 OEE
+            avg_oee = round(sum(t["oee"] for t in trend) / len(trend), 2) if trend else 0
+
+        return {
+            "trend": trend, "avg_oee": avg_oee, "days": days, "granularity": granularity,
+            "equipment_id": equipment_id, "line_id": line_id,
+        }
 
     async def get_factory_oee_summary(self, factory_id: str) -> Dict[str, Any]:
-        """工厂 OEE 概览（今日）"""
+        """工厂 OEE 概览（今日 + 本周/本月累计）"""
+        today = _utc_today()
         result = await self.db.execute(text("""
             SELECT equipment_id, oee, availability, performance, quality, downtime_minutes
-            FROM oee_daily WHERE factory_id = :fid AND snapshot_date = CURRENT_DATE
+            FROM oee_daily WHERE factory_id = :fid AND snapshot_date = :today
             ORDER BY oee DESC
-        """), {"fid": factory_id})
+        """), {"fid": factory_id, "today": today})
         items = [dict(r) for r in result.mappings().all()]
 
         avg_oee = round(sum(i["oee"] for i in items) / len(items), 2) if items else 0
         worst = items[-1] if items else None
 
+        # 周/月累计直接取工厂级汇总行
+        rollup = await self.db.execute(text("""
+            SELECT period, oee_sum / NULLIF(day_count, 0) AS oee FROM oee_rollup
+            WHERE factory_id = :fid AND scope = 'factory' AND scope_id = :fid
+                AND ((period = 'week' AND period_start = :wk) OR (period = 'month' AND period_start = :mo))
+        """), {"fid": factory_id, "wk": _week_start(today), "mo": _month_start(today)})
+        to_date = {r["period"]: round(r["oee"] or 0, 2) for r in rollup.mappings().all()}
+
         return {
-            "date": date.today().isoformat(),
+            "date": today.isoformat(),
             "equipment_count": len(items),
             "avg_oee": avg_oee,
+            "week_to_date_oee": to_date.get("week", 0),
+            "month_to_date_oee": to_date.get("month", 0),
             "items": items,
             "worst_equipment": worst,
             "world_class": 85,  # 世界级 OEE 标准
         }
+
+
+# ============== 当日实时 OEE 累加器 ==============
+
+class _IntradayEquipment:
+    """单台设备当日累计：已结束停机分钟 + 进行中停机 + 产出"""
+
+    __slots__ = ("ideal_cycle", "closed_minutes", "open", "actual", "good")
+
+    def __init__(self, ideal_cycle: float):
+        self.ideal_cycle = ideal_cycle
+        self.closed_minutes = 0.0
+        self.open: Dict[str, datetime] = {}   # downtime_id -> start_time
+        self.actual = 0
+        self.good = 0
+
+    def downtime_minutes(self, now: datetime) -> float:
+        return self.closed_minutes + sum((now - st).total_seconds() / 60 for st in self.open.values())
+
+
+class _IntradayTracker:
+    """一个工厂当日的实时 OEE 状态"""
+
+    def __init__(self, day: date):
+        self.day = day
+        self.loaded_at = time.monotonic()
+        self.equipment: Dict[str, _IntradayEquipment] = {}
+        self.codes: Dict[str, str] = {}   # equipment_code -> id
+
+    def resolve(self, machine_id: Optional[str]) -> Optional[_IntradayEquipment]:
+        if not machine_id:
+            return None
+        return self.equipment.get(machine_id) or self.equipment.get(self.codes.get(machine_id, ""))
+
+
+_intraday: Dict[str, _IntradayTracker] = {}
+_intraday_lock = asyncio.Lock()
+
+
+async def _intraday_tracker(db: AsyncSession, factory_id: str, ideal_cycle_minutes: float) -> _IntradayTracker:
+    """取当日累加器；跨日、未播种或超过 OEE_INTRADAY_TTL 时按当天已有数据重建"""
+    today = _utc_today()
+    tracker = _intraday.get(factory_id)
+    if _is_fresh(tracker, today):
+        return tracker
+
+    async with _intraday_lock:
+        tracker = _intraday.get(factory_id)
+        if _is_fresh(tracker, today):
+            return tracker
+
+        start = datetime.combine(today, datetime.min.time())
+        params = {"fid": factory_id, "start": start, "end": start + timedelta(days=1),
+                  "now": datetime.utcnow(), "ideal": float(ideal_cycle_minutes)}
+        eq_rows = (await db.execute(text(
+            "WITH" + _AGG_CTES + """
+            SELECT e.id, e.equipment_code, e.ideal_cycle,
+                COALESCE(pr.actual_output, 0) AS actual, COALESCE(pr.good_output, 0) AS good
+            FROM eq e LEFT JOIN pr ON pr.equipment_id = e.id
+            """), params)).mappings().all()
+        dt_rows = (await db.execute(text("""
+            SELECT id, equipment_id, start_time, end_time FROM equipment_downtime
+            WHERE factory_id = :fid AND start_time >= :start AND start_time < :end
+        """), params)).mappings().all()
+
+        tracker = _IntradayTracker(today)
+        for r in eq_rows:
+            acc = _IntradayEquipment(float(r["ideal_cycle"]))
+            acc.actual, acc.good = int(r["actual"]), int(r["good"])
+            tracker.equipment[r["id"]] = acc
+            tracker.codes[r["equipment_code"]] = r["id"]
+        for r in dt_rows:
+            acc = tracker.equipment.get(r["equipment_id"])
+            if acc is None:
+                continue
+            if r["end_time"] is None:
+                acc.open[r["id"]] = r["start_time"]
+            else:
+                acc.closed_minutes += (r["end_time"] - r["start_time"]).total_seconds() / 60
+        _intraday[factory_id] = tracker
+        return tracker
+
+
+def _is_fresh(tracker: Optional[_IntradayTracker], today: date) -> bool:
+    return (tracker is not None and tracker.day == today
+            and time.monotonic() - tracker.loaded_at < OEE_INTRADAY_TTL)
+
+
+def _live_tracker(factory_id: str) -> Optional[_IntradayTracker]:
+    tracker = _intraday.get(factory_id)
+    if tracker and tracker.day == _utc_today():
+        return tracker
+    return None
+
+
+def on_downtime_event(
+    factory_id: str, equipment_id: str, downtime_id: str,
+    start_time: datetime, end_time: Optional[datetime] = None,
+) -> None:
+    """停机开始/结束时增量更新当日累加器（未播种的工厂忽略，首次查询时从库里补齐）"""
+    tracker = _live_tracker(factory_id)
+    acc = tracker.resolve(equipment_id) if tracker else None
+    if acc is None:
+        return
+    day_start = datetime.combine(tracker.day, datetime.min.time())
+    if start_time < day_start:
+        return
+    if end_time is None:
+        acc.open[downtime_id] = start_time
+    else:
+        acc.open.pop(downtime_id, None)
+        acc.closed_minutes += max(0.0, (end_time - start_time).total_seconds() / 60)
+
+
+def on_production_event(factory_id: str, machine_id: Optional[str], total_qty: int, good_qty: int) -> None:
+    """报工（或撤回，数量取负）时增量更新当日累加器"""
+    tracker = _live_tracker(factory_id)
+    acc = tracker.resolve(machine_id) if tracker else None
+    if acc is None:
+        return
+    acc.actual = max(0, acc.actual + total_qty)
+    acc.good = max(0, acc.good + good_qty)
@@ -0,0 +1,301 @@
+"""
+报工汇总写后缓冲 - 班次汇总 / 小时快照异步批量累加
+
+报工请求只写 ProductionReport 并提交，汇总增量交给进程内缓冲：
+- 按报工 ID 暂存增量，每 REPORT_ROLLUP_FLUSH_MS 毫秒或攒满 REPORT_ROLLUP_FLUSH_EVENTS 条刷一次
+- 刷写时按 (工厂, 班次日期, 班次, 工位, 工单) / (工厂, 日期, 小时, 工位) 预聚合，
+  一次 executemany 执行 ON CONFLICT 原子累加
+- 崩溃安全：ProductionReport.rolled_up_at 是汇总水位。刷写与回放都先
+  UPDATE ... WHERE rolled_up_at IS NULL RETURNING id 认领，再只累加认领到的报工，
+  与汇总写入同一事务，所以缓冲丢失可从报工表回放，且同一报工只会累加一次
+- 后台循环未启动时（脚本/测试）报工在请求事务内同步累加，行为与原来一致
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import ProductionReport
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.getenv("REPORT_ROLLUP_FLUSH_MS", "1000")) / 1000
+FLUSH_MAX_EVENTS = int(os.getenv("REPORT_ROLLUP_FLUSH_EVENTS", "500"))
+REPLAY_BATCH = 1000
+REPLAY_INTERVAL_SECONDS = 60
+REPLAY_GRACE_SECONDS = 60       # 常驻回放只补超过宽限期仍未汇总的报工（其他实例崩溃遗留）
+
+# 班次汇总原子累加：冲突时在库内对旧值加增量，并按累加后的数量重算良品率
+_SHIFT_SUMMARY_UPSERT = text("""
+    INSERT INTO shift_summaries (
+        id, factory_id, shift_date, shift_type, station_id, work_order_id,
+        total_output, good_qty, defect_qty, scrap_qty, yield_rate,
+        report_count, total_cycle_time, operator_count, created_at, updated_at
+    ) VALUES (
+        :id, :factory_id, :shift_date, :shift_type, :station_id, :work_order_id,
+        :total_output, :good_qty, :defect_qty, :scrap_qty, :yield_rate,
+        :report_count, :cycle_time, 1, :now, :now
+    )
+    ON CONFLICT (factory_id, shift_date, shift_type, station_id, work_order_id) DO UPDATE SET
+        good_qty = COALESCE(shift_summaries.good_qty, 0) + excluded.good_qty,
+        defect_qty = COALESCE(shift_summaries.defect_qty, 0) + excluded.defect_qty,
+        scrap_qty = COALESCE(shift_summaries.scrap_qty, 0) + excluded.scrap_qty,
+        total_output = COALESCE(shift_summaries.good_qty, 0) + COALESCE(shift_summaries.defect_qty, 0)
+                     + COALESCE(shift_summaries.scrap_qty, 0) + excluded.total_output,
+        yield_rate = CASE
+            WHEN COALESCE(shift_summaries.good_qty, 0) + COALESCE(shift_summaries.defect_qty, 0)
+               + COALESCE(shift_summaries.scrap_qty, 0) + excluded.total_output > 0
+            THEN (COALESCE(shift_summaries.good_qty, 0) + excluded.good_qty) * 100.0
+               / (COALESCE(shift_summaries.good_qty, 0) + COALESCE(shift_summaries.defect_qty, 0)
+                  + COALESCE(shift_summaries.scrap_qty, 0) + excluded.total_output)
+            ELSE 0 END,
+        report_count = COALESCE(shift_summaries.report_count, 0) + excluded.report_count,
+        total_cycle_time = COALESCE(shift_summaries.total_cycle_time, 0) + excluded.total_cycle_time,
+        updated_at = excluded.updated_at
+""")
+
+# 小时快照原子累加
+_HOURLY_SNAPSHOT_UPSERT = text("""
+    INSERT INTO hourly_output_snapshots (
+        id, factory_id, snapshot_date, snapshot_hour, station_id,
+        output_qty, good_qty, defect_qty, created_at, updated_at
+    ) VALUES (
+        :id, :factory_id, :snapshot_date, :snapshot_hour, :station_id,
+        :output_qty, :good_qty, :defect_qty, :now, :now
+    )
+    ON CONFLICT (factory_id, snapshot_date, snapshot_hour, station_id) DO UPDATE SET
+        output_qty = COALESCE(hourly_output_snapshots.output_qty, 0) + excluded.output_qty,
+        good_qty = COALESCE(hourly_output_snapshots.good_qty, 0) + excluded.good_qty,
+        defect_qty = COALESCE(hourly_output_snapshots.defect_qty, 0) + excluded.defect_qty,
+        updated_at = excluded.updated_at
+""")
+
+
+@dataclass(frozen=True)
+class RollupEntry:
+    """一条报工对汇总表的增量（可由 ProductionReport 重建，用于回放）"""
+    report_id: str
+    factory_id: str
+    shift: str
+    station_id: str
+    work_order_id: str
+    good_qty: int
+    defect_qty: int
+    scrap_qty: int
+    cycle_time_sec: float
+    reported_at: datetime
+
+    @classmethod
+    def from_report(cls, report: ProductionReport) -> "RollupEntry":
+        return cls(
+            report_id=str(report.id),
+            factory_id=report.factory_id,
+            shift=report.shift,
+            station_id=report.station_id,
+            work_order_id=str(report.work_order_id),
+            good_qty=report.good_qty or 0,
+            defect_qty=report.defect_qty or 0,
+            scrap_qty=report.scrap_qty or 0,
+            cycle_time_sec=report.cycle_time_sec or 0,
+            reported_at=report.created_at,
+        )
+
+
+def _new_id() -> str:
+    return str(uuid.uuid4())
+
+
+def rollup_today() -> date:
+    """汇总分桶用的“今天”：与 reported_at（UTC）.date() 一致，读汇总时缺省日期都取它"""
+    return datetime.utcnow().date()
+
+
+def aggregate_rollups(entries: Iterable[RollupEntry]):
+    """按汇总键预聚合，返回 (班次汇总参数列表, 小时快照参数列表)"""
+    shift: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0, 0, 0, 0.0])
+    hourly: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0, 0])
+    for e in entries:
+        acc = shift[(e.factory_id, e.reported_at.date(), e.shift, e.station_id, e.work_order_id)]
+        acc[0] += e.good_qty
+        acc[1] += e.defect_qty
+        acc[2] += e.scrap_qty
+        acc[3] += 1
+        acc[4] += e.cycle_time_sec
+        acc = hourly[(e.factory_id, e.reported_at.date(), e.reported_at.hour, e.station_id)]
+        acc[0] += e.good_qty + e.defect_qty + e.scrap_qty
+        acc[1] += e.good_qty
+        acc[2] += e.defect_qty
+
+    now = datetime.utcnow()
+    shift_rows = []
+    for (factory_id, shift_date, shift_type, station_id, work_order_id), (g, d, s, n, ct) in shift.items():
+        total = g + d + s
+        shift_rows.append({
+            "id": _new_id(), "factory_id": factory_id, "shift_date": shift_date, "shift_type": shift_type,
+            "station_id": station_id, "work_order_id": work_order_id,
+            "good_qty": g, "defect_qty": d, "scrap_qty": s, "total_output": total,
+            "yield_rate": (g / total * 100) if total > 0 else 0,
+            "report_count": n, "cycle_time": ct, "now": now,
+        })
+    hourly_rows = [
+        {"id": _new_id(), "factory_id": factory_id, "snapshot_date": day, "snapshot_hour": hour,
+         "station_id": station_id, "output_qty": out, "good_qty": g, "defect_qty": d, "now": now}
+        for (factory_id, day, hour, station_id), (out, g, d) in hourly.items()
+    ]
+    return shift_rows, hourly_rows
+
+
+async def apply_rollups(db: AsyncSession, entries: List[RollupEntry]) -> None:
+    """把一批报工增量累加进汇总表（不提交；调用方负责水位与事务）"""
+    shift_rows, hourly_rows = aggregate_rollups(entries)
+    # 固定键序写入，并发刷写时加锁顺序一致，避免死锁
+    shift_rows.sort(key=lambda r: (r["factory_id"], r["shift_date"], r["shift_type"], r["station_id"], r["work_order_id"]))
+    hourly_rows.sort(key=lambda r: (r["factory_id"], r["snapshot_date"], r["snapshot_hour"], r["station_id"]))
+    if shift_rows:
+        await db.execute(_SHIFT_SUMMARY_UPSERT, shift_rows)
+    if hourly_rows:
+        await db.execute(_HOURLY_SNAPSHOT_UPSERT, hourly_rows)
+
+
+async def claim_and_apply(db: AsyncSession, entries: List[RollupEntry]) -> int:
+    """认领尚未汇总的报工（推进水位）并累加；已被其他刷写/回放认领的跳过，返回累加条数"""
+    if not entries:
+        return 0
+    result = await db.execute(
+        update(ProductionReport)
+        .where(ProductionReport.id.in_([e.report_id for e in entries]), ProductionReport.rolled_up_at.is_(None))
+        .values(rolled_up_at=datetime.utcnow())
+        .returning(ProductionReport.id)
+        .execution_options(synchronize_session=False)
+    )
+    claimed = {str(rid) for rid in result.scalars()}
+    mine = [e for e in entries if e.report_id in claimed]
+    await apply_rollups(db, mine)
+    return len(mine)
+
+
+class ReportRollupBuffer:
+    """进程内汇总缓冲：攒增量、定时/定量批量刷写、从报工表回放"""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_events: int = FLUSH_MAX_EVENTS):
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self.running = False
+        self._entries: Dict[str, RollupEntry] = {}
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._last_replay = 0.0
+        self.flushed_reports = 0
+        self.replayed_reports = 0
+        self.flushes = 0
+        self.last_flush_at: Optional[str] = None
+
+    def add(self, entry: RollupEntry) -> None:
+        """报工提交后登记增量；攒满即唤醒刷写"""
+        self._entries[entry.report_id] = entry
+        if len(self._entries) >= self.max_events:
+            self._wake.set()
+
+    async def flush(self, session_factory) -> int:
+        """把缓冲中的增量一次写入汇总表；失败则放回缓冲等下一轮"""
+        async with self._lock:
+            if not self._entries:
+                return 0
+            batch, self._entries = list(self._entries.values()), {}
+            try:
+                async with session_factory() as db:
+                    applied = await claim_and_apply(db, batch)
+                    await db.commit()
+            except Exception:
+                for e in batch:
+                    self._entries.setdefault(e.report_id, e)
+                raise
+            self.flushes += 1
+            self.flushed_reports += applied
+            self.last_flush_at = datetime.utcnow().isoformat()
+            return applied
+
+    async def replay(self, session_factory, grace_seconds: Optional[float] = None) -> int:
+        """从 ProductionReport 回放未汇总的报工（grace_seconds 为空时回放全部）"""
+        total = 0
+        while True:
+            async with session_factory() as db:
+                stmt = select(ProductionReport).where(ProductionReport.rolled_up_at.is_(None))
+                if grace_seconds is not None:
+                    stmt = stmt.where(ProductionReport.created_at < datetime.utcnow() - timedelta(seconds=grace_seconds))
+                reports = (await db.execute(stmt.order_by(ProductionReport.created_at).limit(REPLAY_BATCH))).scalars().all()
+                applied = await claim_and_apply(db, [RollupEntry.from_report(r) for r in reports])
+                await db.commit()
+            total += applied
+            if len(reports) < REPLAY_BATCH:
+                break
+        if total:
+            logger.info(f"Report rollup replayed {total} reports")
+        self.replayed_reports += total
+        return total
+
+    async def run_forever(self, session_factory=None) -> None:
+        if session_factory is None:
+            from database.db_config import db_config
+            session_factory = db_config.session_factory
+        self.running = True
+        logger.info(f"Report rollup buffer started | interval={self.flush_interval}s max_events={self.max_events}")
+        try:
+            await self.replay(session_factory)
+            self._last_replay = time.monotonic()
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                try:
+                    await self.flush(session_factory)
+                    if time.monotonic() - self._last_replay > REPLAY_INTERVAL_SECONDS:
+                        self._last_replay = time.monotonic()
+                        await self.replay(session_factory, REPLAY_GRACE_SECONDS)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:  # noqa: BLE001 — 刷写循环必须常驻
+                    logger.warning(f"Report rollup flush error: {e}")
+        except asyncio.CancelledError:
+            logger.info("Report rollup buffer stopped")
+        finally:
+            self.running = False
+            # 停机前尽量刷掉缓冲；刷不掉的由下次启动回放
+            try:
+                await self.flush(session_factory)
+            except Exception as e:  # noqa: BLE001
+                logger.warning(f"Report rollup final flush failed, will replay on restart: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "buffered": len(self._entries),
+            "flushes": self.flushes,
+            "flushed_reports": self.flushed_reports,
+            "replayed_reports": self.replayed_reports,
+            "last_flush_at": self.last_flush_at,
+            "flush_interval_ms": int(self.flush_interval * 1000),
+            "max_events": self.max_events,
+        }
+
+
+# 全局缓冲单例
+report_rollup_buffer = ReportRollupBuffer()
+
+
+async def report_rollup_loop() -> None:
+    """汇总刷写循环（main.py startup 启动，REPORT_ROLLUP_BUFFER_ENABLED=0 可关，关闭后报工同步汇总）"""
+    if os.getenv("REPORT_ROLLUP_BUFFER_ENABLED", "1").strip().lower() in {"0", "false", "no", "off"}:
+        logger.info("Report rollup buffer disabled (REPORT_ROLLUP_BUFFER_ENABLED=0)")
+        return
+    await report_rollup_buffer.run_forever()
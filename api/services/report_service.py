@@ -1,19 +1,25 @@
 """
 报工服务 - 岗位替代 Phase 1: 消灭统计员
 快速报工 / 批量报工 / 撤回 / 班次汇总 / 异常预警
+
+计数并发安全：
+- 工单完成数在请求内原子累加（UPDATE x = x + :delta），不在 Python 里读-改-写
+- 班次汇总 / 小时快照由写后缓冲批量 ON CONFLICT 累加（见 report_rollup_service），
+  报工请求只写报工记录并提交
 """
 import uuid
 from datetime import datetime, date, timedelta
 from typing import Optional, List, Dict, Any
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, update
-from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy import select, func, and_, bindparam, insert, update, case
 
 from database.models import (
     ProductionReport, WorkOrder, Station, ShiftSummary,
-    ProductionAlert, HourlyOutputSnapshot, Equipment,
+    ProductionAlert, Equipment,
 )
+from api.services.oee_service import on_production_event
+from api.services.report_rollup_service import RollupEntry, apply_rollups, report_rollup_buffer, rollup_today
 
 
 def _gen_id() -> str:
@@ -21,13 +27,40 @@ def _gen_id() -> str:
 
 
 def _gen_report_code(factory_id: str) -> str:
-    """生成报工编码: RPT-{工厂前3位}-{日期}-{4位随机}"""
+    """生成报工编码: RPT-{工厂前3位}-{日期}-{8位随机}
+
+    同一分钟内多终端并发报工，4 位随机后缀在几百条时就会撞唯一键，放宽到 8 位。
+    """
     prefix = factory_id[:3].upper() if factory_id else "FAC"
     ts = datetime.now().strftime("%m%d%H%M")
-    suffix = uuid.uuid4().hex[:4].upper()
+    suffix = uuid.uuid4().hex[:8].upper()
     return f"RPT-{prefix}-{ts}-{suffix}"
 
 
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _rollup_entry(row: Dict[str, Any]) -> RollupEntry:
+    """批量报工的行字典 → 汇总增量"""
+    return RollupEntry(
+        report_id=row["id"],
+        factory_id=row["factory_id"],
+        shift=row["shift"],
+        station_id=row["station_id"],
+        work_order_id=row["work_order_id"],
+        good_qty=row["good_qty"],
+        defect_qty=row["defect_qty"],
+        scrap_qty=row["scrap_qty"],
+        cycle_time_sec=row["cycle_time_sec"] or 0,
+        reported_at=row["created_at"],
+    )
+
+
 def _detect_shift() -> str:
     """根据当前时间自动判断班次"""
     hour = datetime.now().hour
@@ -91,28 +124,24 @@ class ReportService:
             updated_at=now,
         )
         self.db.add(report)
-
-        # 更新工单完成数量
-        wo = await self.db.get(WorkOrder, work_order_id)
-        if wo:
-            wo.completed_qty = (wo.completed_qty or 0) + good_qty + defect_qty + scrap_qty
-            wo.good_qty = (wo.good_qty or 0) + good_qty
-            wo.defect_qty = (wo.defect_qty or 0) + defect_qty
-            wo.scrap_qty = (wo.scrap_qty or 0) + scrap_qty
-            wo.updated_at = now
-
         await self.db.flush()
 
-        # 异步更新班次汇总 + 小时快照
-        await self._update_shift_summary(factory_id, shift, station_id, work_order_id,
-                                         good_qty, defect_qty, scrap_qty, cycle_time_sec, operator_id)
-        await self._update_hourly_snapshot(factory_id, station_id, good_qty + defect_qty + scrap_qty,
-                                           good_qty, defect_qty)
+        # 更新工单完成数量（库内原子累加）
+        await self._increment_work_order(work_order_id, good_qty, defect_qty, scrap_qty, now)
+
+        # 班次汇总 + 小时快照：缓冲在跑就提交后交给它批量刷写，否则在本事务内同步累加
+        buffered = report_rollup_buffer.running
+        if not buffered:
+            report.rolled_up_at = now
+            await apply_rollups(self.db, [RollupEntry.from_report(report)])
 
         # 检查是否触发预警
         await self._check_alerts(factory_id, station_id, work_order_id, good_qty, defect_qty, scrap_qty)
 
         await self.db.commit()
+        if buffered:
+            report_rollup_buffer.add(RollupEntry.from_report(report))
+        on_production_event(factory_id, machine_id, good_qty + defect_qty + scrap_qty, good_qty)
 
         return {
             "id": report.id,
@@ -133,38 +162,106 @@ class ReportService:
         operator_id: Optional[str] = None,
         shift: Optional[str] = None,
     ) -> Dict[str, Any]:
-        """批量报工 - 一次报多个工序/工单"""
+        """批量报工 - 一次报多个工序/工单（单事务，全部成功或全部不生效）
+
+        一次 IN 查询预取工单 → 一条多行 INSERT 写报工 → 按工单预聚合后 executemany 原子累加
+        → 汇总增量按键聚合后集合式累加，最后只提交一次。
+        """
         shift = shift or _detect_shift()
-        results = []
-        total_good = 0
-        total_defect = 0
+        if not items:
+            return {"count": 0, "total_good": 0, "total_defect": 0, "shift": shift, "items": []}
+        now = datetime.utcnow()
 
+        wo_ids = {str(item["work_order_id"]) for item in items}
+        well_formed = [wid for wid in wo_ids if _is_uuid(wid)]
+        found = {
+            str(wid) for wid in (await self.db.execute(
+                select(WorkOrder.id).where(WorkOrder.id.in_(well_formed))
+            )).scalars()
+        } if well_formed else set()
+        missing = sorted(wo_ids - found)
+        if missing:
+            return {"error": f"工单不存在: {', '.join(missing)}"}
+
+        rows: List[Dict[str, Any]] = []
+        wo_deltas: Dict[str, List[int]] = {}
         for item in items:
-            result = await self.quick_report(
-                factory_id=factory_id,
-                work_order_id=item["work_order_id"],
-                station_id=item["station_id"],
-                good_qty=item.get("good_qty", 0),
-                defect_qty=item.get("defect_qty", 0),
-                scrap_qty=item.get("scrap_qty", 0),
-                operator_id=operator_id or item.get("operator_id"),
-                operation_seq=item.get("operation_seq"),
-                operation_name=item.get("operation_name"),
-                machine_id=item.get("machine_id"),
-                cycle_time_sec=item.get("cycle_time_sec"),
-                remark=item.get("remark"),
-                shift=shift,
+            good, defect, scrap = item.get("good_qty", 0), item.get("defect_qty", 0), item.get("scrap_qty", 0)
+            reporter = operator_id or item.get("operator_id")
+            rows.append({
+                "id": _gen_id(),
+                "report_code": _gen_report_code(factory_id),
+                "factory_id": factory_id,
+                "work_order_id": str(item["work_order_id"]),
+                "station_id": item["station_id"],
+                "good_qty": good,
+                "defect_qty": defect,
+                "scrap_qty": scrap,
+                "report_type": "quick",
+                "shift": shift,
+                "operator_id": reporter,
+                "operation_seq": item.get("operation_seq"),
+                "operation_name": item.get("operation_name"),
+                "machine_id": item.get("machine_id"),
+                "start_time": now,
+                "end_time": now,
+                "cycle_time_sec": item.get("cycle_time_sec"),
+                "remark": item.get("remark"),
+                "rolled_up_at": now,
+                "created_by": reporter,
+                "created_at": now,
+                "updated_at": now,
+            })
+            delta = wo_deltas.setdefault(str(item["work_order_id"]), [0, 0, 0])
+            delta[0] += good
+            delta[1] += defect
+            delta[2] += scrap
+
+        try:
+            await self.db.execute(insert(ProductionReport), rows)
+            wo = WorkOrder.__table__
+            await self.db.execute(
+                update(wo)
+                .where(wo.c.id == bindparam("b_id"))
+                .values(
+                    completed_qty=func.coalesce(wo.c.completed_qty, 0) + bindparam("b_total"),
+                    good_qty=func.coalesce(wo.c.good_qty, 0) + bindparam("b_good"),
+                    defect_qty=func.coalesce(wo.c.defect_qty, 0) + bindparam("b_defect"),
+                    scrap_qty=func.coalesce(wo.c.scrap_qty, 0) + bindparam("b_scrap"),
+                    updated_at=now,
+                ),
+                [
+                    {"b_id": wid, "b_total": g + d + sc, "b_good": g, "b_defect": d, "b_scrap": sc}
+                    for wid, (g, d, sc) in sorted(wo_deltas.items())
+                ],
             )
-            results.append(result)
-            total_good += item.get("good_qty", 0)
-            total_defect += item.get("defect_qty", 0) + item.get("scrap_qty", 0)
+            await apply_rollups(self.db, [_rollup_entry(row) for row in rows])
+            for row in rows:
+                await self._check_alerts(factory_id, row["station_id"], row["work_order_id"],
+                                         row["good_qty"], row["defect_qty"], row["scrap_qty"])
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+
+        for row in rows:
+            on_production_event(factory_id, row["machine_id"],
+                                row["good_qty"] + row["defect_qty"] + row["scrap_qty"], row["good_qty"])
 
         return {
-            "count": len(results),
-            "total_good": total_good,
-            "total_defect": total_defect,
+            "count": len(rows),
+            "total_good": sum(r["good_qty"] for r in rows),
+            "total_defect": sum(r["defect_qty"] + r["scrap_qty"] for r in rows),
             "shift": shift,
-            "items": results,
+            "items": [{
+                "id": r["id"],
+                "report_code": r["report_code"],
+                "good_qty": r["good_qty"],
+                "defect_qty": r["defect_qty"],
+                "scrap_qty": r["scrap_qty"],
+                "shift": shift,
+                "created_at": now.isoformat(),
+            } for r in rows],
         }
 
     # ==================== 报工撤回 ====================
@@ -184,21 +281,43 @@ class ReportService:
             return {"error": "超过5分钟，无法撤回"}
 
         now = datetime.utcnow()
-        report.is_undone = True
-        report.undone_at = now
-        report.undone_by = undone_by
-
-        # 回滚工单数量
-        wo = await self.db.get(WorkOrder, report.work_order_id)
-        if wo:
-            total = report.good_qty + report.defect_qty + report.scrap_qty
-            wo.completed_qty = max(0, (wo.completed_qty or 0) - total)
-            wo.good_qty = max(0, (wo.good_qty or 0) - report.good_qty)
-            wo.defect_qty = max(0, (wo.defect_qty or 0) - report.defect_qty)
-            wo.scrap_qty = max(0, (wo.scrap_qty or 0) - report.scrap_qty)
+        # 撤回标记与工单回滚都是单条原子 UPDATE：并发撤回同一条只有一个生效，工单计数不读-改-写
+        marked = await self.db.execute(
+            update(ProductionReport)
+            .where(ProductionReport.id == report.id, ProductionReport.is_undone.isnot(True))
+            .values(is_undone=True, undone_at=now, undone_by=undone_by)
+            .execution_options(synchronize_session=False)
+        )
+        if marked.rowcount != 1:
+            await self.db.rollback()
+            return {"error": "该报工已撤回"}
+
+        # 回滚工单数量（不低于 0）；用 CASE 截断，PostgreSQL 与 SQLite 通用
+        wo = WorkOrder.__table__
+        good, defect, scrap = report.good_qty or 0, report.defect_qty or 0, report.scrap_qty or 0
+
+        def _minus_floor0(col, qty):
+            remaining = func.coalesce(col, 0) - qty
+            return case((remaining < 0, 0), else_=remaining)
+
+        await self.db.execute(
+            update(wo)
+            .where(wo.c.id == report.work_order_id)
+            .values(
+                completed_qty=_minus_floor0(wo.c.completed_qty, (good + defect + scrap)),
+                good_qty=_minus_floor0(wo.c.good_qty, good),
+                defect_qty=_minus_floor0(wo.c.defect_qty, defect),
+                scrap_qty=_minus_floor0(wo.c.scrap_qty, scrap),
+                updated_at=now,
+            )
+        )
 
+        same_day = report.created_at.date() == now.date()
+        factory_id, machine_id, report_code = report.factory_id, report.machine_id, report.report_code
         await self.db.commit()
-        return {"success": True, "report_code": report.report_code, "undone_at": now.isoformat()}
+        if same_day:
+            on_production_event(factory_id, machine_id, -(good + defect + scrap), -good)
+        return {"success": True, "report_code": report_code, "undone_at": now.isoformat()}
 
     # ==================== 班次汇总 ====================
 
@@ -208,8 +327,8 @@ class ReportService:
         shift_date: Optional[str] = None,
         shift_type: Optional[str] = None,
     ) -> Dict[str, Any]:
-        """获取班次汇总数据"""
-        target_date = date.fromisoformat(shift_date) if shift_date else date.today()
+        """获取班次汇总数据（汇总按报工时间的 UTC 日期分桶，缺省日期同样取 UTC 今天）"""
+        target_date = date.fromisoformat(shift_date) if shift_date else rollup_today()
         target_shift = shift_type or _detect_shift()
 
         stmt = select(ShiftSummary).where(
@@ -300,90 +419,20 @@ class ReportService:
 
     # ==================== 内部方法 ====================
 
-    async def _update_shift_summary(
-        self, factory_id, shift_type, station_id, work_order_id,
-        good_qty, defect_qty, scrap_qty, cycle_time_sec, operator_id
-    ):
-        """更新班次汇总表（UPSERT）"""
-        today = date.today()
-        total = good_qty + defect_qty + scrap_qty
-        yield_rate = (good_qty / total * 100) if total > 0 else 0
-
-        # 查找现有记录
-        stmt = select(ShiftSummary).where(
-            and_(
-                ShiftSummary.factory_id == factory_id,
-                ShiftSummary.shift_date == today,
-                ShiftSummary.shift_type == shift_type,
-                ShiftSummary.station_id == station_id,
-                ShiftSummary.work_order_id == work_order_id,
+    async def _increment_work_order(self, work_order_id, good_qty, defect_qty, scrap_qty, now):
+        """工单完成数原子累加（UPDATE x = x + delta，不先读出来）"""
+        await self.db.execute(
+            update(WorkOrder)
+            .where(WorkOrder.id == work_order_id)
+            .values(
+                completed_qty=func.coalesce(WorkOrder.completed_qty, 0) + good_qty + defect_qty + scrap_qty,
+                good_qty=func.coalesce(WorkOrder.good_qty, 0) + good_qty,
+                defect_qty=func.coalesce(WorkOrder.defect_qty, 0) + defect_qty,
+                scrap_qty=func.coalesce(WorkOrder.scrap_qty, 0) + scrap_qty,
+                updated_at=now,
             )
+            .execution_options(synchronize_session=False)
         )
-        result = await self.db.execute(stmt)
-        summary = result.scalar_one_or_none()
-
-        if summary:
-            summary.total_output += total
-            summary.good_qty += good_qty
-            summary.defect_qty += defect_qty
-            summary.scrap_qty += scrap_qty
-            summary.total_output = summary.good_qty + summary.defect_qty + summary.scrap_qty
-            summary.yield_rate = (summary.good_qty / summary.total_output * 100) if summary.total_output > 0 else 0
-            summary.report_count += 1
-            summary.total_cycle_time += (cycle_time_sec or 0)
-            summary.updated_at = datetime.utcnow()
-        else:
-            summary = ShiftSummary(
-                id=_gen_id(),
-                factory_id=factory_id,
-                shift_date=today,
-                shift_type=shift_type,
-                station_id=station_id,
-                work_order_id=work_order_id,
-                total_output=total,
-                good_qty=good_qty,
-                defect_qty=defect_qty,
-                scrap_qty=scrap_qty,
-                yield_rate=yield_rate,
-                report_count=1,
-                total_cycle_time=cycle_time_sec or 0,
-                operator_count=1,
-            )
-            self.db.add(summary)
-
-    async def _update_hourly_snapshot(self, factory_id, station_id, output_qty, good_qty, defect_qty):
-        """更新小时产出快照"""
-        now = datetime.utcnow()
-        today = now.date()
-        hour = now.hour
-
-        stmt = select(HourlyOutputSnapshot).where(
-            and_(
-                HourlyOutputSnapshot.factory_id == factory_id,
-                HourlyOutputSnapshot.snapshot_date == today,
-                HourlyOutputSnapshot.snapshot_hour == hour,
-                HourlyOutputSnapshot.station_id == station_id,
-            )
-        )
-        result = await self.db.execute(stmt)
-        snapshot = result.scalar_one_or_none()
-
-        if snapshot:
-            snapshot.output_qty += output_qty
-            snapshot.good_qty += good_qty
-            snapshot.defect_qty += defect_qty
-        else:
-            snapshot = HourlyOutputSnapshot(
-                id=_gen_id(),
-                factory_id=factory_id,
-                snapshot_date=today,
-                snapshot_hour=hour,
-                station_id=station_id,
-                output_qty=output_qty,
-                good_qty=good_qty,
-                defect_qty=defect_qty,
-            )
-            self.db.add(snapshot)
 
     async def _check_alerts(self, factory_id, station_id, work_order_id, good_qty, defect_qty, scrap_qty):
         """检查是否触发预警"""
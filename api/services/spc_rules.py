@@ -0,0 +1,174 @@
+"""
+SPC 判异规则引擎（Western Electric / Nelson）
+
+两种运行方式，判定口径一致：
+- evaluate_windows: 整厂批量评估，每个特性最近 W 个点拼成 C×W 矩阵，NumPy 滑窗一次算完
+- SpcRuleState: 单特性增量状态，每个新点 O(1) 更新（流式采集时逐点判异，不回扫历史）
+
+z = (x - CL) / σ，σ 取 (UCL - CL) / 3；无控制限时由调用方给出运行均值/标准差。
+两条路径共用同一口径：
+- 窗口类规则（2/3、4/5、连续同侧、分层）只在窗口内凑满有效 z 值后才判，流开头不按残缺窗口触发
+- 趋势只看相邻数值差分，不要求 σ；其余规则 σ 缺失（<=0 或 NaN）时不判
+"""
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 规则参数
+RUN_LENGTH = 7             # 连续 N 点落在中心线同侧
+TREND_LENGTH = 6           # 连续 N 点单调上升/下降
+STRATIFICATION_LENGTH = 15  # 连续 N 点落在 ±1σ 内（分层/混料）
+
+RULE_LABELS = {
+    "beyond_3s": "1 点超出 3σ",
+    "2of3_2s": "3 点中 2 点超出同侧 2σ",
+    "4of5_1s": "5 点中 4 点超出同侧 1σ",
+    "run": f"连续 {RUN_LENGTH} 点在中心线同侧",
+    "trend": f"连续 {TREND_LENGTH} 点单调上升或下降",
+    "stratification": f"连续 {STRATIFICATION_LENGTH} 点在 ±1σ 内",
+}
+RULE_CODES = tuple(RULE_LABELS)
+
+
+def _rolling_sum(flags: np.ndarray, k: int) -> np.ndarray:
+    """沿最后一维的长度 k 滑窗计数，结果与窗口末点对齐（前 k-1 位为 0）"""
+    c = np.cumsum(flags, axis=-1, dtype=np.int32)
+    out = np.zeros_like(c)
+    if flags.shape[-1] >= k:
+        out[..., k - 1:] = c[..., k - 1:]
+        out[..., k:] -= c[..., :-k]
+    return out
+
+
+def evaluate_windows(values: np.ndarray, cl: np.ndarray, sigma: np.ndarray) -> Dict[str, np.ndarray]:
+    """对 C×W 窗口矩阵批量判异
+
+    values 左侧不足部分用 NaN 填充；cl/sigma 为长度 C 的数组（sigma<=0 或 NaN 的行不判）。
+    返回 {规则: C×W 布尔矩阵}，True 表示该点（作为窗口末点）触发规则。
+    """
+    values = np.asarray(values, dtype=float)
+    cl = np.asarray(cl, dtype=float)[:, None]
+    sigma = np.asarray(sigma, dtype=float)[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (values - cl) / np.where(sigma > 0, sigma, np.nan)
+    valid = ~np.isnan(z)
+    full3 = _rolling_sum(valid, 3) == 3
+    full5 = _rolling_sum(valid, 5) == 5
+
+    above = valid & (z > 0)
+    below = valid & (z < 0)
+    hits = {
+        "beyond_3s": valid & (np.abs(np.nan_to_num(z)) > 3),
+        "2of3_2s": full3 & ((_rolling_sum(valid & (z > 2), 3) >= 2) | (_rolling_sum(valid & (z < -2), 3) >= 2)),
+        "4of5_1s": full5 & ((_rolling_sum(valid & (z > 1), 5) >= 4) | (_rolling_sum(valid & (z < -1), 5) >= 4)),
+        "run": (_rolling_sum(above, RUN_LENGTH) == RUN_LENGTH) | (_rolling_sum(below, RUN_LENGTH) == RUN_LENGTH),
+        "stratification": _rolling_sum(valid & (np.abs(np.nan_to_num(z, nan=np.inf)) < 1), STRATIFICATION_LENGTH)
+        == STRATIFICATION_LENGTH,
+    }
+
+    # 趋势：TREND_LENGTH 个点对应 TREND_LENGTH-1 个同向差分（不依赖 σ）
+    d = np.diff(values, axis=-1)
+    d_valid = ~np.isnan(d)
+    k = TREND_LENGTH - 1
+    up = _rolling_sum(d_valid & (d > 0), k) == k
+    down = _rolling_sum(d_valid & (d < 0), k) == k
+    trend = np.zeros_like(valid)
+    trend[:, 1:] = up | down
+    hits["trend"] = trend
+    return hits
+
+
+def summarize_hits(codes: List[str], hits: Dict[str, np.ndarray]) -> List[Dict[str, object]]:
+    """把命中矩阵整理成按特性的列表（只列有命中的特性）"""
+    any_hit = np.zeros(len(codes), dtype=bool)
+    for m in hits.values():
+        any_hit |= m.any(axis=1)
+    out = []
+    for i in np.flatnonzero(any_hit):
+        rules = [r for r in RULE_CODES if hits[r][i].any()]
+        latest = [r for r in RULE_CODES if hits[r][i, -1]]
+        out.append({
+            "characteristic_code": codes[i],
+            "rules": rules,
+            "rule_labels": [RULE_LABELS[r] for r in rules],
+            "latest_point_rules": latest,
+        })
+    return out
+
+
+class SpcRuleState:
+    """单特性增量判异状态：只保留各规则所需的计数器与最近 5 个 z 值"""
+
+    __slots__ = ("run_above", "run_below", "trend_up", "trend_down",
+                 "within_1s", "last_value", "recent_z")
+
+    def __init__(self):
+        self.run_above = 0
+        self.run_below = 0
+        self.trend_up = 0
+        self.trend_down = 0
+        self.within_1s = 0
+        self.last_value: Optional[float] = None
+        self.recent_z: deque = deque(maxlen=5)
+
+    def push(self, value: float, cl: Optional[float], sigma: Optional[float]) -> List[str]:
+        """累加一个点并返回该点触发的规则"""
+        hit: List[str] = []
+
+        # 趋势只看相邻差分，不依赖控制限
+        if self.last_value is not None:
+            if value > self.last_value:
+                self.trend_up, self.trend_down = self.trend_up + 1, 0
+            elif value < self.last_value:
+                self.trend_up, self.trend_down = 0, self.trend_down + 1
+            else:
+                self.trend_up = self.trend_down = 0
+        self.last_value = value
+
+        if cl is None or not sigma or sigma <= 0:
+            self.run_above = self.run_below = self.within_1s = 0
+            self.recent_z.clear()
+            if max(self.trend_up, self.trend_down) >= TREND_LENGTH - 1:
+                hit.append("trend")
+            return hit
+
+        z = (value - cl) / sigma
+        self.recent_z.append(z)
+        self.run_above = self.run_above + 1 if z > 0 else 0
+        self.run_below = self.run_below + 1 if z < 0 else 0
+        self.within_1s = self.within_1s + 1 if abs(z) < 1 else 0
+
+        last3 = list(self.recent_z)[-3:]
+        last5 = list(self.recent_z)
+        if abs(z) > 3:
+            hit.append("beyond_3s")
+        # 窗口未凑满不判，与批量滑窗口径一致
+        if len(last3) == 3 and (sum(1 for v in last3 if v > 2) >= 2 or sum(1 for v in last3 if v < -2) >= 2):
+            hit.append("2of3_2s")
+        if len(last5) == 5 and (sum(1 for v in last5 if v > 1) >= 4 or sum(1 for v in last5 if v < -1) >= 4):
+            hit.append("4of5_1s")
+        if self.run_above >= RUN_LENGTH or self.run_below >= RUN_LENGTH:
+            hit.append("run")
+        if max(self.trend_up, self.trend_down) >= TREND_LENGTH - 1:
+            hit.append("trend")
+        if self.within_1s >= STRATIFICATION_LENGTH:
+            hit.append("stratification")
+        return [r for r in RULE_CODES if r in hit]
+
+
+def limits_to_sigma(cl: Optional[float], ucl: Optional[float], lcl: Optional[float]) -> Tuple[Optional[float], Optional[float]]:
+    """由控制限推出 (CL, σ)；仅有单侧控制限时用单侧距离"""
+    if cl is None:
+        return None, None
+    if ucl is not None and ucl > cl:
+        return cl, (ucl - cl) / 3
+    if lcl is not None and lcl < cl:
+        return cl, (cl - lcl) / 3
+    return cl, None
+
+
+__all__ = [
+    "RULE_LABELS", "RULE_CODES", "SpcRuleState",
+    "evaluate_windows", "summarize_hits", "limits_to_sigma",
+]
@@ -1,14 +1,27 @@
 """
 SPC 统计过程控制服务 - 岗位替代 Phase 4
-X-bar/R 控制图 + 过程能力 Cpk + 失控检测（Western Electric Rules）
+X-bar/R 控制图 + 过程能力 Cpk + 失控检测（Western Electric / Nelson 规则，见 spc_rules）
+
+流式采集：量具批量上报走 ingest_batch（一次多行 INSERT + 一次 commit），
+每个特性在进程内维护 Welford 均值/方差 + 子组 X̄/R 累加器，
+周期性合并落库到 spc_running_stats（增量在提交成功后才从内存清掉）。
+控制图的点与统计量从库读取，多 worker 下各进程看到的一致。
 """
+import os
+import time
 import uuid
 import math
-from datetime import datetime
-from typing import Optional, Dict, Any, List
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
+
+from api.services.spc_rules import (
+    RULE_LABELS, SpcRuleState, evaluate_windows, limits_to_sigma, summarize_hits,
+)
 
 
 def _gen_id() -> str:
@@ -21,6 +34,190 @@ D3_TABLE = {2: 0, 3: 0, 4: 0, 5: 0, 6: 0, 7: 0.076, 8: 0.136, 9: 0.184, 10: 0.22
 D4_TABLE = {2: 3.267, 3: 2.575, 4: 2.282, 5: 2.115, 6: 2.004, 7: 1.924, 8: 1.864, 9: 1.816, 10: 1.777}
 D2_TABLE = {2: 1.128, 3: 1.693, 4: 2.059, 5: 2.326, 6: 2.534, 7: 2.704, 8: 2.847, 9: 2.970, 10: 3.078}
 
+# 运行统计落库间隔（秒）
+SPC_STATS_FLUSH_SEC = int(os.getenv("SPC_STATS_FLUSH_SEC", "30"))
+# 控制限配置缓存 TTL（秒），多 worker 下配置变更最多延迟这么久生效
+SPC_CONFIG_TTL = int(os.getenv("SPC_CONFIG_TTL", "60"))
+# 无控制限配置时，运行统计至少这么多点才用均值/标准差判异
+SPC_RULE_MIN_SAMPLES = 30
+# 整厂判异最小窗口（需覆盖最长的分层规则）
+RULE_WINDOW_MIN = 15
+
+
+class RunningStats:
+    """Welford 在线均值/方差，支持两段统计合并（Chan 并行公式）"""
+
+    __slots__ = ("n", "mean", "m2", "min", "max")
+
+    def __init__(self, n: int = 0, mean: float = 0.0, m2: float = 0.0,
+                 min_value: Optional[float] = None, max_value: Optional[float] = None):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.min = min_value
+        self.max = max_value
+
+    def push(self, x: float) -> None:
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+
+    def merged(self, other: "RunningStats") -> "RunningStats":
+        if other.n == 0:
+            return RunningStats(self.n, self.mean, self.m2, self.min, self.max)
+        if self.n == 0:
+            return RunningStats(other.n, other.mean, other.m2, other.min, other.max)
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        mean = self.mean + delta * other.n / n
+        m2 = self.m2 + other.m2 + delta * delta * self.n * other.n / n
+        mins = [v for v in (self.min, other.min) if v is not None]
+        maxs = [v for v in (self.max, other.max) if v is not None]
+        return RunningStats(n, mean, m2, min(mins) if mins else None, max(maxs) if maxs else None)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class CharacteristicState:
+    """单个 SPC 特性的流式状态
+
+    base 为已落库部分，pending 为本进程尚未合并落库的增量，flushing 为已写库、
+    事务尚未提交的增量（提交成功转入 base，失败并回 pending）；子组累加器同理。
+    未闭合子组只存在内存中。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config: Dict[str, Any] = dict(config or {})
+        self.config_loaded_at = time.monotonic()
+        self.base = RunningStats()
+        self.pending = RunningStats()
+        self.base_subgroups = 0
+        self.base_xbar_sum = 0.0
+        self.base_r_sum = 0.0
+        self.pending_subgroups = 0
+        self.pending_xbar_sum = 0.0
+        self.pending_r_sum = 0.0
+        # (RunningStats, 子组数, X̄ 和, R 和)
+        self.flushing: Optional[Tuple[RunningStats, int, float, float]] = None
+        self.open_group: Optional[int] = None
+        self.open_values: List[float] = []
+        self.last_flush = time.monotonic()
+
+    @property
+    def subgroup_size(self) -> int:
+        return min(max(int(self.config.get("subgroup_size") or 5), 2), 10)
+
+    def set_config(self, config: Optional[Dict[str, Any]]) -> None:
+        self.config = dict(config or {})
+        self.config_loaded_at = time.monotonic()
+
+    def push(self, value: float, sample_group: Optional[int] = None) -> None:
+        """累加一个测量值；sample_group 变化或达到子组容量时闭合子组"""
+        self.pending.push(value)
+        if sample_group is not None:
+            if self.open_group is not None and sample_group != self.open_group:
+                self._close_subgroup()
+            self.open_group = sample_group
+            self.open_values.append(value)
+        else:
+            if self.open_group is not None:
+                self._close_subgroup()
+            self.open_values.append(value)
+            if len(self.open_values) >= self.subgroup_size:
+                self._close_subgroup()
+
+    def _close_subgroup(self) -> None:
+        vals = self.open_values
+        if len(vals) >= 2:
+            self.pending_subgroups += 1
+            self.pending_xbar_sum += sum(vals) / len(vals)
+            self.pending_r_sum += max(vals) - min(vals)
+        self.open_group = None
+        self.open_values = []
+
+    def unflushed(self) -> Tuple[RunningStats, int, float, float]:
+        """本进程尚未提交进 spc_running_stats 的增量（pending + flushing）"""
+        stats, k = self.pending, self.pending_subgroups
+        xs, rs = self.pending_xbar_sum, self.pending_r_sum
+        if self.flushing:
+            f_stats, f_k, f_xs, f_rs = self.flushing
+            stats, k, xs, rs = f_stats.merged(stats), f_k + k, f_xs + xs, f_rs + rs
+        return stats, k, xs, rs
+
+    def totals(self) -> RunningStats:
+        return self.base.merged(self.unflushed()[0])
+
+    def xbar_r(self) -> Tuple[int, Optional[float], Optional[float]]:
+        _, pk, pxs, prs = self.unflushed()
+        k = self.base_subgroups + pk
+        if k == 0:
+            return 0, None, None
+        return k, (self.base_xbar_sum + pxs) / k, (self.base_r_sum + prs) / k
+
+    def cpk(self) -> Optional[float]:
+        stats = self.totals()
+        if stats.n < 10:
+            return None
+        return _cpk_from_moments(stats.mean, stats.std, self.config.get("usl"), self.config.get("lsl"))
+
+    def rule_limits(self) -> Tuple[Optional[float], Optional[float]]:
+        """判异用 (CL, σ)：优先控制限配置，其次运行统计"""
+        cfg = self.config
+        if cfg and cfg.get("is_active", True) is not False:
+            cl, sigma = limits_to_sigma(cfg.get("cl"), cfg.get("ucl"), cfg.get("lcl"))
+            if sigma:
+                return cl, sigma
+        stats = self.totals()
+        if stats.n >= SPC_RULE_MIN_SAMPLES and stats.std > 0:
+            return stats.mean, stats.std
+        return None, None
+
+    def is_dirty(self) -> bool:
+        return self.pending.n > 0 or self.pending_subgroups > 0
+
+    def begin_flush(self) -> Tuple[RunningStats, int, float, float]:
+        """换出 pending 作为待提交增量；await 期间新到的点进新的 pending"""
+        self.flushing = (self.pending, self.pending_subgroups, self.pending_xbar_sum, self.pending_r_sum)
+        self.pending = RunningStats()
+        self.pending_subgroups, self.pending_xbar_sum, self.pending_r_sum = 0, 0.0, 0.0
+        self.last_flush = time.monotonic()
+        return self.flushing
+
+    def end_flush(self, committed: bool, row: Optional[Dict[str, Any]] = None) -> None:
+        """提交成功：以库中合并结果（含其他 worker 的增量）为新基线；失败：增量并回 pending"""
+        if self.flushing is None:
+            return
+        if committed:
+            self.base = RunningStats(row["n"], row["mean"] or 0.0, row["m2"] or 0.0,
+                                     row["min_value"], row["max_value"])
+            self.base_subgroups = row["subgroup_count"]
+            self.base_xbar_sum = row["xbar_sum"]
+            self.base_r_sum = row["r_sum"]
+        else:
+            f_stats, f_k, f_xs, f_rs = self.flushing
+            self.pending = f_stats.merged(self.pending)
+            self.pending_subgroups += f_k
+            self.pending_xbar_sum += f_xs
+            self.pending_r_sum += f_rs
+        self.flushing = None
+
+
+# (factory_id, characteristic_code) -> CharacteristicState，进程级
+_states: Dict[Tuple[str, str], CharacteristicState] = {}
+
+
+def _cpk_from_moments(mean: float, std: float, usl: Optional[float], lsl: Optional[float]) -> Optional[float]:
+    if not usl or not lsl or std == 0:
+        return None
+    cpu = (usl - mean) / (3 * std)
+    cpl = (mean - lsl) / (3 * std)
+    return round(min(cpu, cpl), 3)
+
 
 class SpcService:
     """SPC 统计过程控制"""
@@ -40,82 +237,172 @@ class SpcService:
         measured_by: Optional[str] = None,
     ) -> Dict[str, Any]:
         """记录 SPC 测量值"""
-        now = datetime.utcnow()
+        result = await self.ingest_batch(factory_id, [{
+            "characteristic_code": characteristic_code,
+            "measured_value": measured_value,
+            "characteristic_name": characteristic_name,
+            "work_order_id": work_order_id,
+            "station_id": station_id,
+            "sample_group": sample_group,
+        }], measured_by=measured_by)
+        point = result["points"][0]
 
-        # 获取控制限配置
-        config = await self.db.execute(text(
-            "SELECT ucl, cl, lcl FROM spc_chart_config WHERE factory_id = :fid AND characteristic_code = :code AND is_active = TRUE"
-        ), {"fid": factory_id, "code": characteristic_code})
-        cfg = config.mappings().first()
+        return {
+            "success": True,
+            "measured_value": measured_value,
+            "is_out_of_control": point["is_out_of_control"],
+            "ucl": point["ucl"], "cl": point["cl"], "lcl": point["lcl"],
+        }
 
-        ucl = cfg["ucl"] if cfg else None
-        cl = cfg["cl"] if cfg else None
-        lcl = cfg["lcl"] if cfg else None
+    async def ingest_batch(
+        self,
+        factory_id: str,
+        points: List[Dict[str, Any]],
+        measured_by: Optional[str] = None,
+        flush_stats: bool = False,
+    ) -> Dict[str, Any]:
+        """批量写入测量值
 
-        # 判定是否失控
-        is_ooc = False
-        if ucl is not None and measured_value > ucl:
-            is_ooc = True
-        if lcl is not None and measured_value < lcl:
-            is_ooc = True
+        控制限取自内存配置缓存，所有点一次多行 INSERT，运行统计按间隔合并落库，
+        整批只 commit 一次。points 元素字段同 record_measurement 参数。
+        """
+        if not points:
+            return {"success": True, "accepted": 0, "out_of_control": 0, "points": []}
 
-        await self.db.execute(text("""
-            INSERT INTO qms_spc_points (id, factory_id, characteristic_code, characteristic_name,
-                work_order_id, station_id, measured_value, sample_group, ucl, lcl, cl,
-                is_out_of_control, measured_at, measured_by)
-            VALUES (:id, :fid, :code, :name, :woid, :sid, :val, :grp, :ucl, :lcl, :cl, :ooc, :now, :by)
-        """), {
-            "id": _gen_id(), "fid": factory_id, "code": characteristic_code,
-            "name": characteristic_name, "woid": work_order_id, "sid": station_id,
-            "val": measured_value, "grp": sample_group,
-            "ucl": ucl, "lcl": lcl, "cl": cl, "ooc": is_ooc,
-            "now": now, "by": measured_by,
-        })
-        await self.db.commit()
+        now = datetime.utcnow()
+        codes = {p["characteristic_code"] for p in points}
+        fresh = [code for code in codes if (factory_id, code) not in _states]
+        states = await self._load_states(factory_id, codes)
+
+        # 判异状态按库中各特性最近点重建，不依赖本进程见过哪些点（多 worker 一致）
+        rule_states = await self._rule_states(factory_id, states)
+
+        rows = []
+        summary = []
+        for p in points:
+            code = p["characteristic_code"]
+            value = float(p["measured_value"])
+            cfg = states[code].config
+            # 停用的配置不参与判异（与原单点写入语义一致）
+            active = bool(cfg) and cfg.get("is_active", True) is not False
+            ucl = cfg.get("ucl") if active else None
+            cl = cfg.get("cl") if active else None
+            lcl = cfg.get("lcl") if active else None
+            # 判定是否失控：越限 + 增量判异规则（O(1)，不回扫历史）
+            rule_cl, rule_sigma = states[code].rule_limits()
+            rules = rule_states[code].push(value, rule_cl, rule_sigma)
+            beyond = (ucl is not None and value > ucl) or (lcl is not None and value < lcl)
+            is_ooc = beyond or bool(rules)
+            # 同批未带时间戳的点按上报顺序错开 1µs，保证按 measured_at 排序稳定
+            measured_at = p.get("measured_at") or now + timedelta(microseconds=len(rows))
+            rows.append({
+                "id": _gen_id(), "fid": factory_id, "code": code,
+                "name": p.get("characteristic_name"), "woid": p.get("work_order_id"),
+                "sid": p.get("station_id"), "val": value, "grp": p.get("sample_group"),
+                "ucl": ucl, "lcl": lcl, "cl": cl, "ooc": is_ooc,
+                "rules": ",".join(rules) or None,
+                "now": measured_at, "by": measured_by,
+            })
+            summary.append({
+                "characteristic_code": code, "measured_value": value,
+                "is_out_of_control": is_ooc, "ucl": ucl, "cl": cl, "lcl": lcl,
+                "rules": rules,
+            })
+
+        flushed: List[Tuple[CharacteristicState, Dict[str, Any]]] = []
+        try:
+            await self.db.execute(text("""
+                INSERT INTO qms_spc_points (id, factory_id, characteristic_code, characteristic_name,
+                    work_order_id, station_id, measured_value, sample_group, ucl, lcl, cl,
+                    is_out_of_control, ooc_rules, measured_at, measured_by)
+                VALUES (:id, :fid, :code, :name, :woid, :sid, :val, :grp, :ucl, :lcl, :cl, :ooc,
+                    :rules, :now, :by)
+            """), rows)
+
+            due = [
+                (code, st) for code, st in states.items()
+                if st.flushing is None and st.is_dirty()
+                and (flush_stats or time.monotonic() - st.last_flush >= SPC_STATS_FLUSH_SEC)
+            ]
+            if due:
+                flushed = await _persist_states(self.db, factory_id, due)
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            # 未提交的增量并回 pending，下次再落库；本批测量点随事务回滚，不计入运行统计
+            for st, _ in flushed:
+                st.end_flush(False)
+            # 本次新播种的基线随事务回滚，状态作废，下次重新播种
+            for code in fresh:
+                st = states[code]
+                if _states.get((factory_id, code)) is st and st.flushing is None and not st.is_dirty():
+                    del _states[(factory_id, code)]
+            raise
+
+        for st, row in flushed:
+            st.end_flush(True, row)
+        for row in rows:
+            states[row["code"]].push(row["val"], row["grp"])
 
         return {
             "success": True,
-            "measured_value": measured_value,
-            "is_out_of_control": is_ooc,
-            "ucl": ucl, "cl": cl, "lcl": lcl,
+            "accepted": len(rows),
+            "out_of_control": sum(1 for r in rows if r["ooc"]),
+            "points": summary,
         }
 
     async def get_control_chart(
         self, factory_id: str, characteristic_code: str, limit: int = 50
     ) -> Dict[str, Any]:
-        """获取控制图数据"""
+        """获取控制图数据
+
+        点从 qms_spc_points 读（走 idx_spc_char）；均值/标准差/Cpk 取 spc_running_stats
+        再并上本进程未落库的增量，任一 worker 返回一致。
+        注意：points 只含最近 limit 个点，Cpk/mean/std 则基于该特性全部历史
+        （响应中 cpk_scope="all_history"，样本数见 sample_count），不随 limit 变化。
+        """
+        fresh = (factory_id, characteristic_code) not in _states
+        st = (await self._load_states(factory_id, {characteristic_code}))[characteristic_code]
+        if fresh:
+            await self.db.commit()  # 提交播种行，之后本进程的增量都以它为基线
+        params = {"fid": factory_id, "code": characteristic_code, "lim": limit}
         result = await self.db.execute(text("""
-            SELECT measured_value, sample_group, ucl, lcl, cl, is_out_of_control, measured_at, station_id
+            SELECT measured_value, sample_group, ucl, lcl, cl, is_out_of_control, ooc_rules,
+                measured_at, station_id
             FROM qms_spc_points
             WHERE factory_id = :fid AND characteristic_code = :code
             ORDER BY measured_at DESC LIMIT :lim
-        """), {"fid": factory_id, "code": characteristic_code, "lim": limit})
+        """), params)
         points = [dict(r) for r in result.mappings().all()]
         points.reverse()  # 时间正序
 
-        # 获取配置
-        config = await self.db.execute(text(
-            "SELECT * FROM spc_chart_config WHERE factory_id = :fid AND characteristic_code = :code"
-        ), {"fid": factory_id, "code": characteristic_code})
-        cfg = config.mappings().first()
-
-        # 计算过程能力
-        values = [p["measured_value"] for p in points]
-        cpk = None
-        if cfg and len(values) >= 10:
-            cpk = self._calc_cpk(values, cfg.get("usl"), cfg.get("lsl"))
+        row = (await self.db.execute(text("""
+            SELECT n, mean, m2, min_value, max_value FROM spc_running_stats
+            WHERE factory_id = :fid AND characteristic_code = :code
+        """), params)).mappings().first()
+        stats = RunningStats()
+        if row:
+            stats = RunningStats(row["n"] or 0, row["mean"] or 0.0, row["m2"] or 0.0,
+                                 row["min_value"], row["max_value"])
+        stats = stats.merged(st.unflushed()[0])
+        cfg = st.config
 
         return {
             "characteristic_code": characteristic_code,
-            "characteristic_name": cfg["characteristic_name"] if cfg else characteristic_code,
-            "chart_type": cfg["chart_type"] if cfg else "Xbar-R",
+            "characteristic_name": cfg.get("characteristic_name") or characteristic_code,
+            "chart_type": cfg.get("chart_type") or "Xbar-R",
             "points": points,
-            "ucl": cfg["ucl"] if cfg else None,
-            "cl": cfg["cl"] if cfg else None,
-            "lcl": cfg["lcl"] if cfg else None,
-            "usl": cfg["usl"] if cfg else None,
-            "lsl": cfg["lsl"] if cfg else None,
-            "cpk": cpk,
+            "ucl": cfg.get("ucl"),
+            "cl": cfg.get("cl"),
+            "lcl": cfg.get("lcl"),
+            "usl": cfg.get("usl"),
+            "lsl": cfg.get("lsl"),
+            "cpk": _cpk_from_moments(stats.mean, stats.std, cfg.get("usl"), cfg.get("lsl"))
+            if cfg and stats.n >= 10 else None,
+            "cpk_scope": "all_history",
+            "mean": round(stats.mean, 4) if stats.n else None,
+            "std": round(stats.std, 4) if stats.n > 1 else None,
+            "sample_count": stats.n,
             "total_points": len(points),
             "ooc_count": sum(1 for p in points if p["is_out_of_control"]),
         }
@@ -123,46 +410,62 @@ class SpcService:
     async def calculate_control_limits(
         self, factory_id: str, characteristic_code: str, subgroup_size: int = 5
     ) -> Dict[str, Any]:
-        """根据历史数据计算控制限"""
+        """根据历史数据计算控制限
+
+        A2/D3/D4 按 subgroup_size 取（仅支持 2~10）。子组容量与特性配置一致时用流式子组累加器
+        （全历史 X̄/R，O(1)）；否则或累加器子组不足时扫描最近 200 点重新分组：
+        有 sample_group 的按组号，没有的按时间顺序每 subgroup_size 点一组，只用满员子组。
+        """
+        if subgroup_size not in A2_TABLE:
+            return {"error": f"子组容量须为 {min(A2_TABLE)}~{max(A2_TABLE)}，收到 {subgroup_size}"}
+
+        st = (await self._load_states(factory_id, {characteristic_code}))[characteristic_code]
+        k, x_double_bar, r_bar = st.xbar_r()
+        if subgroup_size == st.subgroup_size and k >= 5 and st.totals().n >= subgroup_size * 5:
+            return await self._save_limits(factory_id, characteristic_code, x_double_bar, r_bar, k, subgroup_size)
+
         result = await self.db.execute(text("""
             SELECT measured_value, sample_group
             FROM qms_spc_points
             WHERE factory_id = :fid AND characteristic_code = :code
             ORDER BY measured_at DESC LIMIT 200
         """), {"fid": factory_id, "code": characteristic_code})
-        rows = result.mappings().all()
+        rows = list(result.mappings().all())
+        rows.reverse()  # 时间正序，无组号的点按到达顺序切子组
 
         if len(rows) < subgroup_size * 5:
             return {"error": f"数据不足（需至少 {subgroup_size * 5} 个点）", "count": len(rows)}
 
-        values = [r["measured_value"] for r in rows]
-
-        # 按子组分组
-        groups: Dict[int, List[float]] = {}
+        groups: Dict[Any, List[float]] = {}
+        chunk: List[float] = []
         for r in rows:
-            grp = r["sample_group"] or (len(groups) + 1)
-            if grp not in groups:
-                groups[grp] = []
-            groups[grp].append(r["measured_value"])
-
-        # 计算 X-bar 和 R
-        xbars = []
-        ranges = []
-        for grp_vals in groups.values():
-            if len(grp_vals) >= 2:
-                xbars.append(sum(grp_vals) / len(grp_vals))
-                ranges.append(max(grp_vals) - min(grp_vals))
-
-        if not xbars:
-            return {"error": "无法计算（子组数据不足）"}
-
+            if r["sample_group"] is not None:
+                groups.setdefault(("g", r["sample_group"]), []).append(r["measured_value"])
+                continue
+            chunk.append(r["measured_value"])
+            if len(chunk) == subgroup_size:
+                groups[("c", len(groups))] = chunk
+                chunk = []
+
+        full = [vals for vals in groups.values() if len(vals) == subgroup_size]
+        if len(full) < 5:
+            return {"error": f"容量为 {subgroup_size} 的子组不足 5 个（共 {len(full)} 个），请核对子组容量"}
+
+        xbars = [sum(vals) / len(vals) for vals in full]
+        ranges = [max(vals) - min(vals) for vals in full]
         x_double_bar = sum(xbars) / len(xbars)
-        r_bar = sum(ranges) / len(ranges) if ranges else 0
+        r_bar = sum(ranges) / len(ranges)
+        return await self._save_limits(factory_id, characteristic_code, x_double_bar, r_bar, len(full), subgroup_size)
 
-        n = min(subgroup_size, 10)
-        A2 = A2_TABLE.get(n, 0.577)
-        D3 = D3_TABLE.get(n, 0)
-        D4 = D4_TABLE.get(n, 2.115)
+    async def _save_limits(
+        self, factory_id: str, characteristic_code: str,
+        x_double_bar: float, r_bar: float, subgroups_used: int, subgroup_size: int,
+    ) -> Dict[str, Any]:
+        """由 X̿ / R̄ 计算控制限并写回配置"""
+        n = subgroup_size
+        A2 = A2_TABLE[n]
+        D3 = D3_TABLE[n]
+        D4 = D4_TABLE[n]
 
         # X-bar 控制限
         xbar_ucl = x_double_bar + A2 * r_bar
@@ -185,12 +488,13 @@ class SpcService:
             "n": n, "now": datetime.utcnow(),
         })
         await self.db.commit()
+        _expire_config(factory_id, characteristic_code)
 
         return {
             "success": True,
             "xbar_chart": {"ucl": round(xbar_ucl, 4), "cl": round(x_double_bar, 4), "lcl": round(xbar_lcl, 4)},
             "r_chart": {"ucl": round(r_ucl, 4), "cl": round(r_bar, 4), "lcl": round(r_lcl, 4)},
-            "subgroups_used": len(xbars),
+            "subgroups_used": subgroups_used,
             "subgroup_size": n,
         }
 
@@ -222,19 +526,254 @@ class SpcService:
             "n": subgroup_size, "now": datetime.utcnow(),
         })
         await self.db.commit()
+        _expire_config(factory_id, characteristic_code)
         return {"success": True, "characteristic_code": characteristic_code}
 
+    async def evaluate_rules(self, factory_id: str, window: int = 50) -> Dict[str, Any]:
+        """整厂判异：每个特性最近 window 个点，NumPy 滑窗一次评估全部规则
+
+        覆盖已配置控制限或已有运行统计的特性（流式采集会自动登记运行统计）。
+        """
+        started = time.perf_counter()
+        window = max(min(window, 500), RULE_WINDOW_MIN)
+        # 每个特性一行：控制限 + 运行统计 + 最近 window 点（走 idx_spc_char 倒序取 LIMIT）
+        result = await self.db.execute(text("""
+            SELECT k.characteristic_code, c.cl, c.ucl, c.lcl, c.is_active, s.n, s.mean, s.m2,
+                ARRAY(
+                    SELECT p.measured_value FROM qms_spc_points p
+                    WHERE p.factory_id = :fid AND p.characteristic_code = k.characteristic_code
+                    ORDER BY p.measured_at DESC LIMIT :w
+                ) AS vals
+            FROM (
+                SELECT characteristic_code FROM spc_chart_config WHERE factory_id = :fid
+                UNION
+                SELECT characteristic_code FROM spc_running_stats WHERE factory_id = :fid
+            ) k
+            LEFT JOIN spc_chart_config c
+              ON c.factory_id = :fid AND c.characteristic_code = k.characteristic_code
+            LEFT JOIN spc_running_stats s
+              ON s.factory_id = :fid AND s.characteristic_code = k.characteristic_code
+        """), {"fid": factory_id, "w": window})
+        rows = [r for r in result.mappings().all() if r["vals"]]
+        if not rows:
+            return {"factory_id": factory_id, "evaluated": 0, "hits": [], "elapsed_ms": 0}
+
+        codes = [r["characteristic_code"] for r in rows]
+        values = np.full((len(rows), window), np.nan)
+        cl = np.full(len(rows), np.nan)
+        sigma = np.full(len(rows), np.nan)
+        for i, r in enumerate(rows):
+            vals = r["vals"]
+            # 数组为时间倒序；不足 window 的特性左侧留 NaN
+            values[i, window - len(vals):] = vals[::-1]
+            c, sg = (None, None)
+            if r["is_active"] is not False:
+                c, sg = limits_to_sigma(r["cl"], r["ucl"], r["lcl"])
+            if not sg and (r["n"] or 0) >= SPC_RULE_MIN_SAMPLES and r["m2"]:
+                c, sg = r["mean"], math.sqrt(r["m2"] / (r["n"] - 1))
+            if sg:
+                cl[i], sigma[i] = c, sg
+
+        hits = evaluate_windows(values, cl, sigma)
+        summary = summarize_hits(codes, hits)
+        return {
+            "factory_id": factory_id,
+            "evaluated": len(codes),
+            "window": window,
+            "hits": summary,
+            "rule_labels": RULE_LABELS,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
     # ==================== 内部方法 ====================
 
-    def _calc_cpk(self, values: List[float], usl: Optional[float], lsl: Optional[float]) -> Optional[float]:
-        """计算 Cpk"""
-        if not usl or not lsl or len(values) < 2:
-            return None
-        mean = sum(values) / len(values)
-        variance = sum((x - mean) ** 2 for x in values) / (len(values) - 1)
-        std = math.sqrt(variance)
-        if std == 0:
-            return None
-        cpu = (usl - mean) / (3 * std)
-        cpl = (mean - lsl) / (3 * std)
-        return round(min(cpu, cpl), 3)
+    async def _load_states(self, factory_id: str, codes) -> Dict[str, CharacteristicState]:
+        """取特性流式状态；缺失的一次性从库重建，配置过期的批量刷新"""
+        now = time.monotonic()
+        states: Dict[str, CharacteristicState] = {}
+        missing, stale = [], []
+        for code in codes:
+            st = _states.get((factory_id, code))
+            if st is None:
+                missing.append(code)
+            else:
+                states[code] = st
+                if now - st.config_loaded_at >= SPC_CONFIG_TTL:
+                    stale.append(code)
+
+        if missing or stale:
+            configs = await self._fetch_configs(factory_id, missing + stale)
+            for code in stale:
+                states[code].set_config(configs.get(code))
+        if missing:
+            for code, st in (await self._hydrate_states(factory_id, missing, configs)).items():
+                # 并发请求可能已先建好，保留先建的那份
+                states[code] = _states.setdefault((factory_id, code), st)
+        return states
+
+    async def _fetch_configs(self, factory_id: str, codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        stmt = text(
+            "SELECT * FROM spc_chart_config WHERE factory_id = :fid AND characteristic_code IN :codes"
+        ).bindparams(bindparam("codes", expanding=True))
+        result = await self.db.execute(stmt, {"fid": factory_id, "codes": list(codes)})
+        return {r["characteristic_code"]: dict(r) for r in result.mappings().all()}
+
+    async def _hydrate_states(
+        self, factory_id: str, codes: List[str], configs: Dict[str, Dict[str, Any]]
+    ) -> Dict[str, CharacteristicState]:
+        """从 spc_running_stats 恢复基线；无记录的特性先由历史点聚合播种
+
+        播种行与调用方第一批测量点同一事务提交；没有历史点的特性也插一行 n=0 的空行。
+        于是某 worker 写入的点要么已在播种行里，要么只在它的增量里：其他 worker 播种时
+        撞上已有行（或等待未提交的行）即 DO NOTHING，不会把别人尚未落库的增量再聚合一遍。
+        """
+        params = {"fid": factory_id, "codes": list(codes), "now": datetime.utcnow()}
+        await self.db.execute(text("""
+            INSERT INTO spc_running_stats (factory_id, characteristic_code, n, mean, m2,
+                min_value, max_value, subgroup_count, xbar_sum, r_sum, updated_at)
+            SELECT p.factory_id, p.characteristic_code, COUNT(*), AVG(p.measured_value),
+                COALESCE(VAR_SAMP(p.measured_value), 0) * (COUNT(*) - 1),
+                MIN(p.measured_value), MAX(p.measured_value),
+                COALESCE(MAX(g.k), 0), COALESCE(MAX(g.xbar_sum), 0), COALESCE(MAX(g.r_sum), 0), :now
+            FROM qms_spc_points p
+            LEFT JOIN (
+                SELECT characteristic_code, COUNT(*) AS k, SUM(xbar) AS xbar_sum, SUM(r) AS r_sum
+                FROM (
+                    SELECT characteristic_code, AVG(measured_value) AS xbar,
+                        MAX(measured_value) - MIN(measured_value) AS r
+                    FROM qms_spc_points
+                    WHERE factory_id = :fid AND characteristic_code IN :codes AND sample_group IS NOT NULL
+                    GROUP BY characteristic_code, sample_group
+                    HAVING COUNT(*) >= 2
+                ) sg
+                GROUP BY characteristic_code
+            ) g ON g.characteristic_code = p.characteristic_code
+            WHERE p.factory_id = :fid AND p.characteristic_code IN :codes
+            GROUP BY p.factory_id, p.characteristic_code
+            ON CONFLICT (factory_id, characteristic_code) DO NOTHING
+        """).bindparams(bindparam("codes", expanding=True)), params)
+        await self.db.execute(text("""
+            INSERT INTO spc_running_stats (factory_id, characteristic_code, updated_at)
+            SELECT :fid, k.code, :now FROM unnest(CAST(:codes AS TEXT[])) AS k(code)
+            ON CONFLICT (factory_id, characteristic_code) DO NOTHING
+        """), params)
+
+        stats = await self.db.execute(text("""
+            SELECT characteristic_code, n, mean, m2, min_value, max_value, subgroup_count, xbar_sum, r_sum
+            FROM spc_running_stats
+            WHERE factory_id = :fid AND characteristic_code IN :codes
+        """).bindparams(bindparam("codes", expanding=True)), params)
+        stats_by_code = {r["characteristic_code"]: r for r in stats.mappings().all()}
+
+        states = {}
+        for code in codes:
+            st = CharacteristicState(configs.get(code))
+            row = stats_by_code.get(code)
+            if row:
+                st.base = RunningStats(row["n"] or 0, row["mean"] or 0.0, row["m2"] or 0.0,
+                                       row["min_value"], row["max_value"])
+                st.base_subgroups = row["subgroup_count"] or 0
+                st.base_xbar_sum = row["xbar_sum"] or 0.0
+                st.base_r_sum = row["r_sum"] or 0.0
+            states[code] = st
+        return states
+
+    async def _rule_states(
+        self, factory_id: str, states: Dict[str, CharacteristicState]
+    ) -> Dict[str, SpcRuleState]:
+        """各特性用库中最近 RULE_WINDOW_MIN 点（最长的分层规则）回放出判异状态
+
+        每个特性走 idx_spc_char 倒序取 LIMIT，一次查询覆盖整批。
+        """
+        result = await self.db.execute(text("""
+            SELECT k.code AS characteristic_code,
+                ARRAY(
+                    SELECT p.measured_value FROM qms_spc_points p
+                    WHERE p.factory_id = :fid AND p.characteristic_code = k.code
+                    ORDER BY p.measured_at DESC LIMIT :lim
+                ) AS vals
+            FROM unnest(CAST(:codes AS TEXT[])) AS k(code)
+        """), {"fid": factory_id, "codes": list(states), "lim": RULE_WINDOW_MIN})
+        recent = {r["characteristic_code"]: r["vals"] or [] for r in result.mappings().all()}
+
+        rule_states = {}
+        for code, st in states.items():
+            rule = SpcRuleState()
+            rule_cl, rule_sigma = st.rule_limits()
+            # 数组为时间倒序
+            for value in reversed(recent.get(code, [])):
+                rule.push(value, rule_cl, rule_sigma)
+            rule_states[code] = rule
+        return rule_states
+
+
+def _expire_config(factory_id: str, characteristic_code: str) -> None:
+    """配置变更后让本进程缓存立即失效"""
+    st = _states.get((factory_id, characteristic_code))
+    if st is not None:
+        st.config_loaded_at = -SPC_CONFIG_TTL
+
+
+async def _persist_states(
+    db: AsyncSession, factory_id: str, items: List[Tuple[str, CharacteristicState]]
+) -> List[Tuple[CharacteristicState, Dict[str, Any]]]:
+    """把各特性的 pending 增量合并进 spc_running_stats（库内按 Chan 公式合并，多 worker 安全）
+
+    不 commit，由调用方与测量点写入同一事务提交。返回 (状态, 库中合并结果)：
+    提交成功后调用方逐个 end_flush(True, row)，失败则 end_flush(False) 把增量并回 pending。
+    """
+    flushed: List[Tuple[CharacteristicState, Dict[str, Any]]] = []
+    try:
+        for code, st in items:
+            delta, k, xs, rs = st.begin_flush()
+            flushed.append((st, {}))
+            result = await db.execute(text("""
+                INSERT INTO spc_running_stats AS s (factory_id, characteristic_code, n, mean, m2,
+                    min_value, max_value, subgroup_count, xbar_sum, r_sum, updated_at)
+                VALUES (:fid, :code, :n, :mean, :m2, :mn, :mx, :k, :xs, :rs, :now)
+                ON CONFLICT (factory_id, characteristic_code) DO UPDATE SET
+                    n = s.n + EXCLUDED.n,
+                    mean = s.mean + (EXCLUDED.mean - s.mean) * EXCLUDED.n / NULLIF(s.n + EXCLUDED.n, 0),
+                    m2 = s.m2 + EXCLUDED.m2
+                        + (EXCLUDED.mean - s.mean) * (EXCLUDED.mean - s.mean)
+                          * s.n * EXCLUDED.n / NULLIF(s.n + EXCLUDED.n, 0),
+                    min_value = LEAST(s.min_value, EXCLUDED.min_value),
+                    max_value = GREATEST(s.max_value, EXCLUDED.max_value),
+                    subgroup_count = s.subgroup_count + EXCLUDED.subgroup_count,
+                    xbar_sum = s.xbar_sum + EXCLUDED.xbar_sum,
+                    r_sum = s.r_sum + EXCLUDED.r_sum,
+                    updated_at = EXCLUDED.updated_at
+                RETURNING n, mean, m2, min_value, max_value, subgroup_count, xbar_sum, r_sum
+            """), {
+                "fid": factory_id, "code": code, "n": delta.n, "mean": delta.mean, "m2": delta.m2,
+                "mn": delta.min, "mx": delta.max, "k": k, "xs": xs, "rs": rs,
+                "now": datetime.utcnow(),
+            })
+            flushed[-1] = (st, dict(result.mappings().first()))
+    except Exception:
+        for st, _ in flushed:
+            st.end_flush(False)
+        raise
+    return flushed
+
+
+async def flush_running_stats(db: AsyncSession) -> int:
+    """把所有特性的未落库增量写回（后台调度器/停机时调用），返回落库特性数"""
+    by_factory: Dict[str, List[Tuple[str, CharacteristicState]]] = {}
+    for (fid, code), st in list(_states.items()):
+        if st.flushing is None and st.is_dirty():
+            by_factory.setdefault(fid, []).append((code, st))
+    flushed: List[Tuple[CharacteristicState, Dict[str, Any]]] = []
+    try:
+        for fid, items in by_factory.items():
+            flushed += await _persist_states(db, fid, items)
+        if flushed:
+            await db.commit()
+    except Exception:
+        await db.rollback()
+        for st, _ in flushed:
+            st.end_flush(False)
+        raise
+    for st, row in flushed:
+        st.end_flush(True, row)
+    return len(flushed)
@@ -16,6 +16,7 @@ from core.tms.distribution_engine import DistributionEngine, DistributionStrateg
 from core.tms.approval_workflow import ApprovalWorkflowEngine, FlowType
 from core.tms.agent_interface import AgentInterface, AgentCommandRequest
 from core.tms.events import tms_event_bus, TMSEventType
+from core.tms.webhook_dispatcher import webhook_dispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -70,15 +71,16 @@ class TMSService:
         )
 
         self.db.add(task)
-        await self.db.commit()
-        await self.db.refresh(task)
 
-        # 发布事件
+        # 发布事件（写入 Outbox，随任务一起提交）
         await tms_event_bus.publish(
             TMSEventType.TASK_CREATED.value,
             {"task_id": str(task.id), "task_code": task_code, "task_type": task_type},
             source=created_by,
+            db=self.db,
         )
+        await self.db.commit()
+        await self.db.refresh(task)
 
         # 自动分发
         if auto_distribute and distribution_strategy:
@@ -203,6 +205,45 @@ class TMSService:
         claim_result = await self.distribution_engine.claim_task(task, user_id)
         return {"success": claim_result.success, "message": claim_result.message}
 
+    async def distribute_backlog(
+        self,
+        task_ids: Optional[List[str]] = None,
+        strategy: str = "skill_match",
+        limit: int = 500,
+        optimal: bool = False,
+        triggered_by: str = "system",
+    ) -> Dict[str, Any]:
+        """批量分发待分发任务（如整班次积压）
+
+        optimal=False 逐单贪心、负载在分配间内存累加；optimal=True 整体求容量约束下的最优指派。
+        """
+        query = select(TMSTask).where(TMSTask.status == "pending_distribution")
+        if task_ids:
+            query = query.where(TMSTask.id.in_(task_ids))
+        query = query.order_by(TMSTask.created_at).limit(limit)
+        tasks = list((await self.db.execute(query)).scalars().all())
+
+        solver = None
+        if optimal:
+            results, solver = await self.distribution_engine.distribute_optimal(
+                tasks, strategy=strategy, triggered_by=triggered_by
+            )
+        else:
+            results = await self.distribution_engine.distribute_many(tasks, strategy=strategy, triggered_by=triggered_by)
+        assigned = [r for r in results if r.success]
+        return {
+            "success": True,
+            "solver": solver,
+            "total": len(results),
+            "assigned": len(assigned),
+            "failed": len(results) - len(assigned),
+            "results": [
+                {"task_id": r.task_id, "success": r.success, "assigned_to": r.assigned_to,
+                 "assigned_to_name": r.assigned_to_name, "reason": r.reason}
+                for r in results
+            ],
+        }
+
     async def get_distribution_stats(self) -> Dict[str, Any]:
         """获取分发统计"""
         return await self.distribution_engine.get_distribution_stats()
@@ -313,6 +354,15 @@ class TMSService:
         """注册 Webhook"""
         return await self.agent_interface.register_webhook(agent_id, event_types, webhook_url, secret)
 
+    async def get_webhook_metrics(self) -> Dict[str, Any]:
+        """Webhook 投递积压 / 死信 / 滞后 / 吞吐"""
+        return await webhook_dispatcher.get_metrics(self.db)
+
+    async def replay_dead_webhooks(self, agent_id: Optional[str] = None) -> Dict[str, Any]:
+        """死信重放"""
+        count = await webhook_dispatcher.replay_dead(self.db, agent_id)
+        return {"success": True, "replayed": count, "message": f"已重放 {count} 条死信投递"}
+
     # ========== Dashboard ==========
 
     async def get_dashboard_stats(self) -> Dict[str, Any]:
@@ -2,12 +2,15 @@
 User Service - 用户管理服务
 处理用户相关的业务逻辑 + 角色管理
 """
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from datetime import datetime
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import User, Role, UserRole, Permission
-from core.auth.security import get_password_hash, verify_password
+from database.models import User, Role, UserRole, Permission, TrustedDevice
+from core.auth.security import (
+    aget_password_hash, averify_password, password_needs_rehash,
+    generate_device_key, hash_device_key, device_key_matches,
+)
 
 
 class UserService:
@@ -50,8 +53,12 @@ class UserService:
         user = await self.get_user_by_username(username)
         if not user:
             return None
-        if not verify_password(password, user.hashed_password):
+        if not await averify_password(password, user.hashed_password):
             return None
+        # cost 参数变更后透明重哈希（明文只在登录成功时可得）
+        if password_needs_rehash(user.hashed_password):
+            user.hashed_password = await aget_password_hash(password)
+            await self.db.commit()
         return user
     
     async def create_user(
@@ -67,7 +74,7 @@ class UserService:
         department: Optional[str] = None,
     ) -> User:
         """创建新用户"""
-        hashed_password = get_password_hash(password)
+        hashed_password = await aget_password_hash(password)
         
         # 查找角色定义
         role_obj = None
@@ -128,7 +135,10 @@ class UserService:
         
         # 特殊处理密码更新
         if "password" in kwargs and kwargs["password"]:
-            user.hashed_password = get_password_hash(kwargs["password"])
+            user.hashed_password = await aget_password_hash(kwargs["password"])
+        # 改密或停用：递增令牌版本，已签发的 access/refresh（含设备长效令牌）立即失效
+        if ("password" in kwargs and kwargs["password"]) or kwargs.get("is_active") is False:
+            user.token_version = (user.token_version or 0) + 1
         
         user.updated_at = datetime.utcnow()
         
@@ -201,11 +211,72 @@ class UserService:
             return False
         
         user.is_active = False
+        user.token_version = (user.token_version or 0) + 1
         user.updated_at = datetime.utcnow()
         
         await self.db.commit()
         return True
     
+    # ---- 车间终端登记 ----
+
+    async def register_device(
+        self,
+        device_id: str,
+        name: Optional[str],
+        factory_id: Optional[str],
+        registered_by: str,
+    ) -> Tuple[TrustedDevice, str]:
+        """登记终端，返回 (设备, 设备密钥)；密钥只在此处出现一次。已登记的设备重新登记即轮换密钥。"""
+        device_key = generate_device_key()
+        result = await self.db.execute(select(TrustedDevice).where(TrustedDevice.device_id == device_id))
+        device = result.scalar_one_or_none()
+        if device is None:
+            device = TrustedDevice(device_id=device_id)
+            self.db.add(device)
+        device.name = name
+        device.factory_id = factory_id
+        device.key_hash = hash_device_key(device_key)
+        device.is_active = True
+        device.revoked_at = None
+        device.registered_by = registered_by
+        await self.db.commit()
+        await self.db.refresh(device)
+        return device, device_key
+
+    async def list_devices(self, factory_id: Optional[str] = None) -> List[TrustedDevice]:
+        query = select(TrustedDevice).order_by(TrustedDevice.created_at.desc())
+        if factory_id:
+            query = query.where(TrustedDevice.factory_id == factory_id)
+        return (await self.db.execute(query)).scalars().all()
+
+    async def revoke_device(self, device_pk: str) -> bool:
+        """停用终端：该设备的长效 refresh_token 下次刷新即被拒绝"""
+        device = await self.db.get(TrustedDevice, device_pk)
+        if not device:
+            return False
+        device.is_active = False
+        device.revoked_at = datetime.utcnow()
+        await self.db.commit()
+        return True
+
+    async def verify_device(
+        self, device_id: Optional[str], device_key: Optional[str], user: User,
+    ) -> Optional[TrustedDevice]:
+        """设备已登记、启用、密钥正确且与用户同工厂（超管不限）时返回设备，否则 None"""
+        if not device_id or not device_key:
+            return None
+        result = await self.db.execute(
+            select(TrustedDevice).where(TrustedDevice.device_id == device_id, TrustedDevice.is_active == True)
+        )
+        device = result.scalar_one_or_none()
+        if device is None or not device_key_matches(device_key, device.key_hash):
+            return None
+        if device.factory_id and not user.is_superuser and device.factory_id != user.factory_id:
+            return None
+        device.last_seen_at = datetime.utcnow()
+        await self.db.commit()
+        return device
+
     # ---- 角色管理 ----
     
     async def list_roles(self, is_system: Optional[bool] = None) -> List[Role]:
@@ -5,8 +5,14 @@ Authentication and Authorization Module
 from .security import (
     verify_password,
     get_password_hash,
+    averify_password,
+    aget_password_hash,
+    password_needs_rehash,
+    get_password_hasher_stats,
     create_access_token,
     create_refresh_token,
+    token_claims,
+    token_version_valid,
     decode_token,
     get_current_user,
 )
@@ -15,8 +21,14 @@ from .user_service import UserService
 __all__ = [
     "verify_password",
     "get_password_hash",
+    "averify_password",
+    "aget_password_hash",
+    "password_needs_rehash",
+    "get_password_hasher_stats",
     "create_access_token",
     "create_refresh_token",
+    "token_claims",
+    "token_version_valid",
     "decode_token",
     "get_current_user",
     "UserService",
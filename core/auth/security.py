@@ -3,7 +3,13 @@ Security utilities for authentication
 密码加密和 JWT Token 工具 + RBAC 权限控制
 """
 import os
+import asyncio
+import hashlib
+import hmac
+import secrets
+import threading
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from functools import wraps
 from typing import Optional, List
@@ -21,9 +27,25 @@ ALGORITHM = "HS256"
 SESSION_EXPIRE_HOURS = int(os.getenv("SESSION_EXPIRE_HOURS", "12"))
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", str(SESSION_EXPIRE_HOURS * 60)))
 REFRESH_TOKEN_EXPIRE_HOURS = int(os.getenv("REFRESH_TOKEN_EXPIRE_HOURS", str(SESSION_EXPIRE_HOURS)))
+# 车间终端：已登记设备（X-Device-Id + X-Device-Key）登录时签发长效 refresh，换班时免重复 bcrypt
+DEVICE_REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("DEVICE_REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+# bcrypt 成本参数；调整后旧哈希在下次登录成功时透明重哈希
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# 密码哈希线程池：bcrypt 释放 GIL，放到有界线程池避免阻塞事件循环
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
+# 可选登录：未带令牌不报错（允许匿名访问的路由用）
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login", auto_error=False)
+
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwd-hash"
+)
+_hash_lock = threading.Lock()
+_hash_stats = {"queued": 0, "running": 0, "completed": 0, "max_queued": 0}
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -38,10 +60,67 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     """生成密码哈希 (直连 bcrypt，输出标准 $2b$ 哈希，与旧 passlib 哈希兼容)"""
-    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
     return hashed.decode("utf-8")
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """哈希的 cost 与当前 BCRYPT_ROUNDS 不一致时返回 True ($2b$12$... 第三段为 cost)"""
+    if not hashed_password:
+        return False
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return False
+    return int(parts[2]) != BCRYPT_ROUNDS
+
+
+def _run_tracked(fn, *args):
+    """在哈希线程池内执行，维护排队/运行计数"""
+    with _hash_lock:
+        _hash_stats["queued"] -= 1
+        _hash_stats["running"] += 1
+    try:
+        return fn(*args)
+    finally:
+        with _hash_lock:
+            _hash_stats["running"] -= 1
+            _hash_stats["completed"] += 1
+
+
+async def _submit_hash_job(fn, *args):
+    with _hash_lock:
+        _hash_stats["queued"] += 1
+        _hash_stats["max_queued"] = max(_hash_stats["max_queued"], _hash_stats["queued"])
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, _run_tracked, fn, *args)
+
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """异步验证密码：bcrypt 在有界线程池执行，不阻塞事件循环"""
+    if not hashed_password:
+        return False
+    return await _submit_hash_job(verify_password, plain_password, hashed_password)
+
+
+async def aget_password_hash(password: str) -> str:
+    """异步生成密码哈希"""
+    return await _submit_hash_job(get_password_hash, password)
+
+
+def get_password_hasher_stats() -> dict:
+    """哈希线程池指标：queue_depth 为等待线程的任务数（换班登录高峰观察用）"""
+    with _hash_lock:
+        stats = dict(_hash_stats)
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "queue_depth": stats["queued"],
+        "running": stats["running"],
+        "completed": stats["completed"],
+        "max_queue_depth": stats["max_queued"],
+    }
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建访问令牌"""
     to_encode = data.copy()
@@ -55,19 +134,56 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """创建刷新令牌"""
+def create_refresh_token(
+    data: dict,
+    expires_delta: Optional[timedelta] = None,
+    device_id: Optional[str] = None,
+) -> str:
+    """创建刷新令牌
+
+    传入 device_id 时签发绑定设备的长效令牌（默认 DEVICE_REFRESH_TOKEN_EXPIRE_DAYS 天），
+    调用方须先校验该设备已登记；刷新时须再次出示同一设备的密钥。
+    """
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
+    elif device_id:
+        expire = datetime.utcnow() + timedelta(days=DEVICE_REFRESH_TOKEN_EXPIRE_DAYS)
     else:
         expire = datetime.utcnow() + timedelta(hours=REFRESH_TOKEN_EXPIRE_HOURS)
 
     to_encode.update({"exp": expire, "type": "refresh"})
+    if device_id:
+        to_encode["device_id"] = device_id
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def token_claims(user: User) -> dict:
+    """refresh/access 共用声明：ver 为用户令牌版本，改密/停用后递增使已签发令牌失效"""
+    return {"sub": user.username, "user_id": str(user.id), "ver": user.token_version or 0}
+
+
+def token_version_valid(payload: dict, user: User) -> bool:
+    return payload.get("ver", 0) == (user.token_version or 0)
+
+
+def generate_device_key() -> str:
+    """设备密钥：登记时生成一次，仅返回给终端，库里只存哈希"""
+    return secrets.token_urlsafe(32)
+
+
+def hash_device_key(device_key: str) -> str:
+    # 密钥为 256 位随机串，用 SHA-256 即可，不占 bcrypt 线程池
+    return hashlib.sha256(device_key.encode("utf-8")).hexdigest()
+
+
+def device_key_matches(device_key: Optional[str], key_hash: Optional[str]) -> bool:
+    if not device_key or not key_hash:
+        return False
+    return hmac.compare_digest(hash_device_key(device_key), key_hash)
+
+
 def decode_token(token: str) -> Optional[dict]:
     """解码令牌"""
     try:
@@ -104,12 +220,33 @@ async def get_current_user(
     result = await db.execute(select(User).where(User.username == username))
     user = result.scalar_one_or_none()
 
-    if user is None or not user.is_active:
+    if user is None or not user.is_active or not token_version_valid(payload, user):
         raise credentials_exception
 
     return user
 
 
+async def get_optional_user(
+    token: Optional[str] = Depends(oauth2_scheme_optional),
+    db: AsyncSession = Depends(get_db)
+) -> Optional[User]:
+    """
+    可选登录：未带令牌返回 None（匿名）
+    带了令牌则与 get_current_user 同样校验（用户存在/启用、token_version 未吊销），
+    且只认访问令牌；校验不过返回 401，不退回匿名
+    """
+    if not token:
+        return None
+    payload = decode_token(token)
+    if payload is None or payload.get("type") != "access":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(token, db)
+
+
 async def get_current_active_superuser(
     current_user: User = Depends(get_current_user)
 ) -> User:
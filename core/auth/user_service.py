@@ -9,7 +9,7 @@ from string import ascii_letters, digits
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import User
-from .security import get_password_hash, verify_password
+from .security import aget_password_hash, averify_password, password_needs_rehash
 
 
 class UserService:
@@ -51,8 +51,11 @@ class UserService:
         user = await self.get_user_by_username(username)
         if not user:
             return None
-        if not verify_password(password, user.hashed_password):
+        if not await averify_password(password, user.hashed_password):
             return None
+        if password_needs_rehash(user.hashed_password):
+            user.hashed_password = await aget_password_hash(password)
+            await self.db.commit()
         return user
     
     async def create_user(
@@ -66,7 +69,7 @@ class UserService:
         is_superuser: bool = False,
     ) -> User:
         """创建新用户"""
-        hashed_password = get_password_hash(password)
+        hashed_password = await aget_password_hash(password)
         
         user = User(
             username=username,
@@ -107,7 +110,10 @@ class UserService:
         
         # 特殊处理密码更新
         if "password" in kwargs and kwargs["password"]:
-            user.hashed_password = get_password_hash(kwargs["password"])
+            user.hashed_password = await aget_password_hash(kwargs["password"])
+        # 改密或停用：递增令牌版本，已签发的 access/refresh（含设备长效令牌）立即失效
+        if ("password" in kwargs and kwargs["password"]) or kwargs.get("is_active") is False:
+            user.token_version = (user.token_version or 0) + 1
         
         user.updated_at = datetime.utcnow()
         
@@ -155,6 +161,7 @@ class UserService:
             return False
         
         user.is_active = False
+        user.token_version = (user.token_version or 0) + 1
         user.updated_at = datetime.utcnow()
         
         await self.db.commit()
@@ -234,8 +241,6 @@ class UserService:
         4. 清除重置令牌
         5. 返回布尔值表示是否成功
         """
-        from .security import get_password_hash
-        
         # 检查新密码长度等基本要求（可扩展为更复杂的策略）
         if len(new_password) < 8:
             raise ValueError("Password must be at least 8 characters long")
@@ -256,7 +261,8 @@ class UserService:
             return False  # 令牌无效或已过期
         
         # 更新密码
-        user.hashed_password = get_password_hash(new_password)
+        user.hashed_password = await aget_password_hash(new_password)
+        user.token_version = (user.token_version or 0) + 1
         user.password_reset_token = None  # 使用后立即清除令牌
         user.password_reset_expires = None
         user.updated_at = datetime.utcnow()
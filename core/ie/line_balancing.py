@@ -0,0 +1,473 @@
+"""
+Line Balancing - 装配线平衡求解（SALBP-1 / SALBP-2）
+
+- SALBP-1：给定节拍，求最少工站数；SALBP-2：给定工站数，求最小节拍
+- 启发式：排序位置权重法（RPW）及若干优先规则，正向/逆向各构造一次取最好
+- 改进：工站导向分支定界——逐站枚举极大负荷，下界（LB1/LB2/LB3）+ 闲置时间界剪枝，
+  已访问的已分配作业集记忆去重；在时间/节点预算内求精，预算内搜完即证明最优
+- 作业时间按最小公共精度换成整数计算（如分钟两位小数 ×100），结果换回原单位
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_TIME_LIMIT = 2.0        # 秒
+MEMO_LIMIT = 500_000            # 已访问状态表上限（超过后不再记录，仍保证正确）
+
+
+@dataclass(frozen=True)
+class BalanceTask:
+    """作业元素：key 唯一，time 为作业时间，predecessors 为紧前作业 key"""
+    key: str
+    time: float
+    predecessors: Tuple[str, ...] = ()
+
+
+@dataclass
+class BalanceResult:
+    cycle_time: float                  # SALBP-1 为给定节拍；SALBP-2 为求得的节拍
+    stations: List[List[str]]          # 各工站作业（按作业先后）
+    loads: List[float]
+    lower_bound: float                 # SALBP-1：工站数下界；SALBP-2：节拍下界
+    optimal: bool                      # 预算内已证明最优
+    method: str                        # heuristic / branch_and_bound
+    nodes: int = 0
+    elapsed_ms: float = 0.0
+
+    @property
+    def station_count(self) -> int:
+        return len(self.stations)
+
+    @property
+    def efficiency(self) -> float:
+        """线平衡率 = 总作业时间 / (工站数 × 节拍)"""
+        if not self.stations or self.cycle_time <= 0:
+            return 0.0
+        return round(sum(self.loads) / (self.station_count * self.cycle_time) * 100, 2)
+
+    def to_dict(self) -> Dict:
+        return {
+            "cycle_time": self.cycle_time,
+            "station_count": self.station_count,
+            "stations": [
+                {"station": i + 1, "tasks": tasks, "load": load, "idle": round(self.cycle_time - load, 6)}
+                for i, (tasks, load) in enumerate(zip(self.stations, self.loads))
+            ],
+            "lower_bound": self.lower_bound,
+            "optimal": self.optimal,
+            "efficiency": self.efficiency,
+            "method": self.method,
+            "nodes": self.nodes,
+            "elapsed_ms": self.elapsed_ms,
+        }
+
+
+def precedence_from_steps(steps: Iterable[Tuple[str, int, bool]]) -> Dict[str, Tuple[str, ...]]:
+    """工艺路线步骤 (key, seq, is_parallel) → 紧前关系
+
+    按 seq 排序分阶段：is_parallel 的步骤与上一步同阶段（可并行），其余步骤开新阶段；
+    每一步依赖上一阶段的全部步骤。
+    """
+    stages: List[List[str]] = []
+    for key, _, is_parallel in sorted(steps, key=lambda s: s[1]):
+        if is_parallel and stages:
+            stages[-1].append(key)
+        else:
+            stages.append([key])
+    preds: Dict[str, Tuple[str, ...]] = {}
+    for i, stage in enumerate(stages):
+        for key in stage:
+            preds[key] = tuple(stages[i - 1]) if i else ()
+    return preds
+
+
+def parse_in2(text: str) -> List[BalanceTask]:
+    """Scholl 数据集 .IN2 格式：第一行作业数 n，随后 n 行作业时间，之后每行 "i,j" 表示 i 为 j 的紧前作业，
+    以 "-1,-1" 结束；作业 key 为序号字符串"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    n = int(lines[0])
+    times = [float(x) for x in lines[1:n + 1]]
+    preds: Dict[int, List[str]] = {i: [] for i in range(1, n + 1)}
+    for line in lines[n + 1:]:
+        a, b = (int(x) for x in line.split(","))
+        if a == -1:
+            break
+        preds[b].append(str(a))
+    return [BalanceTask(str(i), t, tuple(preds[i])) for i, t in enumerate(times, 1)]
+
+
+def solve_salbp1(
+    tasks: Sequence[BalanceTask],
+    cycle_time: float,
+    time_limit: float = DEFAULT_TIME_LIMIT,
+    node_limit: Optional[int] = None,
+) -> BalanceResult:
+    """给定节拍求最少工站数"""
+    started = time.perf_counter()
+    problem = _Problem(tasks, extra=(cycle_time,))
+    c = problem.scaled(cycle_time, floor=True)
+    if problem.times and max(problem.times) > c:
+        raise ValueError(f"节拍 {cycle_time} 小于最长作业时间 {problem.unscale(max(problem.times))}")
+    lb = problem.station_lower_bound(c)
+    best = problem.best_heuristic(c)
+    method, nodes, optimal = "heuristic", 0, len(best) <= lb
+    if not optimal:
+        search = _Search(problem, c, ub=len(best), stop_at=lb,
+                         deadline=started + time_limit, node_limit=node_limit)
+        search.run()
+        nodes = search.nodes
+        if search.best is not None:
+            best, method = search.best, "branch_and_bound"
+        optimal = search.exhausted or len(best) <= lb
+    return problem.result(best, cycle_time, lb, optimal, method, nodes, started)
+
+
+def solve_salbp2(
+    tasks: Sequence[BalanceTask],
+    station_count: int,
+    time_limit: float = DEFAULT_TIME_LIMIT,
+    node_limit: Optional[int] = None,
+) -> BalanceResult:
+    """给定工站数求最小节拍：启发式二分得上界，再用分支定界逐个判定可行性收紧"""
+    if station_count < 1:
+        raise ValueError("工站数至少为 1")
+    started = time.perf_counter()
+    deadline = started + time_limit
+    problem = _Problem(tasks)
+    m = station_count
+    lo = problem.cycle_lower_bound(m)
+
+    best = [list(range(problem.n))]                     # 一个工站装下全部作业总是可行
+    hi = problem.total
+    a, b = lo, hi
+    while a < b:                                        # 启发式二分：找可行节拍上界
+        mid = (a + b) // 2
+        stations = problem.best_heuristic(mid)
+        if len(stations) <= m:
+            best, b = stations, problem.max_load(stations)
+            hi = b
+        else:
+            a = mid + 1
+
+    method, nodes, proven = "heuristic", 0, True
+    while lo < hi:                                      # 精确二分：B&B 判定 mid 下 m 站是否可行
+        mid = (lo + hi) // 2
+        if problem.station_lower_bound(mid) > m:
+            lo = mid + 1
+            continue
+        remaining_nodes = None if node_limit is None else node_limit - nodes
+        if time.perf_counter() >= deadline or (remaining_nodes is not None and remaining_nodes <= 0):
+            proven = False
+            break
+        search = _Search(problem, mid, ub=m + 1, stop_at=m, deadline=deadline, node_limit=remaining_nodes)
+        search.run()
+        nodes += search.nodes
+        if search.best is not None:
+            best, hi, method = search.best, problem.max_load(search.best), "branch_and_bound"
+        elif search.exhausted:
+            lo = mid + 1
+        else:
+            proven = False
+            break
+    cycle = problem.unscale(problem.max_load(best))
+    return problem.result(best, cycle, problem.unscale(problem.cycle_lower_bound(m)),
+                          proven and lo >= hi, method, nodes, started)
+
+
+class _Problem:
+    """整数化后的实例：作业按拓扑序编号，紧前/紧后关系用位掩码"""
+
+    def __init__(self, tasks: Sequence[BalanceTask], extra: Sequence[float] = ()):
+        index = {}
+        for t in tasks:
+            if t.key in index:
+                raise ValueError(f"作业重复：{t.key}")
+            if t.time < 0:
+                raise ValueError(f"作业 {t.key} 时间为负")
+            index[t.key] = len(index)
+        for t in tasks:
+            for p in t.predecessors:
+                if p not in index:
+                    raise ValueError(f"作业 {t.key} 的紧前作业 {p} 不存在")
+
+        order = _topological_order(tasks, index)
+        self.n = len(order)
+        self.keys = [tasks[i].key for i in order]
+        position = {tasks[i].key: pos for pos, i in enumerate(order)}
+        self.scale = _scale_for([t.time for t in tasks] + list(extra))
+        self.times = [self.scaled(tasks[i].time) for i in order]
+        self.total = sum(self.times)
+        self.pred_mask = [0] * self.n
+        self.succ_mask = [0] * self.n
+        for i in order:
+            v = position[tasks[i].key]
+            for p in tasks[i].predecessors:
+                u = position[p]
+                self.pred_mask[v] |= 1 << u
+                self.succ_mask[u] |= 1 << v
+        self.full = (1 << self.n) - 1
+
+        # 传递闭包：全部后继 / 全部前驱
+        self.all_succ = [0] * self.n
+        for v in range(self.n - 1, -1, -1):
+            mask = self.succ_mask[v]
+            closure = mask
+            for w in _bits(mask):
+                closure |= self.all_succ[w]
+            self.all_succ[v] = closure
+        self.all_pred = [0] * self.n
+        for v in range(self.n):
+            closure = self.pred_mask[v]
+            for u in _bits(self.pred_mask[v]):
+                closure |= self.all_pred[u]
+            self.all_pred[v] = closure
+
+    # ---- 单位换算 ----
+
+    def scaled(self, value: float, floor: bool = False) -> int:
+        x = value * self.scale
+        return int(math.floor(x + 1e-6)) if floor else int(round(x))
+
+    def unscale(self, value: int) -> float:
+        return value / self.scale if self.scale != 1 else value
+
+    def mask_time(self, mask: int) -> int:
+        return sum(self.times[i] for i in _bits(mask))
+
+    def max_load(self, stations: List[List[int]]) -> int:
+        return max((sum(self.times[i] for i in s) for s in stations), default=0)
+
+    # ---- 下界 ----
+
+    def station_lower_bound(self, c: int, mask: Optional[int] = None) -> int:
+        """剩余作业（默认全部）至少需要的工站数：max(LB1, LB2, LB3)"""
+        times = self.times if mask is None else [self.times[i] for i in _bits(mask)]
+        if not times:
+            return 0
+        if c <= 0:
+            return math.inf
+        lb1 = -(-sum(times) // c)
+        big = sum(1 for t in times if 2 * t > c)
+        half = sum(1 for t in times if 2 * t == c)
+        lb2 = big + -(-half // 2)
+        w = 0.0
+        for t in times:
+            if 3 * t > 2 * c:
+                w += 1
+            elif 3 * t == 2 * c:
+                w += 2 / 3
+            elif 3 * t > c:
+                w += 1 / 2
+            elif 3 * t == c:
+                w += 1 / 3
+        lb3 = math.ceil(w - 1e-9)
+        return max(lb1, lb2, lb3)
+
+    def cycle_lower_bound(self, m: int) -> int:
+        """m 个工站时节拍下界：最长作业、平均负荷、第 m 与 m+1 大作业必须同站"""
+        if not self.times:
+            return 0
+        desc = sorted(self.times, reverse=True)
+        lb = max(desc[0], -(-self.total // m))
+        if self.n > m:
+            lb = max(lb, desc[m - 1] + desc[m])
+        return lb
+
+    # ---- 启发式 ----
+
+    def best_heuristic(self, c: int) -> List[List[int]]:
+        best = None
+        for rule, backward in self._rules():
+            stations = self.construct(c, rule, backward)
+            if best is None or len(stations) < len(best):
+                best = stations
+        return best or []
+
+    def _rules(self) -> List[Tuple[Callable[[int], tuple], bool]]:
+        succ_time = [self.times[i] + self.mask_time(self.all_succ[i]) for i in range(self.n)]
+        pred_time = [self.times[i] + self.mask_time(self.all_pred[i]) for i in range(self.n)]
+        succ_count = [bin(m).count("1") for m in self.all_succ]
+        pred_count = [bin(m).count("1") for m in self.all_pred]
+        return [
+            (lambda i: (succ_time[i], self.times[i], -i), False),          # RPW 排序位置权重
+            (lambda i: (self.times[i], succ_time[i], -i), False),          # 最长作业时间
+            (lambda i: (succ_count[i], succ_time[i], -i), False),          # 最多后继
+            (lambda i: (pred_time[i], self.times[i], i), True),            # 逆向 RPW
+            (lambda i: (self.times[i], pred_time[i], i), True),
+            (lambda i: (pred_count[i], pred_time[i], i), True),
+        ]
+
+    def construct(self, c: int, priority: Callable[[int], tuple], backward: bool = False) -> List[List[int]]:
+        """工站导向构造：当前站放得下的可选作业里挑优先级最高的，放不下再开新站"""
+        needs = self.succ_mask if backward else self.pred_mask
+        assigned = 0
+        remaining = set(range(self.n))
+        stations: List[List[int]] = []
+        while remaining:
+            load, station = 0, []
+            while True:
+                candidates = [i for i in remaining
+                              if not needs[i] & ~assigned and load + self.times[i] <= c]
+                if not candidates:
+                    break
+                i = max(candidates, key=priority)
+                station.append(i)
+                assigned |= 1 << i
+                remaining.discard(i)
+                load += self.times[i]
+            if not station:
+                raise ValueError(f"节拍 {self.unscale(c)} 放不下剩余作业")
+            stations.append(sorted(station))
+        if backward:
+            stations.reverse()
+        return stations
+
+    def result(self, stations: List[List[int]], cycle_time: float, lower_bound: float, optimal: bool,
+               method: str, nodes: int, started: float) -> BalanceResult:
+        return BalanceResult(
+            cycle_time=cycle_time,
+            stations=[[self.keys[i] for i in sorted(s)] for s in stations],
+            loads=[self.unscale(sum(self.times[i] for i in s)) for s in stations],
+            lower_bound=lower_bound,
+            optimal=optimal,
+            method=method,
+            nodes=nodes,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+        )
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+class _Search:
+    """工站导向分支定界：寻找少于 ub 个工站的方案，找到不多于 stop_at 个工站的方案即停"""
+
+    def __init__(self, problem: _Problem, c: int, ub: int, stop_at: int,
+                 deadline: float, node_limit: Optional[int] = None):
+        self.p = problem
+        self.c = c
+        self.ub = ub
+        self.stop_at = stop_at
+        self.deadline = deadline
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.best: Optional[List[List[int]]] = None
+        self.exhausted = False
+        self._memo: Dict[int, int] = {}
+        self._path: List[List[int]] = []
+
+    def run(self) -> None:
+        try:
+            self._station(0, 0, 0)
+            self.exhausted = True
+        except _BudgetExceeded:
+            pass
+
+    def _tick(self) -> None:
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise _BudgetExceeded
+        if self.nodes & 0x3FF == 0 and time.perf_counter() > self.deadline:
+            raise _BudgetExceeded
+
+    def _station(self, assigned: int, k: int, assigned_time: int) -> bool:
+        """在已分配 assigned、已开 k 站的状态下继续开站；找到目标方案返回 True"""
+        self._tick()
+        p = self.p
+        if assigned == p.full:
+            self.best = [list(s) for s in self._path]
+            self.ub = k
+            return k <= self.stop_at
+        if k + p.station_lower_bound(self.c, p.full & ~assigned) >= self.ub:
+            return False
+        seen = self._memo.get(assigned)
+        if seen is not None and seen <= k:
+            return False
+        if len(self._memo) < MEMO_LIMIT:
+            self._memo[assigned] = k
+
+        loads = self._maximal_loads(assigned, k, assigned_time)
+        loads.sort(key=lambda load: -load[1])
+        for mask, load, tasks in loads:
+            # 闲置时间界：要比当前最好方案少一站，全线总闲置不能超过 (ub-1)·c - T
+            if (k + 1) * self.c - assigned_time - load > (self.ub - 1) * self.c - p.total:
+                continue
+            self._path.append(tasks)
+            found = self._station(assigned | mask, k + 1, assigned_time + load)
+            self._path.pop()
+            if found:
+                return True
+        return False
+
+    def _maximal_loads(self, assigned: int, k: int, assigned_time: int) -> List[Tuple[int, int, List[int]]]:
+        """枚举下一站的极大负荷（再也放不进任何可选作业的作业组合）"""
+        p, c = self.p, self.c
+        min_load = (k + 1) * c - assigned_time - ((self.ub - 1) * c - p.total)
+        # 候选池：本站内有可能做的作业（未分配前驱连同自身能放进一个工站）
+        pool = [i for i in range(p.n)
+                if not assigned >> i & 1
+                and p.times[i] + p.mask_time(p.all_pred[i] & ~assigned) <= c]
+        suffix = [0] * (len(pool) + 1)
+        for j in range(len(pool) - 1, -1, -1):
+            suffix[j] = suffix[j + 1] + p.times[pool[j]]
+        loads: List[Tuple[int, int, List[int]]] = []
+        chosen: List[int] = []
+
+        def extend(mask: int, load: int, start: int) -> None:
+            self._tick()
+            done = assigned | mask
+            maximal = True
+            for j, i in enumerate(pool):
+                if mask >> i & 1 or p.pred_mask[i] & ~done or load + p.times[i] > c:
+                    continue
+                maximal = False
+                if j >= start:
+                    if load + suffix[j] < min_load:
+                        break               # 后面全放进来也达不到最小负荷
+                    chosen.append(i)
+                    extend(mask | 1 << i, load + p.times[i], j + 1)
+                    chosen.pop()
+            if maximal and mask and load >= min_load:
+                loads.append((mask, load, list(chosen)))
+
+        extend(0, 0, 0)
+        return loads
+
+
+def _topological_order(tasks: Sequence[BalanceTask], index: Dict[str, int]) -> List[int]:
+    indegree = [len(set(t.predecessors)) for t in tasks]
+    children: List[List[int]] = [[] for _ in tasks]
+    for i, t in enumerate(tasks):
+        for p in set(t.predecessors):
+            children[index[p]].append(i)
+    ready = [i for i, d in enumerate(indegree) if d == 0]
+    order: List[int] = []
+    while ready:
+        ready.sort(reverse=True)
+        i = ready.pop()
+        order.append(i)
+        for j in children[i]:
+            indegree[j] -= 1
+            if indegree[j] == 0:
+                ready.append(j)
+    if len(order) != len(tasks):
+        raise ValueError("作业紧前关系存在环")
+    return order
+
+
+def _scale_for(values: Iterable[float]) -> int:
+    values = list(values)
+    for scale in (1, 10, 100, 1000):
+        if all(abs(v * scale - round(v * scale)) < 1e-6 for v in values):
+            return scale
+    return 1000
+
+
+def _bits(mask: int):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
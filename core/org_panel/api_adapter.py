@@ -10,33 +10,57 @@ GET  /api/v1/org-panel/nodes/{id}/detail  → 节点微观数据快照
 POST /api/v1/org-panel/nodes/{id}/param   → 调整参数
 POST /api/v1/org-panel/propagate          → 执行传播，返回全图快照
 POST /api/v1/org-panel/what-if            → 多参数what-if
+POST /api/v1/org-panel/sweep              → K 个 what-if 场景向量化批量计算
+GET  /api/v1/org-panel/tornado/{node_id}/{signal} → 全参数龙卷风敏感性
 GET  /api/v1/org-panel/chains             → 所有逻辑链及其传导状态
 GET  /api/v1/org-panel/trace/{node_id}/{param_key} → 影响追踪
+
+会话：每个用户一份基线的写时复制分支（见 sessions.py）。
+会话 ID 以登录用户名为命名空间，X-Org-Session 请求头只在该用户名下区分多个会话，
+不能借此进入其他用户的会话；登录校验复用 core.auth.security（含 token_version 吊销），
+令牌无效/已吊销返回 401。未登录请求落在匿名命名空间，匿名会话单独限额，不挤占登录用户。
 """
 
 from __future__ import annotations
 
+import asyncio
+import os
 from typing import Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from pydantic import BaseModel
 
-from core.org_panel.presets import build_electronics_factory
+from core.auth.security import get_optional_user
+from core.org_panel.sessions import OrgSession, OrgSessionStore, scenario_executor
 from core.org_panel.signals import SignalType
+from database.models import User
 
 router = APIRouter(prefix="/api/v1/org-panel", tags=["org-panel"])
 
-# ── 全局引擎实例（单例） ──
-_engine = None
+# 单次 /sweep 的场景数上限（每个场景一列向量，且整批结果进场景缓存）
+MAX_SWEEP_SCENARIOS = int(os.getenv("ORG_PANEL_MAX_SWEEP_SCENARIOS", "1024"))
+
+# ── 会话仓库（共享不可变基线） ──
+_store: Optional[OrgSessionStore] = None
+
+
+def get_store() -> OrgSessionStore:
+    """获取/初始化会话仓库"""
+    global _store
+    if _store is None:
+        _store = OrgSessionStore()
+    return _store
 
 
-def get_engine():
-    """获取/初始化引擎单例"""
-    global _engine
-    if _engine is None:
-        _engine = build_electronics_factory()
-        _engine.propagate()  # 初始传播
-    return _engine
+def get_session(
+    x_org_session: Optional[str] = Header(None),
+    user: Optional[User] = Depends(get_optional_user),
+) -> OrgSession:
+    """按请求方取会话：user:<用户名>[/<X-Org-Session>]，未登录为 anon:<X-Org-Session 或 default>"""
+    if user is not None:
+        session_id = f"user:{user.username}" + (f"/{x_org_session}" if x_org_session else "")
+        return get_store().get(session_id)
+    return get_store().get(f"anon:{x_org_session or 'default'}", anonymous=True)
 
 
 # ==================== Schemas ====================
@@ -52,6 +76,12 @@ class WhatIfRequest(BaseModel):
     adjustments: Dict[str, float]  # "node_id.param_key" → new_value
 
 
+class SweepRequest(BaseModel):
+    """批量场景请求：每个场景同 WhatIfRequest.adjustments"""
+    scenarios: List[Dict[str, float]]
+    targets: Optional[List[str]] = None  # "node_id.signal"（信号写代码或中文名），默认返回全部
+
+
 class PropagateResponse(BaseModel):
     """传播响应"""
     nodes: Dict[str, dict]
@@ -61,11 +91,15 @@ class PropagateResponse(BaseModel):
 # ==================== 端点 ====================
 
 @router.get("/nodes")
-def list_nodes(level: Optional[int] = Query(None, description="按层级过滤 (1-5)")):
+def list_nodes(
+    level: Optional[int] = Query(None, description="按层级过滤 (1-5)"),
+    session: OrgSession = Depends(get_session),
+):
     """获取所有组织节点列表（按层级排序）"""
-    engine = get_engine()
+    with session.lock:
+        items = sorted(session.engine.nodes.items(), key=lambda x: (x[1].level, x[0]))
     nodes = []
-    for nid, node in sorted(engine.nodes.items(), key=lambda x: (x[1].level, x[0])):
+    for nid, node in items:
         if level is not None and node.level != level:
             continue
         nodes.append({
@@ -81,12 +115,12 @@ def list_nodes(level: Optional[int] = Query(None, description="按层级过滤 (
 
 
 @router.get("/nodes/{node_id}/detail")
-def node_detail(node_id: str):
+def node_detail(node_id: str, session: OrgSession = Depends(get_session)):
     """获取节点微观数据快照（该角色视角看到的一切）"""
-    engine = get_engine()
-    if node_id not in engine.nodes:
-        raise HTTPException(status_code=404, detail=f"节点 '{node_id}' 不存在")
-    snap = engine.snapshot(node_id)
+    with session.lock:
+        if node_id not in session.engine.nodes:
+            raise HTTPException(status_code=404, detail=f"节点 '{node_id}' 不存在")
+        snap = session.engine.snapshot(node_id)
     return {
         "node_id": snap.node_id,
         "name": snap.name,
@@ -102,9 +136,9 @@ def node_detail(node_id: str):
 
 
 @router.post("/nodes/{node_id}/param")
-def set_param(node_id: str, req: ParamSetRequest):
-    """调整某节点的某参数，自动传播并返回全图影响"""
-    engine = get_engine()
+def set_param(node_id: str, req: ParamSetRequest, session: OrgSession = Depends(get_session)):
+    """调整某节点的某参数（仅当前会话），自动增量传播并返回全图影响"""
+    engine = session.engine
     if node_id not in engine.nodes:
         raise HTTPException(status_code=404, detail=f"节点 '{node_id}' 不存在")
     node = engine.nodes[node_id]
@@ -114,15 +148,18 @@ def set_param(node_id: str, req: ParamSetRequest):
             detail=f"参数 '{req.param_key}' 不存在。可用: {list(node.parameters.keys())}"
         )
 
-    # 设值（自动截断）
-    actual_value = engine.set_parameter(node_id, req.param_key, req.value)
-    # 传播
-    engine.propagate()
+    # 设值（自动截断）+ 增量传播
+    actual_value = session.set_parameter(node_id, req.param_key, req.value)
 
-    # 收集违反
-    all_violations = []
-    for n in engine.nodes.values():
-        all_violations.extend(n.violations)
+    with session.lock:
+        # 收集违反
+        all_violations = []
+        for n in engine.nodes.values():
+            all_violations.extend(n.violations)
+        current_outputs = {
+            nid: {k.label: round(v, 4) for k, v in n.output_signals.items()}
+            for nid, n in engine.nodes.items()
+        }
 
     return {
         "node_id": node_id,
@@ -131,22 +168,20 @@ def set_param(node_id: str, req: ParamSetRequest):
         "actual_value": actual_value,
         "propagated": True,
         "violations": all_violations,
-        "current_outputs": {
-            nid: {k.label: round(v, 4) for k, v in n.output_signals.items()}
-            for nid, n in engine.nodes.items()
-        },
+        "current_outputs": current_outputs,
     }
 
 
 @router.post("/propagate")
-def propagate():
+def propagate(session: OrgSession = Depends(get_session)):
     """手动触发全图传播，返回所有节点最新状态"""
-    engine = get_engine()
-    engine.propagate()
+    with session.lock:
+        session.engine.propagate()
+        items = list(session.engine.nodes.items())
 
     all_violations = []
     nodes_data = {}
-    for nid, node in engine.nodes.items():
+    for nid, node in items:
         nodes_data[nid] = {
             "name": node.name,
             "level": node.level,
@@ -159,47 +194,154 @@ def propagate():
 
 
 @router.post("/what-if")
-def what_if(req: WhatIfRequest):
-    """多参数 What-If 分析（不修改引擎当前状态）
+async def what_if(req: WhatIfRequest, session: OrgSession = Depends(get_session)):
+    """多参数 What-If 分析（在会话分支上计算，不修改会话状态；结果按场景缓存）
     
     adjustments 格式: {"line_leader.speed": 1.5, "line_leader.shifts": 3}
     """
-    engine = get_engine()
+    scenario = _parse_scenario(req.adjustments)
+
+    def compute(branch):
+        result = branch.what_if(scenario)
+        return {
+            nid: {
+                "name": snap.name,
+                "level": snap.level,
+                "outputs": snap.outputs,
+                "violations": snap.violations,
+            }
+            for nid, snap in result.items()
+        }
 
-    # 解析 "node_id.param_key" → (node_id, param_key)
+    key = ("what_if", tuple(sorted(scenario.items())))
+    loop = asyncio.get_running_loop()
+    try:
+        results = await loop.run_in_executor(scenario_executor, get_store().memoized, session, key, compute)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"scenario": req.adjustments, "results": results}
+
+
+def _parse_scenario(adjustments: Dict[str, float]) -> Dict[Tuple[str, str], float]:
+    """解析 "node_id.param_key" → (node_id, param_key)
+
+    节点 ID 自身可能带点（多产线前缀 L1.），按最后一个点切分。
+    """
     scenario: Dict[Tuple[str, str], float] = {}
-    for composite_key, value in req.adjustments.items():
-        parts = composite_key.split(".", 1)
+    for composite_key, value in adjustments.items():
+        parts = composite_key.rsplit(".", 1)
         if len(parts) != 2:
             raise HTTPException(
                 status_code=400,
                 detail=f"键格式错误: '{composite_key}'，应为 'node_id.param_key'"
             )
         scenario[(parts[0], parts[1])] = value
+    return scenario
 
+
+def _parse_signal(name: str) -> SignalType:
+    """信号按代码或中文名查找"""
+    for sig in SignalType:
+        if name in (sig.code, sig.label, sig.name):
+            return sig
+    raise HTTPException(status_code=400, detail=f"未知信号: '{name}'")
+
+
+@router.post("/sweep")
+async def sweep(req: SweepRequest, session: OrgSession = Depends(get_session)):
+    """批量 What-If：K 个场景在会话分支上向量化地一次传播（结果按场景缓存）
+
+    返回每个 (节点, 信号) 一个长度 K 的数组，第 i 个元素对应第 i 个场景。
+    """
+    if not req.scenarios:
+        raise HTTPException(status_code=400, detail="至少需要一个场景")
+    if len(req.scenarios) > MAX_SWEEP_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"场景数超过上限 {MAX_SWEEP_SCENARIOS}，请分批提交")
+    scenarios = [_parse_scenario(adjustments) for adjustments in req.scenarios]
+    targets = None
+    if req.targets:
+        targets = []
+        for composite in req.targets:
+            parts = composite.rsplit(".", 1)
+            if len(parts) != 2:
+                raise HTTPException(status_code=400, detail=f"目标格式错误: '{composite}'，应为 'node_id.signal'")
+            targets.append((parts[0], _parse_signal(parts[1])))
+
+    def compute(branch):
+        result = branch.sweep(scenarios, targets=targets)
+        return {
+            "scenario_count": result.scenario_count,
+            "passes": result.passes,
+            "outputs": {
+                nid: {sig.label: [round(float(v), 4) for v in values] for sig, values in signals.items()}
+                for nid, signals in result.outputs.items()
+            },
+            "violations": result.violations,
+        }
+
+    key = ("sweep", (
+        tuple(tuple(sorted(s.items())) for s in scenarios),
+        tuple(targets) if targets else None,
+    ))
+    loop = asyncio.get_running_loop()
     try:
-        result = engine.what_if(scenario)
+        return await loop.run_in_executor(scenario_executor, get_store().memoized, session, key, compute)
     except KeyError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return {
-        "scenario": req.adjustments,
-        "results": {
-            nid: {
-                "name": snap.name,
-                "level": snap.level,
-                "outputs": snap.outputs,
-                "violations": snap.violations,
-            }
-            for nid, snap in result.items()
-        },
-    }
+
+@router.get("/tornado/{node_id}/{signal}")
+async def tornado(
+    node_id: str,
+    signal: str,
+    span: float = Query(0.1, gt=0, le=1, description="拨动幅度（参数量程的比例）"),
+    session: OrgSession = Depends(get_session),
+):
+    """龙卷风敏感性：全图每个可调参数上/下拨 span × 量程时目标信号的摆幅，按摆幅排序"""
+    sig = _parse_signal(signal)
+    with session.lock:
+        if node_id not in session.engine.nodes:
+            raise HTTPException(status_code=404, detail=f"节点 '{node_id}' 不存在")
+
+    def compute(branch):
+        bars = branch.tornado(node_id, sig, span)
+        return {
+            "node_id": node_id,
+            "signal": sig.label,
+            "span": span,
+            "bars": [
+                {
+                    "node_id": b.node_id,
+                    "node_name": b.node_name,
+                    "param_key": b.param_key,
+                    "param_label": b.param_label,
+                    "low_param": b.low_param,
+                    "high_param": b.high_param,
+                    "low_output": b.low_output,
+                    "high_output": b.high_output,
+                    "swing": b.swing,
+                }
+                for b in bars
+            ],
+        }
+
+    key = ("tornado", (node_id, sig.code, span))
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(scenario_executor, get_store().memoized, session, key, compute)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/chains")
-def list_chains():
-    """获取所有逻辑链及其传导状态"""
-    engine = get_engine()
+def list_chains(session: OrgSession = Depends(get_session)):
+    """获取所有逻辑链及其传导状态（会话锁内只读，不分支）"""
+    with session.lock:
+        return _chains_payload(session.engine)
+
+
+def _chains_payload(engine) -> dict:
     chains_data = []
     for chain in engine.chains:
         links_data = []
@@ -232,18 +374,28 @@ def list_chains():
 
 
 @router.get("/trace/{node_id}/{param_key}")
-def trace_impact(
+async def trace_impact(
     node_id: str,
     param_key: str,
     delta: float = Query(..., description="参数变化量（+/-）"),
+    session: OrgSession = Depends(get_session),
 ):
     """影响追踪：如果某角色调了某参数（+delta），全链确定性影响"""
-    engine = get_engine()
-    if node_id not in engine.nodes:
-        raise HTTPException(status_code=404, detail=f"节点 '{node_id}' 不存在")
-    if param_key not in engine.nodes[node_id].parameters:
-        raise HTTPException(status_code=400, detail=f"参数 '{param_key}' 不存在")
+    with session.lock:
+        if node_id not in session.engine.nodes:
+            raise HTTPException(status_code=404, detail=f"节点 '{node_id}' 不存在")
+        if param_key not in session.engine.nodes[node_id].parameters:
+            raise HTTPException(status_code=400, detail=f"参数 '{param_key}' 不存在")
 
+    key = ("trace", (node_id, param_key, delta))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        scenario_executor, get_store().memoized, session, key,
+        lambda branch: _trace_payload(branch, node_id, param_key, delta),
+    )
+
+
+def _trace_payload(engine, node_id: str, param_key: str, delta: float) -> dict:
     report = engine.trace_impact(node_id, param_key, delta)
     return {
         "source_node": node_id,
@@ -268,16 +420,20 @@ def trace_impact(
 
 
 @router.get("/graph")
-def graph_description():
-    """获取全图的人类可读描述"""
-    engine = get_engine()
-    return {"description": engine.describe_graph()}
+def graph_description(session: OrgSession = Depends(get_session)):
+    """获取全图的人类可读描述（会话锁内只读，不分支）"""
+    with session.lock:
+        return {"description": session.engine.describe_graph()}
 
 
 @router.post("/reset")
-def reset_engine():
-    """重置引擎到初始状态"""
-    global _engine
-    _engine = build_electronics_factory()
-    _engine.propagate()
-    return {"status": "reset", "message": "引擎已重置为电子厂初始状态"}
+def reset_engine(session: OrgSession = Depends(get_session)):
+    """重置当前会话到电子厂初始状态（其他用户的会话不受影响）"""
+    get_store().reset(session.session_id)
+    return {"status": "reset", "message": "引擎已重置为电子厂初始状态", "session_id": session.session_id}
+
+
+@router.get("/sessions/stats")
+def session_stats():
+    """会话数与场景缓存命中情况"""
+    return get_store().stats()
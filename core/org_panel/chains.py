@@ -14,18 +14,66 @@
 - 纯函数：相同输入永远相同输出
 - 单参数：f(float) → float
 - 可含衰减/放大/阈值/非线性，但不可有随机
+- 数组兼容：输入为 K 维 ndarray（K 个场景同时传播）时逐元素计算，
+  分支/取大取小/指数用下方 vwhere/vmin/vmax/vexp 等，标量输入仍走纯 Python
 """
 
 from __future__ import annotations
 
+import math
 from dataclasses import dataclass, field
-from typing import Callable, Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
 
 from .signals import SignalType, signals_compatible
 
 
+# 信号值：标量，或 K 个场景并行时的 K 维向量
+Value = Union[float, np.ndarray]
+
 # 传导函数类型：f(输入值) → 输出值
-PropagationFn = Callable[[float], float]
+PropagationFn = Callable[[Value], Value]
+
+
+# ==================== 数组兼容运算 ====================
+# 任一操作数是 ndarray 时走 NumPy 逐元素运算，否则保持原来的纯 Python 标量语义（结果逐位一致）
+
+def _is_array(*values) -> bool:
+    return any(isinstance(v, np.ndarray) for v in values)
+
+
+def vmin(a: Value, b: Value) -> Value:
+    return np.minimum(a, b) if _is_array(a, b) else min(a, b)
+
+
+def vmax(a: Value, b: Value) -> Value:
+    return np.maximum(a, b) if _is_array(a, b) else max(a, b)
+
+
+def vwhere(cond, a: Value, b: Value) -> Value:
+    """cond ? a : b（两侧都会先求值，调用方需保证两侧在全定义域上可计算）"""
+    if _is_array(cond, a, b):
+        return np.where(cond, a, b)
+    return a if cond else b
+
+
+def vselect(cases: Sequence[Tuple[object, Value]], default: Value) -> Value:
+    """if/elif 级联：取第一个成立分支的值"""
+    if _is_array(*(c for c, _ in cases)):
+        return np.select([np.asarray(c) for c, _ in cases], [v for _, v in cases], default)
+    for cond, value in cases:
+        if cond:
+            return value
+    return default
+
+
+def vexp(x: Value) -> Value:
+    return np.exp(x) if _is_array(x) else math.exp(x)
+
+
+def vround(x: Value, digits: int = 0) -> Value:
+    return np.round(x, digits) if _is_array(x) else round(x, digits)
 
 
 @dataclass
@@ -45,7 +93,7 @@ class ChainLink:
     latency_hours: float = 0.0  # 传导延迟（不是调了立刻到）
     label: str = ""             # 这一环的描述
 
-    def propagate(self, value: float) -> float:
+    def propagate(self, value: Value) -> Value:
         """执行传导"""
         return self.propagation_fn(value)
 
@@ -119,7 +167,7 @@ class LogicChain:
 
 def linear(gain: float = 1.0, offset: float = 0.0) -> PropagationFn:
     """线性传导：y = gain * x + offset"""
-    def fn(x: float) -> float:
+    def fn(x: Value) -> Value:
         return gain * x + offset
     return fn
 
@@ -128,47 +176,42 @@ def quadratic_degrade(base: float = 0.98, coeff: float = 0.15, threshold: float
     """二次退化：speed ≤ threshold 时保持 base，超过后二次下降
     y = base - coeff * (x - threshold)^2
     """
-    def fn(x: float) -> float:
-        if x <= threshold:
-            return base
-        return max(0.1, base - coeff * (x - threshold) ** 2)
+    def fn(x: Value) -> Value:
+        return vwhere(x <= threshold, base, vmax(0.1, base - coeff * (x - threshold) ** 2))
     return fn
 
 
 def power_stress(exponent: float = 1.5, normalize_max: float = 3.0) -> PropagationFn:
     """幂次应力：y = (x / max) ^ exponent，归一化到 0-1"""
-    def fn(x: float) -> float:
-        return min(1.0, (x / normalize_max) ** exponent)
+    def fn(x: Value) -> Value:
+        return vmin(1.0, (x / normalize_max) ** exponent)
     return fn
 
 
 def threshold_linear(threshold: float, collapse: float) -> PropagationFn:
     """阈值后线性：x ≤ threshold → 0，之后线性到 collapse 时 = 1.0"""
-    def fn(x: float) -> float:
-        if x <= threshold:
-            return 0.0
-        return min(1.0, (x - threshold) / (collapse - threshold))
+    def fn(x: Value) -> Value:
+        return vwhere(x <= threshold, 0.0, vmin(1.0, (x - threshold) / (collapse - threshold)))
     return fn
 
 
 def exponential_decay(base_rate: float = 0.02, exponent: float = 2.5, hours: float = 24.0) -> PropagationFn:
     """指数衰减（故障概率）：P = 1 - exp(-rate * x^exponent * hours)"""
-    import math
-    def fn(x: float) -> float:
+    def fn(x: Value) -> Value:
         rate = base_rate * (x ** exponent)
-        return 1.0 - math.exp(-rate * hours)
+        return 1.0 - vexp(-rate * hours)
     return fn
 
 
 def inverse_proportional(numerator: float = 100.0, floor: float = 0.01) -> PropagationFn:
     """反比：y = numerator / max(x, floor)"""
-    def fn(x: float) -> float:
-        return numerator / max(x, floor)
+    def fn(x: Value) -> Value:
+        return numerator / vmax(x, floor)
     return fn
 
 
 def clamp_propagation(min_val: float = 0.0, max_val: float = 1.0) -> PropagationFn:
     """截断传导：将值限制在范围内"""
-    def fn(x: float) -> float:
-        return max(min_val, min(max_val, x))
+    def fn(x: Value) -> Value:
+        return vmax(min_val, vmin(max_val, x))
     return fn
@@ -12,14 +12,27 @@
 5. 反馈环通过迭代收敛处理（最多 N 轮，epsilon 收敛）
 6. 全部收敛后返回快照
 
+增量传播：
+- 入边索引（target → links）建图时维护，收集输入只看指向本节点的链
+- 图按强连通分量（Tarjan）缩点后拓扑排序，只有反馈环所在分量迭代收敛，其余节点算一次
+- 只重算参数变化的节点及其输出确实变化后波及的下游（脏集合），未受影响的节点保持原值
+
+批量场景扫描（sweep）：
+- K 个场景合成一次传播：被调到的参数变成 K 维向量，下游节点的每个信号随之成为 K 维向量
+- 传导函数/约束都是数组兼容的，反馈环按 K 个场景中最大的变化量判断收敛
+- 龙卷风图（tornado）把全图每个可调参数的上/下拨动作为 2P 个场景一次扫完
+
 确定性保证：相同参数 → 永远相同结果（可复现）
 """
 
 from __future__ import annotations
 
+import heapq
 from collections import defaultdict, deque
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
 
 from .signals import SignalType
 from .node import OrgNode
@@ -67,6 +80,37 @@ class ImpactReport:
     chain_path: List[str] = field(default_factory=list)  # 传导路径描述
 
 
+@dataclass
+class SweepResult:
+    """批量场景扫描结果：每个信号一个 K 维向量（第 i 个元素对应第 i 个场景）"""
+    scenario_count: int
+    parameters: Dict[Tuple[str, str], np.ndarray]            # 被调到的参数在各场景下的实际生效值
+    outputs: Dict[str, Dict[SignalType, np.ndarray]]         # node_id → {信号: K 维向量}
+    violations: Dict[str, List[str]] = field(default_factory=dict)
+    passes: int = 0                                          # 实际传播次数（按批）
+
+    def scenario(self, index: int) -> Dict[str, Dict[SignalType, float]]:
+        """取第 index 个场景的全部输出"""
+        return {
+            nid: {sig: float(values[index]) for sig, values in signals.items()}
+            for nid, signals in self.outputs.items()
+        }
+
+
+@dataclass
+class TornadoBar:
+    """龙卷风图的一根条：某参数下拨/上拨时目标信号的取值"""
+    node_id: str
+    node_name: str
+    param_key: str
+    param_label: str
+    low_param: float
+    high_param: float
+    low_output: float
+    high_output: float
+    swing: float          # |high_output - low_output|
+
+
 # ==================== 引擎 ====================
 
 class OrgSimEngine:
@@ -77,6 +121,7 @@ class OrgSimEngine:
 
     MAX_ITERATIONS = 20       # 反馈环最大迭代次数
     CONVERGENCE_EPS = 1e-6    # 收敛精度
+    SWEEP_BATCH = 512         # 批量扫描单次传播的场景数上限（限制向量宽度与被调参数列数）
 
     def __init__(self):
         self.nodes: Dict[str, OrgNode] = {}
@@ -85,12 +130,30 @@ class OrgSimEngine:
         self._outgoing: Dict[str, List[ChainLink]] = defaultdict(list)
         # 反向：target_node_id → [source_node_id]
         self._incoming: Dict[str, List[str]] = defaultdict(list)
+        # 入边索引：target_node_id → [link]
+        self._incoming_links: Dict[str, List[ChainLink]] = defaultdict(list)
+
+        # 传播计划（强连通分量按拓扑序），建图变化时作废
+        self._components: Optional[List[List[str]]] = None
+        self._component_of: Dict[str, int] = {}
+        self._cyclic: List[bool] = []
+        # 上次计算时各节点的参数值，用来发现参数变化（含绕过引擎直接改 ParameterDef 的情况）
+        self._computed_params: Dict[str, Dict[str, float]] = {}
+        self._dirty: Set[str] = set()
+        # 写时复制：None 表示独占所有节点；fork 之后为已复制（可写）的节点集合
+        self._owned: Optional[Set[str]] = None
+        self._graph_shared = False
 
     # ── 构建 ──
 
     def add_node(self, node: OrgNode) -> None:
         """注册一个组织节点"""
+        self._own_graph()
         self.nodes[node.node_id] = node
+        if self._owned is not None:
+            self._owned.add(node.node_id)
+        self._components = None
+        self._dirty.add(node.node_id)
 
     def connect(self, chain: LogicChain) -> None:
         """注册一条逻辑链（自动做类型安全检查）"""
@@ -99,6 +162,7 @@ class OrgSimEngine:
             raise TypeError(
                 f"逻辑链 '{chain.name}' 类型校验失败:\n" + "\n".join(errors)
             )
+        self._own_graph()
         # 检查节点存在性
         for link in chain.links:
             if link.source_node_id not in self.nodes:
@@ -107,8 +171,11 @@ class OrgSimEngine:
                 raise KeyError(f"目标节点 '{link.target_node_id}' 未注册")
             self._outgoing[link.source_node_id].append(link)
             self._incoming[link.target_node_id].append(link.source_node_id)
+            self._incoming_links[link.target_node_id].append(link)
+            self._dirty.add(link.target_node_id)
 
         self.chains.append(chain)
+        self._components = None
 
     # ── 参数操作 ──
 
@@ -116,99 +183,250 @@ class OrgSimEngine:
         """设置某节点的某参数，返回实际生效值"""
         if node_id not in self.nodes:
             raise KeyError(f"节点 '{node_id}' 不存在")
-        return self.nodes[node_id].set_parameter(param_key, value)
+        return self._writable(node_id).set_parameter(param_key, value)
+
+    # ── 写时复制 ──
+
+    def fork(self) -> "OrgSimEngine":
+        """写时复制分支：共享图结构与节点对象，任一方要改某节点时先复制该节点
+
+        fork 之后父引擎同样按写时复制处理，双方都不会原地修改共享节点。
+        """
+        self._ensure_plan()
+        child = OrgSimEngine.__new__(OrgSimEngine)
+        child.nodes = dict(self.nodes)
+        child.chains = self.chains
+        child._outgoing = self._outgoing
+        child._incoming = self._incoming
+        child._incoming_links = self._incoming_links
+        child._components = self._components
+        child._component_of = self._component_of
+        child._cyclic = self._cyclic
+        child._computed_params = dict(self._computed_params)
+        child._dirty = set(self._dirty)
+        child._owned = set()
+        child._graph_shared = True
+        self._owned = set()
+        self._graph_shared = True
+        return child
+
+    def _writable(self, node_id: str) -> OrgNode:
+        """取可原地修改的节点（共享节点先复制一份）"""
+        node = self.nodes[node_id]
+        if self._owned is not None and node_id not in self._owned:
+            node = node.clone()
+            self.nodes[node_id] = node
+            self._owned.add(node_id)
+        return node
+
+    def _own_graph(self) -> None:
+        """改图结构前复制与其他分支共享的邻接表"""
+        if not self._graph_shared:
+            return
+        self.chains = list(self.chains)
+        self._outgoing = defaultdict(list, {k: list(v) for k, v in self._outgoing.items()})
+        self._incoming = defaultdict(list, {k: list(v) for k, v in self._incoming.items()})
+        self._incoming_links = defaultdict(list, {k: list(v) for k, v in self._incoming_links.items()})
+        self._graph_shared = False
 
     # ── 传播 ──
 
-    def propagate(self) -> Dict[str, Dict[SignalType, float]]:
+    def propagate(self, full: bool = False) -> Dict[str, Dict[SignalType, float]]:
         """执行全图传播
         
         算法：
-        1. 计算所有节点的初始输出（基于当前输入+参数）
-        2. 拓扑排序确定传播顺序
-        3. 按序传播信号
-        4. 对有反馈环的，迭代直到收敛
+        1. 找出参数变化 / 新接入的节点（full=True 时全部节点）
+        2. 按强连通分量的拓扑序处理：无环节点算一次，反馈环分量内迭代直到收敛
+        3. 节点输出变化时把直接下游加入脏集合，未被波及的节点不重算
         
         返回：{node_id: {SignalType: value}} 所有节点的最终输出
         """
-        # 拓扑排序（Kahn's algorithm）
-        order = self._topological_sort()
-
-        # 迭代传播（处理反馈环）
-        for iteration in range(self.MAX_ITERATIONS):
-            prev_outputs = {
-                nid: dict(node.output_signals) for nid, node in self.nodes.items()
-            }
-
-            # 按拓扑序逐节点计算
-            for node_id in order:
-                node = self.nodes[node_id]
-                # 收集来自上游的信号
-                self._gather_inputs(node_id)
-                # 执行传导函数
-                node.compute()
-
-            # 检查收敛
-            if self._converged(prev_outputs):
-                break
-
+        self._run(self.nodes.keys() if full else ())
         return {nid: dict(node.output_signals) for nid, node in self.nodes.items()}
 
-    def _gather_inputs(self, node_id: str):
-        """收集所有指向该节点的链传导信号"""
-        for link in self._outgoing.get(node_id, []):
-            # 这里是 node_id 作为 source 的情况，不需要 gather
-            pass
+    def _run(
+        self,
+        extra_dirty: Iterable[str] = (),
+        journal: Optional[Dict[str, tuple]] = None,
+    ) -> Set[str]:
+        """增量传播，返回本次重算过的节点
 
-        # 找所有以 node_id 为 target 的 link
-        for source_id, links in self._outgoing.items():
-            for link in links:
-                if link.target_node_id == node_id:
-                    source_node = self.nodes.get(link.source_node_id)
-                    if source_node and link.source_signal in source_node.output_signals:
-                        raw_value = source_node.output_signals[link.source_signal]
-                        propagated = link.propagate(raw_value)
-                        self.nodes[node_id].receive_signal(link.target_signal, propagated)
-
-    def _topological_sort(self) -> List[str]:
-        """Kahn 拓扑排序（有环时退化为全节点遍历）"""
-        in_degree: Dict[str, int] = {nid: 0 for nid in self.nodes}
-        adj: Dict[str, List[str]] = defaultdict(list)
+        journal 不为 None 时，节点第一次重算前把 (输入, 输出, 违反, 警告) 记进去，供 _restore 回滚。
+        """
+        self._ensure_plan()
+        dirty = self._dirty | set(extra_dirty)
+        self._dirty = set()
+        for nid, node in self.nodes.items():
+            if not _same_values(self._computed_params.get(nid), node.get_param_dict()):
+                dirty.add(nid)
+
+        recomputed: Set[str] = set()
+        if not dirty:
+            return recomputed
+        pending = sorted({self._component_of[nid] for nid in dirty})
+        heap_set = set(pending)
+        heapq.heapify(pending)
+
+        while pending:
+            comp = heapq.heappop(pending)
+            heap_set.discard(comp)
+            members = self._components[comp]
+            if self._cyclic[comp]:
+                changed = self._solve_cycle(members, journal, recomputed)
+            else:
+                changed = members if self._compute_node(members[0], journal, recomputed) else []
+            for nid in changed:
+                for link in self._outgoing.get(nid, []):
+                    target_comp = self._component_of[link.target_node_id]
+                    if target_comp != comp and target_comp not in heap_set:
+                        heap_set.add(target_comp)
+                        heapq.heappush(pending, target_comp)
+        return recomputed
+
+    def _compute_node(self, node_id: str, journal: Optional[Dict[str, tuple]], recomputed: Set[str]) -> bool:
+        """收集输入并计算单个节点，返回输出是否变化"""
+        node = self._writable(node_id)
+        if journal is not None and node_id not in journal:
+            journal[node_id] = (
+                dict(node.input_signals), dict(node.output_signals),
+                list(node.violations), list(node.warnings),
+            )
+        before = dict(node.output_signals)
+        self._gather_inputs(node_id)
+        node.compute()
+        self._computed_params[node_id] = node.get_param_dict()
+        recomputed.add(node_id)
+        return not _same_values(before, node.output_signals)
+
+    def _solve_cycle(
+        self, members: List[str], journal: Optional[Dict[str, tuple]], recomputed: Set[str],
+    ) -> List[str]:
+        """反馈环分量内迭代到收敛，返回输出有变化的节点"""
+        start = {nid: dict(self.nodes[nid].output_signals) for nid in members}
+        for _ in range(self.MAX_ITERATIONS):
+            prev = {nid: dict(self.nodes[nid].output_signals) for nid in members}
+            for nid in members:
+                self._compute_node(nid, journal, recomputed)
+            if self._converged(prev, members):
+                break
+        return [nid for nid in members if not _same_values(start[nid], self.nodes[nid].output_signals)]
 
+    def _gather_inputs(self, node_id: str):
+        """收集所有指向该节点的链传导信号（入边索引）"""
+        target = self.nodes[node_id]
+        for link in self._incoming_links.get(node_id, []):
+            source_node = self.nodes.get(link.source_node_id)
+            if source_node and link.source_signal in source_node.output_signals:
+                raw_value = source_node.output_signals[link.source_signal]
+                target.receive_signal(link.target_signal, link.propagate(raw_value))
+
+    def _ensure_plan(self) -> None:
+        """按强连通分量缩点并拓扑排序（建图后只算一次）"""
+        if self._components is not None:
+            return
+        components = self._strongly_connected_components()
+        component_of = {nid: i for i, comp in enumerate(components) for nid in comp}
+
+        # 缩点图上的 Kahn 拓扑排序；同层按节点注册顺序，保证结果可复现
+        position = {nid: i for i, nid in enumerate(self.nodes)}
+        succ: Dict[int, Set[int]] = defaultdict(set)
+        in_degree = [0] * len(components)
+        self_loop = [False] * len(components)
         for source_id, links in self._outgoing.items():
             for link in links:
-                target = link.target_node_id
-                if target in in_degree:
-                    adj[source_id].append(target)
-                    in_degree[target] = in_degree.get(target, 0) + 1
-
-        queue = deque([nid for nid, deg in in_degree.items() if deg == 0])
-        order = []
-
-        while queue:
-            nid = queue.popleft()
-            order.append(nid)
-            for neighbor in adj.get(nid, []):
-                in_degree[neighbor] -= 1
-                if in_degree[neighbor] == 0:
-                    queue.append(neighbor)
-
-        # 有环：把剩余节点追加（迭代收敛处理）
-        remaining = [nid for nid in self.nodes if nid not in set(order)]
-        order.extend(remaining)
-        return order
-
-    def _converged(self, prev_outputs: Dict[str, Dict[SignalType, float]]) -> bool:
-        """检查是否收敛（所有节点输出变化 < epsilon）"""
-        for nid, node in self.nodes.items():
+                a, b = component_of[source_id], component_of[link.target_node_id]
+                if a == b:
+                    self_loop[a] = True
+                elif b not in succ[a]:
+                    succ[a].add(b)
+                    in_degree[b] += 1
+        first = [min(position[n] for n in comp) for comp in components]
+        ready = [(first[i], i) for i, deg in enumerate(in_degree) if deg == 0]
+        heapq.heapify(ready)
+        order: List[int] = []
+        while ready:
+            _, i = heapq.heappop(ready)
+            order.append(i)
+            for j in succ[i]:
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    heapq.heappush(ready, (first[j], j))
+
+        self._components = [sorted(components[i], key=position.__getitem__) for i in order]
+        self._component_of = {nid: k for k, comp in enumerate(self._components) for nid in comp}
+        self._cyclic = [len(components[i]) > 1 or self_loop[i] for i in order]
+
+    def _strongly_connected_components(self) -> List[List[str]]:
+        """Tarjan 强连通分量（迭代实现，避免大图递归过深）"""
+        index: Dict[str, int] = {}
+        low: Dict[str, int] = {}
+        on_stack: Set[str] = set()
+        stack: List[str] = []
+        components: List[List[str]] = []
+        counter = 0
+
+        for root in self.nodes:
+            if root in index:
+                continue
+            work = [(root, iter(self._outgoing.get(root, [])))]
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                nid, links = work[-1]
+                advanced = False
+                for link in links:
+                    nxt = link.target_node_id
+                    if nxt not in index:
+                        index[nxt] = low[nxt] = counter
+                        counter += 1
+                        stack.append(nxt)
+                        on_stack.add(nxt)
+                        work.append((nxt, iter(self._outgoing.get(nxt, []))))
+                        advanced = True
+                        break
+                    if nxt in on_stack:
+                        low[nid] = min(low[nid], index[nxt])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[nid])
+                if low[nid] == index[nid]:
+                    comp = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        comp.append(member)
+                        if member == nid:
+                            break
+                    components.append(comp)
+        return components
+
+    def _converged(self, prev_outputs: Dict[str, Dict[SignalType, float]], node_ids: Iterable[str]) -> bool:
+        """检查是否收敛（给定节点输出变化 < epsilon）"""
+        for nid in node_ids:
             prev = prev_outputs.get(nid, {})
-            curr = node.output_signals
+            curr = self.nodes[nid].output_signals
             all_keys = set(prev.keys()) | set(curr.keys())
             for k in all_keys:
-                if abs(curr.get(k, 0.0) - prev.get(k, 0.0)) > self.CONVERGENCE_EPS:
+                diff = abs(curr.get(k, 0.0) - prev.get(k, 0.0))
+                if (diff.max() if isinstance(diff, np.ndarray) else diff) > self.CONVERGENCE_EPS:
                     return False
         return True
 
+    def _restore(self, journal: Dict[str, tuple], params: Dict[Tuple[str, str], float]) -> None:
+        """回滚参数与 journal 中记录的节点状态（what-if / 影响追踪用，免去再传播一遍）"""
+        for (nid, pkey), value in params.items():
+            self._writable(nid).parameters[pkey].value = value
+        for nid, (inputs, outputs, violations, warnings) in journal.items():
+            node = self._writable(nid)
+            node.input_signals, node.output_signals = inputs, outputs
+            node.violations, node.warnings = violations, warnings
+            self._computed_params[nid] = node.get_param_dict()
+
     # ── 查询 ──
 
     def snapshot(self, node_id: str) -> NodeSnapshot:
@@ -240,9 +458,9 @@ class OrgSimEngine:
         """追踪：如果某角色调了某参数（+delta），全链影响是什么
         
         方法：
-        1. 保存当前状态
-        2. 应用 delta → 传播 → 记录 after
-        3. 恢复原始状态 → 传播 → 记录 before
+        1. 当前状态补齐传播 → 即 before
+        2. 应用 delta → 只重算受影响的下游 → 记录 after
+        3. 按 journal 回滚被重算的节点（不再整图传播）
         4. 对比生成 ImpactReport
         """
         if node_id not in self.nodes:
@@ -256,25 +474,30 @@ class OrgSimEngine:
         new_value = node.parameters[param_key].clamp(original_value + delta)
 
         # 计算 before（原始状态传播）
-        node.parameters[param_key].value = original_value
-        self.propagate()
-        before_state = {nid: dict(n.output_signals) for nid, n in self.nodes.items()}
+        self._run()
 
-        # 计算 after（新参数传播）
-        node.parameters[param_key].value = new_value
-        self.propagate()
-        after_state = {nid: dict(n.output_signals) for nid, n in self.nodes.items()}
+        # 计算 after（新参数传播，只有下游会被重算）
+        journal: Dict[str, tuple] = {}
+        self._writable(node_id).parameters[param_key].value = new_value
+        self._run(journal=journal)
+        after_state = {nid: dict(self.nodes[nid].output_signals) for nid in journal}
+
+        # 违反（after 状态下的全图）
+        violations = []
+        for n in self.nodes.values():
+            violations.extend(n.violations)
 
         # 恢复原始
-        node.parameters[param_key].value = original_value
-        self.propagate()
+        self._restore(journal, {(node_id, param_key): original_value})
 
-        # 生成影响报告
+        # 生成影响报告（未重算的节点输出不变）
         impacts = []
         for nid in self.nodes:
+            if nid not in journal:
+                continue
             n = self.nodes[nid]
-            before_sigs = before_state.get(nid, {})
-            after_sigs = after_state.get(nid, {})
+            before_sigs = n.output_signals
+            after_sigs = after_state[nid]
             all_sigs = set(before_sigs.keys()) | set(after_sigs.keys())
             for sig in all_sigs:
                 b = before_sigs.get(sig, 0.0)
@@ -295,11 +518,6 @@ class OrgSimEngine:
         # 传导路径
         chain_path = self._trace_chain_path(node_id)
 
-        # 违反
-        violations = []
-        for n in self.nodes.values():
-            violations.extend(n.violations)
-
         return ImpactReport(
             source_node_id=node_id,
             param_key=param_key,
@@ -338,32 +556,169 @@ class OrgSimEngine:
         scenario: {(node_id, param_key): new_value, ...}
         返回：调整后的全图快照（不修改引擎当前状态）
         """
+        self._check_params(scenario)
+        self._run()
+
         # 保存当前状态
         saved_params = {}
         for (nid, pkey), val in scenario.items():
-            if nid not in self.nodes:
-                raise KeyError(f"节点 '{nid}' 不存在")
-            node = self.nodes[nid]
-            if pkey not in node.parameters:
-                raise KeyError(f"节点 '{nid}' 没有参数 '{pkey}'")
-            saved_params[(nid, pkey)] = node.parameters[pkey].value
-            node.parameters[pkey].set(val)
+            saved_params.setdefault((nid, pkey), self.nodes[nid].parameters[pkey].value)
+            self._writable(nid).parameters[pkey].set(val)
 
-        # 传播
-        self.propagate()
+        # 传播（只重算受影响的下游）
+        journal: Dict[str, tuple] = {}
+        self._run(journal=journal)
 
         # 快照
         result = self.snapshot_all()
 
         # 恢复
-        for (nid, pkey), val in saved_params.items():
-            self.nodes[nid].parameters[pkey].value = val
-        self.propagate()
+        self._restore(journal, saved_params)
 
         return result
 
+    # ── 批量场景扫描 ──
+
+    def sweep(
+        self,
+        scenarios: Sequence[Dict[Tuple[str, str], float]],
+        targets: Optional[Iterable[Tuple[str, SignalType]]] = None,
+    ) -> SweepResult:
+        """K 个 what-if 场景向量化地一起算
+
+        scenarios: [{(node_id, param_key): new_value, ...}, ...]，场景里没调的参数取当前值
+        targets: 只收集这些 (node_id, 信号) 的结果（大图上省内存），默认收集全部节点
+
+        被任一场景调到的参数变成 K 维向量，在写时复制分支上传播一次：只有这些参数的下游
+        被重算，其余节点保持标量、结果里广播成 K 维。场景多于 SWEEP_BATCH 时分批传播。
+        不修改引擎当前状态。
+        """
+        if not scenarios:
+            raise ValueError("至少需要一个场景")
+        for scenario in scenarios:
+            self._check_params(scenario)
+        self._run()
+
+        k = len(scenarios)
+        wanted = None if targets is None else list(targets)
+        parameters: Dict[Tuple[str, str], np.ndarray] = {}
+        outputs: Dict[str, Dict[SignalType, np.ndarray]] = {}
+        violations: Dict[str, List[str]] = defaultdict(list)
+        passes = 0
+
+        for start in range(0, k, self.SWEEP_BATCH):
+            batch = scenarios[start:start + self.SWEEP_BATCH]
+            width = len(batch)
+            columns: Dict[Tuple[str, str], np.ndarray] = {}
+            for i, scenario in enumerate(batch):
+                for (nid, pkey), value in scenario.items():
+                    column = columns.get((nid, pkey))
+                    if column is None:
+                        column = columns[(nid, pkey)] = np.full(width, float(self.nodes[nid].parameters[pkey].value))
+                    column[i] = value
+
+            branch = self.fork()
+            for (nid, pkey), column in columns.items():
+                p = branch._writable(nid).parameters[pkey]
+                p.value = np.clip(column, p.min_val, p.max_val)
+            touched = branch._run()
+            passes += 1
+
+            for key in columns:
+                actual = branch.nodes[key[0]].parameters[key[1]].value
+                self._fill(parameters, key, actual, start, width, k, float(self.nodes[key[0]].parameters[key[1]].value))
+            for nid, sig in wanted if wanted is not None else (
+                (nid, sig) for nid, node in branch.nodes.items() for sig in node.output_signals
+            ):
+                value = branch.nodes[nid].output_signals.get(sig)
+                if value is not None:
+                    baseline = self.nodes[nid].output_signals.get(sig, 0.0)
+                    self._fill(outputs.setdefault(nid, {}), sig, value, start, width, k, baseline)
+            for nid in touched:
+                for message in branch.nodes[nid].violations:
+                    if message not in violations[nid]:
+                        violations[nid].append(message)
+
+        return SweepResult(
+            scenario_count=k, parameters=parameters, outputs=outputs,
+            violations=dict(violations), passes=passes,
+        )
+
+    @staticmethod
+    def _fill(target: dict, key, value, start: int, width: int, total: int, baseline: float) -> None:
+        """把一批的结果写进总长 total 的向量（标量广播，未涉及的批取 baseline）"""
+        column = target.get(key)
+        if column is None:
+            column = target[key] = np.full(total, float(baseline))
+        column[start:start + width] = value
+
+    def tornado(self, node_id: str, signal: SignalType, span: float = 0.1) -> List[TornadoBar]:
+        """龙卷风敏感性：全图每个可调参数各下拨/上拨 span × 量程，看目标信号的摆幅
+
+        2P 个单参数场景（P = 全图参数个数）合成一次 sweep，按摆幅从大到小排序。
+        传导不到目标节点的参数摆幅恒为 0，不参与扫描。
+        """
+        if node_id not in self.nodes:
+            raise KeyError(f"节点 '{node_id}' 不存在")
+        self._run()
+        if signal not in self.nodes[node_id].output_signals:
+            raise KeyError(f"节点 '{node_id}' 没有输出信号 '{signal.label}'")
+
+        upstream = self._upstream_of(node_id)
+        baseline = float(self.nodes[node_id].output_signals[signal])
+        keys = [(nid, pkey) for nid, node in self.nodes.items() for pkey in node.parameters]
+        scenarios = []
+        for nid, pkey in keys:
+            p = self.nodes[nid].parameters[pkey]
+            width = span * (p.max_val - p.min_val)
+            scenarios.append({(nid, pkey): p.clamp(p.value - width)})
+            scenarios.append({(nid, pkey): p.clamp(p.value + width)})
+        reachable = [i for i, (nid, _) in enumerate(keys) if nid in upstream]
+        swept = self.sweep(
+            [scenarios[j] for i in reachable for j in (2 * i, 2 * i + 1)], targets=[(node_id, signal)],
+        ).outputs[node_id][signal] if reachable else np.empty(0)
+        values = np.full(2 * len(keys), baseline)
+        for n, i in enumerate(reachable):
+            values[2 * i:2 * i + 2] = swept[2 * n:2 * n + 2]
+
+        bars = []
+        for i, (nid, pkey) in enumerate(keys):
+            node = self.nodes[nid]
+            low, high = float(values[2 * i]), float(values[2 * i + 1])
+            bars.append(TornadoBar(
+                node_id=nid,
+                node_name=node.name,
+                param_key=pkey,
+                param_label=node.parameters[pkey].label,
+                low_param=scenarios[2 * i][(nid, pkey)],
+                high_param=scenarios[2 * i + 1][(nid, pkey)],
+                low_output=round(low, 4),
+                high_output=round(high, 4),
+                swing=round(abs(high - low), 4),
+            ))
+        bars.sort(key=lambda b: b.swing, reverse=True)
+        return bars
+
     # ── 辅助 ──
 
+    def _upstream_of(self, node_id: str) -> Set[str]:
+        """能传导到该节点的所有节点（含自身）"""
+        seen = {node_id}
+        queue = deque([node_id])
+        while queue:
+            for source in self._incoming.get(queue.popleft(), []):
+                if source not in seen:
+                    seen.add(source)
+                    queue.append(source)
+        return seen
+
+    def _check_params(self, scenario: Dict[Tuple[str, str], float]) -> None:
+        for (nid, pkey) in scenario:
+            if nid not in self.nodes:
+                raise KeyError(f"节点 '{nid}' 不存在")
+            if pkey not in self.nodes[nid].parameters:
+                raise KeyError(f"节点 '{nid}' 没有参数 '{pkey}'")
+
     def get_nodes_by_level(self, level: int) -> List[OrgNode]:
         """按层级获取节点"""
         return [n for n in self.nodes.values() if n.level == level]
@@ -387,3 +742,14 @@ class OrgSimEngine:
         for chain in self.chains:
             lines.append(f"  {chain.describe()}")
         return "\n".join(lines)
+
+
+def _same_values(a: Optional[dict], b: dict) -> bool:
+    """两个 {键: 值} 字典是否逐值相等（值可能是 K 维向量）"""
+    if a is None:
+        return False
+    try:
+        return a == b
+    except ValueError:
+        # 含多元素向量时 == 无法直接转布尔
+        return a.keys() == b.keys() and all(np.array_equal(a[key], b[key]) for key in a)
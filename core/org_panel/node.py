@@ -7,14 +7,20 @@
 - CapabilityDef: 能力（该角色能影响什么信号）
 - Constraint: 硬边界（不可被参数绕过的物理限制）
 - OrgNode: 组织节点（参数+能力+输入+输出+约束+传导函数）
+
+参数/信号值可以是 K 维向量（批量场景扫描），此时约束按场景逐个生效。
 """
 
 from __future__ import annotations
 
-from dataclasses import dataclass, field
+import copy
+from dataclasses import dataclass, field, replace
 from typing import Callable, Dict, List, Optional
 
+import numpy as np
+
 from .signals import SignalType
+from .chains import vmax, vwhere
 
 
 @dataclass
@@ -82,7 +88,7 @@ class Constraint:
     description: str = ""
 
     def check(self, value: float) -> bool:
-        """检查是否触发"""
+        """检查是否触发（向量输入返回逐场景的布尔向量）"""
         ops = {
             "<": lambda v, t: v < t,
             ">": lambda v, t: v > t,
@@ -169,33 +175,45 @@ class OrgNode:
         for c in self.constraints:
             # 检查输入信号
             if c.signal_type in self.input_signals:
-                if c.check(self.input_signals[c.signal_type]):
-                    self._apply_constraint(c)
+                hit = c.check(self.input_signals[c.signal_type])
+                if _triggered(hit):
+                    self._apply_constraint(c, hit=hit)
             # 检查输出信号
             if c.signal_type in raw_outputs:
-                if c.check(raw_outputs[c.signal_type]):
-                    self._apply_constraint(c, raw_outputs)
+                hit = c.check(raw_outputs[c.signal_type])
+                if _triggered(hit):
+                    self._apply_constraint(c, raw_outputs, hit)
 
         # 3. 存储输出
         self.output_signals = raw_outputs
         return raw_outputs
 
-    def _apply_constraint(self, c: Constraint, outputs: Optional[Dict[SignalType, float]] = None):
-        """应用约束动作"""
+    def _apply_constraint(self, c: Constraint, outputs: Optional[Dict[SignalType, float]] = None, hit=True):
+        """应用约束动作（hit 为布尔向量时只作用于触发的场景）"""
+        scope = f"（{int(hit.sum())}/{hit.size} 个场景）" if isinstance(hit, np.ndarray) else ""
         self.violations.append(
-            f"[{c.name}] {c.signal_type.label} 触发 {c.operator} {c.threshold} → {c.action}"
+            f"[{c.name}] {c.signal_type.label} 触发 {c.operator} {c.threshold} → {c.action}{scope}"
         )
         if c.action == "shutdown" and outputs is not None:
             # 强制停线：产出归零
             target = c.action_target or SignalType.THROUGHPUT
-            outputs[target] = c.action_value
+            outputs[target] = vwhere(hit, c.action_value, outputs.get(target, c.action_value))
         elif c.action == "clamp_output" and outputs is not None:
             target = c.action_target or c.signal_type
-            outputs[target] = c.action_value
+            outputs[target] = vwhere(hit, c.action_value, outputs.get(target, c.action_value))
         elif c.action == "escalate":
-            self.output_signals[SignalType.ESCALATION_LEVEL] = max(
-                self.output_signals.get(SignalType.ESCALATION_LEVEL, 0), 2.0
-            )
+            current = self.output_signals.get(SignalType.ESCALATION_LEVEL, 0)
+            self.output_signals[SignalType.ESCALATION_LEVEL] = vwhere(hit, vmax(current, 2.0), current)
+
+    def clone(self) -> "OrgNode":
+        """复制可变状态（参数/信号/违反记录），传导函数、能力与约束定义共享"""
+        twin = copy.copy(self)
+        twin.parameters = {k: replace(p) for k, p in self.parameters.items()}
+        twin.input_signals = dict(self.input_signals)
+        twin.output_signals = dict(self.output_signals)
+        twin.violations = list(self.violations)
+        twin.warnings = list(self.warnings)
+        return twin
 
     def receive_signal(self, signal_type: SignalType, value: float):
         """接收一个输入信号"""
@@ -244,3 +262,8 @@ class OrgNode:
 
     def __repr__(self) -> str:
         return f"OrgNode({self.node_id}, '{self.name}', L{self.level})"
+
+
+def _triggered(hit) -> bool:
+    """约束是否在任一场景触发"""
+    return bool(hit.any()) if isinstance(hit, np.ndarray) else bool(hit)
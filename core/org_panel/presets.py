@@ -13,12 +13,14 @@
    │
    └──产出→消耗──→ [仓储主管] ──缺料──→ [生产经理]
    
-所有 transfer_fn 均为纯函数（确定性，无随机）。
+所有 transfer_fn 均为纯函数（确定性，无随机），且数组兼容：参数/输入为 K 维向量时
+一次算出 K 个场景（OrgSimEngine.sweep），分支与取大取小用 chains 中的 vwhere/vmin/vmax 等。
+
+build_multi_line_factory(n) 把同一模板复制 n 条线（节点 ID 前缀 L{i}.），用于大图场景。
 """
 
 from __future__ import annotations
 
-import math
 from typing import Dict
 
 from .signals import SignalType
@@ -27,6 +29,7 @@ from .chains import (
     LogicChain, ChainLink,
     linear, quadratic_degrade, power_stress,
     threshold_linear, exponential_decay,
+    vexp, vmax, vmin, vround, vselect, vwhere,
 )
 from .engine import OrgSimEngine
 
@@ -57,26 +60,24 @@ def line_leader_transfer(inputs: Dict[SignalType, float], params: Dict[str, floa
     throughput = base_capacity_per_shift * shifts * effective_speed * health_factor
 
     # WIP：非瓶颈堆积（速度>1时WIP增长）
-    wip = max(0, (speed - 1.0) * 50 * shifts)
+    wip = vmax(0, (speed - 1.0) * 50 * shifts)
 
     # 节拍：速度越快节拍越短（但有下限）
-    cycle_time = max(0.1, 0.8 / speed)
+    cycle_time = vmax(0.1, 0.8 / speed)
 
     # 设备应力：speed^1.5 归一化
-    if speed <= 1.0:
-        stress = speed * 0.6
-    else:
-        stress = min(1.0, 0.6 + 0.4 * ((speed - 1.0) / 2.0) ** 1.5)
+    stress = vwhere(
+        speed <= 1.0,
+        speed * 0.6,
+        vmin(1.0, 0.6 + 0.4 * (vmax(speed - 1.0, 0.0) / 2.0) ** 1.5),
+    )
 
     # 故障概率：指数增长
     lam = 0.02
-    failure_prob = 1.0 - math.exp(-lam * (speed ** 2.5) * 24)
+    failure_prob = 1.0 - vexp(-lam * (speed ** 2.5) * 24)
 
     # 人员疲劳：阈值1.2后线性到2.0崩溃
-    if speed <= 1.2:
-        fatigue = 0.0
-    else:
-        fatigue = min(1.0, (speed - 1.2) / 0.8)
+    fatigue = vwhere(speed <= 1.2, 0.0, vmin(1.0, (speed - 1.2) / 0.8))
 
     # 加班时数
     overtime_hours = overtime_pct * 8 * shifts
@@ -86,18 +87,18 @@ def line_leader_transfer(inputs: Dict[SignalType, float], params: Dict[str, floa
 
     # 计划达成率（目标100件/天）
     target = params.get("target_output", 100.0)
-    schedule_adh = min(1.5, throughput / target) if target > 0 else 1.0
+    schedule_adh = vwhere(target > 0, vmin(1.5, throughput / vmax(target, 1e-9)), 1.0)
 
     return {
-        SignalType.THROUGHPUT: round(throughput, 2),
-        SignalType.WIP_LEVEL: round(wip, 1),
-        SignalType.CYCLE_TIME: round(cycle_time, 3),
-        SignalType.SCHEDULE_ADHERENCE: round(schedule_adh, 3),
-        SignalType.EQUIPMENT_STRESS: round(stress, 4),
-        SignalType.FAILURE_PROB: round(failure_prob, 4),
-        SignalType.FATIGUE_LEVEL: round(fatigue, 4),
-        SignalType.OVERTIME_HOURS: round(overtime_hours, 1),
-        SignalType.MATERIAL_BURN: round(material_burn, 1),
+        SignalType.THROUGHPUT: vround(throughput, 2),
+        SignalType.WIP_LEVEL: vround(wip, 1),
+        SignalType.CYCLE_TIME: vround(cycle_time, 3),
+        SignalType.SCHEDULE_ADHERENCE: vround(schedule_adh, 3),
+        SignalType.EQUIPMENT_STRESS: vround(stress, 4),
+        SignalType.FAILURE_PROB: vround(failure_prob, 4),
+        SignalType.FATIGUE_LEVEL: vround(fatigue, 4),
+        SignalType.OVERTIME_HOURS: vround(overtime_hours, 1),
+        SignalType.MATERIAL_BURN: vround(material_burn, 1),
     }
 
 
@@ -116,24 +117,18 @@ def quality_supervisor_transfer(inputs: Dict[SignalType, float], params: Dict[st
 
     # 良率：从应力反推（应力越高良率越低）
     # stress 0.6 → yield 0.98, stress 1.0 → yield ~0.70
-    if stress <= 0.6:
-        yield_rate = 0.98
-    else:
-        yield_rate = max(0.1, 0.98 - 0.7 * (stress - 0.6) ** 1.8)
+    yield_rate = vwhere(stress <= 0.6, 0.98, vmax(0.1, 0.98 - 0.7 * vmax(stress - 0.6, 0.0) ** 1.8))
 
     # 缺陷率（ppm）
     defect_rate = (1.0 - yield_rate) * 1_000_000 / 1000  # 转为千分比 ppm
 
     # SPC状态：灵敏度越高越容易失控
     # stress > 0.8 且 sensitivity >= 2 → 失控
-    if stress > 0.9 and spc_sensitivity >= 1.5:
-        spc_status = 3.0  # 严重失控
-    elif stress > 0.75 and spc_sensitivity >= 2.0:
-        spc_status = 2.0  # 失控
-    elif stress > 0.65:
-        spc_status = 1.0  # 警告
-    else:
-        spc_status = 0.0  # 受控
+    spc_status = vselect([
+        ((stress > 0.9) & (spc_sensitivity >= 1.5), 3.0),   # 严重失控
+        ((stress > 0.75) & (spc_sensitivity >= 2.0), 2.0),  # 失控
+        (stress > 0.65, 1.0),                               # 警告
+    ], 0.0)                                                 # 受控
 
     # 返工量 = 产出 × (1-良率) × 可返工比例(70%)
     rework_volume = throughput * (1.0 - yield_rate) * 0.7
@@ -142,19 +137,17 @@ def quality_supervisor_transfer(inputs: Dict[SignalType, float], params: Dict[st
     inspection_load = throughput * inspection_ratio
 
     # 升级：良率低于停线阈值 → 升级
-    escalation = 0.0
-    if yield_rate < stop_threshold:
-        escalation = 3.0  # 危机
-    elif yield_rate < 0.75:
-        escalation = 2.0  # 紧急
-    elif yield_rate < 0.90:
-        escalation = 1.0  # 注意
+    escalation = vselect([
+        (yield_rate < stop_threshold, 3.0),  # 危机
+        (yield_rate < 0.75, 2.0),            # 紧急
+        (yield_rate < 0.90, 1.0),            # 注意
+    ], 0.0)
 
     return {
-        SignalType.YIELD_RATE: round(yield_rate, 4),
-        SignalType.DEFECT_RATE: round(defect_rate, 1),
+        SignalType.YIELD_RATE: vround(yield_rate, 4),
+        SignalType.DEFECT_RATE: vround(defect_rate, 1),
         SignalType.SPC_STATUS: spc_status,
-        SignalType.REWORK_VOLUME: round(rework_volume, 2),
+        SignalType.REWORK_VOLUME: vround(rework_volume, 2),
         SignalType.ESCALATION_LEVEL: escalation,
     }
 
@@ -174,33 +167,31 @@ def equipment_supervisor_transfer(inputs: Dict[SignalType, float], params: Dict[
 
     # MTBF：基础720h，应力越高越短，PM越频繁越长
     base_mtbf = 720.0
-    pm_factor = min(1.5, pm_frequency / 30.0)  # PM越频繁（数值小）→因子小→MTBF短? 不对
+    pm_factor = vmin(1.5, pm_frequency / 30.0)  # PM越频繁（数值小）→因子小→MTBF短? 不对
     # PM频率=30天是标准，<30天更频繁→MTBF更长
-    pm_factor = 30.0 / max(7.0, pm_frequency)  # 7天PM → factor=4.3(好), 90天PM → factor=0.33(差)
-    stress_penalty = max(0.1, 1.0 - stress)
+    pm_factor = 30.0 / vmax(7.0, pm_frequency)  # 7天PM → factor=4.3(好), 90天PM → factor=0.33(差)
+    stress_penalty = vmax(0.1, 1.0 - stress)
     mtbf = base_mtbf * stress_penalty * pm_factor
 
     # 可用率 = MTBF / (MTBF + MTTR)
     # MTTR = 维修响应时间 × (2 - 备件水平)（备件越全修越快）
     mttr = repair_response * (2.0 - spare_level)
-    availability = mtbf / (mtbf + mttr) if (mtbf + mttr) > 0 else 0.0
+    availability = vwhere(mtbf + mttr > 0, mtbf / vmax(mtbf + mttr, 1e-9), 0.0)
 
     # 维修负荷（工时/天）：故障概率越高、响应越慢 → 负荷越大
     maintenance_load = failure_prob * 24 * (repair_response / 4.0) * (1.0 + stress)
 
     # 升级
-    escalation = 0.0
-    if availability < 0.7:
-        escalation = 3.0
-    elif availability < 0.85:
-        escalation = 2.0
-    elif stress > 0.9:
-        escalation = 1.0
+    escalation = vselect([
+        (availability < 0.7, 3.0),
+        (availability < 0.85, 2.0),
+        (stress > 0.9, 1.0),
+    ], 0.0)
 
     return {
-        SignalType.MTBF: round(mtbf, 1),
-        SignalType.AVAILABILITY: round(availability, 4),
-        SignalType.MAINTENANCE_LOAD: round(maintenance_load, 2),
+        SignalType.MTBF: vround(mtbf, 1),
+        SignalType.AVAILABILITY: vround(availability, 4),
+        SignalType.MAINTENANCE_LOAD: vround(maintenance_load, 2),
         SignalType.ESCALATION_LEVEL: escalation,
     }
 
@@ -221,27 +212,25 @@ def hr_supervisor_transfer(inputs: Dict[SignalType, float], params: Dict[str, fl
     # 出勤率：疲劳越高出勤越低，轮班缓解
     rotation_relief = 1.0 / rotation_policy  # 轮班越多疲劳缓解越大
     effective_fatigue = fatigue * rotation_relief
-    attendance = max(0.5, 0.98 - effective_fatigue * 0.3)
+    attendance = vmax(0.5, 0.98 - effective_fatigue * 0.3)
 
     # 人力利用率：加班越多利用率越高（但有上限）
-    overtime_ratio = min(1.0, overtime_hours / max(1, overtime_limit / 30))
-    labor_util = min(1.5, 0.85 + overtime_ratio * 0.4)
+    overtime_ratio = vmin(1.0, overtime_hours / vmax(1, overtime_limit / 30))
+    labor_util = vmin(1.5, 0.85 + overtime_ratio * 0.4)
 
     # 技能提升（培训投入的长期效果）：每5000元 → +0.1级
     skill_gain = training_budget / 50000.0  # 归一化
 
     # 升级：出勤太低或加班超限
-    escalation = 0.0
-    if attendance < 0.7:
-        escalation = 3.0
-    elif overtime_hours * 30 > overtime_limit:
-        escalation = 2.0
-    elif effective_fatigue > 0.5:
-        escalation = 1.0
+    escalation = vselect([
+        (attendance < 0.7, 3.0),
+        (overtime_hours * 30 > overtime_limit, 2.0),
+        (effective_fatigue > 0.5, 1.0),
+    ], 0.0)
 
     return {
-        SignalType.ATTENDANCE: round(attendance, 4),
-        SignalType.LABOR_UTILIZATION: round(labor_util, 4),
+        SignalType.ATTENDANCE: vround(attendance, 4),
+        SignalType.LABOR_UTILIZATION: vround(labor_util, 4),
         SignalType.ESCALATION_LEVEL: escalation,
     }
 
@@ -264,32 +253,28 @@ def warehouse_supervisor_transfer(inputs: Dict[SignalType, float], params: Dict[
     stock_level = current_stock
 
     # 缺料风险（小时）
-    if daily_net > 0:
-        hours_to_stockout = current_stock / (daily_net / 24.0)
-    else:
-        hours_to_stockout = 9999.0
+    hours_to_stockout = vwhere(daily_net > 0, current_stock / (vmax(daily_net, 1e-9) / 24.0), 9999.0)
 
     # 是否需要紧急采购
-    days_of_stock = current_stock / max(1, daily_net)
-    if days_of_stock < supplier_lead_days:
-        # 库存撑不到补货到达
-        stockout_risk = max(0, hours_to_stockout - supplier_lead_days * 24)
-    else:
-        stockout_risk = hours_to_stockout
+    days_of_stock = current_stock / vmax(1, daily_net)
+    # 库存撑不到补货到达时，扣掉提前期
+    stockout_risk = vwhere(
+        days_of_stock < supplier_lead_days,
+        vmax(0, hours_to_stockout - supplier_lead_days * 24),
+        hours_to_stockout,
+    )
 
     # 升级
-    escalation = 0.0
-    if hours_to_stockout < 12:
-        escalation = 3.0  # 12h内缺料
-    elif hours_to_stockout < 48:
-        escalation = 2.0  # 2天内缺料
-    elif current_stock < reorder_point:
-        escalation = 1.0  # 低于再订购点
+    escalation = vselect([
+        (hours_to_stockout < 12, 3.0),          # 12h内缺料
+        (hours_to_stockout < 48, 2.0),          # 2天内缺料
+        (current_stock < reorder_point, 1.0),   # 低于再订购点
+    ], 0.0)
 
     return {
-        SignalType.STOCK_LEVEL: round(stock_level, 0),
-        SignalType.STOCKOUT_RISK_HOURS: round(min(9999, stockout_risk), 1),
-        SignalType.MATERIAL_BURN: round(material_burn, 1),
+        SignalType.STOCK_LEVEL: vround(stock_level, 0),
+        SignalType.STOCKOUT_RISK_HOURS: vround(vmin(9999, stockout_risk), 1),
+        SignalType.MATERIAL_BURN: vround(material_burn, 1),
         SignalType.ESCALATION_LEVEL: escalation,
     }
 
@@ -310,24 +295,24 @@ def production_manager_transfer(inputs: Dict[SignalType, float], params: Dict[st
     base_cost = params.get("base_cost", 50.0)  # 元/件基础成本
 
     # OEE = 可用率 × 性能 × 良率
-    performance = min(1.0, throughput / target_output) if target_output > 0 else 1.0
+    performance = vwhere(target_output > 0, vmin(1.0, throughput / vmax(target_output, 1e-9)), 1.0)
     oee = availability * performance * yield_rate
 
     # 单位成本 = 基础成本 / 良率 + 返工成本
-    rework_cost_per_unit = rework_volume * 10.0 / max(1, throughput)  # 每件返工10元
-    unit_cost = base_cost / max(0.1, yield_rate) + rework_cost_per_unit
+    rework_cost_per_unit = rework_volume * 10.0 / vmax(1, throughput)  # 每件返工10元
+    unit_cost = base_cost / vmax(0.1, yield_rate) + rework_cost_per_unit
 
     # 计划达成率
-    schedule_adh = min(1.5, throughput / target_output) if target_output > 0 else 1.0
+    schedule_adh = vwhere(target_output > 0, vmin(1.5, throughput / vmax(target_output, 1e-9)), 1.0)
 
     # 综合升级（取所有下属最大）
     escalation = escalation_quality  # 从输入中已聚合
 
     return {
-        SignalType.OEE: round(oee, 4),
-        SignalType.UNIT_COST: round(unit_cost, 2),
-        SignalType.SCHEDULE_ADHERENCE: round(schedule_adh, 4),
-        SignalType.THROUGHPUT: round(throughput, 2),
+        SignalType.OEE: vround(oee, 4),
+        SignalType.UNIT_COST: vround(unit_cost, 2),
+        SignalType.SCHEDULE_ADHERENCE: vround(schedule_adh, 4),
+        SignalType.THROUGHPUT: vround(throughput, 2),
         SignalType.ESCALATION_LEVEL: escalation,
     }
 
@@ -340,11 +325,27 @@ def build_electronics_factory() -> OrgSimEngine:
     6 节点 + 7 逻辑链
     """
     engine = OrgSimEngine()
+    add_smt_line(engine)
+    return engine
+
+
+def build_multi_line_factory(line_count: int = 10) -> OrgSimEngine:
+    """构建多条 SMT 产线的工厂（每条线 6 节点 + 7 逻辑链，节点 ID 加 L{n}. 前缀）
+
+    用于大图性能验证：300 条线 ≈ 1800 节点。
+    """
+    engine = OrgSimEngine()
+    for i in range(1, line_count + 1):
+        add_smt_line(engine, prefix=f"L{i}.", title=f"{i}号线")
+    return engine
+
 
+def add_smt_line(engine: OrgSimEngine, prefix: str = "", title: str = "") -> OrgSimEngine:
+    """向引擎注册一条 SMT 产线的节点与逻辑链（prefix 加在节点 ID / 链 ID 前，title 加在名称前）"""
     # ── 节点 1: 线长 (Level 1 - 现场) ──
     line_leader = OrgNode(
-        node_id="line_leader",
-        name="SMT线长",
+        node_id=f"{prefix}line_leader",
+        name=f"{title}SMT线长",
         level=1,
         scope="SMT产线日常调度：速度/班次/加班/物料协调",
         transfer_fn=line_leader_transfer,
@@ -369,8 +370,8 @@ def build_electronics_factory() -> OrgSimEngine:
 
     # ── 节点 2: 质量主管 (Level 2 - 主管) ──
     quality_sup = OrgNode(
-        node_id="quality_sup",
-        name="质量主管",
+        node_id=f"{prefix}quality_sup",
+        name=f"{title}质量主管",
         level=2,
         scope="产线质量管控：SPC监控/抽检/停线决策/返工调度",
         transfer_fn=quality_supervisor_transfer,
@@ -392,8 +393,8 @@ def build_electronics_factory() -> OrgSimEngine:
 
     # ── 节点 3: 设备主管 (Level 2 - 主管) ──
     equipment_sup = OrgNode(
-        node_id="equipment_sup",
-        name="设备主管",
+        node_id=f"{prefix}equipment_sup",
+        name=f"{title}设备主管",
         level=2,
         scope="设备维保：PM计划/故障响应/备件管理/可用率保障",
         transfer_fn=equipment_supervisor_transfer,
@@ -415,8 +416,8 @@ def build_electronics_factory() -> OrgSimEngine:
 
     # ── 节点 4: HR主管 (Level 2 - 主管) ──
     hr_sup = OrgNode(
-        node_id="hr_sup",
-        name="HR主管",
+        node_id=f"{prefix}hr_sup",
+        name=f"{title}HR主管",
         level=2,
         scope="人力管理：排班/培训/加班管控/出勤保障",
         transfer_fn=hr_supervisor_transfer,
@@ -438,8 +439,8 @@ def build_electronics_factory() -> OrgSimEngine:
 
     # ── 节点 5: 仓储主管 (Level 2 - 主管) ──
     warehouse_sup = OrgNode(
-        node_id="warehouse_sup",
-        name="仓储主管",
+        node_id=f"{prefix}warehouse_sup",
+        name=f"{title}仓储主管",
         level=2,
         scope="物料管理：库存控制/补货/缺料预警/供应商协调",
         transfer_fn=warehouse_supervisor_transfer,
@@ -461,8 +462,8 @@ def build_electronics_factory() -> OrgSimEngine:
 
     # ── 节点 6: 生产经理 (Level 3 - 经理) ──
     prod_manager = OrgNode(
-        node_id="prod_manager",
-        name="生产经理",
+        node_id=f"{prefix}prod_manager",
+        name=f"{title}生产经理",
         level=3,
         scope="全产线统筹：KPI监控/资源调配/异常升级决策/成本管控",
         transfer_fn=production_manager_transfer,
@@ -488,98 +489,98 @@ def build_electronics_factory() -> OrgSimEngine:
     # ── 逻辑链 ──
 
     # 链1: 速度-质量链（线长→质量主管）
-    chain_speed_quality = LogicChain("chain_speed_quality", "速度-质量链")
+    chain_speed_quality = LogicChain(f"{prefix}chain_speed_quality", f"{title}速度-质量链")
     chain_speed_quality.add_link(ChainLink(
-        "line_leader", SignalType.EQUIPMENT_STRESS,
-        "quality_sup", SignalType.EQUIPMENT_STRESS,
+        f"{prefix}line_leader", SignalType.EQUIPMENT_STRESS,
+        f"{prefix}quality_sup", SignalType.EQUIPMENT_STRESS,
         linear(1.0), label="应力→良率推导"
     ))
     chain_speed_quality.add_link(ChainLink(
-        "line_leader", SignalType.THROUGHPUT,
-        "quality_sup", SignalType.THROUGHPUT,
+        f"{prefix}line_leader", SignalType.THROUGHPUT,
+        f"{prefix}quality_sup", SignalType.THROUGHPUT,
         linear(1.0), label="产出→返工基数"
     ))
 
     # 链2: 速度-设备链（线长→设备主管）
-    chain_speed_equipment = LogicChain("chain_speed_equipment", "速度-设备链")
+    chain_speed_equipment = LogicChain(f"{prefix}chain_speed_equipment", f"{title}速度-设备链")
     chain_speed_equipment.add_link(ChainLink(
-        "line_leader", SignalType.EQUIPMENT_STRESS,
-        "equipment_sup", SignalType.EQUIPMENT_STRESS,
+        f"{prefix}line_leader", SignalType.EQUIPMENT_STRESS,
+        f"{prefix}equipment_sup", SignalType.EQUIPMENT_STRESS,
         linear(1.0), label="应力传导"
     ))
     chain_speed_equipment.add_link(ChainLink(
-        "line_leader", SignalType.FAILURE_PROB,
-        "equipment_sup", SignalType.FAILURE_PROB,
+        f"{prefix}line_leader", SignalType.FAILURE_PROB,
+        f"{prefix}equipment_sup", SignalType.FAILURE_PROB,
         linear(1.0), label="故障概率传导"
     ))
 
     # 链3: 速度-人员链（线长→HR主管）
-    chain_speed_workforce = LogicChain("chain_speed_workforce", "速度-人员链")
+    chain_speed_workforce = LogicChain(f"{prefix}chain_speed_workforce", f"{title}速度-人员链")
     chain_speed_workforce.add_link(ChainLink(
-        "line_leader", SignalType.FATIGUE_LEVEL,
-        "hr_sup", SignalType.FATIGUE_LEVEL,
+        f"{prefix}line_leader", SignalType.FATIGUE_LEVEL,
+        f"{prefix}hr_sup", SignalType.FATIGUE_LEVEL,
         linear(1.0), label="疲劳传导"
     ))
     chain_speed_workforce.add_link(ChainLink(
-        "line_leader", SignalType.OVERTIME_HOURS,
-        "hr_sup", SignalType.OVERTIME_HOURS,
+        f"{prefix}line_leader", SignalType.OVERTIME_HOURS,
+        f"{prefix}hr_sup", SignalType.OVERTIME_HOURS,
         linear(1.0), label="加班传导"
     ))
 
     # 链4: 产出-物料链（线长→仓储主管）
-    chain_output_material = LogicChain("chain_output_material", "产出-物料链")
+    chain_output_material = LogicChain(f"{prefix}chain_output_material", f"{title}产出-物料链")
     chain_output_material.add_link(ChainLink(
-        "line_leader", SignalType.MATERIAL_BURN,
-        "warehouse_sup", SignalType.MATERIAL_BURN,
+        f"{prefix}line_leader", SignalType.MATERIAL_BURN,
+        f"{prefix}warehouse_sup", SignalType.MATERIAL_BURN,
         linear(1.0), label="消耗速率传导"
     ))
 
     # 链5: 设备-产能反馈（设备主管→线长）
-    chain_equip_feedback = LogicChain("chain_equip_feedback", "设备-产能反馈")
+    chain_equip_feedback = LogicChain(f"{prefix}chain_equip_feedback", f"{title}设备-产能反馈")
     chain_equip_feedback.add_link(ChainLink(
-        "equipment_sup", SignalType.AVAILABILITY,
-        "line_leader", SignalType.AVAILABILITY,
+        f"{prefix}equipment_sup", SignalType.AVAILABILITY,
+        f"{prefix}line_leader", SignalType.AVAILABILITY,
         linear(1.0), label="可用率反馈→有效产能"
     ))
 
     # 链6: 人员-产能反馈（HR主管→线长）
-    chain_hr_feedback = LogicChain("chain_hr_feedback", "人员-产能反馈")
+    chain_hr_feedback = LogicChain(f"{prefix}chain_hr_feedback", f"{title}人员-产能反馈")
     chain_hr_feedback.add_link(ChainLink(
-        "hr_sup", SignalType.ATTENDANCE,
-        "line_leader", SignalType.ATTENDANCE,
+        f"{prefix}hr_sup", SignalType.ATTENDANCE,
+        f"{prefix}line_leader", SignalType.ATTENDANCE,
         linear(1.0), label="出勤率反馈→有效产能"
     ))
 
     # 链7: 聚合链（所有主管→生产经理）
-    chain_aggregate = LogicChain("chain_aggregate", "KPI聚合链")
+    chain_aggregate = LogicChain(f"{prefix}chain_aggregate", f"{title}KPI聚合链")
     chain_aggregate.add_link(ChainLink(
-        "line_leader", SignalType.THROUGHPUT,
-        "prod_manager", SignalType.THROUGHPUT,
+        f"{prefix}line_leader", SignalType.THROUGHPUT,
+        f"{prefix}prod_manager", SignalType.THROUGHPUT,
         linear(1.0), label="产出汇总"
     ))
     chain_aggregate.add_link(ChainLink(
-        "quality_sup", SignalType.YIELD_RATE,
-        "prod_manager", SignalType.YIELD_RATE,
+        f"{prefix}quality_sup", SignalType.YIELD_RATE,
+        f"{prefix}prod_manager", SignalType.YIELD_RATE,
         linear(1.0), label="良率汇总"
     ))
     chain_aggregate.add_link(ChainLink(
-        "quality_sup", SignalType.REWORK_VOLUME,
-        "prod_manager", SignalType.REWORK_VOLUME,
+        f"{prefix}quality_sup", SignalType.REWORK_VOLUME,
+        f"{prefix}prod_manager", SignalType.REWORK_VOLUME,
         linear(1.0), label="返工汇总"
     ))
     chain_aggregate.add_link(ChainLink(
-        "equipment_sup", SignalType.AVAILABILITY,
-        "prod_manager", SignalType.AVAILABILITY,
+        f"{prefix}equipment_sup", SignalType.AVAILABILITY,
+        f"{prefix}prod_manager", SignalType.AVAILABILITY,
         linear(1.0), label="可用率汇总"
     ))
     chain_aggregate.add_link(ChainLink(
-        "hr_sup", SignalType.ATTENDANCE,
-        "prod_manager", SignalType.ATTENDANCE,
+        f"{prefix}hr_sup", SignalType.ATTENDANCE,
+        f"{prefix}prod_manager", SignalType.ATTENDANCE,
         linear(1.0), label="出勤汇总"
     ))
     chain_aggregate.add_link(ChainLink(
-        "quality_sup", SignalType.ESCALATION_LEVEL,
-        "prod_manager", SignalType.ESCALATION_LEVEL,
+        f"{prefix}quality_sup", SignalType.ESCALATION_LEVEL,
+        f"{prefix}prod_manager", SignalType.ESCALATION_LEVEL,
         linear(1.0), label="升级汇总"
     ))
 
@@ -0,0 +1,150 @@
+"""
+组织面板会话 (Org Panel Sessions)
+==================================
+
+每个用户一个会话，互不干扰：
+
+- 基线：预设构建并传播一次后不再修改，是所有会话共享的不可变快照
+- 会话：基线的写时复制分支（OrgSimEngine.fork），用户调参只复制被波及的节点
+- What-If / 影响追踪：在会话的再一次分支上计算，计算完直接丢弃，会话状态不受影响；
+  放到独立线程池执行，不占事件循环
+- 结果按 (会话参数覆盖, 场景) 的哈希缓存，参数覆盖相同的会话（含未调参的会话）共享缓存；
+  命中缓存时不分支（分支会让会话之后的调参重新复制节点）
+- 只读查询（节点、逻辑链、图描述）在会话锁内直接读，不分支
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from .engine import OrgSimEngine
+from .presets import build_electronics_factory
+
+# what-if 计算线程池大小
+ORG_PANEL_WORKERS = int(os.getenv("ORG_PANEL_WORKERS", "4"))
+MAX_SESSIONS = 200                  # 登录用户会话上限，超出后淘汰最久未用的
+MAX_ANON_SESSIONS = 20              # 匿名会话单独限额，匿名请求再多也挤不掉登录用户的会话
+SESSION_IDLE_SECONDS = 2 * 3600     # 空闲超时
+MEMO_SIZE = 512                     # 场景结果缓存条数
+
+ScenarioKey = Tuple[str, str]
+
+scenario_executor = ThreadPoolExecutor(max_workers=ORG_PANEL_WORKERS, thread_name_prefix="org-whatif")
+
+
+class OrgSession:
+    """单个用户的仿真会话：基线分支 + 参数覆盖"""
+
+    def __init__(self, session_id: str, engine: OrgSimEngine):
+        self.session_id = session_id
+        self.engine = engine
+        self.overrides: Dict[ScenarioKey, float] = {}
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+    def set_parameter(self, node_id: str, param_key: str, value: float) -> float:
+        """在会话内调参并增量传播，返回实际生效值"""
+        with self.lock:
+            actual = self.engine.set_parameter(node_id, param_key, value)
+            self.overrides[(node_id, param_key)] = actual
+            self.engine.propagate()
+            return actual
+
+    def signature(self) -> Tuple[Tuple[ScenarioKey, float], ...]:
+        """参数覆盖的规范化表示，作为结果缓存键的一部分"""
+        with self.lock:
+            return tuple(sorted(self.overrides.items()))
+
+    def branch(self) -> Tuple[OrgSimEngine, Tuple[Tuple[ScenarioKey, float], ...]]:
+        """会话当前状态的写时复制分支（供 what-if / 追踪在其上计算后丢弃）+ 同一时刻的签名"""
+        with self.lock:
+            return self.engine.fork(), tuple(sorted(self.overrides.items()))
+
+
+class OrgSessionStore:
+    """会话仓库：共享不可变基线，按需创建会话，LRU + 空闲超时淘汰"""
+
+    def __init__(self, builder: Callable[[], OrgSimEngine] = build_electronics_factory):
+        self._builder = builder
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, OrgSession]" = OrderedDict()
+        self._anon_sessions: "OrderedDict[str, OrgSession]" = OrderedDict()
+        self._memo: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self._baseline = self._build_baseline()
+
+    def _build_baseline(self) -> OrgSimEngine:
+        engine = self._builder()
+        engine.propagate()
+        return engine
+
+    def get(self, session_id: str, anonymous: bool = False) -> OrgSession:
+        """取会话（不存在则从基线分支出一个）；匿名会话放在单独的小池子里淘汰"""
+        now = time.time()
+        pool, limit = (self._anon_sessions, MAX_ANON_SESSIONS) if anonymous else (self._sessions, MAX_SESSIONS)
+        with self._lock:
+            session = pool.get(session_id)
+            if session is None:
+                session = OrgSession(session_id, self._baseline.fork())
+                pool[session_id] = session
+            pool.move_to_end(session_id)
+            session.last_used = now
+            while len(pool) > limit:
+                pool.popitem(last=False)
+            self._evict_idle(now)
+            return session
+
+    def _evict_idle(self, now: float) -> None:
+        for pool in (self._sessions, self._anon_sessions):
+            stale = [sid for sid, s in pool.items() if now - s.last_used > SESSION_IDLE_SECONDS]
+            for sid in stale:
+                del pool[sid]
+
+    def reset(self, session_id: str) -> None:
+        """丢弃某会话的调参，下次访问重新从基线分支"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._anon_sessions.pop(session_id, None)
+
+    def memoized(
+        self, session: OrgSession, key: Tuple[Hashable, ...], compute: Callable[[OrgSimEngine], Any],
+    ) -> Any:
+        """按 (计算类型, 会话签名, 场景) 缓存计算结果
+
+        key 为 (计算类型, 场景参数)。未命中时才分支，compute 在该分支上、调用线程内执行；
+        结果按分支时刻的签名入缓存，与期间并发的调参无关。
+        """
+        kind, params = key
+        cached = (kind, session.signature(), params)
+        with self._lock:
+            if cached in self._memo:
+                self._memo.move_to_end(cached)
+                self.memo_hits += 1
+                return self._memo[cached]
+            self.memo_misses += 1
+        branch, signature = session.branch()
+        value = compute(branch)
+        with self._lock:
+            self._memo[(kind, signature, params)] = value
+            while len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions) + len(self._anon_sessions),
+                "anonymous_sessions": len(self._anon_sessions),
+                "memo_entries": len(self._memo),
+                "memo_hits": self.memo_hits,
+                "memo_misses": self.memo_misses,
+                "workers": ORG_PANEL_WORKERS,
+            }
+
@@ -224,7 +224,9 @@ class AgentInterface:
                     "params": request.params,
                 },
                 source=f"agent:{agent_id}",
+                db=self.db,
             )
+            await self.db.commit()
 
             return AgentCommandResponse(
                 success=True,
@@ -255,7 +257,9 @@ class AgentInterface:
                 TMSEventType.AGENT_ACTION_COMPLETED.value,
                 {"agent_id": agent_id, "command": command, "result": result},
                 source=f"agent:{agent_id}",
+                db=self.db,
             )
+            await self.db.commit()
 
             return AgentCommandResponse(
                 success=True,
@@ -499,13 +503,13 @@ class AgentInterface:
         )
 
         self.db.add(task)
-        await self.db.commit()
-
         await tms_event_bus.publish(
             TMSEventType.TASK_CREATED.value,
             {"task_id": str(task.id), "task_code": task_code, "source": "agent"},
             source=f"agent:{agent_id}",
+            db=self.db,
         )
+        await self.db.commit()
 
         return {
             "message": f"任务创建成功: {task_code}",
@@ -562,13 +566,13 @@ class AgentInterface:
         task.assigned_by = f"agent:{agent_id}"
         task.status = "distributed"
         task.updated_at = datetime.utcnow()
-        await self.db.commit()
-
         await tms_event_bus.publish(
             TMSEventType.TASK_REASSIGNED.value,
             {"task_id": task_id, "old_assignee": old_assignee, "new_assignee": user_id},
             source=f"agent:{agent_id}",
+            db=self.db,
         )
+        await self.db.commit()
 
         return {"message": f"任务已重新分配给 {user_id}", "task_code": task.task_code}
 
@@ -620,19 +624,29 @@ class AgentInterface:
         task_ids = params.get("task_ids", [])
         strategy = params.get("strategy", "skill_match")
 
-        results = []
-        for task_id in task_ids:
-            result = await self.db.execute(select(TMSTask).where(TMSTask.id == task_id))
-            task = result.scalar_one_or_none()
-            if task and task.status == "pending_distribution":
-                dist_result = await self.distribution_engine.distribute(
-                    task, strategy=strategy, triggered_by=f"agent:{agent_id}"
-                )
-                results.append({"task_code": task.task_code, "success": dist_result.success})
+        tasks = []
+        if task_ids:
+            result = await self.db.execute(
+                select(TMSTask).where(and_(TMSTask.id.in_(task_ids), TMSTask.status == "pending_distribution"))
+            )
+            tasks = list(result.scalars().all())
+
+        codes = {str(t.id): t.task_code for t in tasks}
+        solver = None
+        if params.get("optimal"):
+            dist_results, solver = await self.distribution_engine.distribute_optimal(
+                tasks, strategy=strategy, triggered_by=f"agent:{agent_id}"
+            )
+        else:
+            dist_results = await self.distribution_engine.distribute_many(
+                tasks, strategy=strategy, triggered_by=f"agent:{agent_id}"
+            )
+        results = [{"task_code": codes[r.task_id], "success": r.success} for r in dist_results]
 
         return {
             "message": f"批量分发完成: {len([r for r in results if r['success']])}/{len(task_ids)} 成功",
             "results": results,
+            "solver": solver,
         }
 
     # ========== 辅助方法 ==========
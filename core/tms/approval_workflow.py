@@ -132,10 +132,7 @@ class ApprovalWorkflowEngine:
         task.approval_flow_id = flow.id
         task.updated_at = datetime.utcnow()
 
-        await self.db.commit()
-        await self.db.refresh(flow)
-
-        # 发布事件
+        # 发布事件（写入 Outbox，随审批流一起提交）
         await tms_event_bus.publish(
             TMSEventType.APPROVAL_INITIATED.value,
             {
@@ -147,11 +144,15 @@ class ApprovalWorkflowEngine:
                 "total_steps": len(steps),
             },
             source=initiated_by,
+            db=self.db,
         )
 
         # 通知第一步审批人
         await self._notify_current_approver(flow)
 
+        await self.db.commit()
+        await self.db.refresh(flow)
+
         logger.info(f"Approval flow initiated: {flow_code} | task={task.task_code} | steps={len(steps)}")
         return flow
 
@@ -214,7 +215,6 @@ class ApprovalWorkflowEngine:
             await self._notify_current_approver(flow)
 
         flow.updated_at = datetime.utcnow()
-        await self.db.commit()
 
         # 发布事件
         await tms_event_bus.publish(
@@ -227,7 +227,9 @@ class ApprovalWorkflowEngine:
                 "flow_status": flow.status,
             },
             source=acted_by or f"user:{approver_id}",
+            db=self.db,
         )
+        await self.db.commit()
 
         next_approver = None
         if flow.status == FlowStatus.ACTIVE.value and flow.current_step < len(flow.steps):
@@ -275,7 +277,6 @@ class ApprovalWorkflowEngine:
         flow.updated_at = datetime.utcnow()
 
         await self._complete_flow(flow, approved=False)
-        await self.db.commit()
 
         await tms_event_bus.publish(
             TMSEventType.APPROVAL_REJECTED.value,
@@ -286,7 +287,9 @@ class ApprovalWorkflowEngine:
                 "reason": reason,
             },
             source=acted_by or f"user:{approver_id}",
+            db=self.db,
         )
+        await self.db.commit()
 
         return FlowResult(
             success=True,
@@ -326,9 +329,9 @@ class ApprovalWorkflowEngine:
         )
         self.db.add(record)
         flow.updated_at = datetime.utcnow()
-        await self.db.commit()
 
         await self._notify_current_approver(flow)
+        await self.db.commit()
 
         return FlowResult(
             success=True,
@@ -376,15 +379,16 @@ class ApprovalWorkflowEngine:
             })
 
         flow.updated_at = datetime.utcnow()
-        await self.db.commit()
 
         await tms_event_bus.publish(
             TMSEventType.APPROVAL_ESCALATED.value,
             {"flow_id": flow_id, "reason": reason, "new_step": flow.current_step},
             source=acted_by or "system",
+            db=self.db,
         )
 
         await self._notify_current_approver(flow)
+        await self.db.commit()
 
         return FlowResult(
             success=True,
@@ -492,6 +496,7 @@ class ApprovalWorkflowEngine:
                 "task_id": str(flow.task_id),
                 "approved": approved,
             },
+            db=self.db,
         )
 
     async def _notify_current_approver(self, flow: TMSApprovalFlow) -> None:
@@ -510,6 +515,7 @@ class ApprovalWorkflowEngine:
                 "approver_id": step.get("approver_id"),
                 "approver_role": step.get("approver_role"),
             },
+            db=self.db,
         )
 
     def _get_default_steps(self, task_type: str) -> List[Dict[str, Any]]:
@@ -18,10 +18,11 @@ TMS Distribution Engine - 任务分发引擎（核心模块）
 import logging
 import uuid
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Set, Sequence, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 
+import numpy as np
 from sqlalchemy import select, func, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -32,6 +33,7 @@ from database.models import (
     EmployeeSkill,
     Skill,
 )
+from core.tms.assignment_solver import solve_capacitated_assignment
 from core.tms.events import tms_event_bus, TMSEventType
 
 logger = logging.getLogger(__name__)
@@ -55,6 +57,13 @@ class DistributionMode(str, Enum):
     ROLE_MATCH = "role_match"  # 审批人指定
 
 
+# 技能等级分 / 有效资质等级 / 计入负载的任务状态 / 批量分发的优先级顺序
+LEVEL_SCORES = {"L1": 0.2, "L2": 0.4, "L3": 0.6, "L4": 0.8, "L5": 1.0}
+QUALIFIED_LEVELS = ("L3", "L4", "L5")
+OPEN_STATUSES = ("distributed", "claimed", "in_progress")
+PRIORITY_RANK = {"urgent": 0, "high": 1, "medium": 2, "low": 3}
+
+
 @dataclass
 class CandidateScore:
     """候选人评分"""
@@ -69,6 +78,49 @@ class CandidateScore:
     reasons: List[str] = field(default_factory=list)
 
 
+@dataclass
+class CandidateFeatures:
+    """候选人评分特征（批量加载，按下标与 users 对齐）"""
+    users: List[User]
+    skills: List[Dict[str, str]]                 # 每人 {技能编码: 等级}，仅含任务涉及的技能
+    known_skills: Set[str]                       # 技能表中存在的技能编码
+    load: np.ndarray                             # 进行中任务数
+    history: Dict[str, np.ndarray] = field(default_factory=dict)  # task_type -> 历史完成率
+
+    def skill_vector(self, required_skills: Sequence[str]) -> np.ndarray:
+        """技能匹配度：匹配率 70% + 已匹配技能平均等级 30%；无技能要求给 0.7"""
+        n = len(self.users)
+        if not required_skills:
+            return np.full(n, 0.7)
+        levels = np.array(
+            [[LEVEL_SCORES.get(sk.get(code), 0.5) if code in sk else 0.0 for code in required_skills]
+             for sk in self.skills],
+            dtype=float,
+        ).reshape(n, len(required_skills))
+        has = np.array([[code in sk for code in required_skills] for sk in self.skills],
+                       dtype=bool).reshape(n, len(required_skills))
+        matched = has.sum(axis=1)
+        match_rate = matched / len(required_skills)
+        avg_level = levels.sum(axis=1) / np.maximum(matched, 1)
+        return np.minimum(1.0, match_rate * 0.7 + avg_level * 0.3)
+
+    def load_vector(self, max_tasks: int) -> np.ndarray:
+        """负载评分（负载越低分越高）"""
+        return np.maximum(0.0, 1.0 - self.load / max_tasks)
+
+    def history_vector(self, task_type: str) -> np.ndarray:
+        """同类任务历史完成率（无历史 0.5）"""
+        vec = self.history.get(task_type)
+        return vec if vec is not None else np.full(len(self.users), 0.5)
+
+    def qualified_mask(self, required_skills: Sequence[str]) -> np.ndarray:
+        """至少具备一项所需技能且等级 ≥ L3（所需技能均不在技能表中时不过滤）"""
+        codes = [c for c in (required_skills or []) if c in self.known_skills]
+        if not codes:
+            return np.ones(len(self.users), dtype=bool)
+        return np.array([any(sk.get(c) in QUALIFIED_LEVELS for c in codes) for sk in self.skills], dtype=bool)
+
+
 @dataclass
 class DistributionResult:
     """分发结果"""
@@ -221,7 +273,7 @@ class DistributionEngine:
             select(EmployeeSkill.user_id).where(
                 and_(
                     EmployeeSkill.skill_id.in_(skill_ids),
-                    EmployeeSkill.level.in_(["L3", "L4", "L5"]),  # 至少 L3 级别
+                    EmployeeSkill.level.in_(QUALIFIED_LEVELS),  # 至少 L3 级别
                 )
             ).distinct()
         )
@@ -244,7 +296,7 @@ class DistributionEngine:
             ).where(
                 and_(
                     TMSTask.assigned_to.in_(user_ids),
-                    TMSTask.status.in_(["distributed", "claimed", "in_progress"]),
+                    TMSTask.status.in_(OPEN_STATUSES),
                 )
             ).group_by(TMSTask.assigned_to)
         )
@@ -257,63 +309,13 @@ class DistributionEngine:
 
     async def _score_by_skill(self, task: TMSTask, candidates: List[User]) -> List[CandidateScore]:
         """技能匹配评分"""
-        scored = []
-        for candidate in candidates:
-            score = CandidateScore(
-                user_id=str(candidate.id),
-                username=candidate.username,
-                full_name=candidate.full_name or candidate.username,
-                total_score=0.0,
-            )
-
-            # 技能匹配度 (40%)
-            skill_score = await self._calc_skill_score(candidate, task.required_skills or [])
-            score.skill_score = skill_score * self.WEIGHTS["skill"]
-            if skill_score > 0.8:
-                score.reasons.append(f"技能高度匹配 ({skill_score:.0%})")
-
-            # 当前负载 (25%)
-            load_score = await self._calc_load_score(candidate)
-            score.load_score = load_score * self.WEIGHTS["load"]
-            if load_score > 0.7:
-                score.reasons.append("当前负载较低")
-
-            # 历史完成率 (20%)
-            history_score = await self._calc_history_score(candidate, task.task_type)
-            score.history_score = history_score * self.WEIGHTS["history"]
-
-            # 响应速度 (15%)
-            response_score = await self._calc_response_score(candidate)
-            score.response_score = response_score * self.WEIGHTS["response"]
-
-            score.total_score = score.skill_score + score.load_score + score.history_score + score.response_score
-            scored.append(score)
-
-        return scored
+        features = await self._load_features(candidates, [task])
+        return self._to_candidate_scores(features, task, DistributionStrategy.SKILL_MATCH.value)
 
     async def _score_by_load(self, task: TMSTask, candidates: List[User]) -> List[CandidateScore]:
         """负载均衡评分（主要看负载）"""
-        scored = []
-        for candidate in candidates:
-            score = CandidateScore(
-                user_id=str(candidate.id),
-                username=candidate.username,
-                full_name=candidate.full_name or candidate.username,
-                total_score=0.0,
-            )
-
-            # 负载评分占主导 (60%)
-            load_score = await self._calc_load_score(candidate)
-            score.load_score = load_score * 0.60
-            score.skill_score = await self._calc_skill_score(candidate, task.required_skills or []) * 0.25
-            score.history_score = await self._calc_history_score(candidate, task.task_type) * 0.15
-
-            score.total_score = score.load_score + score.skill_score + score.history_score
-            if load_score > 0.8:
-                score.reasons.append("负载最低优先")
-            scored.append(score)
-
-        return scored
+        features = await self._load_features(candidates, [task])
+        return self._to_candidate_scores(features, task, DistributionStrategy.LOAD_BALANCE.value)
 
     async def _score_round_robin(self, task: TMSTask, candidates: List[User]) -> List[CandidateScore]:
         """轮询评分"""
@@ -338,101 +340,291 @@ class DistributionEngine:
 
     async def _score_by_priority(self, task: TMSTask, candidates: List[User]) -> List[CandidateScore]:
         """优先级队列评分（高优先级任务分配给高技能人员）"""
-        scored = await self._score_by_skill(task, candidates)
+        features = await self._load_features(candidates, [task])
+        return self._to_candidate_scores(features, task, DistributionStrategy.PRIORITY_QUEUE.value)
 
-        # 高优先级任务加权技能分
-        if task.priority in ["high", "urgent"]:
-            for s in scored:
-                s.total_score = s.skill_score * 1.5 + s.load_score + s.history_score
-                if s.skill_score > 0.7:
-                    s.reasons.append("高优先级任务 - 技能优先")
+    # ========== 批量评分 ==========
 
-        return scored
+    async def _load_features(self, candidates: List[User], tasks: Sequence[TMSTask]) -> CandidateFeatures:
+        """三次分组查询加载全部候选人的技能、进行中负载、历史完成率"""
+        n = len(candidates)
+        user_ids = [c.id for c in candidates]
+        index = {str(c.id): i for i, c in enumerate(candidates)}
+        skill_codes = sorted({code for t in tasks for code in (t.required_skills or [])})
+        task_types = sorted({t.task_type for t in tasks if t.task_type})
+
+        # 1. 技能：技能表左连员工技能，同时得到存在的技能编码
+        skills: List[Dict[str, str]] = [{} for _ in range(n)]
+        known_skills: Set[str] = set()
+        if skill_codes and n:
+            skill_result = await self.db.execute(
+                select(Skill.code, EmployeeSkill.user_id, EmployeeSkill.level)
+                .select_from(Skill)
+                .outerjoin(EmployeeSkill, and_(
+                    EmployeeSkill.skill_id == Skill.id,
+                    EmployeeSkill.user_id.in_(user_ids),
+                ))
+                .where(Skill.code.in_(skill_codes))
+            )
+            for row in skill_result.all():
+                known_skills.add(row.code)
+                i = index.get(str(row.user_id)) if row.user_id is not None else None
+                if i is not None:
+                    skills[i][row.code] = row.level
+
+        # 2. 进行中任务数
+        load = np.zeros(n, dtype=float)
+        if n:
+            load_result = await self.db.execute(
+                select(TMSTask.assigned_to, func.count(TMSTask.id).label("task_count"))
+                .where(and_(TMSTask.assigned_to.in_(user_ids), TMSTask.status.in_(OPEN_STATUSES)))
+                .group_by(TMSTask.assigned_to)
+            )
+            for row in load_result.all():
+                i = index.get(str(row.assigned_to))
+                if i is not None:
+                    load[i] = row.task_count
+
+        # 3. 同类任务历史完成率（完成 / (完成 + 驳回)）
+        history: Dict[str, np.ndarray] = {}
+        if task_types and n:
+            history_result = await self.db.execute(
+                select(
+                    TMSTask.assigned_to,
+                    TMSTask.task_type,
+                    func.count(TMSTask.id).filter(TMSTask.status == "completed").label("completed"),
+                    func.count(TMSTask.id).label("total"),
+                )
+                .where(and_(
+                    TMSTask.assigned_to.in_(user_ids),
+                    TMSTask.task_type.in_(task_types),
+                    TMSTask.status.in_(["completed", "rejected"]),
+                ))
+                .group_by(TMSTask.assigned_to, TMSTask.task_type)
+            )
+            for row in history_result.all():
+                i = index.get(str(row.assigned_to))
+                if i is None or not row.total:
+                    continue
+                vec = history.setdefault(row.task_type, np.full(n, 0.5))
+                vec[i] = row.completed / row.total
+
+        return CandidateFeatures(
+            users=list(candidates), skills=skills, known_skills=known_skills, load=load, history=history,
+        )
 
-    async def _calc_skill_score(self, candidate: User, required_skills: List[str]) -> float:
-        """计算技能匹配度"""
-        if not required_skills:
-            return 0.7  # 无技能要求时给默认分
+    def _score_arrays(self, features: CandidateFeatures, task: TMSTask, strategy: str) -> Dict[str, np.ndarray]:
+        """按策略对全部候选人向量化评分，返回各分项与总分（已乘权重）"""
+        skill = features.skill_vector(task.required_skills or [])
+        load = features.load_vector(self.MAX_TASKS_PER_USER)
+        history = features.history_vector(task.task_type)
+        response = np.full(len(features.users), self._calc_response_score())
 
-        # 查询候选人技能
-        result = await self.db.execute(
-            select(Skill.code, EmployeeSkill.level).join(
-                EmployeeSkill, EmployeeSkill.skill_id == Skill.id
-            ).where(EmployeeSkill.user_id == candidate.id)
+        if strategy == DistributionStrategy.LOAD_BALANCE.value:
+            parts = {"skill": skill * 0.25, "load": load * 0.60, "history": history * 0.15,
+                     "response": np.zeros_like(skill)}
+        else:
+            parts = {"skill": skill * self.WEIGHTS["skill"], "load": load * self.WEIGHTS["load"],
+                     "history": history * self.WEIGHTS["history"], "response": response * self.WEIGHTS["response"]}
+
+        total = parts["skill"] + parts["load"] + parts["history"] + parts["response"]
+        # 高优先级任务加权技能分
+        if strategy == DistributionStrategy.PRIORITY_QUEUE.value and task.priority in ["high", "urgent"]:
+            total = parts["skill"] * 1.5 + parts["load"] + parts["history"]
+
+        return {**parts, "total": total, "raw_skill": skill, "raw_load": load}
+
+    def _candidate_score(self, features: CandidateFeatures, arrays: Dict[str, np.ndarray],
+                         i: int, task: TMSTask, strategy: str) -> CandidateScore:
+        user = features.users[i]
+        score = CandidateScore(
+            user_id=str(user.id),
+            username=user.username,
+            full_name=user.full_name or user.username,
+            total_score=float(arrays["total"][i]),
+            skill_score=float(arrays["skill"][i]),
+            load_score=float(arrays["load"][i]),
+            history_score=float(arrays["history"][i]),
+            response_score=float(arrays["response"][i]),
         )
-        candidate_skills = {row.code: row.level for row in result.all()}
+        raw_skill, raw_load = arrays["raw_skill"][i], arrays["raw_load"][i]
+        if strategy == DistributionStrategy.LOAD_BALANCE.value:
+            if raw_load > 0.8:
+                score.reasons.append("负载最低优先")
+        else:
+            if raw_skill > 0.8:
+                score.reasons.append(f"技能高度匹配 ({raw_skill:.0%})")
+            if raw_load > 0.7:
+                score.reasons.append("当前负载较低")
+        if (strategy == DistributionStrategy.PRIORITY_QUEUE.value and task.priority in ["high", "urgent"]
+                and score.skill_score > 0.7):
+            score.reasons.append("高优先级任务 - 技能优先")
+        return score
 
-        # 计算匹配度
-        matched = 0
-        level_bonus = 0.0
-        for skill_code in required_skills:
-            if skill_code in candidate_skills:
-                matched += 1
-                level = candidate_skills[skill_code]
-                level_bonus += {"L1": 0.2, "L2": 0.4, "L3": 0.6, "L4": 0.8, "L5": 1.0}.get(level, 0.5)
+    def _to_candidate_scores(self, features: CandidateFeatures, task: TMSTask, strategy: str) -> List[CandidateScore]:
+        arrays = self._score_arrays(features, task, strategy)
+        return [self._candidate_score(features, arrays, i, task, strategy) for i in range(len(features.users))]
 
-        if not required_skills:
-            return 0.7
+    def _calc_response_score(self) -> float:
+        """计算响应速度评分"""
+        # 简化实现：基于最近认领任务的时间差
+        # 实际生产中可计算平均认领时间
+        return 0.7  # 默认分
 
-        match_rate = matched / len(required_skills)
-        avg_level = level_bonus / max(matched, 1)
+    # ========== 批量分发 ==========
+
+    async def distribute_many(
+        self,
+        tasks: Sequence[TMSTask],
+        strategy: str = DistributionStrategy.SKILL_MATCH.value,
+        triggered_by: str = "system",
+    ) -> List[DistributionResult]:
+        """
+        批量直接分配（如整班次待分发任务）
 
-        return min(1.0, match_rate * 0.7 + avg_level * 0.3)
+        候选人与评分特征只加载一次；按优先级 → 截止时间 → 创建时间依次分配，
+        每分配一单即在内存中累加负载，后续任务据此重新评分与过滤超负载。
+        支持 skill_match / load_balance / priority_queue，其余策略按 skill_match 处理。
+        全部分配在一个事务内提交，提交后统一发布事件。
+        """
+        if not tasks:
+            return []
+        strategy = self._batch_strategy(strategy)
+        users, features, roles, ordered = await self._batch_context(tasks)
+
+        results: List[DistributionResult] = []
+        for task in ordered:
+            eligible = self._batch_eligible(task, features, roles) & (features.load < self.MAX_TASKS_PER_USER)
+            if not eligible.any():
+                results.append(self._no_candidate_result(task, strategy))
+                continue
+
+            arrays = self._score_arrays(features, task, strategy)
+            i = int(np.argmax(np.where(eligible, arrays["total"], -np.inf)))
+            candidate = self._candidate_score(features, arrays, i, task, strategy)
+            self._apply_assignment(task, candidate, strategy, triggered_by)
+            features.load[i] += 1
+            results.append(self._assignment_result(task, candidate, strategy))
+
+        await self._finish_batch(ordered, results, triggered_by, strategy)
+        return results
+
+    async def distribute_optimal(
+        self,
+        tasks: Sequence[TMSTask],
+        strategy: str = DistributionStrategy.SKILL_MATCH.value,
+        triggered_by: str = "system",
+    ) -> Tuple[List[DistributionResult], Dict[str, Any]]:
+        """
+        批量最优分配（班次开始集中派单）
 
-    async def _calc_load_score(self, candidate: User) -> float:
-        """计算负载评分（负载越低分越高）"""
-        result = await self.db.execute(
-            select(func.count(TMSTask.id)).where(
-                and_(
-                    TMSTask.assigned_to == candidate.id,
-                    TMSTask.status.in_(["distributed", "claimed", "in_progress"]),
-                )
-            )
-        )
-        current_load = result.scalar() or 0
-        return max(0.0, 1.0 - (current_load / self.MAX_TASKS_PER_USER))
-
-    async def _calc_history_score(self, candidate: User, task_type: str) -> float:
-        """计算历史完成率"""
-        # 同类任务完成数
-        completed_result = await self.db.execute(
-            select(func.count(TMSTask.id)).where(
-                and_(
-                    TMSTask.assigned_to == candidate.id,
-                    TMSTask.task_type == task_type,
-                    TMSTask.status == "completed",
-                )
-            )
+        构造 任务 × 候选人 评分矩阵，在 MAX_TASKS_PER_USER 剩余容量约束下求总分最大的指派，
+        避免逐单贪心把任务压给评分最高的少数人。容量不足时按优先级决定先分哪些任务。
+        返回 (分发结果, 求解统计：方法/目标值/耗时)。
+        """
+        if not tasks:
+            return [], solve_capacitated_assignment(np.zeros((0, 0)), np.zeros(0)).stats()
+        strategy = self._batch_strategy(strategy)
+        users, features, roles, ordered = await self._batch_context(tasks)
+
+        # 同一画像（类型/技能/角色/优先级）的任务评分行相同，只算一次
+        profiles: Dict[tuple, Dict[str, np.ndarray]] = {}
+        rows, masks = [], []
+        for task in ordered:
+            key = (task.task_type, tuple(task.required_skills or []),
+                   tuple(task.required_roles or []), task.priority)
+            if key not in profiles:
+                arrays = self._score_arrays(features, task, strategy)
+                arrays["eligible"] = self._batch_eligible(task, features, roles)
+                profiles[key] = arrays
+            rows.append(profiles[key])
+        scores = np.vstack([r["total"] for r in rows]) if users else np.zeros((len(ordered), 0))
+        eligible = np.vstack([r["eligible"] for r in rows]) if users else np.zeros((len(ordered), 0), dtype=bool)
+        capacity = np.maximum(0, self.MAX_TASKS_PER_USER - features.load).astype(int)
+        bonus = np.array([10.0 * (3 - PRIORITY_RANK.get(t.priority, 2)) for t in ordered])
+
+        # 每多接一单负载分下降 load 权重 / MAX_TASKS_PER_USER，与逐单分配时的负载分口径一致
+        load_weight = 0.60 if strategy == DistributionStrategy.LOAD_BALANCE.value else self.WEIGHTS["load"]
+        solution = solve_capacitated_assignment(
+            scores, capacity, eligible, row_bonus=bonus, slot_penalty=load_weight / self.MAX_TASKS_PER_USER,
         )
-        completed = completed_result.scalar() or 0
 
-        # 同类任务总数
-        total_result = await self.db.execute(
-            select(func.count(TMSTask.id)).where(
-                and_(
-                    TMSTask.assigned_to == candidate.id,
-                    TMSTask.task_type == task_type,
-                    TMSTask.status.in_(["completed", "rejected"]),
-                )
-            )
+        results: List[DistributionResult] = []
+        for t_idx, task in enumerate(ordered):
+            i = int(solution.assignment[t_idx])
+            if i < 0:
+                results.append(self._no_candidate_result(task, strategy))
+                continue
+            candidate = self._candidate_score(features, rows[t_idx], i, task, strategy)
+            candidate.reasons.append("批量最优指派")
+            self._apply_assignment(task, candidate, strategy, triggered_by)
+            features.load[i] += 1
+            results.append(self._assignment_result(task, candidate, strategy))
+
+        stats = {**solution.stats(), "candidates": len(users), "profiles": len(profiles)}
+        await self._finish_batch(ordered, results, triggered_by, strategy, stats)
+        return results, stats
+
+    def _batch_strategy(self, strategy: str) -> str:
+        if strategy in (DistributionStrategy.LOAD_BALANCE.value, DistributionStrategy.PRIORITY_QUEUE.value):
+            return strategy
+        return DistributionStrategy.SKILL_MATCH.value
+
+    async def _batch_context(self, tasks: Sequence[TMSTask]):
+        """批量分发公共准备：候选人、评分特征、角色数组、按优先级排序的任务"""
+        user_result = await self.db.execute(
+            select(User).where(and_(User.is_active == True, User.role.in_(["operator", "manager", "admin"])))
         )
-        total = total_result.scalar() or 0
-
-        if total == 0:
-            return 0.5  # 无历史数据给默认分
+        users = list(user_result.scalars().all())
+        features = await self._load_features(users, tasks)
+        roles = np.array([u.role for u in users], dtype=object)
+        ordered = sorted(tasks, key=lambda t: (
+            PRIORITY_RANK.get(t.priority, 2),
+            t.deadline or datetime.max,
+            t.created_at or datetime.max,
+        ))
+        return users, features, roles, ordered
+
+    def _batch_eligible(self, task: TMSTask, features: CandidateFeatures, roles: np.ndarray) -> np.ndarray:
+        """技能资质 + 角色过滤（不含负载）"""
+        eligible = features.qualified_mask(task.required_skills or [])
+        if task.required_roles:
+            eligible &= np.isin(roles, list(task.required_roles))
+        return eligible
 
-        return completed / total
+    def _no_candidate_result(self, task: TMSTask, strategy: str) -> DistributionResult:
+        return DistributionResult(
+            success=False, task_id=str(task.id), strategy=strategy, mode=DistributionMode.DIRECT.value,
+            reason="无可用候选人", message="未找到符合条件的候选人，请调整任务要求或手动分配",
+        )
 
-    async def _calc_response_score(self, candidate: User) -> float:
-        """计算响应速度评分"""
-        # 简化实现：基于最近认领任务的时间差
-        # 实际生产中可计算平均认领时间
-        return 0.7  # 默认分
+    async def _finish_batch(
+        self, ordered: Sequence[TMSTask], results: List[DistributionResult], triggered_by: str,
+        strategy: str, stats: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """批量分配与事件 Outbox 统一提交"""
+        for task, result in zip(ordered, results):
+            if result.success:
+                await self._publish_distributed(task, result, triggered_by)
+        await self.db.commit()
+        assigned = sum(1 for r in results if r.success)
+        logger.info(f"Batch distributed {assigned}/{len(ordered)} tasks | strategy={strategy}"
+                    + (f" | solver={stats}" if stats else ""))
 
     async def _direct_assign(
         self, task: TMSTask, candidate: CandidateScore, strategy: str, triggered_by: str
     ) -> DistributionResult:
         """直接分配"""
+        self._apply_assignment(task, candidate, strategy, triggered_by)
+        result = self._assignment_result(task, candidate, strategy)
+        await self._publish_distributed(task, result, triggered_by)
+        await self.db.commit()
+        return result
+
+    def _apply_assignment(
+        self, task: TMSTask, candidate: CandidateScore, strategy: str, triggered_by: str
+    ) -> None:
+        """写入分配结果与分发日志（不提交）"""
         task.assigned_to = candidate.user_id
         task.assigned_by = triggered_by
         task.status = "distributed"
@@ -451,22 +643,8 @@ class DistributionEngine:
             triggered_by=triggered_by,
         )
         self.db.add(log)
-        await self.db.commit()
-
-        # 发布事件
-        await tms_event_bus.publish(
-            TMSEventType.TASK_DISTRIBUTED.value,
-            {
-                "task_id": str(task.id),
-                "task_code": task.task_code,
-                "assigned_to": candidate.user_id,
-                "assigned_to_name": candidate.full_name,
-                "strategy": strategy,
-                "score": candidate.total_score,
-            },
-            source=triggered_by,
-        )
 
+    def _assignment_result(self, task: TMSTask, candidate: CandidateScore, strategy: str) -> DistributionResult:
         return DistributionResult(
             success=True,
             task_id=str(task.id),
@@ -479,6 +657,21 @@ class DistributionEngine:
             message=f"任务已分配给 {candidate.full_name}",
         )
 
+    async def _publish_distributed(self, task: TMSTask, result: DistributionResult, triggered_by: str) -> None:
+        await tms_event_bus.publish(
+            TMSEventType.TASK_DISTRIBUTED.value,
+            {
+                "task_id": str(task.id),
+                "task_code": task.task_code,
+                "assigned_to": result.assigned_to,
+                "assigned_to_name": result.assigned_to_name,
+                "strategy": result.strategy,
+                "score": result.candidate_scores.get(result.assigned_to),
+            },
+            source=triggered_by,
+            db=self.db,
+        )
+
     async def _pool_distribute(
         self, task: TMSTask, candidates: List[CandidateScore], strategy: str, triggered_by: str
     ) -> DistributionResult:
@@ -504,7 +697,6 @@ class DistributionEngine:
             triggered_by=triggered_by,
         )
         self.db.add(log)
-        await self.db.commit()
 
         # 发布事件
         await tms_event_bus.publish(
@@ -517,7 +709,9 @@ class DistributionEngine:
                 "candidates": [c.user_id for c in candidates],
             },
             source=triggered_by,
+            db=self.db,
         )
+        await self.db.commit()
 
         return DistributionResult(
             success=True,
@@ -562,13 +756,13 @@ class DistributionEngine:
             triggered_by=triggered_by,
         )
         self.db.add(log)
-        await self.db.commit()
-
         await tms_event_bus.publish(
             TMSEventType.TASK_DISTRIBUTED.value,
             {"task_id": str(task.id), "task_code": task.task_code, "assigned_to": target_user_id, "mode": "manual"},
             source=triggered_by,
+            db=self.db,
         )
+        await self.db.commit()
 
         return DistributionResult(
             success=True,
@@ -585,18 +779,20 @@ class DistributionEngine:
         self, task: TMSTask, candidates: List[User], triggered_by: str
     ) -> DistributionResult:
         """Agent 决策模式 - 返回候选人列表等待外部 AI 决定"""
-        candidate_info = []
-        for c in candidates:
-            skill_score = await self._calc_skill_score(c, task.required_skills or [])
-            load_score = await self._calc_load_score(c)
-            candidate_info.append({
+        features = await self._load_features(candidates, [task])
+        skill_scores = features.skill_vector(task.required_skills or [])
+        load_scores = features.load_vector(self.MAX_TASKS_PER_USER)
+        candidate_info = [
+            {
                 "user_id": str(c.id),
                 "username": c.username,
                 "full_name": c.full_name or c.username,
-                "skill_score": round(skill_score, 3),
-                "load_score": round(load_score, 3),
+                "skill_score": round(float(skill_scores[i]), 3),
+                "load_score": round(float(load_scores[i]), 3),
                 "role": c.role,
-            })
+            }
+            for i, c in enumerate(candidates)
+        ]
 
         # 标记为等待 Agent 决策
         task.status = "pending_distribution"
@@ -608,8 +804,6 @@ class DistributionEngine:
             "requested_at": datetime.utcnow().isoformat(),
         }
         task.updated_at = datetime.utcnow()
-        await self.db.commit()
-
         await tms_event_bus.publish(
             TMSEventType.AGENT_CONFIRMATION_REQUIRED.value,
             {
@@ -619,7 +813,9 @@ class DistributionEngine:
                 "candidates": candidate_info,
             },
             source=triggered_by,
+            db=self.db,
         )
+        await self.db.commit()
 
         return DistributionResult(
             success=True,
@@ -647,12 +843,12 @@ class DistributionEngine:
         task.assigned_to = user_id
         task.status = "claimed"
         task.updated_at = datetime.utcnow()
-        await self.db.commit()
-
         await tms_event_bus.publish(
             TMSEventType.TASK_CLAIMED.value,
             {"task_id": str(task.id), "task_code": task.task_code, "claimed_by": user_id},
+            db=self.db,
         )
+        await self.db.commit()
 
         return DistributionResult(
             success=True,
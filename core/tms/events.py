@@ -7,19 +7,26 @@ TMS Event Bus - 事件驱动架构
 - 审批完成后通知相关方
 - 超期任务自动升级
 - Agent 实时感知任务变化
+
+Webhook 外推走事务性 Outbox：publish 只把事件写入 tms_event_outbox
+（传入 db 时与调用方的业务变更同一事务），由 core.tms.webhook_dispatcher
+在后台并发投递、重试与死信，发布方不再等待任何外部 HTTP。
+传入 db 时进程内 handlers 与投递器唤醒推迟到调用方提交之后，回滚则丢弃。
 """
 
 import asyncio
 import logging
-import hashlib
-import hmac
 import json
+import uuid
 from datetime import datetime
 from typing import Callable, Dict, List, Any, Optional
 from dataclasses import dataclass, field
 from enum import Enum
 
-import httpx
+from sqlalchemy import event as sa_event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import TMSEventOutbox
 
 logger = logging.getLogger(__name__)
 
@@ -57,9 +64,7 @@ class TMSEvent:
     payload: Dict[str, Any]
     timestamp: str = field(default_factory=lambda: datetime.utcnow().isoformat())
     source: str = "system"
-    event_id: str = field(default_factory=lambda: hashlib.md5(
-        f"{datetime.utcnow().isoformat()}{id(object())}".encode()
-    ).hexdigest()[:16])
+    event_id: str = field(default_factory=lambda: uuid.uuid4().hex)
 
 
 @dataclass
@@ -72,13 +77,16 @@ class WebhookSubscription:
     is_active: bool = True
 
 
+_PENDING_EVENTS_KEY = "tms_pending_events"
+
+
 class TMSEventBus:
     """
     TMS 事件总线
     
     支持：
     - 进程内事件订阅/发布
-    - Webhook 外部推送（Agent 订阅）
+    - Webhook 外部推送（Agent 订阅，经 Outbox 由后台投递器完成）
     - 异步非阻塞处理
     """
 
@@ -87,6 +95,7 @@ class TMSEventBus:
         self._webhook_subscriptions: List[WebhookSubscription] = []
         self._event_history: List[TMSEvent] = []
         self._max_history = 1000
+        self._outbox_listeners: List[Callable[[], None]] = []
 
     def subscribe(self, event_type: str, handler: Callable) -> None:
         """订阅事件"""
@@ -102,14 +111,20 @@ class TMSEventBus:
                 h for h in self._handlers[event_type] if h != handler
             ]
 
-    async def publish(self, event_type: str, payload: Dict[str, Any], source: str = "system") -> TMSEvent:
+    async def publish(
+        self,
+        event_type: str,
+        payload: Dict[str, Any],
+        source: str = "system",
+        db: Optional[AsyncSession] = None,
+    ) -> TMSEvent:
         """
         发布事件
         
         1. 创建事件对象
-        2. 调用进程内 handlers
-        3. 推送 Webhook
-        4. 记录事件历史
+        2. 写入 Outbox（传入 db 时只加入调用方会话，随调用方提交；否则独立提交）
+        3. 调用进程内 handlers、唤醒 Webhook 投递器
+           （传入 db 时等调用方提交后再执行，handlers 不会看到未提交或已回滚的变更）
         """
         event = TMSEvent(event_type=event_type, payload=payload, source=source)
         
@@ -120,14 +135,68 @@ class TMSEventBus:
 
         logger.info(f"Event published: {event_type} | source={source} | id={event.event_id}")
 
-        # 进程内处理
-        await self._dispatch_local(event)
+        await self._write_outbox(event, db)
 
-        # Webhook 外推
-        await self._dispatch_webhooks(event)
+        if db is not None:
+            self._defer_until_commit(db, event)
+        else:
+            await self._after_publish(event)
 
         return event
 
+    async def _after_publish(self, event: TMSEvent) -> None:
+        """进程内处理 + 唤醒投递器"""
+        await self._dispatch_local(event)
+        for listener in self._outbox_listeners:
+            listener()
+
+    def _defer_until_commit(self, db: AsyncSession, event: TMSEvent) -> None:
+        """事件挂到会话上，after_commit 时统一派发；after_rollback 时丢弃"""
+        session = db.sync_session
+        pending = session.info.setdefault(_PENDING_EVENTS_KEY, [])
+        pending.append(event)
+        if not sa_event.contains(session, "after_commit", self._on_commit):
+            sa_event.listen(session, "after_commit", self._on_commit)
+            sa_event.listen(session, "after_rollback", self._on_rollback)
+
+    def _on_commit(self, session) -> None:
+        events = session.info.pop(_PENDING_EVENTS_KEY, [])
+        if events:
+            asyncio.get_running_loop().create_task(self._dispatch_committed(events))
+
+    def _on_rollback(self, session) -> None:
+        dropped = session.info.pop(_PENDING_EVENTS_KEY, [])
+        if dropped:
+            logger.info(f"Events dropped on rollback: {[e.event_id for e in dropped]}")
+
+    async def _dispatch_committed(self, events: List[TMSEvent]) -> None:
+        for event in events:
+            await self._after_publish(event)
+
+    async def _write_outbox(self, event: TMSEvent, db: Optional[AsyncSession]) -> None:
+        """事件写入 Outbox，Webhook 由后台投递器异步外推"""
+        row = TMSEventOutbox(
+            event_id=event.event_id,
+            event_type=event.event_type,
+            source=event.source,
+            payload=json.loads(json.dumps(event.payload, default=str)),  # 序列化失败不能拖垮业务提交
+            created_at=datetime.fromisoformat(event.timestamp),
+        )
+        if db is not None:
+            db.add(row)
+            return
+        try:
+            from database.db_config import db_config
+            async with db_config.session_factory() as session:
+                session.add(row)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Event outbox write failed: {event.event_type} | id={event.event_id}: {e}")
+
+    def add_outbox_listener(self, listener: Callable[[], None]) -> None:
+        """登记 Outbox 写入回调（投递器用来提前结束轮询等待）"""
+        self._outbox_listeners.append(listener)
+
     async def _dispatch_local(self, event: TMSEvent) -> None:
         """进程内事件分发"""
         handlers = self._handlers.get(event.event_type, [])
@@ -140,40 +209,6 @@ class TMSEventBus:
             except Exception as e:
                 logger.error(f"Event handler error: {event.event_type} -> {handler.__name__}: {e}")
 
-    async def _dispatch_webhooks(self, event: TMSEvent) -> None:
-        """Webhook 外推"""
-        active_subscriptions = [
-            sub for sub in self._webhook_subscriptions
-            if sub.is_active and event.event_type in sub.event_types
-        ]
-
-        if not active_subscriptions:
-            return
-
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            for sub in active_subscriptions:
-                try:
-                    headers = {"Content-Type": "application/json"}
-                    body = json.dumps({
-                        "event_id": event.event_id,
-                        "event_type": event.event_type,
-                        "timestamp": event.timestamp,
-                        "source": event.source,
-                        "payload": event.payload,
-                    })
-
-                    # 签名
-                    if sub.secret:
-                        signature = hmac.new(
-                            sub.secret.encode(), body.encode(), hashlib.sha256
-                        ).hexdigest()
-                        headers["X-TMS-Signature"] = f"sha256={signature}"
-
-                    await client.post(sub.webhook_url, content=body, headers=headers)
-                    logger.info(f"Webhook delivered: {sub.agent_id} <- {event.event_type}")
-                except Exception as e:
-                    logger.error(f"Webhook delivery failed: {sub.agent_id} @ {sub.webhook_url}: {e}")
-
     def register_webhook(
         self,
         agent_id: str,
@@ -181,7 +216,7 @@ class TMSEventBus:
         webhook_url: str,
         secret: Optional[str] = None,
     ) -> WebhookSubscription:
-        """注册 Webhook 订阅"""
+        """进程内登记 Webhook 订阅（实际投递以 tms_webhook_subscriptions 表为准）"""
         subscription = WebhookSubscription(
             agent_id=agent_id,
             event_types=event_types,
@@ -0,0 +1,444 @@
+"""
+TMS Webhook 投递器 - 事件 Outbox 的后台消费者
+
+TMSEventBus.publish 只把事件写入 tms_event_outbox（与业务变更同一事务），
+外推在这里异步完成：
+
+1. 扇出：未扇出的事件按 tms_webhook_subscriptions 展开为 tms_webhook_deliveries（每订阅一行）
+2. 认领：FOR UPDATE SKIP LOCKED 批量认领到期投递并加租约，多实例部署互不重复
+3. 投递：共享连接池的 httpx 客户端，不同订阅者并发，同一订阅者按事件顺序串行
+   （更早的投递还在退避/在途时，后面的事件不会越过它）
+4. 失败按指数退避 + 抖动重试，超过最大次数或订阅已注销进入死信（status=dead），可重放
+
+HTTP 请求不在数据库事务内进行；认领、结果回写各自短事务提交。
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.tms.events import tms_event_bus
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+
+BATCH_SIZE = _env_int("TMS_WEBHOOK_BATCH_SIZE", 200)          # 每轮认领的投递数
+CONCURRENCY = _env_int("TMS_WEBHOOK_CONCURRENCY", 16)         # 同时投递的订阅者数
+MAX_ATTEMPTS = _env_int("TMS_WEBHOOK_MAX_ATTEMPTS", 8)        # 超过即进入死信
+POLL_SECONDS = 1.0
+WAKE_DEBOUNCE_SECONDS = 0.05    # 发布方唤醒后稍等其事务提交
+LEASE_SECONDS = 60
+REQUEST_TIMEOUT = 10.0
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 600.0
+RETENTION_DAYS = 7              # 已投递事件的保留天数（死信不清理）
+PURGE_INTERVAL_SECONDS = 3600
+
+# 扇出：事件 × 订阅（event_types 为 JSON 数组）
+_FANOUT_SQL = text("""
+WITH ev AS (
+    SELECT id, event_type FROM tms_event_outbox
+    WHERE fanned_out_at IS NULL
+    ORDER BY id
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+), ins AS (
+    INSERT INTO tms_webhook_deliveries (outbox_id, subscription_id, agent_id, webhook_url)
+    SELECT ev.id, s.id::text, s.agent_id, s.webhook_url
+    FROM ev
+    JOIN tms_webhook_subscriptions s
+      ON s.is_active AND s.event_types::jsonb @> jsonb_build_array(ev.event_type)
+    ON CONFLICT (outbox_id, subscription_id) DO NOTHING
+    RETURNING 1
+), upd AS (
+    UPDATE tms_event_outbox o SET fanned_out_at = NOW()
+    FROM ev WHERE o.id = ev.id
+    RETURNING 1
+)
+SELECT (SELECT COUNT(*) FROM upd) AS events, (SELECT COUNT(*) FROM ins) AS deliveries
+""")
+
+# 认领：到期、未被租约占用、且同订阅下没有更早的未完成投递挡在前面
+_CLAIM_SQL = text("""
+WITH due AS (
+    SELECT d.id FROM tms_webhook_deliveries d
+    WHERE d.status = 'pending'
+      AND d.next_attempt_at <= NOW()
+      AND (d.locked_until IS NULL OR d.locked_until < NOW())
+      AND NOT EXISTS (
+          SELECT 1 FROM tms_webhook_deliveries p
+          WHERE p.subscription_id = d.subscription_id
+            AND p.status = 'pending'
+            AND p.id < d.id
+            AND (p.next_attempt_at > NOW() OR p.locked_until >= NOW())
+      )
+    ORDER BY d.id
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+), claimed AS (
+    UPDATE tms_webhook_deliveries d
+    SET locked_until = NOW() + make_interval(secs => :lease)
+    FROM due WHERE d.id = due.id
+    RETURNING d.id, d.outbox_id, d.subscription_id, d.agent_id, d.webhook_url, d.attempts
+)
+SELECT c.id, c.subscription_id, c.agent_id, c.webhook_url, c.attempts,
+       o.event_id, o.event_type, o.source, o.payload, o.created_at AS event_created_at,
+       s.secret, s.is_active
+FROM claimed c
+JOIN tms_event_outbox o ON o.id = c.outbox_id
+LEFT JOIN tms_webhook_subscriptions s ON s.id::text = c.subscription_id
+ORDER BY c.id
+""")
+
+_DELIVERED_SQL = text("""
+UPDATE tms_webhook_deliveries
+SET status = 'delivered', attempts = attempts + 1, delivered_at = NOW(),
+    locked_until = NULL, last_error = NULL
+WHERE id IN :ids
+""").bindparams(bindparam("ids", expanding=True))
+
+_FAILED_SQL = text("""
+UPDATE tms_webhook_deliveries
+SET attempts = attempts + 1,
+    status = CASE WHEN :dead OR attempts + 1 >= :max_attempts THEN 'dead' ELSE 'pending' END,
+    next_attempt_at = NOW() + make_interval(secs => :delay),
+    last_error = :error,
+    locked_until = NULL
+WHERE id = :id
+""")
+
+_RELEASE_SQL = text("""
+UPDATE tms_webhook_deliveries SET locked_until = NULL WHERE id IN :ids
+""").bindparams(bindparam("ids", expanding=True))
+
+_PURGE_SQL = text("""
+DELETE FROM tms_event_outbox o
+WHERE o.fanned_out_at < NOW() - make_interval(days => :days)
+  AND NOT EXISTS (
+      SELECT 1 FROM tms_webhook_deliveries d
+      WHERE d.outbox_id = o.id AND d.status IN ('pending', 'dead')
+  )
+""")
+
+_BACKLOG_SQL = text("""
+SELECT
+    (SELECT COUNT(*) FROM tms_event_outbox WHERE fanned_out_at IS NULL) AS unfanned_events,
+    COUNT(*) FILTER (WHERE d.status = 'pending') AS pending,
+    COUNT(*) FILTER (WHERE d.status = 'dead') AS dead,
+    EXTRACT(EPOCH FROM NOW() - MIN(o.created_at) FILTER (WHERE d.status = 'pending')) AS oldest_pending_seconds
+FROM tms_webhook_deliveries d
+JOIN tms_event_outbox o ON o.id = d.outbox_id
+WHERE d.status IN ('pending', 'dead')
+""")
+
+
+@dataclass
+class ClaimedDelivery:
+    """已认领的一条投递"""
+    id: int
+    subscription_id: str
+    agent_id: str
+    webhook_url: str
+    attempts: int
+    event_id: str
+    event_type: str
+    source: Optional[str]
+    payload: Any
+    event_created_at: datetime
+    secret: Optional[str] = None
+    is_active: Optional[bool] = None
+
+    def body(self) -> str:
+        payload = json.loads(self.payload) if isinstance(self.payload, str) else self.payload
+        return json.dumps({
+            "event_id": self.event_id,
+            "event_type": self.event_type,
+            "timestamp": self.event_created_at.isoformat(),
+            "source": self.source,
+            "payload": payload,
+        })
+
+
+@dataclass
+class DeliveryOutcome:
+    """单条投递结果：delivered / failed / released（被同订阅更早的失败挡住，原样放回）"""
+    delivery: ClaimedDelivery
+    status: str
+    error: Optional[str] = None
+    permanent: bool = False
+
+
+@dataclass
+class DispatcherMetrics:
+    """进程内投递计数（积压/死信/滞后从数据库实时查询）"""
+    fanned_out_events: int = 0
+    delivered: int = 0
+    failed_attempts: int = 0
+    dead_lettered: int = 0
+    last_batch_at: Optional[str] = None
+    _recent: Deque[Tuple[float, float]] = field(default_factory=lambda: deque(maxlen=5000))
+
+    def record_delivery(self, latency_seconds: float) -> None:
+        self.delivered += 1
+        self._recent.append((time.monotonic(), latency_seconds))
+
+    def snapshot(self) -> Dict[str, Any]:
+        cutoff = time.monotonic() - 60
+        last_minute = [lat for ts, lat in self._recent if ts >= cutoff]
+        latencies = [lat for _, lat in self._recent]
+        return {
+            "fanned_out_events": self.fanned_out_events,
+            "delivered": self.delivered,
+            "failed_attempts": self.failed_attempts,
+            "dead_lettered": self.dead_lettered,
+            "delivered_last_minute": len(last_minute),
+            "avg_delivery_latency_seconds": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "last_batch_at": self.last_batch_at,
+        }
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次失败后的等待秒数：指数退避，上限 BACKOFF_MAX_SECONDS，乘 0.5~1.0 抖动"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** max(0, attempt - 1)))
+    return delay * (0.5 + random.random() / 2)
+
+
+class WebhookDispatcher:
+    """Outbox 投递器：扇出 → 认领 → 并发投递 → 回写结果"""
+
+    def __init__(
+        self,
+        batch_size: int = BATCH_SIZE,
+        concurrency: int = CONCURRENCY,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.metrics = DispatcherMetrics()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._wake = asyncio.Event()
+        self._last_purge = 0.0
+
+    # ---------- HTTP ----------
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """全进程共享的连接池客户端（按订阅者 keep-alive 复用连接）"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=REQUEST_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.concurrency * 4,
+                                    max_keepalive_connections=self.concurrency * 2),
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, delivery: ClaimedDelivery) -> DeliveryOutcome:
+        if not delivery.is_active:
+            return DeliveryOutcome(delivery, "failed", "订阅已注销或停用", permanent=True)
+        body = delivery.body()
+        headers = {
+            "Content-Type": "application/json",
+            "X-TMS-Event-Id": delivery.event_id,
+            "X-TMS-Delivery-Attempt": str(delivery.attempts + 1),
+        }
+        if delivery.secret:
+            signature = hmac.new(delivery.secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+            headers["X-TMS-Signature"] = f"sha256={signature}"
+        try:
+            resp = await self._get_client().post(delivery.webhook_url, content=body, headers=headers)
+        except httpx.HTTPError as e:
+            return DeliveryOutcome(delivery, "failed", f"{type(e).__name__}: {e}"[:500])
+        if 200 <= resp.status_code < 300:
+            return DeliveryOutcome(delivery, "delivered")
+        # 410 Gone 表示对方明确下线了该端点，不再重试
+        return DeliveryOutcome(delivery, "failed", f"HTTP {resp.status_code}", permanent=resp.status_code == 410)
+
+    async def deliver(self, claimed: List[ClaimedDelivery]) -> List[DeliveryOutcome]:
+        """按订阅者分组并发投递；组内按事件顺序，一条失败则其后的事件放回等待"""
+        groups: Dict[str, List[ClaimedDelivery]] = {}
+        for d in claimed:
+            groups.setdefault(d.subscription_id, []).append(d)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_group(items: List[ClaimedDelivery]) -> List[DeliveryOutcome]:
+            outcomes: List[DeliveryOutcome] = []
+            async with semaphore:
+                for i, d in enumerate(items):
+                    outcome = await self._post(d)
+                    outcomes.append(outcome)
+                    if outcome.status == "failed":
+                        outcomes.extend(DeliveryOutcome(rest, "released") for rest in items[i + 1:])
+                        break
+            return outcomes
+
+        grouped = await asyncio.gather(*(run_group(items) for items in groups.values()))
+        return [o for outcomes in grouped for o in outcomes]
+
+    # ---------- 数据库 ----------
+
+    async def fan_out(self, db: AsyncSession) -> int:
+        row = (await db.execute(_FANOUT_SQL, {"limit": self.batch_size * 5})).mappings().one()
+        await db.commit()
+        self.metrics.fanned_out_events += int(row["events"])
+        return int(row["events"])
+
+    async def claim(self, db: AsyncSession) -> List[ClaimedDelivery]:
+        rows = (await db.execute(_CLAIM_SQL, {"limit": self.batch_size, "lease": LEASE_SECONDS})).mappings().all()
+        await db.commit()
+        return [ClaimedDelivery(**dict(r)) for r in rows]
+
+    async def record(self, db: AsyncSession, outcomes: List[DeliveryOutcome]) -> None:
+        """批量回写投递结果"""
+        delivered = [o.delivery.id for o in outcomes if o.status == "delivered"]
+        released = [o.delivery.id for o in outcomes if o.status == "released"]
+        failed = [o for o in outcomes if o.status == "failed"]
+        if delivered:
+            await db.execute(_DELIVERED_SQL, {"ids": delivered})
+        if released:
+            await db.execute(_RELEASE_SQL, {"ids": released})
+        if failed:
+            await db.execute(_FAILED_SQL, [
+                {
+                    "id": o.delivery.id,
+                    "dead": o.permanent,
+                    "max_attempts": self.max_attempts,
+                    "delay": backoff_delay(o.delivery.attempts + 1),
+                    "error": o.error,
+                }
+                for o in failed
+            ])
+        await db.commit()
+
+        now = datetime.utcnow()
+        for o in outcomes:
+            if o.status == "delivered":
+                self.metrics.record_delivery((now - o.delivery.event_created_at).total_seconds())
+            elif o.status == "failed":
+                self.metrics.failed_attempts += 1
+                if o.permanent or o.delivery.attempts + 1 >= self.max_attempts:
+                    self.metrics.dead_lettered += 1
+                    logger.error(f"Webhook dead-lettered: {o.delivery.agent_id} <- {o.delivery.event_type} "
+                                 f"| id={o.delivery.event_id}: {o.error}")
+                else:
+                    logger.warning(f"Webhook delivery failed: {o.delivery.agent_id} @ {o.delivery.webhook_url} "
+                                   f"| attempt={o.delivery.attempts + 1}: {o.error}")
+
+    async def run_once(self, session_factory) -> bool:
+        """跑一轮；返回是否可能还有积压（用于决定是否立刻再跑）"""
+        async with session_factory() as db:
+            fanned = await self.fan_out(db)
+            claimed = await self.claim(db)
+        if claimed:
+            outcomes = await self.deliver(claimed)
+            async with session_factory() as db:
+                await self.record(db, outcomes)
+            self.metrics.last_batch_at = datetime.utcnow().isoformat()
+        if time.monotonic() - self._last_purge > PURGE_INTERVAL_SECONDS:
+            async with session_factory() as db:
+                await db.execute(_PURGE_SQL, {"days": RETENTION_DAYS})
+                await db.commit()
+            self._last_purge = time.monotonic()
+        return fanned >= self.batch_size * 5 or len(claimed) >= self.batch_size
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    async def run_forever(self) -> None:
+        from database.db_config import db_config
+        tms_event_bus.add_outbox_listener(self.wake)
+        logger.info(f"TMS webhook dispatcher started | batch={self.batch_size} concurrency={self.concurrency}")
+        try:
+            while True:
+                try:
+                    more = await self.run_once(db_config.session_factory)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:  # noqa: BLE001 — 投递循环必须常驻
+                    logger.warning(f"TMS webhook dispatcher error: {e}")
+                    more = False
+                if more:
+                    continue
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=POLL_SECONDS)
+                    await asyncio.sleep(WAKE_DEBOUNCE_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+        except asyncio.CancelledError:
+            logger.info("TMS webhook dispatcher stopped")
+        finally:
+            await self.close()
+
+    # ---------- 运维 ----------
+
+    async def get_metrics(self, db: AsyncSession) -> Dict[str, Any]:
+        """积压 / 死信 / 最老未投递事件滞后（秒）+ 进程内吞吐与延迟"""
+        row = (await db.execute(_BACKLOG_SQL)).mappings().one()
+        lag = row["oldest_pending_seconds"]
+        return {
+            "unfanned_events": int(row["unfanned_events"] or 0),
+            "pending": int(row["pending"] or 0),
+            "dead": int(row["dead"] or 0),
+            "oldest_pending_seconds": round(float(lag), 1) if lag is not None else 0.0,
+            **self.metrics.snapshot(),
+        }
+
+    async def replay_dead(self, db: AsyncSession, agent_id: Optional[str] = None) -> int:
+        """死信重放：重置为待投递（可按 Agent 过滤）"""
+        sql = """
+            UPDATE tms_webhook_deliveries
+            SET status = 'pending', attempts = 0, next_attempt_at = NOW(), last_error = NULL
+            WHERE status = 'dead'
+        """
+        params: Dict[str, Any] = {}
+        if agent_id:
+            sql += " AND agent_id = :agent_id"
+            params["agent_id"] = agent_id
+        result = await db.execute(text(sql), params)
+        await db.commit()
+        self.wake()
+        return result.rowcount or 0
+
+
+def _env_flag(name: str, default: bool = True) -> bool:
+    raw = os.getenv(name)
+    if raw is None or not str(raw).strip():
+        return default
+    return str(raw).strip().lower() in {"1", "true", "yes", "on"}
+
+
+# 全局投递器单例
+webhook_dispatcher = WebhookDispatcher()
+
+
+async def webhook_dispatcher_loop() -> None:
+    """后台投递循环（main.py startup 启动，TMS_WEBHOOK_DISPATCHER_ENABLED=0 可关）"""
+    if not _env_flag("TMS_WEBHOOK_DISPATCHER_ENABLED", True):
+        logger.info("TMS webhook dispatcher disabled (TMS_WEBHOOK_DISPATCHER_ENABLED=0)")
+        return
+    await webhook_dispatcher.run_forever()
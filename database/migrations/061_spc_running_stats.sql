@@ -0,0 +1,23 @@
+-- =============================================================================
+-- Migration: 061_spc_running_stats.sql
+-- Description: SPC 流式采集 — 每个特性的运行统计（Welford 均值/M2 + 子组 X̄/R 累加器），
+--              由 SpcService 周期性合并落库，控制图/Cpk 不再扫描原始点
+-- Date: 2026-10-19
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS spc_running_stats (
+  factory_id VARCHAR(50) NOT NULL,
+  characteristic_code VARCHAR(50) NOT NULL,
+  n BIGINT NOT NULL DEFAULT 0,                  -- 累计测量点数
+  mean DOUBLE PRECISION NOT NULL DEFAULT 0,     -- 运行均值
+  m2 DOUBLE PRECISION NOT NULL DEFAULT 0,       -- Σ(x-mean)²，方差 = m2/(n-1)
+  min_value DOUBLE PRECISION,
+  max_value DOUBLE PRECISION,
+  subgroup_count BIGINT NOT NULL DEFAULT 0,     -- 已闭合子组数
+  xbar_sum DOUBLE PRECISION NOT NULL DEFAULT 0, -- Σ 子组均值
+  r_sum DOUBLE PRECISION NOT NULL DEFAULT 0,    -- Σ 子组极差
+  updated_at TIMESTAMP DEFAULT NOW(),
+  PRIMARY KEY (factory_id, characteristic_code)
+);
+
+COMMENT ON TABLE spc_running_stats IS 'SPC 特性运行统计（流式增量合并）';
@@ -0,0 +1,15 @@
+-- =============================================================================
+-- Migration: 062_spc_rule_hits.sql
+-- Description: SPC 判异规则命中记录 — 流式采集逐点判异（Western Electric / Nelson），
+--              命中规则写入 ooc_rules 并置 is_out_of_control，预警巡检据此生成审查
+-- Date: 2026-10-19
+-- =============================================================================
+
+ALTER TABLE IF EXISTS qms_spc_points
+    ADD COLUMN IF NOT EXISTS ooc_rules VARCHAR(100);
+
+-- 预警巡检按厂区扫描近期失控点
+CREATE INDEX IF NOT EXISTS idx_spc_ooc ON qms_spc_points(factory_id, measured_at)
+    WHERE is_out_of_control = TRUE;
+
+COMMENT ON COLUMN qms_spc_points.ooc_rules IS '命中的判异规则编码，逗号分隔（beyond_3s/2of3_2s/4of5_1s/run/trend/stratification）';
@@ -0,0 +1,52 @@
+-- =============================================================================
+-- Migration: 063_oee_rollup.sql
+-- Description: OEE 周/月预聚合 — 按 设备 / 产线(设备所属工位) / 工厂 三级，
+--              oee_daily 写入时由 OeeService 刷新受影响的周期，趋势查询只读本表
+-- Date: 2026-10-19
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS oee_rollup (
+  factory_id VARCHAR(50) NOT NULL,
+  period VARCHAR(10) NOT NULL,                  -- week / month
+  period_start DATE NOT NULL,                   -- 周一 / 月初
+  scope VARCHAR(20) NOT NULL,                   -- equipment / line / factory
+  scope_id VARCHAR(50) NOT NULL,                -- 设备 id / 工位 id / 工厂 id
+  day_count INT NOT NULL DEFAULT 0,             -- 参与汇总的 设备·日 数
+  availability_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  performance_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  quality_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  oee_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  planned_minutes DOUBLE PRECISION NOT NULL DEFAULT 0,
+  run_minutes DOUBLE PRECISION NOT NULL DEFAULT 0,
+  downtime_minutes DOUBLE PRECISION NOT NULL DEFAULT 0,
+  actual_output BIGINT NOT NULL DEFAULT 0,
+  good_output BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT NOW(),
+  PRIMARY KEY (factory_id, period, scope, scope_id, period_start)
+);
+
+COMMENT ON TABLE oee_rollup IS 'OEE 周/月汇总（设备/产线/工厂），趋势按主键区间读取';
+
+-- 趋势默认按日期范围读取，daily 表补一个设备维度的覆盖索引
+CREATE INDEX IF NOT EXISTS idx_oee_factory_eq ON oee_daily(factory_id, equipment_id, snapshot_date);
+
+-- 存量数据初始化
+INSERT INTO oee_rollup (factory_id, period, period_start, scope, scope_id, day_count,
+    availability_sum, performance_sum, quality_sum, oee_sum,
+    planned_minutes, run_minutes, downtime_minutes, actual_output, good_output)
+SELECT o.factory_id, p.period, CAST(date_trunc(p.period, o.snapshot_date) AS DATE),
+    CASE WHEN GROUPING(o.equipment_id) = 0 THEN 'equipment'
+         WHEN GROUPING(COALESCE(e.station_id, '-')) = 0 THEN 'line' ELSE 'factory' END,
+    COALESCE(o.equipment_id, COALESCE(e.station_id, '-'), o.factory_id),
+    COUNT(*), SUM(o.availability), SUM(o.performance), SUM(o.quality), SUM(o.oee),
+    SUM(o.planned_production_minutes), SUM(o.actual_run_minutes), SUM(o.downtime_minutes),
+    SUM(o.actual_output), SUM(o.good_output)
+FROM oee_daily o
+LEFT JOIN equipment e ON e.id = o.equipment_id
+CROSS JOIN (VALUES ('week'), ('month')) AS p(period)
+GROUP BY GROUPING SETS (
+    (o.factory_id, p.period, CAST(date_trunc(p.period, o.snapshot_date) AS DATE), o.equipment_id),
+    (o.factory_id, p.period, CAST(date_trunc(p.period, o.snapshot_date) AS DATE), COALESCE(e.station_id, '-')),
+    (o.factory_id, p.period, CAST(date_trunc(p.period, o.snapshot_date) AS DATE))
+)
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,48 @@
+-- =============================================================================
+-- Migration: 064_tms_event_outbox.sql
+-- Description: TMS 事件 Outbox — 事件与业务变更同事务写入 tms_event_outbox，
+--              后台投递器按订阅扇出到 tms_webhook_deliveries 并并发投递、退避重试、死信
+-- Date: 2026-10-19
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS tms_event_outbox (
+  id BIGSERIAL PRIMARY KEY,
+  event_id VARCHAR(32) NOT NULL UNIQUE,
+  event_type VARCHAR(50) NOT NULL,
+  source VARCHAR(100),
+  payload JSONB NOT NULL DEFAULT '{}',
+  created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  fanned_out_at TIMESTAMP                       -- 已按订阅展开投递行的时间
+);
+
+COMMENT ON TABLE tms_event_outbox IS 'TMS 事件 Outbox（与业务变更同事务提交）';
+
+CREATE INDEX IF NOT EXISTS idx_tms_outbox_unfanned
+  ON tms_event_outbox(id) WHERE fanned_out_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS tms_webhook_deliveries (
+  id BIGSERIAL PRIMARY KEY,
+  outbox_id BIGINT NOT NULL REFERENCES tms_event_outbox(id) ON DELETE CASCADE,
+  subscription_id VARCHAR(36) NOT NULL,
+  agent_id VARCHAR(100) NOT NULL,
+  webhook_url VARCHAR(500) NOT NULL,
+  status VARCHAR(20) NOT NULL DEFAULT 'pending',   -- pending / delivered / dead
+  attempts INT NOT NULL DEFAULT 0,
+  next_attempt_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  locked_until TIMESTAMP,                          -- 认领租约，过期视为未认领
+  last_error TEXT,
+  created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  delivered_at TIMESTAMP,
+  UNIQUE (outbox_id, subscription_id)
+);
+
+COMMENT ON TABLE tms_webhook_deliveries IS 'TMS Webhook 投递（每事件每订阅一行，status=dead 为死信）';
+
+-- 认领到期投递
+CREATE INDEX IF NOT EXISTS idx_tms_delivery_due
+  ON tms_webhook_deliveries(next_attempt_at, id) WHERE status = 'pending';
+-- 同一订阅者按顺序投递：检查更早的未完成投递
+CREATE INDEX IF NOT EXISTS idx_tms_delivery_sub_pending
+  ON tms_webhook_deliveries(subscription_id, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_tms_delivery_dead
+  ON tms_webhook_deliveries(subscription_id) WHERE status = 'dead';
@@ -0,0 +1,18 @@
+-- =============================================================================
+-- Migration: 065_alert_review_dedupe.sql
+-- Description: 预警巡检去重与审查结论缓存 — 巡检按来源一次反连接排除已有待处理审查，
+--              审查结论按上下文哈希复用（上下文不变的预警不重复调 LLM）
+-- Date: 2026-10-19
+-- =============================================================================
+
+ALTER TABLE alert_intelligence_reviews ADD COLUMN IF NOT EXISTS context_hash VARCHAR(64);
+
+-- 反连接：NOT EXISTS (source, ref_id, status = 'pending')
+CREATE INDEX IF NOT EXISTS idx_air_pending_ref
+  ON alert_intelligence_reviews(alert_source, alert_ref_id)
+  WHERE status = 'pending';
+
+-- 结论缓存：按上下文哈希取最近一次审查
+CREATE INDEX IF NOT EXISTS idx_air_context_hash
+  ON alert_intelligence_reviews(context_hash, created_at DESC)
+  WHERE context_hash IS NOT NULL;
@@ -0,0 +1,85 @@
+-- =============================================================================
+-- Migration: 066_report_rollup_upsert.sql
+-- Description: 报工汇总原子累加 — 班次汇总 / 小时快照改为 INSERT ... ON CONFLICT DO UPDATE，
+--              冲突键需要唯一索引支撑；先合并历史并发写入产生的重复行
+-- Date: 2026-10-19
+-- =============================================================================
+
+-- 补齐模型中的审计列（023 建表时缺失，ORM 读取汇总会报列不存在；ON CONFLICT 更新 updated_at）
+ALTER TABLE shift_summaries ADD COLUMN IF NOT EXISTS created_by VARCHAR(50);
+ALTER TABLE shift_summaries ADD COLUMN IF NOT EXISTS updated_by VARCHAR(50);
+ALTER TABLE hourly_output_snapshots ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+ALTER TABLE hourly_output_snapshots ADD COLUMN IF NOT EXISTS created_by VARCHAR(50);
+ALTER TABLE hourly_output_snapshots ADD COLUMN IF NOT EXISTS updated_by VARCHAR(50);
+
+-- 合并重复的班次汇总行（保留 id 最小的一行，累加其余行后删除）
+WITH dup AS (
+  SELECT factory_id, shift_date, shift_type, station_id, work_order_id,
+         MIN(id) AS keep_id,
+         SUM(COALESCE(good_qty, 0)) AS good_qty,
+         SUM(COALESCE(defect_qty, 0)) AS defect_qty,
+         SUM(COALESCE(scrap_qty, 0)) AS scrap_qty,
+         SUM(COALESCE(report_count, 0)) AS report_count,
+         SUM(COALESCE(total_cycle_time, 0)) AS total_cycle_time
+    FROM shift_summaries
+   GROUP BY factory_id, shift_date, shift_type, station_id, work_order_id
+  HAVING COUNT(*) > 1
+)
+UPDATE shift_summaries s
+   SET good_qty = dup.good_qty,
+       defect_qty = dup.defect_qty,
+       scrap_qty = dup.scrap_qty,
+       total_output = dup.good_qty + dup.defect_qty + dup.scrap_qty,
+       yield_rate = CASE WHEN dup.good_qty + dup.defect_qty + dup.scrap_qty > 0
+                         THEN dup.good_qty * 100.0 / (dup.good_qty + dup.defect_qty + dup.scrap_qty)
+                         ELSE 0 END,
+       report_count = dup.report_count,
+       total_cycle_time = dup.total_cycle_time
+  FROM dup
+ WHERE s.id = dup.keep_id;
+
+DELETE FROM shift_summaries s
+ USING shift_summaries k
+ WHERE s.factory_id = k.factory_id AND s.shift_date = k.shift_date
+   AND s.shift_type = k.shift_type AND s.station_id = k.station_id
+   AND s.work_order_id = k.work_order_id AND s.id > k.id;
+
+-- 合并重复的小时快照行
+WITH dup AS (
+  SELECT factory_id, snapshot_date, snapshot_hour, station_id,
+         MIN(id) AS keep_id,
+         SUM(COALESCE(output_qty, 0)) AS output_qty,
+         SUM(COALESCE(good_qty, 0)) AS good_qty,
+         SUM(COALESCE(defect_qty, 0)) AS defect_qty
+    FROM hourly_output_snapshots
+   GROUP BY factory_id, snapshot_date, snapshot_hour, station_id
+  HAVING COUNT(*) > 1
+)
+UPDATE hourly_output_snapshots h
+   SET output_qty = dup.output_qty, good_qty = dup.good_qty, defect_qty = dup.defect_qty
+  FROM dup
+ WHERE h.id = dup.keep_id;
+
+DELETE FROM hourly_output_snapshots h
+ USING hourly_output_snapshots k
+ WHERE h.factory_id = k.factory_id AND h.snapshot_date = k.snapshot_date
+   AND h.snapshot_hour = k.snapshot_hour AND h.station_id = k.station_id AND h.id > k.id;
+
+-- ON CONFLICT 冲突键（023 建表时已有 UNIQUE 约束的库会直接复用，不重复建索引）
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_index i JOIN pg_class t ON t.oid = i.indrelid
+     WHERE t.relname = 'shift_summaries' AND i.indisunique AND i.indnatts = 5
+  ) THEN
+    CREATE UNIQUE INDEX uq_shift_summaries_key
+      ON shift_summaries(factory_id, shift_date, shift_type, station_id, work_order_id);
+  END IF;
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_index i JOIN pg_class t ON t.oid = i.indrelid
+     WHERE t.relname = 'hourly_output_snapshots' AND i.indisunique AND i.indnatts = 4
+  ) THEN
+    CREATE UNIQUE INDEX uq_hourly_output_snapshots_key
+      ON hourly_output_snapshots(factory_id, snapshot_date, snapshot_hour, station_id);
+  END IF;
+END $$;
@@ -0,0 +1,16 @@
+-- =============================================================================
+-- Migration: 067_report_rollup_watermark.sql
+-- Description: 报工汇总写后缓冲水位 — production_reports.rolled_up_at 标记已累加进
+--              班次汇总/小时快照的报工；进程崩溃丢失的缓冲从 rolled_up_at IS NULL 回放
+-- Date: 2026-10-19
+-- =============================================================================
+
+ALTER TABLE production_reports ADD COLUMN IF NOT EXISTS rolled_up_at TIMESTAMP;
+
+-- 存量报工已在请求内同步汇总过，直接推进水位，避免启动回放重复累加
+UPDATE production_reports SET rolled_up_at = created_at WHERE rolled_up_at IS NULL;
+
+-- 回放只扫未汇总的报工
+CREATE INDEX IF NOT EXISTS idx_pr_rollup_pending
+  ON production_reports(created_at)
+  WHERE rolled_up_at IS NULL;
@@ -0,0 +1,23 @@
+-- =============================================================================
+-- Migration: 068_bom_closure.sql
+-- Description: BOM 闭包表 — (型号, 祖先, 后代, 层数, 展开用量)，BOM 同步后重建；
+--              支撑多级展开、跨型号反查（where-used）与展开用量查询
+-- Date: 2026-10-19
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS enghub_bom_closure (
+  product_model VARCHAR(100) NOT NULL,
+  ancestor_part VARCHAR(100) NOT NULL,     -- 空串 = 型号本身
+  descendant_part VARCHAR(100) NOT NULL,
+  depth INT NOT NULL,                      -- 最短路径层数
+  extended_qty FLOAT NOT NULL,             -- 路径数量连乘后求和
+  PRIMARY KEY (product_model, ancestor_part, descendant_part)
+);
+
+-- 反查：某物料被哪些型号/上级使用
+CREATE INDEX IF NOT EXISTS idx_enghub_bom_closure_where_used
+  ON enghub_bom_closure(descendant_part, product_model);
+
+-- 展开：某型号/某组件下的全部后代（按层）
+CREATE INDEX IF NOT EXISTS idx_enghub_bom_closure_explode
+  ON enghub_bom_closure(product_model, ancestor_part, depth);
@@ -0,0 +1,40 @@
+-- =============================================================================
+-- Migration: 069_bom_history.sql
+-- Description: BOM 行版本历史 — 每次同步对比缓存表与当前版本，关闭变化/消失的行
+--              (valid_to) 并追加新版本；BOM 对比按时间点取版本后一次 FULL OUTER JOIN
+-- Date: 2026-10-19
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS enghub_bom_history (
+  id BIGSERIAL PRIMARY KEY,
+  source_row_id BIGINT NOT NULL,           -- 对应 bom_items.row_id
+  product_model VARCHAR(100),
+  part_number VARCHAR(100),
+  parent_part VARCHAR(100),
+  description TEXT,
+  level INT,
+  quantity FLOAT,
+  unit VARCHAR(20),
+  unit_price FLOAT,
+  valid_from TIMESTAMP NOT NULL,
+  valid_to TIMESTAMP,                      -- NULL = 当前版本
+  sync_log_id INT                          -- 写入该版本的同步记录
+);
+
+-- 按型号取某时间点的版本
+CREATE INDEX IF NOT EXISTS idx_enghub_bom_history_model_time
+  ON enghub_bom_history(product_model, valid_from, valid_to);
+
+-- 每个源行同时只有一个当前版本；同步时按 source_row_id 对比
+CREATE UNIQUE INDEX IF NOT EXISTS idx_enghub_bom_history_open
+  ON enghub_bom_history(source_row_id)
+  WHERE valid_to IS NULL;
+
+-- 以现有缓存作为初始版本
+INSERT INTO enghub_bom_history
+  (source_row_id, product_model, part_number, parent_part, description, level, quantity, unit, unit_price, valid_from)
+SELECT i.source_row_id, i.product_model, i.part_number, i.parent_part, i.description, i.level, i.quantity,
+       i.unit, i.unit_price, COALESCE(i.synced_at, NOW())
+  FROM enghub_bom_items i
+ WHERE i.source_row_id IS NOT NULL
+   AND NOT EXISTS (SELECT 1 FROM enghub_bom_history h WHERE h.source_row_id = i.source_row_id AND h.valid_to IS NULL);
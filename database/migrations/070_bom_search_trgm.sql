@@ -0,0 +1,20 @@
+-- =============================================================================
+-- Migration: 070_bom_search_trgm.sql
+-- Description: BOM 物料搜索 — pg_trgm GIN 索引，part_number / description 的
+--              ILIKE '%kw%' 子串搜索走索引（SQLite 开发库由服务按需建 FTS5 trigram 表）
+-- Date: 2026-10-19
+-- =============================================================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_enghub_bom_items_part_trgm
+  ON enghub_bom_items USING gin (part_number gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_enghub_bom_items_desc_trgm
+  ON enghub_bom_items USING gin (description gin_trgm_ops);
+
+-- 分面统计
+CREATE INDEX IF NOT EXISTS idx_enghub_bom_items_category_l1
+  ON enghub_bom_items(category_l1);
+CREATE INDEX IF NOT EXISTS idx_enghub_bom_items_component_type
+  ON enghub_bom_items(component_type);
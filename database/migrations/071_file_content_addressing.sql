@@ -0,0 +1,24 @@
+-- =============================================================================
+-- Migration: 071_file_content_addressing.sql
+-- Description: 附件内容寻址 + 断点续传 — files.sha256 记录内容哈希（同内容共用
+--              UPLOAD_DIR/sha256/ 下一个实体）；file_upload_sessions 记录续传会话
+-- Date: 2026-10-19
+-- =============================================================================
+
+ALTER TABLE files ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64);   -- 存量文件为空（仍按原路径读取）
+CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256);
+
+CREATE TABLE IF NOT EXISTS file_upload_sessions (
+    id VARCHAR(36) PRIMARY KEY,
+    filename VARCHAR(255) NOT NULL,
+    content_type VARCHAR(100),
+    total_size BIGINT,                         -- 客户端声明的总字节数
+    uploaded_by VARCHAR(50),
+    factory_id VARCHAR(50),
+    related_type VARCHAR(50),
+    related_id VARCHAR(50),
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()   -- 最近一次收到分块，超时由服务清理
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_upload_sessions_updated ON file_upload_sessions (updated_at);
@@ -0,0 +1,27 @@
+-- =============================================================================
+-- Migration: 072_export_jobs.sql
+-- Description: 报表导出后台任务 — 流式写 CSV/XLSX，记录状态与进度，
+--              完成后登记 files 记录（file_id）供下载
+-- Date: 2026-10-19
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    export_type VARCHAR(50) NOT NULL,          -- 导出数据源（work_orders/production_reports/standard_times）
+    format VARCHAR(10) NOT NULL,               -- csv / xlsx
+    params JSONB DEFAULT '{}'::jsonb,          -- 过滤条件
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',   -- pending/running/success/failed
+    total_rows INTEGER,                        -- 开始时统计的总行数（进度分母）
+    rows_written INTEGER DEFAULT 0,
+    file_id VARCHAR(36),                       -- 完成后对应的 files.id
+    error_message TEXT,
+    requested_by VARCHAR(50),
+    factory_id VARCHAR(50),
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_export_jobs_status ON export_jobs (status);
+CREATE INDEX IF NOT EXISTS idx_export_jobs_requested_by ON export_jobs (requested_by, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_export_jobs_factory ON export_jobs (factory_id);
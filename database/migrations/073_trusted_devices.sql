@@ -0,0 +1,24 @@
+-- =============================================================================
+-- Migration: 073_trusted_devices.sql
+-- Description: 车间终端登记 + 用户令牌版本
+--   - trusted_devices：仅登记且启用的设备（X-Device-Id + 设备密钥）可换取长效 refresh_token
+--   - users.token_version：改密/停用时递增，已签发的 access/refresh 令牌随之失效
+-- Date: 2026-10-19
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS trusted_devices (
+    id VARCHAR(36) PRIMARY KEY,
+    device_id VARCHAR(100) NOT NULL UNIQUE,   -- 终端上报的设备标识
+    name VARCHAR(100),
+    factory_id VARCHAR(50),
+    key_hash VARCHAR(64) NOT NULL,            -- 设备密钥 SHA-256
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    registered_by VARCHAR(50),
+    last_seen_at TIMESTAMP,
+    revoked_at TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_trusted_devices_factory ON trusted_devices (factory_id);
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
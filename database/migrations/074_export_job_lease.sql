@@ -0,0 +1,11 @@
+-- =============================================================================
+-- Migration: 074_export_job_lease.sql
+-- Description: 导出任务租约 — 执行中定时刷新 heartbeat_at；心跳过期视为执行进程已死，
+--              由启动恢复/定期巡检重新排队（attempts 达上限则记为失败）
+-- Date: 2026-10-19
+-- =============================================================================
+
+ALTER TABLE export_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP;           -- 执行进程最近一次心跳
+ALTER TABLE export_jobs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;  -- 已认领执行次数
+
+CREATE INDEX IF NOT EXISTS idx_export_jobs_status_heartbeat ON export_jobs (status, heartbeat_at);
@@ -19,6 +19,7 @@ from sqlalchemy import (
     Text,
     JSON,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import declarative_base, relationship, backref
@@ -149,6 +150,7 @@ class User(Base):
     # 密码重置相关字段（用于忘记密码功能）
     password_reset_token = Column(String(255), index=True, nullable=True, default=None)  # 重置令牌哈希
     password_reset_expires = Column(DateTime, nullable=True)  # 令牌过期时间
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")  # 改密/停用时递增，旧令牌失效
     
     # 关系
     role_obj = relationship("Role", back_populates="users", foreign_keys=[role_id])
@@ -160,6 +162,36 @@ class User(Base):
     )
 
 
+class TrustedDevice(Base):
+    """登记的车间终端：仅登记且启用的设备可换取长效 refresh_token"""
+
+    __tablename__ = "trusted_devices"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    device_id = Column(String(100), unique=True, nullable=False, index=True)  # 终端上报的 X-Device-Id
+    name = Column(String(100))
+    factory_id = Column(String(50), index=True)
+    key_hash = Column(String(64), nullable=False)  # 设备密钥 SHA-256，明文只在登记时返回一次
+    is_active = Column(Boolean, default=True, nullable=False)
+    registered_by = Column(String(50))
+    last_seen_at = Column(DateTime)
+    revoked_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "device_id": self.device_id,
+            "name": self.name,
+            "factory_id": self.factory_id,
+            "is_active": self.is_active,
+            "registered_by": self.registered_by,
+            "last_seen_at": self.last_seen_at.isoformat() if self.last_seen_at else None,
+            "revoked_at": self.revoked_at.isoformat() if self.revoked_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
 class WorkOrder(Base):
     """生产工单表"""
     
@@ -336,6 +368,7 @@ class FileRecord(Base):
     filename = Column(String(255), nullable=False)        # 原始文件名
     content_type = Column(String(100), nullable=True)     # MIME 类型
     size = Column(Integer, default=0)                     # 字节数
+    sha256 = Column(String(64), nullable=True, index=True)  # 内容哈希（内容寻址，同内容共用一个实体）
     storage_path = Column(String(500), nullable=False)    # 容器内落盘路径
     uploaded_by = Column(String(50), nullable=True)       # 上传人 username
     factory_id = Column(String(50), nullable=True, index=True)  # 所属工厂
@@ -357,10 +390,78 @@ class FileRecord(Base):
             "factory_id": self.factory_id,
             "related_type": self.related_type,
             "related_id": self.related_id,
+            "sha256": self.sha256,
             "created_at": self.created_at.strftime("%Y-%m-%d %H:%M") if self.created_at else None,
         }
 
 
+class FileUploadSession(Base):
+    """断点续传会话：分块写入 UPLOAD_DIR/partial/<id>，完成后归档为 FileRecord 并删除。"""
+    __tablename__ = "file_upload_sessions"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(100), nullable=True)
+    total_size = Column(BigInteger, nullable=True)        # 客户端声明的总字节数
+    uploaded_by = Column(String(50), nullable=True)
+    factory_id = Column(String(50), nullable=True)
+    related_type = Column(String(50), nullable=True)
+    related_id = Column(String(50), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)  # 最近一次收到分块
+
+
+class ExportJob(Base):
+    """报表导出后台任务：流式写 CSV/XLSX，完成后登记 FileRecord（file_id）。"""
+    __tablename__ = "export_jobs"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    export_type = Column(String(50), nullable=False)       # 导出数据源（work_orders/production_reports/...）
+    format = Column(String(10), nullable=False)            # csv / xlsx
+    params = Column(JSON().with_variant(JSONB, "postgresql"), default=dict)  # 过滤条件
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending/running/success/failed
+    total_rows = Column(Integer, nullable=True)            # 开始时统计的总行数（进度分母）
+    rows_written = Column(Integer, default=0)
+    file_id = Column(String(36), nullable=True)            # 完成后对应的 files.id
+    error_message = Column(Text, nullable=True)
+    requested_by = Column(String(50), nullable=True)
+    factory_id = Column(String(50), nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)         # 执行进程最近一次心跳（过期视为进程已死）
+    attempts = Column(Integer, nullable=False, default=0)  # 已认领执行次数
+
+    __table_args__ = (
+        Index("idx_export_jobs_requested_by", "requested_by", "created_at"),
+        Index("idx_export_jobs_status_heartbeat", "status", "heartbeat_at"),
+    )
+
+    def to_dict(self):
+        progress = None
+        if self.status == "success":
+            progress = 100.0
+        elif self.total_rows:
+            progress = round(min((self.rows_written or 0) / self.total_rows, 1.0) * 100, 1)
+        return {
+            "id": self.id,
+            "export_type": self.export_type,
+            "format": self.format,
+            "params": self.params or {},
+            "status": self.status,
+            "total_rows": self.total_rows,
+            "rows_written": self.rows_written or 0,
+            "progress_pct": progress,
+            "file_id": self.file_id,
+            "download_url": f"/api/v1/files/{self.file_id}" if self.file_id else None,
+            "error_message": self.error_message,
+            "requested_by": self.requested_by,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
 class Plan(Base):
     """生产计划表 (MPS)"""
     
@@ -436,6 +537,7 @@ class ProductionReport(Base):
     undone_at = Column(DateTime, nullable=True)
     undone_by = Column(String(50), nullable=True)
     # ----
+    rolled_up_at = Column(DateTime, nullable=True)  # 已累加进班次汇总/小时快照的时间（汇总水位）
     is_modified = Column(Boolean, default=False)
     modified_at = Column(DateTime)
     modified_by = Column(String(50))
@@ -599,6 +701,7 @@ class AlertIntelligenceReview(Base):
     recommended_actions = Column(Text, nullable=True)      # JSON array
     dispatch_recommendation = Column(String(100), nullable=True)
     raw_ai_response = Column(Text, nullable=True)
+    context_hash = Column(String(64), nullable=True)       # 上下文哈希（审查结论缓存键）
     status = Column(String(20), default="pending")         # pending/acknowledged/dismissed/acted
     acknowledged_by = Column(String(50), nullable=True)
     acknowledged_at = Column(DateTime, nullable=True)
@@ -703,6 +806,27 @@ class LineBalanceAnalysis(Base):
     updated_by = Column(String(50))
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "factory_id": self.factory_id,
+            "product_id": self.product_id,
+            "line_id": self.line_id,
+            "analysis_date": self.analysis_date.isoformat() if self.analysis_date else None,
+            "takt_time_min": self.takt_time_min,
+            "cycle_time_max": self.cycle_time_max,
+            "cycle_time_avg": self.cycle_time_avg,
+            "balance_rate": self.balance_rate,
+            "idle_time_total": self.idle_time_total,
+            "workstation_count": self.workstation_count,
+            "is_balanced": self.is_balanced,
+            "station_details": self.workstation_details or [],
+            "bottleneck_station": self.bottleneck_station,
+            "bottleneck_time": self.bottleneck_time,
+            "recommendations": self.recommendations or [],
+            "created_by": self.created_by,
+        }
+
 
 class ProcessAnalysis(Base):
     """工序分析记录"""
@@ -891,6 +1015,11 @@ class ShiftSummary(Base):
     """班次汇总记录"""
     
     __tablename__ = "shift_summaries"
+    __table_args__ = (
+        # 报工原子累加的 ON CONFLICT 冲突键
+        UniqueConstraint("factory_id", "shift_date", "shift_type", "station_id", "work_order_id",
+                         name="uq_shift_summaries_key"),
+    )
     
     id = Column(String(36), primary_key=True, default=generate_uuid)
     factory_id = Column(String(50), nullable=False, index=True)
@@ -1364,6 +1493,43 @@ class TMSWebhookSubscription(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
+class TMSEventOutbox(Base):
+    """TMS 事件 Outbox - 与业务变更同事务写入，由后台投递器扇出"""
+
+    __tablename__ = "tms_event_outbox"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    event_id = Column(String(32), unique=True, nullable=False)
+    event_type = Column(String(50), nullable=False)
+    source = Column(String(100))
+    payload = Column(JSON().with_variant(JSONB, "postgresql"), nullable=False, default=dict)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    fanned_out_at = Column(DateTime)  # 已展开为投递行的时间
+
+
+class TMSWebhookDelivery(Base):
+    """TMS Webhook 投递 - 每事件每订阅一行，status=dead 为死信"""
+
+    __tablename__ = "tms_webhook_deliveries"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    outbox_id = Column(BigInteger, ForeignKey("tms_event_outbox.id", ondelete="CASCADE"), nullable=False)
+    subscription_id = Column(String(36), nullable=False)
+    agent_id = Column(String(100), nullable=False)
+    webhook_url = Column(String(500), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending / delivered / dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = Column(DateTime)  # 认领租约
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    delivered_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("outbox_id", "subscription_id", name="uq_tms_delivery_event_sub"),
+    )
+
+
 # ==================== v2.5 Data Consistency Models ====================
 
 class DefectRecord(Base):
@@ -1807,6 +1973,55 @@ class EngHubBomItem(Base):
     )
 
 
+class EngHubBomClosure(Base):
+    """BOM 闭包表（同步后由 BomSyncService 重建）
+
+    每个型号内 祖先物料 → 后代物料 一行；ancestor_part 为空串表示型号本身（顶层）。
+    extended_qty 为沿所有路径数量连乘后求和（1 个祖先需要多少个后代）。
+    """
+    __tablename__ = "enghub_bom_closure"
+
+    product_model = Column(String(100), primary_key=True)
+    ancestor_part = Column(String(100), primary_key=True)
+    descendant_part = Column(String(100), primary_key=True)
+    depth = Column(Integer, nullable=False)          # 最短路径层数
+    extended_qty = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("idx_enghub_bom_closure_where_used", "descendant_part", "product_model"),
+        Index("idx_enghub_bom_closure_explode", "product_model", "ancestor_part", "depth"),
+    )
+
+
+class EngHubBomHistory(Base):
+    """BOM 行版本历史（同步时由 BomSyncService 追加，只增不删）
+
+    同一源行 (source_row_id) 内容变化时关闭旧版本（valid_to）并追加新版本；
+    时间点 T 的 BOM = valid_from <= T 且 (valid_to 为空 或 valid_to > T) 的行。
+    """
+    __tablename__ = "enghub_bom_history"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    source_row_id = Column(BigInteger, nullable=False)
+    product_model = Column(String(100))
+    part_number = Column(String(100))
+    parent_part = Column(String(100))
+    description = Column(Text)
+    level = Column(Integer)
+    quantity = Column(Float)
+    unit = Column(String(20))
+    unit_price = Column(Float)
+    valid_from = Column(DateTime, nullable=False)
+    valid_to = Column(DateTime)                      # 空 = 当前版本
+    sync_log_id = Column(Integer)                    # 写入该版本的同步记录
+
+    __table_args__ = (
+        Index("idx_enghub_bom_history_model_time", "product_model", "valid_from", "valid_to"),
+        Index("idx_enghub_bom_history_open", "source_row_id", unique=True,
+              postgresql_where=text("valid_to IS NULL"), sqlite_where=text("valid_to IS NULL")),
+    )
+
+
 class QmsInspectionItem(Base):
     """QMS检验项记录"""
     
@@ -1888,6 +2103,7 @@ class QmsSpcPoint(Base):
     lcl = Column(Float)  # 下控制限
     cl = Column(Float)  # 中心线
     is_out_of_control = Column(Boolean, default=False)  # 是否失控
+    ooc_rules = Column(String(100), nullable=True)  # 命中的判异规则（逗号分隔）
     measured_at = Column(DateTime, nullable=False)  # 测量时间
     measured_by = Column(String(50))  # 测量人
     
@@ -2071,6 +2287,10 @@ class HourlyOutputSnapshot(Base):
     """小时产出快照"""
     
     __tablename__ = "hourly_output_snapshots"
+    __table_args__ = (
+        UniqueConstraint("factory_id", "snapshot_date", "snapshot_hour", "station_id",
+                         name="uq_hourly_output_snapshots_key"),
+    )
     
     id = Column(String(36), primary_key=True, default=generate_uuid)
     factory_id = Column(String(50), nullable=False, index=True)  # 工厂
@@ -38,6 +38,7 @@ from api.routes.production_dashboard_routes import router as production_dashboar
 from api.routes.search_routes import router as search_router
 from api.routes.code_table_routes import router as code_table_router
 from api.routes.file_routes import router as file_router
+from api.routes.export_routes import router as export_router
 from api.routes.routing_template_routes import router as routing_template_router
 from api.routes.alert_intelligence_routes import router as alert_intelligence_router
 from api.routes.aps_routes import router as aps_router
@@ -91,6 +92,7 @@ app.include_router(equipment_router)  # 设备 TPM
 app.include_router(search_router)  # 全站系统搜索
 app.include_router(code_table_router)  # 统一码表/基础数据管理
 app.include_router(file_router)  # 文件/附件上传下载（chatbot 多模态 + 表单/报告导出）
+app.include_router(export_router)  # 大报表流式导出后台任务（CSV/XLSX）
 app.include_router(routing_template_router)  # 工艺路线模板 CRUD（016 工序流转）
 app.include_router(alert_intelligence_router)  # 预警情报审查（017 Chatbot 主动智能）
 app.include_router(production_phase1_router)  # 岗位替代 Phase 1: 报工终端/实时看板/报表中心
@@ -147,6 +149,14 @@ async def _periodic_scheduler():
         except Exception as e:
             _logger.warning(f"[scheduler] 安灯巡检异常: {e}")
 
+        # SPC 运行统计落库（流式采集的内存增量合并到 spc_running_stats）
+        try:
+            from api.services.spc_service import flush_running_stats
+            async with db_config.session_factory() as db:
+                await flush_running_stats(db)
+        except Exception as e:
+            _logger.warning(f"[scheduler] SPC 统计落库异常: {e}")
+
         # 预警巡检（工单超时 + 安灯未响应）—— 每 30 分钟跑一次（避免频繁调 LLM）
         try:
             import time as _t
@@ -335,6 +345,22 @@ async def _start_scheduler():
     from api.services.followup_task_service import followup_scanner_loop
     asyncio.create_task(followup_scanner_loop())
 
+    # TMS 事件 Outbox 投递：Webhook 并发推送/退避重试/死信（TMS_WEBHOOK_DISPATCHER_ENABLED=0 可关）
+    from core.tms.webhook_dispatcher import webhook_dispatcher_loop
+    asyncio.create_task(webhook_dispatcher_loop())
+
+    # 报工汇总写后缓冲：班次汇总/小时快照批量刷写 + 崩溃回放（REPORT_ROLLUP_BUFFER_ENABLED=0 可关）
+    from api.services.report_rollup_service import report_rollup_loop
+    asyncio.create_task(report_rollup_loop())
+
+    # 报表导出任务恢复：接手重启前遗留/执行进程已死的导出任务（EXPORT_RECOVERY_ENABLED=0 可关）
+    from api.services.export_job_service import export_recovery_loop
+    asyncio.create_task(export_recovery_loop())
+
+    # BOM 物料搜索：SQLite 库建 FTS5 trigram 表（PostgreSQL 由迁移 070 建 pg_trgm 索引）
+    from api.services.bom_service import ensure_search_index
+    await ensure_search_index()
+
 
 # ---------- 前端静态托管（FastAPI 同源服务，替代 nginx） ----------
 FRONTEND_DIST = Path(os.environ.get("FRONTEND_DIST", str(Path(__file__).parent / "frontend_dist")))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+装配线平衡求解器基准（core/ie/line_balancing.py）
+
+读取 Scholl 经典数据集的 .IN2 文件（SALBP 数据集：https://assembly-line-balancing.de），逐个实例在
+时间预算内求解 SALBP-1（给定节拍）与 SALBP-2（给定工站数），输出下界、结果、是否证明最优、节点数与耗时。
+缺省读仓库内 data/salbp（已知最优值见 tests/unit/ie/test_line_balancing.py），完整数据集下载后用 --data-dir 指定。
+
+用法：
+    python scripts/benchmark_line_balancing.py
+    python scripts/benchmark_line_balancing.py --data-dir data/SALBP --cycles 7,10,14 --stations 3,5 --time-limit 5
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.insert(0, ".")
+
+from core.ie.line_balancing import BalanceTask, parse_in2, solve_salbp1, solve_salbp2
+
+
+def load_instances(data_dir: str) -> List[Tuple[str, List[BalanceTask]]]:
+    files = sorted(Path(data_dir).glob("*.IN2")) + sorted(Path(data_dir).glob("*.in2"))
+    if not files:
+        sys.exit(f"{data_dir} 下没有 .IN2 文件")
+    return [(f.stem.upper(), parse_in2(f.read_text(encoding="latin-1"))) for f in files]
+
+
+def _ints(value: str) -> List[int]:
+    return [int(x) for x in value.split(",") if x.strip()] if value else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SALBP 求解器基准")
+    parser.add_argument("--data-dir", default="data/salbp", help="Scholl .IN2 文件目录，缺省 data/salbp")
+    parser.add_argument("--cycles", default="", help="SALBP-1 节拍列表，缺省取 最长作业时间 ×1/1.5/2/3")
+    parser.add_argument("--stations", default="", help="SALBP-2 工站数列表，缺省 3,5,8")
+    parser.add_argument("--time-limit", type=float, default=2.0, help="每次求解的时间预算（秒）")
+    args = parser.parse_args()
+
+    header = f"{'instance':<12}{'n':>5}  {'type':<8}{'param':>8}{'LB':>10}{'result':>10}  {'optimal':<8}{'nodes':>10}{'ms':>10}"
+    print(header)
+    print("-" * len(header))
+    runs = proven = 0
+    started = time.perf_counter()
+    for name, tasks in load_instances(args.data_dir):
+        t_max = max(t.time for t in tasks)
+        cycles = _ints(args.cycles) or sorted({int(t_max * k) for k in (1, 1.5, 2, 3)})
+        for c in cycles:
+            if c < t_max:
+                continue
+            r = solve_salbp1(tasks, c, time_limit=args.time_limit)
+            runs, proven = runs + 1, proven + r.optimal
+            print(f"{name:<12}{len(tasks):>5}  {'SALBP-1':<8}{c:>8}{r.lower_bound:>10}{r.station_count:>10}  "
+                  f"{str(r.optimal):<8}{r.nodes:>10}{r.elapsed_ms:>10.1f}")
+        for m in _ints(args.stations) or [3, 5, 8]:
+            r = solve_salbp2(tasks, m, time_limit=args.time_limit)
+            runs, proven = runs + 1, proven + r.optimal
+            print(f"{name:<12}{len(tasks):>5}  {'SALBP-2':<8}{m:>8}{r.lower_bound:>10g}{r.cycle_time:>10g}  "
+                  f"{str(r.optimal):<8}{r.nodes:>10}{r.elapsed_ms:>10.1f}")
+    print("-" * len(header))
+    print(f"{runs} 次求解，{proven} 次在预算内证明最优，总耗时 {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
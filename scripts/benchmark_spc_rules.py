@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+SPC 判异规则引擎基准（api/services/spc_rules.py）
+
+1. 向量化整厂判异：随机生成 C 个特性 × W 点窗口，evaluate_windows 一次评估全部规则
+2. 逐点增量判异：同样数据逐点喂给 SpcRuleState，给出单点平均耗时
+3. 指定 --factory-id 时再对库跑一次 SpcService.evaluate_rules（含取数，需 DATABASE_URL）
+
+请求目标：5k 特性整厂评估远低于 1 秒。
+
+用法：
+    python scripts/benchmark_spc_rules.py
+    python scripts/benchmark_spc_rules.py --characteristics 5000 --window 50 --repeat 5
+    python scripts/benchmark_spc_rules.py --factory-id F01
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, ".")
+
+from api.services.spc_rules import SpcRuleState, evaluate_windows, summarize_hits
+
+
+def bench_vectorized(values: np.ndarray, cl: np.ndarray, sigma: np.ndarray, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hits = evaluate_windows(values, cl, sigma)
+        summarize_hits([f"C{i}" for i in range(len(values))], hits)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_incremental(values: np.ndarray, cl: np.ndarray, sigma: np.ndarray) -> float:
+    started = time.perf_counter()
+    for row, c, s in zip(values, cl, sigma):
+        state = SpcRuleState()
+        for v in row:
+            state.push(float(v), float(c), float(s))
+    return time.perf_counter() - started
+
+
+async def bench_database(factory_id: str, window: int) -> dict:
+    from api.services.spc_service import SpcService
+    from database.db_config import db_config
+
+    await db_config.init_db()
+    try:
+        async with db_config.session_factory() as session:
+            started = time.perf_counter()
+            result = await SpcService(session).evaluate_rules(factory_id, window)
+            result["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return result
+    finally:
+        await db_config.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SPC 判异规则引擎基准")
+    parser.add_argument("--characteristics", type=int, default=5000, help="特性数，缺省 5000")
+    parser.add_argument("--window", type=int, default=50, help="每个特性的窗口点数，缺省 50")
+    parser.add_argument("--repeat", type=int, default=5, help="向量化评估重复次数，取最快一次")
+    parser.add_argument("--factory-id", default="", help="指定时对库中该工厂跑 evaluate_rules")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(2026)
+    values = rng.normal(0, 1, size=(args.characteristics, args.window))
+    cl = rng.normal(0, 0.1, size=args.characteristics)
+    sigma = np.full(args.characteristics, 1.0)
+    points = args.characteristics * args.window
+
+    vec = bench_vectorized(values, cl, sigma, args.repeat)
+    print(f"向量化整厂判异：{args.characteristics} 特性 × {args.window} 点，最快 {vec * 1000:.1f} ms")
+    inc = bench_incremental(values, cl, sigma)
+    print(f"逐点增量判异：{points} 点，总 {inc * 1000:.1f} ms，单点 {inc / points * 1e6:.2f} µs")
+
+    if args.factory_id:
+        result = asyncio.run(bench_database(args.factory_id, args.window))
+        print(f"库内 evaluate_rules：{result['evaluated']} 特性，命中 {len(result['hits'])}，"
+              f"判异 {result['elapsed_ms']} ms，含取数 {result['total_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+预警巡检单元测试 - 并发扫描 / 按来源隔离写入 / 上下文去重与结论缓存 / 共享 LLM 客户端 / 审查微批
+"""
+
+import asyncio
+import contextlib
+import json
+import re
+import uuid
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from unittest.mock import AsyncMock, MagicMock
+
+from api.services import alert_intelligence_service as ais
+from database.models import AlertIntelligenceReview
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache(monkeypatch):
+    monkeypatch.setattr(ais, "_verdict_cache", ais.OrderedDict())
+
+
+def _scanner(source, contexts, overlap=None):
+    async def scan(db, factory_id, now):
+        if overlap is not None:
+            overlap["now"] += 1
+            overlap["peak"] = max(overlap["peak"], overlap["now"])
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            overlap["now"] -= 1
+        return [ais.AlertCandidate(source, f"{source}-{i}", f"C{i}", ctx) for i, ctx in enumerate(contexts)]
+    scan.__name__ = f"scan_{source}"
+    return scan
+
+
+@pytest.mark.asyncio
+async def test_patrol_scans_concurrently_and_reviews_each_context_once(mock_db_session, monkeypatch):
+    """测试：各来源并发扫描；相同上下文只审一次，按来源成批送审且在途批次受限；第二次巡检全部命中结论缓存"""
+    overlap = {"now": 0, "peak": 0}
+    monkeypatch.setattr(ais, "PATROL_SCANNERS", (
+        _scanner("andon", ["停线 A", "停线 A", "停线 B"], overlap),
+        _scanner("inventory", ["缺料 X"], overlap),
+        _scanner("wo_timeout", ["超期 W1", "超期 W2", "超期 W3"], overlap),
+    ))
+    monkeypatch.setattr(ais, "review_batcher", ais.ReviewBatcher(window=0.01, concurrency=2))
+    in_flight, peak, prompts, batches = 0, 0, [], []
+
+    async def fake_batch(contexts, source):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        prompts.extend(contexts)
+        batches.append(source)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return [{"severity": "high", "root_causes": [], "actions": [], "dispatch_to": "x", "_raw": "{}"}] * len(contexts)
+
+    monkeypatch.setattr(ais, "_call_llm_for_batch", fake_batch)
+    empty = MagicMock()
+    empty.scalars.return_value.all.return_value = []
+    mock_db_session.execute.return_value = empty
+    mock_db_session.add_all = MagicMock()
+
+    result = await ais.patrol(mock_db_session, "F1", session_factory=lambda: contextlib.nullcontext(MagicMock()))
+
+    assert overlap["peak"] == 3  # 三个来源的扫描同时在途（串行时峰值为 1）
+    assert result["alerts_found"] == 7 and result["by_source"]["andon"] == 3
+    assert sorted(prompts) == sorted({"停线 A", "停线 B", "缺料 X", "超期 W1", "超期 W2", "超期 W3"})
+    assert sorted(batches) == ["andon", "inventory", "wo_timeout"]
+    assert peak == 2
+    rows = [r for call in mock_db_session.add_all.call_args_list for r in call.args[0]]
+    assert len(rows) == 7 and all(r.context_hash for r in rows)
+    assert mock_db_session.add_all.call_count == 3 and result["reviews_created"] == 7
+    mock_db_session.commit.assert_awaited_once()
+
+    prompts.clear()
+    again = await ais.patrol(mock_db_session, "F1", session_factory=lambda: contextlib.nullcontext(MagicMock()))
+    assert prompts == [] and again["cached_verdicts"] == 7
+
+
+@pytest.mark.asyncio
+async def test_llm_review_reuses_shared_client_and_does_not_cache_fallback(monkeypatch):
+    """测试：审查复用同一个连接池客户端；网关失败走规则兜底且兜底结论不进缓存"""
+    statuses = iter([200, 503])
+
+    def handler(request):
+        status = next(statuses)
+        body = {"choices": [{"message": {"content": '{"severity": "low", "actions": []}'}}]}
+        return httpx.Response(status, json=body)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(ais, "_llm_client", client)
+
+    ok = await ais._call_llm_for_review("停线", "andon")
+    fallback = await ais._call_llm_for_review("停线", "andon")
+    assert ais._get_llm_client() is client
+    await client.aclose()
+
+    assert ok["severity"] == "low" and not ok.get("_fallback")
+    assert fallback["_fallback"] and fallback["severity"] == "critical"
+    ais._remember_verdict("h1", ok)
+    ais._remember_verdict("h2", fallback)
+    assert list(ais._verdict_cache) == ["h1"]
+
+
+@pytest.mark.asyncio
+async def test_batcher_packs_related_alerts_into_few_gateway_calls(monkeypatch):
+    """测试：200 条相关预警（120 种上下文）合成 2 次网关调用；缺失条目与网关超时逐条规则兜底"""
+    calls = []
+
+    async def handler(request):
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        indices = [int(i) for i in re.findall(r"【预警 (\d+)】", prompt)]
+        calls.append(len(indices))
+        if len(calls) > 2:
+            await asyncio.sleep(0.5)  # 网关变慢
+        items = [{"index": i, "severity": "medium", "root_causes": [], "actions": [], "dispatch_to": f"组{i}"}
+                 for i in indices if i != 2]
+        # 越界/非整数 index、未知 severity 的条目丢弃，重复 index 取第一条
+        items += [{"index": 999, "severity": "low"}, {"index": "3", "severity": "low"}, {"index": True, "severity": "low"},
+                  {"index": 4, "severity": "urgent!"}, {"index": 1, "severity": "low", "dispatch_to": "重复"}]
+        items[3]["severity"] = " HIGH "
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({"items": items})}}]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(ais, "_llm_client", client)
+    batcher = ais.ReviewBatcher(window=0.05, max_items=100, concurrency=4)
+
+    verdicts = await asyncio.gather(*(
+        batcher.review("F1", "inventory", f"缺料 M{i % 120}") for i in range(200)
+    ))
+
+    assert sorted(calls) == [20, 100]
+    assert batcher.stats() == {"batches_sent": 2, "items_sent": 120}
+    assert verdicts[0]["dispatch_to"] == "组1" and verdicts[0]["severity"] == "medium"
+    assert verdicts[4]["severity"] == "high"  # 第 5 条的 severity 大小写/空白归一
+    assert verdicts[1]["_fallback"] and verdicts[121]["_fallback"]  # 第 2 条没有返回结论
+    assert verdicts[5] is verdicts[125]
+
+    monkeypatch.setattr(ais, "REVIEW_BATCH_TIMEOUT", 0.05)
+    slow = await asyncio.gather(*(batcher.review("F1", "andon", f"停线 {i}") for i in range(3)))
+    await client.aclose()
+    assert all(v["_fallback"] for v in slow)
+
+
+@pytest_asyncio.fixture
+async def review_db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'alerts.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: AlertIntelligenceReview.metadata.create_all(
+            c, tables=[AlertIntelligenceReview.__table__]))
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_patrol_isolates_failing_source_and_hashes_stable_context(review_db, monkeypatch):
+    """测试：某来源审查写入失败只回滚该来源；剩余时长变化不改变上下文哈希，结论缓存可复用"""
+    bad = ais.AlertCandidate("equipment", None, "EQ-1", "停机")  # alert_ref_id 非空约束失败
+
+    async def scan_bad(db, factory_id, now):
+        return [bad]
+
+    async def scan_ok(db, factory_id, now):
+        return [ais.AlertCandidate("inventory", "th-1", "M-1", "缺料 M-1")]
+
+    monkeypatch.setattr(ais, "PATROL_SCANNERS", (scan_bad, scan_ok))
+
+    async def fake_review(db, factory_id, candidates):
+        return [{"severity": "low", "_raw": "{}"}] * len(candidates), {"cached_verdicts": 0, "llm_reviews": 1}
+
+    monkeypatch.setattr(ais, "_review_candidates", fake_review)
+    result = await ais.patrol(review_db, "F1", session_factory=lambda: contextlib.nullcontext(MagicMock()))
+
+    assert result["reviews_created"] == 1 and result["failed_sources"] == ["equipment"]
+    rows = (await review_db.execute(select(AlertIntelligenceReview))).scalars().all()
+    assert [(r.alert_source, r.alert_ref_id) for r in rows] == [("inventory", "th-1")]
+
+    threshold_id = uuid.uuid4()
+    shortage = MagicMock()
+    shortage.fetchall.return_value = [(threshold_id, "M-1", 10, 20, 5)]
+    (candidate,) = await ais._scan_shortages(MagicMock(execute=AsyncMock(return_value=shortage)), "F1", None)
+    assert candidate.ref_id == str(threshold_id)
+
+    def overdue_candidate(hours_left):
+        wo = SimpleNamespace(id=7, work_order_code="WO-7", process_code="P1", work_center="WC",
+                             planned_due=datetime(2026, 1, 2, 12), planned_qty=10, completed_qty=3, priority=2)
+        scalars = MagicMock()
+        scalars.scalars.return_value.all.return_value = [wo]
+        db = MagicMock()
+        db.execute = AsyncMock(return_value=scalars)
+        return ais._scan_overdue_work_orders(db, "F1", wo.planned_due - timedelta(hours=hours_left))
+
+    (early,), (later,) = await overdue_candidate(20), await overdue_candidate(3.5)
+    assert early.context != later.context and early.context_hash == later.context_hash
+    assert "3.5 小时" in later.context
+
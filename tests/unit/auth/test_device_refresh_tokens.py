@@ -0,0 +1,121 @@
+"""
+设备长效刷新令牌单元测试 - 仅登记设备签发 / 刷新校验设备密钥 / 改密、停用、设备停用后失效
+"""
+
+from types import SimpleNamespace
+
+import bcrypt
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from jose import jwt
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.routes import auth_routes
+from api.routes.auth_routes import RefreshTokenRequest
+from api.services.user_service import UserService
+from core.auth import security
+from database.models import TrustedDevice, User
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(security, "BCRYPT_ROUNDS", 4)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'auth.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: User.metadata.create_all(c, tables=[User.__table__, TrustedDevice.__table__]))
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        session.add(User(
+            id="u-1", username="op1", email="op1@example.com", factory_id="F1", role="operator",
+            hashed_password=bcrypt.hashpw(b"secret1", bcrypt.gensalt(4)).decode(),
+        ))
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+
+async def _login(db, device_id=None, device_key=None):
+    form = SimpleNamespace(username="op1", password="secret1")
+    return await auth_routes.login(form_data=form, db=db, x_device_id=device_id, x_device_key=device_key)
+
+
+async def _refresh(db, token, device_id=None, device_key=None):
+    return await auth_routes.refresh_token(
+        RefreshTokenRequest(refresh_token=token), db=db, x_device_id=device_id, x_device_key=device_key,
+    )
+
+
+def _claims(token):
+    return jwt.get_unverified_claims(token)
+
+
+@pytest.mark.asyncio
+async def test_long_lived_token_only_for_registered_device(db):
+    """测试：未登记设备只拿普通会话令牌；登记设备凭密钥拿到绑定设备的长效令牌并可滑动续期"""
+    unknown = await _login(db, device_id="TERM-01", device_key="guess")
+    assert "device_id" not in _claims(unknown.refresh_token)
+
+    device, key = await UserService(db).register_device("TERM-01", "装配线终端", "F1", "admin")
+    wrong_key = await _login(db, device_id="TERM-01", device_key="guess")
+    assert "device_id" not in _claims(wrong_key.refresh_token)
+
+    issued = await _login(db, device_id="TERM-01", device_key=key)
+    claims = _claims(issued.refresh_token)
+    assert claims["device_id"] == "TERM-01" and claims["ver"] == 0
+    assert claims["exp"] - _claims(unknown.refresh_token)["exp"] > 20 * 86400
+
+    renewed = await _refresh(db, issued.refresh_token, "TERM-01", key)
+    assert _claims(renewed.refresh_token)["device_id"] == "TERM-01"
+    assert (await db.get(TrustedDevice, device.id)).last_seen_at is not None
+
+
+@pytest.mark.asyncio
+async def test_refresh_rejects_device_mismatch_and_missing_key(db):
+    """测试：令牌里的 device_id 可读，但没有设备密钥或换设备刷新一律 401；其他工厂的设备不签长效令牌"""
+    _, key = await UserService(db).register_device("TERM-01", None, "F1", "admin")
+    _, other_key = await UserService(db).register_device("TERM-02", None, "F1", "admin")
+    token = (await _login(db, "TERM-01", key)).refresh_token
+
+    for device_id, device_key in [(None, None), ("TERM-01", None), ("TERM-01", other_key), ("TERM-02", other_key)]:
+        with pytest.raises(HTTPException) as exc:
+            await _refresh(db, token, device_id, device_key)
+        assert exc.value.status_code == 401
+
+    _, f2_key = await UserService(db).register_device("TERM-F2", None, "F2", "admin")
+    assert "device_id" not in _claims((await _login(db, "TERM-F2", f2_key)).refresh_token)
+
+
+@pytest.mark.asyncio
+async def test_password_change_disable_and_device_revocation_invalidate_tokens(db):
+    """测试：改密/停用递增 token_version，旧 refresh 与 access 失效；设备停用后其长效令牌无法续期"""
+    service = UserService(db)
+
+    async def by_username(_):  # get_user_by_id 按 PG UUID 绑定参数，SQLite 下查不到
+        return await service.get_user_by_username("op1")
+    service.get_user_by_id = by_username
+
+    device, key = await service.register_device("TERM-01", None, "F1", "admin")
+    device_token = (await _login(db, "TERM-01", key)).refresh_token
+    session = await _login(db)
+
+    await service.revoke_device(device.id)
+    with pytest.raises(HTTPException):
+        await _refresh(db, device_token, "TERM-01", key)
+    assert "device_id" not in _claims((await _login(db, "TERM-01", key)).refresh_token)
+
+    user = await service.update_user("u-1", password="secret2")
+    assert user.token_version == 1
+    with pytest.raises(HTTPException) as exc:
+        await _refresh(db, session.refresh_token, None, None)
+    assert exc.value.detail == "令牌已失效，请重新登录"
+    with pytest.raises(HTTPException):
+        await security.get_current_user(token=session.access_token, db=db)
+
+    user.hashed_password = bcrypt.hashpw(b"secret1", bcrypt.gensalt(4)).decode()
+    await db.commit()
+    fresh = await _login(db)
+    assert (await security.get_current_user(token=fresh.access_token, db=db)).username == "op1"
+    await service.delete_user(user.id)
+    assert user.token_version == 2
+    with pytest.raises(HTTPException):
+        await _refresh(db, fresh.refresh_token, None, None)
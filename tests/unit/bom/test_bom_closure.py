@@ -0,0 +1,86 @@
+"""
+BOM 闭包单元测试 - 展开用量 / 反查 / 树缓存按同步版本失效
+"""
+
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.services import bom_service
+from api.services.bom_service import BomService
+from api.services.bom_sync_service import BomSyncService
+from database.models import EngHubBomClosure, EngHubBomItem, EngHubBomSyncLog
+
+# M1: A ─┬─ B ×2 ── C ×3
+#        └─ C ×1            → 每台 M1 需要 C = 2×3 + 1 = 7
+# M2: C ×4
+ITEMS = [
+    ("M1", "A", None, 1, 1.0, 100.0),
+    ("M1", "B", "A", 2, 2.0, 10.0),
+    ("M1", "C", "B", 3, 3.0, 1.0),
+    ("M1", "C", "A", 2, 1.0, 1.0),
+    ("M2", "C", None, 1, 4.0, 1.0),
+]
+
+
+@pytest_asyncio.fixture
+async def bom_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(bom_service, "_tree_cache", bom_service.OrderedDict())
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'closure.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: EngHubBomItem.metadata.create_all(
+            c, tables=[EngHubBomItem.__table__, EngHubBomSyncLog.__table__, EngHubBomClosure.__table__]))
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as db:
+        db.add_all(
+            EngHubBomItem(source_row_id=i, product_model=m, part_number=p, parent_part=parent,
+                          level=lvl, quantity=qty, unit_price=price)
+            for i, (m, p, parent, lvl, qty, price) in enumerate(ITEMS, 1)
+        )
+        await db.commit()
+        await BomSyncService(db).rebuild_closure()
+        yield db
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_explode_multiplies_quantities_along_paths(bom_db):
+    """测试：展开用量沿路径连乘、多路径求和；从组件展开只含其后代"""
+    service = BomService(bom_db)
+    full = {i["part_number"]: i for i in (await service.explode("M1"))["items"]}
+
+    assert {p: (i["depth"], i["extended_qty"]) for p, i in full.items()} == {
+        "A": (1, 1.0), "B": (2, 2.0), "C": (2, 7.0)}
+    assert full["B"]["extended_cost"] == 20.0
+    sub = await service.explode("M1", part_number="B")
+    assert [(i["part_number"], i["extended_qty"]) for i in sub["items"]] == [("C", 3.0)]
+    assert await service.get_extended_quantity("M1", "C", ancestor_part="A") == 7.0
+
+
+@pytest.mark.asyncio
+async def test_where_used_spans_all_models(bom_db):
+    """测试：反查覆盖全部型号，带每台用量与直接上级；物料详情用量取自闭包"""
+    service = BomService(bom_db)
+    usages = {u["model_name"]: u for u in (await service.where_used("C"))["usages"]}
+
+    assert usages["M1"]["extended_qty"] == 7.0 and sorted(usages["M1"]["parents"]) == ["A", "B"]
+    assert usages["M2"]["extended_qty"] == 4.0 and usages["M2"]["parents"] == []
+    detail = await service.get_material_detail("C")
+    assert detail["used_in_models"] == ["M1", "M2"] and detail["usage_count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_tree_cache_reused_until_next_sync(bom_db):
+    """测试：同步前重复请求返回同一份序列化结果；新的成功同步后重新组树"""
+    service = BomService(bom_db)
+    first = await service.get_bom_tree_json("M1")
+    assert await service.get_bom_tree_json("M1") is first
+    assert (await service.get_bom_tree("M1"))["tree"][0]["children"][0]["part_number"] == "B"
+
+    bom_db.add(EngHubBomItem(source_row_id=9, product_model="M1", part_number="D", parent_part="A", level=2))
+    bom_db.add(EngHubBomSyncLog(sync_type="incremental", status="success", watermark=datetime(2026, 1, 1)))
+    await bom_db.commit()
+    refreshed = await service.get_bom_tree_json("M1")
+    assert refreshed is not first and b'"D"' in refreshed
@@ -0,0 +1,97 @@
+"""
+BOM 物料搜索单元测试 - FTS5 trigram 子串匹配 / 键集分页 / 封顶计数 / 分面
+"""
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, select, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.services import bom_service
+from api.services.bom_service import BomService
+from database.models import EngHubBomItem
+
+
+@pytest_asyncio.fixture
+async def search_db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'search.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: EngHubBomItem.metadata.create_all(c, tables=[EngHubBomItem.__table__]))
+    assert await bom_service.ensure_search_index(engine)   # 启动时建 FTS 表
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as db:
+        db.add_all(
+            EngHubBomItem(source_row_id=i, product_model=f"M{i % 2}", part_number=f"RES-{i:04d}",
+                          description=f"Chip Resistor 10K {i}", category_l1="被动" if i % 3 else "电阻",
+                          component_type="SMD" if i % 4 else "DIP")
+            for i in range(1, 13)
+        )
+        db.add(EngHubBomItem(source_row_id=99, product_model="M0", part_number="CAP-0001",
+                             description="100%_ceramic cap", category_l1="电容", component_type="SMD"))
+        await db.commit()
+        yield db
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_search_pages_by_cursor_with_facets(search_db):
+    """测试：子串不分大小写命中描述；键集翻页不重不漏、只在首页计数；分面各自排除本维度筛选"""
+    service = BomService(search_db)
+    first = page = await service.search_materials("resistor", limit=5)
+    seen = [i["part_number"] for i in page["items"]]
+    while page["next_cursor"] is not None:
+        page = await service.search_materials("resistor", limit=5, cursor=page["next_cursor"])
+        assert page["total"] is None and page["facets"] is None   # 后续页不重复计数
+        seen += [i["part_number"] for i in page["items"]]
+    assert seen == [f"RES-{i:04d}" for i in range(1, 13)]
+    assert first["total"] == 12 and first["total_exact"]
+
+    filtered = await service.search_materials("res-00", category_l1="电阻")
+    assert [i["part_number"] for i in filtered["items"]] == ["RES-0003", "RES-0006", "RES-0009", "RES-0012"]
+    assert filtered["facets"]["category_l1"] == [{"value": "被动", "count": 8}, {"value": "电阻", "count": 4}]
+    assert filtered["facets"]["component_type"] == [{"value": "SMD", "count": 3}, {"value": "DIP", "count": 1}]
+
+
+@pytest.mark.asyncio
+async def test_search_caps_count_and_tracks_updates(search_db, monkeypatch):
+    """测试：总数封顶；索引随更新同步；通配符按字面匹配；短关键词退回 LIKE"""
+    monkeypatch.setattr(bom_service, "SEARCH_COUNT_CAP", 10)
+    service = BomService(search_db)
+    capped = await service.search_materials("chip")
+    assert capped["total"] == 10 and not capped["total_exact"]
+
+    await search_db.execute(update(EngHubBomItem).where(EngHubBomItem.part_number == "RES-0001")
+                            .values(description="Ferrite bead"))
+    await search_db.commit()
+    assert [i["part_number"] for i in (await service.search_materials("ferrite"))["items"]] == ["RES-0001"]
+    assert (await service.search_materials("chip"))["total"] == 10
+    assert [i["part_number"] for i in (await service.search_materials("%_"))["items"]] == ["CAP-0001"]
+    assert len((await service.search_materials("10"))["items"]) == 12   # 11 个 10K 电阻 + 100% 电容
+
+
+@pytest.mark.asyncio
+async def test_search_does_no_ddl_and_keeps_caller_transaction(tmp_path):
+    """测试：FTS 表未建好时搜索退回 LIKE，不执行 DDL、不提交调用方会话里未提交的改动"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'plain.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: EngHubBomItem.metadata.create_all(c, tables=[EngHubBomItem.__table__]))
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    statements = []
+    listen = lambda conn, cursor, stmt, *a: statements.append(stmt)  # noqa: E731
+    event.listen(engine.sync_engine, "before_cursor_execute", listen)
+    try:
+        async with factory() as db:
+            db.add(EngHubBomItem(source_row_id=1, part_number="RES-0001", description="Chip Resistor"))
+            await db.flush()
+            result = await BomService(db).search_materials("resistor")
+            assert [i["part_number"] for i in result["items"]] == ["RES-0001"]
+            await db.rollback()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listen)
+
+    assert not any(s.lstrip().upper().startswith(("CREATE", "INSERT INTO ENGHUB_BOM_ITEMS_FTS")) for s in statements)
+    async with factory() as db:
+        assert (await db.execute(select(EngHubBomItem))).first() is None
+        fts = await db.execute(text("SELECT name FROM sqlite_master WHERE name = 'enghub_bom_items_fts'"))
+        assert fts.first() is None
+    await engine.dispose()
@@ -0,0 +1,212 @@
+"""
+BOM 同步单元测试 - 键集分页 / 批量 upsert / 增量水位 / 版本历史与对比
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, func, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.services import bom_sync_service
+from api.services.bom_service import BomService
+from api.services.bom_sync_service import BomSyncService
+from database.models import EngHubBomClosure, EngHubBomHistory, EngHubBomItem, EngHubBomSyncLog
+
+T0 = datetime(2026, 1, 1, 8, 0)
+PG_URL = os.getenv("TEST_POSTGRES_URL")  # 影子表交换只在 PostgreSQL 上走，集成测试需给出库地址
+
+
+@pytest_asyncio.fixture
+async def sync_db(tmp_path, monkeypatch):
+    """SQLite 上的源表 bom_items / part_master + 本地缓存表；小批量逼出多页"""
+    monkeypatch.setattr(bom_sync_service, "BATCH_SIZE", 3)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bom.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: EngHubBomItem.metadata.create_all(
+            c, tables=[EngHubBomItem.__table__, EngHubBomSyncLog.__table__, EngHubBomClosure.__table__,
+                       EngHubBomHistory.__table__]))
+        await conn.execute(text("""
+            CREATE TABLE bom_items (
+                row_id INTEGER PRIMARY KEY, company_id TEXT, model_name TEXT, part_number TEXT,
+                description TEXT, level INTEGER, quantity REAL, unit TEXT, unit_price REAL, total_cost REAL,
+                vendor_code TEXT, vendor_name TEXT, parent_sap TEXT, category_l1 TEXT, category_l2 TEXT,
+                updated_at TIMESTAMP)"""))
+        await conn.execute(text(
+            "CREATE TABLE part_master (part_number TEXT, company_id TEXT, material_family TEXT, component_type TEXT)"))
+        await conn.execute(text("INSERT INTO part_master VALUES ('P1', 'C1', 'FAM', 'IC')"))
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as db:
+        yield db
+    await engine.dispose()
+
+
+async def _source(db, row_id, updated_at, part="P1", qty=1.0):
+    await db.execute(text("""
+        INSERT INTO bom_items (row_id, company_id, model_name, part_number, level, quantity, updated_at)
+        VALUES (:id, 'C1', 'M1', :part, 1, :qty, :ts)
+        ON CONFLICT (row_id) DO UPDATE SET quantity = excluded.quantity, updated_at = excluded.updated_at
+    """), {"id": row_id, "part": part, "qty": qty, "ts": updated_at})
+    await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_full_sync_pages_by_keyset_without_gaps(sync_db):
+    """测试：同一时间戳跨页、updated_at 为空的行都不漏不重；分页不用 OFFSET、不拼接值"""
+    for i in range(1, 8):
+        await _source(sync_db, i, T0 if i <= 5 else T0 + timedelta(minutes=i))
+    for i in (20, 21, 22, 23):
+        await _source(sync_db, i, None)
+
+    statements = []
+    engine = sync_db.get_bind()
+    listen = lambda conn, cursor, stmt, *a: statements.append(stmt)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listen)
+    try:
+        result = await BomSyncService(sync_db).full_sync()
+    finally:
+        event.remove(engine, "before_cursor_execute", listen)
+
+    assert result["status"] == "success" and result["records_synced"] == 11
+    assert result["rows_per_second"] > 0
+    ids = (await sync_db.execute(select(EngHubBomItem.source_row_id))).scalars().all()
+    assert sorted(ids) == [1, 2, 3, 4, 5, 6, 7, 20, 21, 22, 23]
+    reads = [s for s in statements if "FROM bom_items" in s]
+    assert len(reads) == 5  # 空时间戳 2 页 + 有时间戳 3 页，每页一次读取
+    assert not any("OFFSET" in s or "2026-" in s for s in reads)
+
+
+@pytest.mark.asyncio
+async def test_incremental_sync_upserts_changed_rows_in_place(sync_db):
+    """测试：增量只拉水位之后的行，已有行原地更新（主键不变），新行插入，水位推进"""
+    for i in range(1, 5):
+        await _source(sync_db, i, T0)
+    await BomSyncService(sync_db).full_sync()
+    before = {r.source_row_id: r.id for r in (await sync_db.execute(select(EngHubBomItem))).scalars()}
+
+    await _source(sync_db, 2, T0 + timedelta(hours=1), qty=9.0)
+    await _source(sync_db, 9, T0 + timedelta(hours=2))
+    result = await BomSyncService(sync_db).incremental_sync()
+
+    assert result["records_synced"] == 2
+    assert result["watermark"] == str(T0 + timedelta(hours=2))
+    sync_db.expire_all()
+    rows = {r.source_row_id: r for r in (await sync_db.execute(select(EngHubBomItem))).scalars()}
+    assert rows[2].id == before[2] and rows[2].quantity == 9.0
+    assert rows[2].material_family == "FAM"
+    assert set(rows) == {1, 2, 3, 4, 9}
+
+
+@pytest.mark.asyncio
+async def test_full_sync_versions_history_and_diffs_by_version(sync_db):
+    """测试：全量同步把变化/删除/新增写成版本；按同步版本号对比得到全量差异（不截断）"""
+    for i in range(1, 5):
+        await _source(sync_db, i, T0, part=f"P{i}")
+    v1 = (await BomSyncService(sync_db).full_sync(), await _last_log_id(sync_db))[1]
+
+    await _source(sync_db, 2, T0, part="P2", qty=5.0)
+    await sync_db.execute(text("DELETE FROM bom_items WHERE row_id = 3"))
+    await _source(sync_db, 8, T0, part="P8")
+    await BomSyncService(sync_db).full_sync()
+    v2 = await _last_log_id(sync_db)
+
+    diff = await BomService(sync_db).compare_bom("M1", str(v1), str(v2))
+    assert {d["part_number"]: d["diff"] for d in diff["differences"]} == {
+        "P2": "changed", "P3": "removed", "P8": "added"}
+    assert diff["changed"] == [{"part_number": "P2", "before": {"quantity": 1.0, "unit_price": None},
+                                "after": {"quantity": 5.0, "unit_price": None}}]
+    versions = (await sync_db.execute(select(EngHubBomHistory))).scalars().all()
+    assert len(versions) == 6 and sum(v.valid_to is None for v in versions) == 4
+    assert (await BomService(sync_db).compare_bom("M1", str(v2), str(v2)))["differences"] == []
+
+
+@pytest.mark.asyncio
+async def test_incremental_sync_versions_only_changed_rows(sync_db):
+    """测试：增量同步只为水位后变化的源行开新版本；按时间点对比"""
+    for i in range(1, 4):
+        await _source(sync_db, i, T0, part=f"P{i}")
+    await BomSyncService(sync_db).full_sync()
+    between = datetime.utcnow().isoformat()
+
+    await _source(sync_db, 1, T0 + timedelta(hours=1), part="P1", qty=3.0)
+    await _source(sync_db, 2, T0 + timedelta(hours=1), part="P2")   # 内容未变
+    result = await BomSyncService(sync_db).incremental_sync()
+
+    assert result["records_synced"] == 2
+    assert len((await sync_db.execute(select(EngHubBomHistory))).scalars().all()) == 4
+    diff = await BomService(sync_db).compare_bom("M1", between, datetime.utcnow().isoformat())
+    assert [(d["part_number"], d["qty_a"], d["qty_b"]) for d in diff["differences"]] == [("P1", 1.0, 3.0)]
+
+
+async def _last_log_id(db):
+    return (await db.execute(select(func.max(EngHubBomSyncLog.id)))).scalar()
+
+
+@pytest_asyncio.fixture
+async def pg_sync_db(monkeypatch):
+    """PostgreSQL 上的源表与缓存表（TEST_POSTGRES_URL，如 postgresql+asyncpg://...）"""
+    if not PG_URL:
+        pytest.skip("需设置 TEST_POSTGRES_URL")
+    monkeypatch.setattr(bom_sync_service, "BATCH_SIZE", 3)
+    engine = create_async_engine(PG_URL)
+    tables = [EngHubBomItem.__table__, EngHubBomSyncLog.__table__, EngHubBomClosure.__table__,
+              EngHubBomHistory.__table__]
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS bom_items, part_master, enghub_bom_items_shadow"))
+        await conn.run_sync(lambda c: EngHubBomItem.metadata.drop_all(c, tables=tables))
+        await conn.run_sync(lambda c: EngHubBomItem.metadata.create_all(c, tables=tables))
+        await conn.execute(text("""
+            CREATE TABLE bom_items (
+                row_id BIGINT PRIMARY KEY, company_id TEXT, model_name TEXT, part_number TEXT,
+                description TEXT, level INTEGER, quantity DOUBLE PRECISION, unit TEXT,
+                unit_price DOUBLE PRECISION, total_cost DOUBLE PRECISION, vendor_code TEXT, vendor_name TEXT,
+                parent_sap TEXT, category_l1 TEXT, category_l2 TEXT, updated_at TIMESTAMP)"""))
+        await conn.execute(text(
+            "CREATE TABLE part_master (part_number TEXT, company_id TEXT, material_family TEXT, component_type TEXT)"))
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    yield factory
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS bom_items, part_master"))
+        await conn.run_sync(lambda c: EngHubBomItem.metadata.drop_all(c, tables=tables))
+    await engine.dispose()
+
+
+async def _schema_names(db):
+    indexes = await db.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = 'enghub_bom_items' ORDER BY indexname"))
+    constraints = await db.execute(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = 'enghub_bom_items'::regclass ORDER BY conname"))
+    return indexes.scalars().all(), constraints.scalars().all()
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_pg_shadow_swap_keeps_names_and_concurrent_increments(pg_sync_db):
+    """测试（PostgreSQL）：影子表交换后索引/约束名不变；交换前增量已提交的行不被覆盖丢失"""
+    async with pg_sync_db() as db:
+        for i in range(1, 8):
+            await _source(db, i, T0 + timedelta(minutes=i))
+        original = await _schema_names(db)
+        assert (await BomSyncService(db).full_sync())["status"] == "success"
+        assert await _schema_names(db) == original
+
+    swap = BomSyncService._swap_shadow
+
+    async def swap_after_increment(self, load_started):
+        # 全量读完源表、交换之前：源行 2 变更并由另一会话的增量同步写进正式表
+        async with pg_sync_db() as other:
+            await _source(other, 2, T0 + timedelta(hours=1), qty=9.0)
+            assert (await BomSyncService(other).incremental_sync())["records_synced"] == 1
+        await swap(self, load_started)
+
+    async with pg_sync_db() as db:
+        service = BomSyncService(db)
+        service._swap_shadow = swap_after_increment.__get__(service)
+        assert (await service.full_sync())["status"] == "success"
+        assert await _schema_names(db) == original
+        qty = await db.execute(text("SELECT quantity FROM enghub_bom_items WHERE source_row_id = 2"))
+        assert qty.scalar() == 9.0
+        count = await db.execute(text("SELECT COUNT(*) FROM enghub_bom_items"))
+        assert count.scalar() == 7
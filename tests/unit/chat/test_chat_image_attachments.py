@@ -0,0 +1,93 @@
+"""
+对话图片附件单元测试 - 线程内缩图并落派生图 / data URL LRU / 附件批量加载
+"""
+
+import base64
+import io
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from PIL import Image
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.routes.chat_routes import Attachment, _build_multimodal_content, _load_attachment_records
+from api.services import attachment_image_service as ais
+from database.models import FileRecord
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache(monkeypatch):
+    monkeypatch.setattr(ais, "_data_url_cache", ais.OrderedDict())
+
+
+def _png(path, size):
+    Image.new("RGB", size, (200, 30, 30)).save(path, format="PNG")
+    return FileRecord(id=path.stem, filename=path.name, content_type="image/png", storage_path=str(path))
+
+
+def _decode(url):
+    header, b64 = url.split(",", 1)
+    return header, base64.b64decode(b64)
+
+
+@pytest.mark.asyncio
+async def test_large_photo_downscaled_once_and_cached(tmp_path):
+    """测试：大图缩到长边上限转 JPEG 并落在原图旁；后续轮次命中 LRU，不再读盘"""
+    rec = _png(tmp_path / "photo.png", (2400, 1800))
+    content = await _build_multimodal_content("看看这个不良", [rec])
+
+    header, data = _decode(content[1]["image_url"]["url"])
+    assert header == "data:image/jpeg;base64"
+    with Image.open(io.BytesIO(data)) as img:
+        assert max(img.size) == ais.CHAT_IMAGE_MAX_EDGE
+    assert ais.derived_path(tmp_path / "photo.png", ais.CHAT_IMAGE_MAX_EDGE).is_file()
+
+    (tmp_path / "photo.png").unlink()
+    again = await _build_multimodal_content("再看一次", [rec])
+    assert again[1] == content[1]
+
+
+@pytest.mark.asyncio
+async def test_small_image_passes_through_and_missing_file_skipped(tmp_path):
+    """测试：尺寸已达标的小图原样发送；实体缺失的附件跳过，无图时退化为纯文本"""
+    rec = _png(tmp_path / "icon.png", (64, 64))
+    content = await _build_multimodal_content("x", [rec])
+    header, data = _decode(content[1]["image_url"]["url"])
+    assert header == "data:image/png;base64" and data == (tmp_path / "icon.png").read_bytes()
+
+    gone = FileRecord(id="gone", filename="gone.png", content_type="image/png", storage_path=str(tmp_path / "gone.png"))
+    assert await _build_multimodal_content("只有文字", [gone]) == "只有文字"
+
+
+@pytest_asyncio.fixture
+async def file_db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'files.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: FileRecord.metadata.create_all(c, tables=[FileRecord.__table__]))
+    async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+        yield db
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_attachments_loaded_in_one_query_in_request_order(file_db):
+    """测试：多个附件一次 SELECT 加载，保持请求顺序，跨工厂与不存在的附件被忽略"""
+    for fid, factory in (("a", "F1"), ("b", "F2"), ("c", "F1")):
+        file_db.add(FileRecord(id=fid, filename=f"{fid}.png", storage_path=f"/x/{fid}", factory_id=factory))
+    await file_db.commit()
+
+    statements = []
+    engine = file_db.get_bind()
+    listen = lambda conn, cursor, stmt, *a: statements.append(stmt)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listen)
+    try:
+        user = SimpleNamespace(is_superuser=False, factory_id="F1")
+        atts = [Attachment(file_id=f) for f in ("c", "missing", "b", "a", "c")]
+        records = await _load_attachment_records(file_db, atts, user)
+    finally:
+        event.remove(engine, "before_cursor_execute", listen)
+
+    assert [r.id for r in records] == ["c", "a"]
+    assert len(statements) == 1
@@ -0,0 +1,105 @@
+"""
+对话表格附件单元测试 - 关键路径只读样本 + 后台全表列统计 / 按附件缓存 / 无法解析时提示
+"""
+
+import asyncio
+
+import pytest
+from openpyxl import Workbook
+
+from api.routes.chat_routes import _attachment_text_note, _parse_spreadsheet_record
+from api.services import attachment_table_service as ats
+from database.models import FileRecord
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache(monkeypatch):
+    monkeypatch.setattr(ats, "_table_cache", ats.OrderedDict())
+    monkeypatch.setattr(ats, "_full_scans", {})
+
+
+def _gated(scan, gate):
+    """后台全表统计等 gate 放行后再跑，便于断言本轮拿到的是样本结果"""
+    async def gated(*args):
+        await gate.wait()
+        await scan(*args)
+    return gated
+
+
+def _csv(path, rows):
+    path.write_text("\n".join(",".join(str(c) for c in r) for r in rows), encoding="utf-8")
+    return FileRecord(id=path.stem, filename=path.name, content_type="text/csv", storage_path=str(path), size=0)
+
+
+@pytest.mark.asyncio
+async def test_large_xlsx_sample_first_then_full_stats_in_background(tmp_path, monkeypatch):
+    """测试：10 万行报表本轮只读前 100 行样本即返回，全表行数与列统计在后台算完后供下一轮使用"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["工单", "产线", "产量"])
+    for i in range(1, 100_001):
+        ws.append([f"WO-{i:06d}", "L1" if i % 4 else "L2", i])
+    path = tmp_path / "shop"   # 内容寻址落盘，实体无扩展名
+    wb.save(path)
+    rec = FileRecord(id="shop", filename="shop.xlsx", content_type=None, storage_path=str(path), size=0)
+
+    read = []
+    iter_rows = ats._iter_rows
+
+    def counting(*args):
+        for row in iter_rows(*args):
+            read.append(1)
+            yield row
+
+    monkeypatch.setattr(ats, "_iter_rows", counting)
+    full_scan = asyncio.Event()
+    monkeypatch.setattr(ats, "_scan_full_table", _gated(ats._scan_full_table, full_scan))
+    sample = await _parse_spreadsheet_record(rec)
+    assert not sample.complete and sample.total_rows == 100 and len(read) == 102   # 表头 + 100 行 + 探到第 101 行即停
+    assert sample.stats[2].max == 100
+    note = await _attachment_text_note([rec])
+    assert "超过 100 行 × 3 列（全表统计计算中）" in note and "列信息（基于前 100 行样本）" in note
+
+    full_scan.set()
+    await ats._full_scans[("shop", 100, 20)]
+    sheet = await _parse_spreadsheet_record(rec)
+    assert sheet.complete and sheet.total_rows == 100_000
+    assert len(sheet.table["rows"]) == 100
+    assert [c["label"] for c in sheet.table["columns"]] == ["工单", "产线", "产量"]
+    qty = sheet.stats[2]
+    assert qty.is_numeric and qty.min == 1 and qty.max == 100_000 and qty.mean == 50_000.5
+    assert sheet.stats[1].counts == {"L1": 75_000, "L2": 25_000}
+    assert sheet.stats[0].overflow
+
+    note = await _attachment_text_note([rec])
+    assert "共 100000 行 × 3 列" in note
+    assert "产量 [数值]: min=1.00, max=100000.00, avg=50000.50" in note
+    assert "产线 [文本]: 2种取值" in note
+
+
+@pytest.mark.asyncio
+async def test_parsed_sheet_cached_per_attachment(tmp_path):
+    """测试：同一附件第二轮直接命中缓存（实体删除后仍可用），小表给出全部行"""
+    rec = _csv(tmp_path / "small.csv", [["料号", "数量"], ["R-1", 2], ["", ""], ["C-2", '"1,200"']])
+    first = await _parse_spreadsheet_record(rec)
+    assert first.total_rows == 2
+    assert first.table["rows"][1] == {"c0": "C-2", "c1": "1,200"}
+    assert first.stats[1].is_numeric and first.stats[1].max == 1200
+
+    (tmp_path / "small.csv").unlink()
+    assert await _parse_spreadsheet_record(rec) is first
+    note = await _attachment_text_note([rec])
+    assert "全部数据如下" in note and "| C-2 | 1,200 |" in note
+
+
+@pytest.mark.asyncio
+async def test_unreadable_sheet_reported_not_cached(tmp_path):
+    """测试：文件缺失/.xls 不支持时返回 None 并明确提示，不写入缓存"""
+    missing = FileRecord(id="gone", filename="gone.csv", content_type="text/csv",
+                         storage_path=str(tmp_path / "gone.csv"), size=0)
+    legacy = FileRecord(id="old", filename="old.xls", content_type="application/vnd.ms-excel",
+                        storage_path=str(tmp_path / "old.xls"), size=0)
+    assert await _parse_spreadsheet_record(missing) is None
+    note = await _attachment_text_note([missing, legacy])
+    assert note.count("无法解析") == 2
+    assert not ats._table_cache
@@ -0,0 +1,149 @@
+"""
+报表导出任务单元测试 - 服务端游标分批写 XLSX/CSV / 后台任务状态与 FileRecord 登记 / 失败清理
+"""
+
+import asyncio
+import csv
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from openpyxl import load_workbook
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.services import export_job_service as ejs
+from api.services import file_storage_service as fss
+from api.services.export_job_service import ExportError, ExportJobService
+from database.models import ExportJob, FileRecord, ProductionReport, WorkOrder
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(fss, "BLOB_DIR", tmp_path / "sha256")
+    monkeypatch.setattr(fss, "PARTIAL_DIR", tmp_path / "partial")
+    monkeypatch.setattr(ejs, "PARTIAL_DIR", tmp_path / "partial")
+    monkeypatch.setattr(ejs, "PROGRESS_INTERVAL_SECONDS", 0)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'export.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: FileRecord.metadata.create_all(c, tables=[
+            FileRecord.__table__, ExportJob.__table__, WorkOrder.__table__, ProductionReport.__table__]))
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _run(factory, export_type, fmt, params=None, factory_id="F1"):
+    async with factory() as db:
+        job = await ExportJobService(db, factory).submit(export_type, fmt, params, "planner", factory_id)
+        assert job.status == "pending"
+        await ejs._job_tasks[job.id]
+    async with factory() as db:
+        job = await db.get(ExportJob, job.id)
+        record = await db.get(FileRecord, job.file_id) if job.file_id else None
+    return job, record
+
+
+@pytest.mark.asyncio
+async def test_work_orders_streamed_to_xlsx_in_batches(session_factory, monkeypatch):
+    """测试：按批写入 write-only XLSX，超过单表上限续到新工作表；完成后登记 FileRecord"""
+    monkeypatch.setattr(ejs, "EXPORT_BATCH_SIZE", 500)
+    monkeypatch.setattr(ejs, "XLSX_MAX_ROWS", 1000)
+    batches = []
+    write = ejs._XlsxWriter.write
+    monkeypatch.setattr(ejs._XlsxWriter, "write", lambda self, rows: (batches.append(len(rows)), write(self, rows)))
+    base = datetime(2026, 10, 1)
+    async with session_factory() as db:
+        db.add_all(
+            WorkOrder(work_order_code=f"WO-{i:05d}", factory_id="F1" if i % 5 else "F2", product_id="P-1",
+                      planned_qty=i, status="released", created_at=base + timedelta(minutes=i))
+            for i in range(1, 2501)
+        )
+        await db.commit()
+
+    job, record = await _run(session_factory, "work_orders", "xlsx")
+    assert job.status == "success" and job.total_rows == job.rows_written == 2000
+    assert max(batches) <= 500 and sum(batches) == 2000
+    assert record.related_type == "export" and record.related_id == job.id and record.uploaded_by == "planner"
+    assert job.to_dict()["download_url"] == f"/api/v1/files/{record.id}"
+
+    with open(record.storage_path, "rb") as fh:
+        wb = load_workbook(fh, read_only=True)
+        assert wb.sheetnames == ["工单明细", "工单明细_2"]
+        first = list(wb["工单明细"].iter_rows(values_only=True))
+        assert first[0][:3] == ("工单号", "工单类型", "产品")
+        assert first[1][0] == "WO-00001" and len(first) == 1001
+        assert len(list(wb["工单明细_2"].iter_rows(values_only=True))) == 1001
+        wb.close()
+
+
+@pytest.mark.asyncio
+async def test_production_reports_csv_applies_filters(session_factory):
+    """测试：CSV 带 BOM 表头；按工厂/日期过滤并排除已撤销报工，date_to 只给日期时含当天"""
+    async with session_factory() as db:
+        db.add(WorkOrder(id="wo-1", work_order_code="WO-1", factory_id="F1", product_id="P-1", planned_qty=10))
+        for day, undone in [(1, False), (2, False), (2, True), (3, False)]:
+            db.add(ProductionReport(
+                report_code=f"PR-{day}-{int(undone)}", factory_id="F1", work_order_id="wo-1", station_id="S1",
+                good_qty=day, is_undone=undone, created_at=datetime(2026, 10, day, 15, 0),
+            ))
+        await db.commit()
+
+    job, record = await _run(session_factory, "production_reports", "csv", {"date_to": "2026-10-02", "ignored": "x"})
+    assert job.status == "success" and job.params == {"date_to": "2026-10-02"}
+    with open(record.storage_path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0][:2] == ["报工单号", "工单号"]
+    assert [r[0] for r in rows[1:]] == ["PR-1-0", "PR-2-0"]
+    assert rows[1][1] == "WO-1"
+
+    async with session_factory() as db:
+        with pytest.raises(ExportError):
+            await ExportJobService(db, session_factory).submit("production_reports", "pdf", {}, "planner", "F1")
+        with pytest.raises(ExportError):
+            await ExportJobService(db, session_factory).submit("production_reports", "csv", {"date_from": "昨天"}, "planner", "F1")
+
+
+@pytest.mark.asyncio
+async def test_failed_export_recorded_and_partial_file_removed(session_factory, tmp_path):
+    """测试：查询失败（表不存在）时任务记为 failed 并带错误信息，不留临时文件、不登记文件"""
+    job, record = await _run(session_factory, "standard_times", "xlsx", {"product_id": "P-1"})
+    assert job.status == "failed" and "standard_operation_times" in job.error_message
+    assert record is None and job.finished_at is not None
+    assert list((tmp_path / "partial").iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_orphaned_jobs_recovered_by_lease(session_factory, tmp_path):
+    """测试：心跳过期的 running 任务重新排队执行（超过次数记失败并清理临时文件），心跳新鲜的不动；
+    遗留 pending 启动时接手，同一任务重复启动也只认领执行一次"""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=ejs.EXPORT_LEASE_SECONDS + 60)
+    async with session_factory() as db:
+        db.add(WorkOrder(work_order_code="WO-1", factory_id="F1", product_id="P-1", planned_qty=1))
+        db.add_all([
+            ExportJob(id="dead", export_type="work_orders", format="csv", status="running", attempts=1,
+                      factory_id="F1", created_at=stale, started_at=stale, heartbeat_at=stale),
+            ExportJob(id="exhausted", export_type="work_orders", format="csv", status="running",
+                      attempts=ejs.EXPORT_MAX_ATTEMPTS, factory_id="F1", created_at=stale, heartbeat_at=stale),
+            ExportJob(id="alive", export_type="work_orders", format="csv", status="running", attempts=1,
+                      factory_id="F1", created_at=stale, heartbeat_at=now),
+            ExportJob(id="queued", export_type="work_orders", format="csv", status="pending", factory_id="F1",
+                      created_at=now),
+        ])
+        await db.commit()
+    leftover = tmp_path / "partial" / "export-job-exhausted.csv"
+    leftover.parent.mkdir(parents=True, exist_ok=True)
+    leftover.write_text("half")
+
+    result = await ejs.recover_export_jobs(session_factory, startup=True)
+    assert result == {"failed": 1, "requeued": 1, "started": 2}
+    ejs.start_export_job("queued", session_factory)   # 重复启动：认领失败直接返回
+    await asyncio.gather(*ejs._job_tasks.values())
+
+    async with session_factory() as db:
+        jobs = {j.id: j for j in (await db.execute(select(ExportJob))).scalars()}
+    assert (jobs["dead"].status, jobs["dead"].attempts, jobs["dead"].rows_written) == ("success", 2, 1)
+    assert (jobs["queued"].status, jobs["queued"].attempts) == ("success", 1)
+    assert jobs["exhausted"].status == "failed" and "中断" in jobs["exhausted"].error_message
+    assert jobs["alive"].status == "running"
+    assert not leftover.exists()
@@ -0,0 +1,131 @@
+"""
+附件存储单元测试 - 流式内容寻址落盘 / 大小上限 / 断点续传
+"""
+
+import hashlib
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.services import file_storage_service as fss
+from api.services.file_storage_service import (
+    FileStorageService, MultipartUpload, UploadOffsetMismatch, UploadTooLarge,
+)
+from database.models import FileRecord, FileUploadSession
+
+
+@pytest_asyncio.fixture
+async def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(fss, "BLOB_DIR", tmp_path / "sha256")
+    monkeypatch.setattr(fss, "PARTIAL_DIR", tmp_path / "partial")
+    monkeypatch.setattr(fss, "CHUNK_SIZE", 4)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'files.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: FileRecord.metadata.create_all(
+            c, tables=[FileRecord.__table__, FileUploadSession.__table__]))
+    async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+        yield FileStorageService(db)
+    await engine.dispose()
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+BOUNDARY = "----enghub"
+FORM_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def _form(body: bytes, filename: str, **fields) -> bytes:
+    """related_type 放文件前、其余字段放文件后，覆盖字段顺序不限"""
+    def field(name, value):
+        return f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    before = b"".join(field(k, v) for k, v in fields.items() if k == "related_type")
+    after = b"".join(field(k, v) for k, v in fields.items() if k != "related_type")
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: video/mp4\r\n\r\n").encode()
+    return before + head + body + b"\r\n" + after + f"--{BOUNDARY}--\r\n".encode()
+
+
+def _sliced(data: bytes, size: int):
+    return _chunks(*(data[i:i + size] for i in range(0, len(data), size)))
+
+
+@pytest.mark.asyncio
+async def test_streamed_uploads_dedupe_by_content(storage, tmp_path):
+    """测试：请求体边收边解析、分块落盘到 SHA-256 地址；相同内容两次上传共用一个实体、各有一条记录"""
+    body = b"line-side video bytes" * 10
+    form = _form(body, "clip.mp4", related_type="work_order", related_id="WO1")
+    first = await storage.save_upload(MultipartUpload(FORM_TYPE, _sliced(form, 7)), "op1", "F1")
+    second = await storage.save_upload(MultipartUpload(FORM_TYPE, _sliced(_form(body, "a/b.mp4"), 5)), "op2", "F1")
+
+    digest = hashlib.sha256(body).hexdigest()
+    assert first.sha256 == second.sha256 == digest and first.id != second.id
+    assert (first.filename, first.content_type, first.related_type, first.related_id) == (
+        "clip.mp4", "video/mp4", "work_order", "WO1")
+    assert second.filename == "a_b.mp4" and second.related_type is None
+    assert first.storage_path == second.storage_path == str(tmp_path / "sha256" / digest[:2] / digest[2:4] / digest)
+    assert first.size == len(body)
+    assert list((tmp_path / "partial").iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_size_limit_enforced_while_streaming(storage, tmp_path, monkeypatch):
+    """测试：超过上限时在写入途中中止，不留临时文件、不写记录"""
+    monkeypatch.setattr(fss, "MAX_UPLOAD_SIZE", 10)
+    consumed = []
+
+    async def endless():
+        while True:
+            consumed.append(1)
+            yield b"xxxx"
+
+    with pytest.raises(UploadTooLarge):
+        await fss.store_stream(endless())
+    assert len(consumed) == 3
+
+    # 直传按已接收的请求体字节数中止（不看 Content-Length、不等请求体收完），普通字段灌水同样拦得住
+    monkeypatch.setattr(fss, "MULTIPART_OVERHEAD", 200)
+    head = f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="related_id"\r\n\r\n'.encode()
+    consumed.clear()
+
+    async def endless_form():
+        yield head
+        while True:
+            consumed.append(1)
+            yield b"x" * 64
+
+    with pytest.raises(UploadTooLarge):
+        await storage.save_upload(MultipartUpload(FORM_TYPE, endless_form()), "op1", "F1")
+    assert len(consumed) == (10 + 200 - len(head)) // 64 + 1
+    assert list((tmp_path / "partial").iterdir()) == []
+    assert not (tmp_path / "sha256").exists()
+    with pytest.raises(ValueError):
+        MultipartUpload("application/octet-stream", endless_form())
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload_survives_retries(storage, tmp_path):
+    """测试：续传按偏移写入，重发同一块幂等，跳跃偏移返回已接收长度；完成后校验哈希并归档"""
+    body = b"0123456789abcdef"
+    session = await storage.create_session("big.xlsx", None, len(body), "op1", "F1", "work_order", "WO1")
+
+    assert await storage.append_chunks(session, 0, _chunks(body[:6])) == 6
+    assert await storage.append_chunks(session, 4, _chunks(body[4:10])) == 10   # 断线重发，部分重叠
+    with pytest.raises(UploadOffsetMismatch) as gap:
+        await storage.append_chunks(session, 12, _chunks(body[12:]))
+    assert gap.value.offset == 10
+    with pytest.raises(UploadOffsetMismatch):
+        await storage.complete_session(session)
+    assert await storage.append_chunks(session, 10, _chunks(body[10:])) == len(body)
+
+    with pytest.raises(ValueError):
+        await storage.complete_session(session, expected_sha256="0" * 64)
+    record = await storage.complete_session(session, expected_sha256=hashlib.sha256(body).hexdigest())
+    assert record.related_id == "WO1" and record.size == len(body)
+    with open(record.storage_path, "rb") as fh:
+        assert fh.read() == body
+    assert await storage.get_session(session.id) is None
+    assert list((tmp_path / "partial").iterdir()) == []
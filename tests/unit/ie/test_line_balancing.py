@@ -0,0 +1,181 @@
+"""
+装配线平衡单元测试 - SALBP-1/2 求解与穷举最优比对 / 预算截断 / 按工艺路线优化与平衡分析
+"""
+
+import random
+import time
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.routes.ie_routes import LineBalanceOptimizeInput
+from api.services.ie_service import LineBalanceService
+from core.ie.line_balancing import BalanceTask, parse_in2, precedence_from_steps, solve_salbp1, solve_salbp2
+from database.models import (
+    LineBalanceAnalysis, RoutingTemplate, RoutingTemplateStep, StandardOperationTime, WorkOrder,
+)
+
+SALBP_DIR = Path(__file__).resolve().parents[3] / "data" / "salbp"
+
+# Scholl 数据集已知最优值：{实例: ({节拍: 最少工站数}, {工站数: 最小节拍})}，data/salbp 下每个 .IN2 都要登记
+SCHOLL_OPTIMA = {
+    "JACKSON": ({7: 8, 9: 6, 10: 5, 13: 4, 14: 4, 21: 3}, {5: 10, 8: 7}),
+}
+
+
+def _tasks(times, edges):
+    preds = {i: [] for i in range(1, len(times) + 1)}
+    for a, b in edges:
+        preds[b].append(str(a))
+    return [BalanceTask(str(i), t, tuple(preds[i])) for i, t in enumerate(times, 1)]
+
+
+def _min_stations(tasks, c):
+    """穷举：按已分配作业集逐站 BFS，返回最少工站数"""
+    index = {t.key: i for i, t in enumerate(tasks)}
+    pred = [sum(1 << index[p] for p in t.predecessors) for t in tasks]
+    full = (1 << len(tasks)) - 1
+    frontier, seen, k = {0}, {0}, 0
+    while full not in frontier:
+        nxt = set()
+        for done in frontier:
+            stack = [(0, 0, 0)]
+            while stack:
+                load_set, load, start = stack.pop()
+                if load_set and done | load_set not in seen:
+                    seen.add(done | load_set)
+                    nxt.add(done | load_set)
+                cur = done | load_set
+                for i in range(start, len(tasks)):
+                    if not cur >> i & 1 and not pred[i] & ~cur and load + tasks[i].time <= c:
+                        stack.append((load_set | 1 << i, load + tasks[i].time, i + 1))
+        frontier, k = nxt, k + 1
+    return k
+
+
+def _check_feasible(tasks, result, cycle):
+    position = {key: s for s, keys in enumerate(result.stations) for key in keys}
+    assert sorted(position) == sorted(t.key for t in tasks)
+    assert max(result.loads) <= cycle
+    for t in tasks:
+        assert all(position[p] <= position[t.key] for p in t.predecessors)
+
+
+def test_scholl_instances_reach_known_optima():
+    """测试：仓库内 Scholl 算例（.IN2）在预算内求得已知最优值并证明最优，解满足节拍与先后关系"""
+    files = sorted(SALBP_DIR.glob("*.IN2"))
+    assert files and {f.stem.upper() for f in files} == set(SCHOLL_OPTIMA)
+    for f in files:
+        tasks = parse_in2(f.read_text(encoding="latin-1"))
+        salbp1, salbp2 = SCHOLL_OPTIMA[f.stem.upper()]
+        for c, stations in salbp1.items():
+            result = solve_salbp1(tasks, c, time_limit=5)
+            assert (f.stem, c, result.station_count, result.optimal) == (f.stem, c, stations, True)
+            _check_feasible(tasks, result, c)
+        for m, cycle in salbp2.items():
+            result = solve_salbp2(tasks, m, time_limit=5)
+            assert (f.stem, m, result.cycle_time, result.optimal) == (f.stem, m, cycle, True)
+            _check_feasible(tasks, result, cycle)
+
+
+def test_salbp_matches_exhaustive_optimum():
+    """测试：随机小规模 DAG 上 SALBP-1/2 结果与穷举最优一致且证明最优"""
+    rng = random.Random(2026)
+    for _ in range(60):
+        n = rng.randint(4, 10)
+        times = [rng.randint(1, 9) for _ in range(n)]
+        edges = [(a, b) for b in range(2, n + 1) for a in range(1, b) if rng.random() < 0.25]
+        tasks = _tasks(times, edges)
+
+        c = rng.randint(max(times), sum(times))
+        r1 = solve_salbp1(tasks, c)
+        assert r1.optimal and r1.station_count == _min_stations(tasks, c)
+        _check_feasible(tasks, r1, c)
+
+        m = rng.randint(1, n)
+        r2 = solve_salbp2(tasks, m)
+        best_c = next(cc for cc in range(max(times), sum(times) + 1) if _min_stations(tasks, cc) <= m)
+        assert r2.optimal and r2.cycle_time == best_c and r2.station_count <= m
+        _check_feasible(tasks, r2, best_c)
+
+
+def test_budget_returns_feasible_heuristic_bound():
+    """测试：大实例在时间预算内返回可行解，未证明最优时 optimal=False；小数工时换算不丢精度"""
+    rng = random.Random(7)
+    n = 120
+    times = [rng.randint(1, 40) for _ in range(n)]
+    edges = [(a, b) for b in range(2, n + 1) for a in range(max(1, b - 8), b) if rng.random() < 0.2]
+    tasks = _tasks(times, edges)
+    for solve, arg in ((solve_salbp1, 47), (solve_salbp2, 17)):
+        started = time.perf_counter()
+        result = solve(tasks, arg, time_limit=0.3)
+        assert time.perf_counter() - started < 1.5
+        _check_feasible(tasks, result, result.cycle_time)
+        assert result.optimal or result.nodes > 0
+
+    decimal = [BalanceTask("a", 0.35), BalanceTask("b", 0.25, ("a",)), BalanceTask("c", 0.4, ("a",))]
+    result = solve_salbp1(decimal, 0.6)
+    assert result.station_count == 2 and result.optimal
+    assert max(result.loads) <= 0.6 and sum(result.loads) == pytest.approx(1.0)
+    with pytest.raises(ValueError):
+        solve_salbp1(decimal, 0.3)
+
+    assert precedence_from_steps([("s3", 30, False), ("s1", 10, False), ("s2", 20, True), ("s4", 40, False)]) == {
+        "s1": (), "s2": (), "s3": ("s1", "s2"), "s4": ("s3",),
+    }
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'ie.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: WorkOrder.metadata.create_all(c, tables=[
+            WorkOrder.__table__, RoutingTemplate.__table__, RoutingTemplateStep.__table__,
+            StandardOperationTime.__table__, LineBalanceAnalysis.__table__]))
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_optimize_line_balance_from_routing(db):
+    """测试：按产品最近工单的工艺路线建模（并行步骤同阶段），SOT 工时优先；平衡分析可入库并读回"""
+    db.add(RoutingTemplate(id="rt-1", template_code="RT-1", template_name="装配", factory_id="F1"))
+    for seq, code, hours, parallel in [(10, "PREP", 0.1, False), (20, "SCREW", 0.05, False),
+                                       (30, "LABEL", 0.05, True), (40, "TEST", 0.1, False), (50, "PACK", 0.05, False)]:
+        db.add(RoutingTemplateStep(id=f"st-{seq}", template_id="rt-1", seq=seq, process_code=code,
+                                   operation_name=code, standard_hours=hours, is_parallel=parallel))
+    db.add(WorkOrder(work_order_code="WO-1", factory_id="F1", product_id="P-1", planned_qty=1, routing_template_id="rt-1"))
+    db.add(StandardOperationTime(factory_id="F1", product_id="P-1", routing_step="PREP", operation_seq=10,
+                                 operation_name="备料", station_id="S1", effective_standard_time=4.0))
+    db.add(StandardOperationTime(factory_id="F1", product_id="P-1", routing_step="TEST", operation_name="测试",
+                                 station_id="S2", effective_standard_time=5.0))
+    await db.commit()
+
+    service = LineBalanceService(db)
+    plan = await service.optimize_line_balance("F1", "P-1", takt_time=8)
+    # 工时：PREP 4（SOT）、SCREW 3、LABEL 3、TEST 5（SOT）、PACK 3 → 总 18，节拍 8 时 LB=3
+    assert plan["problem"] == "SALBP-1" and plan["routing_template_id"] == "rt-1"
+    assert plan["total_work_content"] == 18 and plan["station_count"] == 3 and plan["optimal"]
+    first = plan["stations"][0]["tasks"]
+    assert first[0]["process_code"] == "PREP" and first[0]["time_source"] == "sot"
+    codes = [t["process_code"] for s in plan["stations"] for t in s["tasks"]]
+    assert codes.index("TEST") > max(codes.index("SCREW"), codes.index("LABEL"))
+
+    plan2 = await service.optimize_line_balance("F1", "P-1", station_count=2)
+    assert plan2["problem"] == "SALBP-2" and plan2["cycle_time"] == 10 and plan2["optimal"]
+    with pytest.raises(ValueError):
+        await service.optimize_line_balance("F1", "P-1", takt_time=7, station_count=2)
+    with pytest.raises(ValueError):   # 其他工厂不能借用本厂工艺路线
+        await service.optimize_line_balance("F2", "P-1", routing_template_id="rt-1", takt_time=8)
+    for bad in ({"takt_time": 0}, {"station_count": 0}, {"takt_time": -1.5}):
+        with pytest.raises(ValidationError):
+            LineBalanceOptimizeInput(product_id="P-1", **bad)
+
+    lba = await service.analyze_line_balance("F1", "L1", "P-1", takt_time=6)
+    report = (await service.get_line_balance_report(lba.id)).to_dict()
+    assert report["workstation_count"] == 2 and report["bottleneck_station"] == "S2"
+    assert [s["station_id"] for s in report["station_details"]] == ["S1", "S2"]
@@ -0,0 +1,118 @@
+"""
+OEE 批量计算单元测试 - 回填分块 / 汇总增量刷新 / 当日实时累加器（增量更新与按 TTL 重建）
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from api.services import oee_service
+from api.services.oee_service import OeeService, _IntradayEquipment, _IntradayTracker
+
+
+@pytest.mark.asyncio
+async def test_backfill_splits_range_into_chunks(mock_db_session):
+    """测试：回填按块调用集合计算，块与块首尾相接不重叠"""
+    svc = OeeService(mock_db_session)
+    svc.calculate_factory_oee = AsyncMock(return_value={"count": 10})
+
+    result = await svc.backfill_oee("F1", "2026-01-01", "2026-01-20", chunk_days=7)
+
+    ranges = [c.args[1:3] for c in svc.calculate_factory_oee.await_args_list]
+    assert ranges == [
+        ("2026-01-01", "2026-01-07"),
+        ("2026-01-08", "2026-01-14"),
+        ("2026-01-15", "2026-01-20"),
+    ]
+    assert result["chunks"] == 3
+    assert result["rows_written"] == 30
+
+
+def test_intraday_events_update_tracker():
+    """测试：停机开始/结束与报工（含撤回）增量更新当日累加器，设备编码可解析到设备"""
+    now = datetime.utcnow()
+    tracker = _IntradayTracker(now.date())
+    tracker.equipment["e1"] = _IntradayEquipment(0.5)
+    tracker.codes["CNC-01"] = "e1"
+    oee_service._intraday["F1"] = tracker
+    try:
+        start = now - timedelta(minutes=1)
+        oee_service.on_downtime_event("F1", "e1", "d1", start)
+        acc = tracker.equipment["e1"]
+        assert "d1" in acc.open
+
+        oee_service.on_downtime_event("F1", "e1", "d1", start, start + timedelta(minutes=1))
+        assert acc.open == {}
+        assert acc.closed_minutes == pytest.approx(1.0)
+
+        oee_service.on_production_event("F1", "CNC-01", 12, 10)
+        oee_service.on_production_event("F1", "CNC-01", -2, -2)
+        assert (acc.actual, acc.good) == (10, 8)
+
+        # 未播种的工厂直接忽略
+        oee_service.on_production_event("F2", "CNC-01", 5, 5)
+        assert "F2" not in oee_service._intraday
+    finally:
+        oee_service._intraday.clear()
+
+
+@pytest.mark.asyncio
+async def test_intraday_tracker_reseeds_after_ttl(mock_db_session):
+    """测试：累加器超过 TTL 后按库重建（其他 worker 的事件可见），TTL 内直接复用；日期按 UTC"""
+    rows = MagicMock()
+    rows.mappings.return_value.all.return_value = [
+        {"id": "e1", "equipment_code": "CNC-01", "ideal_cycle": 0.5, "actual": 30, "good": 28},
+    ]
+    no_downtime = MagicMock()
+    no_downtime.mappings.return_value.all.return_value = []
+    mock_db_session.execute = AsyncMock(side_effect=[rows, no_downtime])
+    stale = _IntradayTracker(datetime.utcnow().date())
+    stale.loaded_at -= oee_service.OEE_INTRADAY_TTL + 1
+    oee_service._intraday["F1"] = stale
+    try:
+        tracker = await oee_service._intraday_tracker(mock_db_session, "F1", 1.0)
+        assert tracker is not stale and tracker.day == datetime.utcnow().date()
+        assert (tracker.equipment["e1"].actual, tracker.equipment["e1"].good) == (30, 28)
+
+        assert await oee_service._intraday_tracker(mock_db_session, "F1", 1.0) is tracker
+        assert mock_db_session.execute.await_count == 2
+    finally:
+        oee_service._intraday.clear()
+
+
+@pytest.mark.asyncio
+async def test_trend_week_reads_rollup_with_bound_params(mock_db_session):
+    """测试：周趋势只读 oee_rollup 一次，参数全部绑定，按天数加权平均"""
+    result = MagicMock()
+    result.mappings.return_value.all.return_value = [
+        {"snapshot_date": "2026-01-05", "oee": 60.0, "day_count": 7},
+        {"snapshot_date": "2026-01-12", "oee": 80.0, "day_count": 3},
+    ]
+    mock_db_session.execute = AsyncMock(return_value=result)
+
+    trend = await OeeService(mock_db_session).get_oee_trend("F1", days=730, granularity="week", line_id="L1")
+
+    mock_db_session.execute.assert_awaited_once()
+    sql, params = str(mock_db_session.execute.await_args.args[0]), mock_db_session.execute.await_args.args[1]
+    assert "oee_rollup" in sql and "INTERVAL" not in sql
+    assert (params["period"], params["scope"], params["sid"]) == ("week", "line", "L1")
+    assert trend["avg_oee"] == 66.0
+
+
+@pytest.mark.asyncio
+async def test_refresh_rollups_upserts_only_touched_keys(mock_db_session):
+    """测试：汇总刷新不删行，按受影响设备过滤后 ON CONFLICT upsert，工厂内先取 advisory 锁"""
+    mock_db_session.execute = AsyncMock(return_value=MagicMock())
+    await OeeService(mock_db_session).refresh_rollups(
+        "F1", date(2026, 1, 30), date(2026, 2, 2), equipment_ids=["e2", "e1", "e2"],
+    )
+
+    lock, upsert = [c.args for c in mock_db_session.execute.await_args_list]
+    assert "pg_advisory_xact_lock" in str(lock[0])
+    sql, params = str(upsert[0]), upsert[1]
+    assert "DELETE" not in sql and "ON CONFLICT (factory_id, period, scope, scope_id, period_start) DO UPDATE" in sql
+    assert params["eids"] == ["e1", "e2"]
+    assert (params["wk_lo"], params["wk_hi"]) == (date(2026, 1, 26), date(2026, 2, 2))
+    assert (params["mo_lo"], params["mo_hi"]) == (date(2026, 1, 1), date(2026, 2, 1))
+
@@ -0,0 +1,271 @@
+"""
+报工原子累加单元测试 - 班次汇总 / 小时快照 ON CONFLICT 累加 / 多终端并发不丢数 / 写后缓冲与回放
+"""
+
+import asyncio
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from api.services import dashboard_service, report_service
+from api.services.dashboard_service import DashboardService
+from api.services.report_rollup_service import ReportRollupBuffer
+from api.services.report_service import ReportService
+from database.models import (
+    HourlyOutputSnapshot, ProductionAlert, ProductionReport, ShiftSummary, WorkOrder,
+)
+
+WO_ID = str(uuid.uuid4())
+TABLES = [WorkOrder.__table__, ProductionReport.__table__, ShiftSummary.__table__,
+          HourlyOutputSnapshot.__table__, ProductionAlert.__table__]
+
+
+@pytest_asyncio.fixture
+async def sqlite_factory(tmp_path, monkeypatch):
+    """文件型 SQLite + 有界连接池（与线上一样，终端请求排队借连接），报工后的 OEE 钩子置空"""
+    monkeypatch.setattr(report_service, "on_production_event", lambda *a, **k: None)
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'report.db'}",
+        connect_args={"timeout": 30},
+        poolclass=AsyncAdaptedQueuePool, pool_size=8, max_overflow=0, pool_timeout=60,
+    )
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _begin_immediate(conn):
+        # SQLite 事务一开始就拿写锁，避免两个读事务升级写锁时互相 BUSY
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _no_pysqlite_begin(dbapi_conn, _):
+        dbapi_conn.isolation_level = None
+        dbapi_conn.execute("PRAGMA journal_mode=WAL")
+        dbapi_conn.execute("PRAGMA synchronous=OFF")
+
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: WorkOrder.metadata.create_all(c, tables=TABLES))
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as db:
+        db.add(WorkOrder(id=WO_ID, work_order_code="WO-1", factory_id="F1", product_id="P1",
+                         planned_qty=100000, completed_qty=0, good_qty=0, defect_qty=0, scrap_qty=0))
+        await db.commit()
+    yield factory
+    await engine.dispose()
+
+
+async def _report(factory, good, defect=0, scrap=0, station="S1"):
+    async with factory() as db:
+        return await ReportService(db).quick_report(
+            "F1", WO_ID, station, good, defect, scrap, cycle_time_sec=2.0, shift="day")
+
+
+@pytest.mark.asyncio
+async def test_rollup_rows_accumulate_in_place(sqlite_factory):
+    """测试：同一键的多次报工累加到同一行，良品率按累计数量重算"""
+    await _report(sqlite_factory, 19, 1)
+    await _report(sqlite_factory, 10, 0, 0)
+    await _report(sqlite_factory, 5, station="S2")
+
+    async with sqlite_factory() as db:
+        rows = {r.station_id: r for r in (await db.execute(select(ShiftSummary))).scalars()}
+        snaps = {r.station_id: r for r in (await db.execute(select(HourlyOutputSnapshot))).scalars()}
+        wo = await db.get(WorkOrder, WO_ID)
+
+    s1 = rows["S1"]
+    assert (s1.good_qty, s1.defect_qty, s1.total_output, s1.report_count) == (29, 1, 30, 2)
+    assert s1.yield_rate == pytest.approx(29 / 30 * 100)
+    assert s1.total_cycle_time == pytest.approx(4.0)
+    assert rows["S2"].report_count == 1
+    assert (snaps["S1"].output_qty, snaps["S1"].good_qty) == (30, 29)
+    assert (wo.completed_qty, wo.good_qty, wo.defect_qty) == (35, 34, 1)
+
+
+async def _burst(factory, terminals):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await asyncio.gather(*(_report(factory, 1 + i % 3, i % 2) for i in range(terminals)))
+    return loop.time() - started
+
+
+@pytest.mark.asyncio
+async def test_concurrent_terminals_lose_no_counts(sqlite_factory):
+    """测试：200 个终端同时报同一工单/工位，计数与报工条数一致（无丢失更新、无重复汇总行），
+    耗时随终端数线性增长（热点行不退化成锁等待风暴）"""
+    warmup = 50
+    terminals = 200
+    small = await _burst(sqlite_factory, warmup)
+    large = await _burst(sqlite_factory, terminals)
+    assert large < small * terminals / warmup * 2
+
+    expected_good = sum(1 + i % 3 for n in (warmup, terminals) for i in range(n))
+    expected_defect = sum(i % 2 for n in (warmup, terminals) for i in range(n))
+    async with sqlite_factory() as db:
+        summaries = (await db.execute(select(ShiftSummary))).scalars().all()
+        snaps = (await db.execute(select(HourlyOutputSnapshot))).scalars().all()
+        wo = await db.get(WorkOrder, WO_ID)
+        reports = (await db.execute(select(ProductionReport))).scalars().all()
+
+    assert len(reports) == warmup + terminals
+    assert len(summaries) == 1
+    assert summaries[0].report_count == warmup + terminals
+    assert (summaries[0].good_qty, summaries[0].defect_qty) == (expected_good, expected_defect)
+    assert sum(s.output_qty for s in snaps) == expected_good + expected_defect
+    assert (wo.good_qty, wo.completed_qty) == (expected_good, expected_good + expected_defect)
+
+
+async def _rollup_state(factory):
+    async with factory() as db:
+        summaries = (await db.execute(select(ShiftSummary))).scalars().all()
+        snaps = (await db.execute(select(HourlyOutputSnapshot))).scalars().all()
+        pending = (await db.execute(
+            select(ProductionReport).where(ProductionReport.rolled_up_at.is_(None)))).scalars().all()
+    return summaries, snaps, pending
+
+
+@pytest.mark.asyncio
+async def test_buffered_reports_flush_in_bulk(sqlite_factory, monkeypatch):
+    """测试：缓冲运行时报工请求不碰汇总表；攒满 N 条唤醒刷写，一次刷写按键聚合并推进水位"""
+    buffer = ReportRollupBuffer(flush_interval=60, max_events=3)
+    buffer.running = True
+    monkeypatch.setattr(report_service, "report_rollup_buffer", buffer)
+
+    for station in ("S1", "S1", "S2"):
+        await _report(sqlite_factory, 10, 1, station=station)
+    summaries, snaps, pending = await _rollup_state(sqlite_factory)
+    assert summaries == [] and snaps == [] and len(pending) == 3
+    assert buffer._wake.is_set()
+
+    assert await buffer.flush(sqlite_factory) == 3
+    assert await buffer.flush(sqlite_factory) == 0
+    summaries, snaps, pending = await _rollup_state(sqlite_factory)
+    by_station = {s.station_id: s for s in summaries}
+    assert (by_station["S1"].good_qty, by_station["S1"].report_count) == (20, 2)
+    assert by_station["S2"].total_output == 11
+    assert sum(s.output_qty for s in snaps) == 33
+    assert pending == []
+
+
+@pytest.mark.asyncio
+async def test_lost_buffer_is_replayed_exactly_once(sqlite_factory, monkeypatch):
+    """测试：缓冲随进程丢失后从报工表回放；回放与残留缓冲刷写不会重复累加"""
+    crashed = ReportRollupBuffer(flush_interval=60, max_events=100)
+    crashed.running = True
+    monkeypatch.setattr(report_service, "report_rollup_buffer", crashed)
+    for i in range(5):
+        await _report(sqlite_factory, 2 + i)
+
+    restarted = ReportRollupBuffer()
+    assert await restarted.replay(sqlite_factory) == 5
+    assert await restarted.replay(sqlite_factory) == 0
+    assert await crashed.flush(sqlite_factory) == 0  # 认领不到已回放的报工
+
+    summaries, _, pending = await _rollup_state(sqlite_factory)
+    assert len(summaries) == 1
+    assert (summaries[0].good_qty, summaries[0].report_count) == (20, 5)
+    assert pending == []
+
+
+@pytest.mark.asyncio
+async def test_shift_summary_defaults_to_utc_day(sqlite_factory, monkeypatch):
+    """测试：汇总按 UTC 日期分桶，缺省查询日期也取 UTC 今天（本地时区跨日时仍查得到）"""
+    class _LocalAhead(date):
+        @classmethod
+        def today(cls):
+            return datetime.utcnow().date() + timedelta(days=1)
+
+    monkeypatch.setattr(report_service, "date", _LocalAhead)
+    monkeypatch.setattr(dashboard_service, "date", _LocalAhead)
+    await _report(sqlite_factory, 12, 1)
+    async with sqlite_factory() as db:
+        await db.execute(update(ShiftSummary).values(target_output=26))
+        await db.commit()
+        summary = await ReportService(db).get_shift_summary("F1", shift_type="day")
+        live = await DashboardService(db).get_live_dashboard("F1")
+    assert summary["date"] == datetime.utcnow().date().isoformat()
+    assert (summary["total_output"], summary["report_count"]) == (13, 1)
+    assert live["date"] == summary["date"]
+    assert (live["total_output"], live["target_output"], live["achievement_rate"]) == (13, 26, 50.0)
+
+
+@pytest.mark.asyncio
+async def test_undo_is_atomic_and_applied_once(sqlite_factory):
+    """测试：撤回用原子 UPDATE 扣减工单（不低于 0），并发重复撤回只扣一次"""
+    first = await _report(sqlite_factory, 18, 1)
+    await _report(sqlite_factory, 5)
+    async with sqlite_factory() as db:
+        await db.execute(update(WorkOrder).where(WorkOrder.id == WO_ID).values(defect_qty=0))
+        await db.commit()
+
+    async def undo():
+        async with sqlite_factory() as db:
+            return await ReportService(db).undo_report(first["id"], "op1")
+
+    results = await asyncio.gather(undo(), undo(), undo())
+    assert sum(1 for r in results if r.get("success")) == 1
+    async with sqlite_factory() as db:
+        wo = await db.get(WorkOrder, WO_ID)
+        report = await db.get(ProductionReport, first["id"])
+    assert (wo.completed_qty, wo.good_qty, wo.defect_qty) == (5, 5, 0)
+    assert report.is_undone and report.undone_by == "op1"
+
+
+@pytest.mark.asyncio
+async def test_batch_report_is_one_bulk_transaction(sqlite_factory):
+    """测试：100 行批量报工语句数与行数无关、只提交一次；工单与汇总一次累加到位"""
+    async with sqlite_factory() as db:
+        second = WorkOrder(id=str(uuid.uuid4()), work_order_code="WO-2", factory_id="F1", product_id="P1",
+                           planned_qty=1000, completed_qty=5, good_qty=5, defect_qty=0, scrap_qty=0)
+        db.add(second)
+        await db.commit()
+    items = [{"work_order_id": (WO_ID, second.id)[i % 2], "station_id": f"S{i % 3}",
+              "good_qty": 10, "defect_qty": i % 2, "cycle_time_sec": 1.5} for i in range(100)]
+
+    statements, commits = [], []
+    async with sqlite_factory() as db:
+        engine = db.bind.sync_engine
+        listen = lambda conn, cursor, stmt, *a: statements.append(stmt)  # noqa: E731
+        event.listen(engine, "before_cursor_execute", listen)
+        event.listen(db.sync_session, "after_commit", lambda s: commits.append(True))
+        try:
+            result = await ReportService(db).batch_report("F1", items, operator_id="op1", shift="day")
+        finally:
+            event.remove(engine, "before_cursor_execute", listen)
+
+    assert result["count"] == 100 and result["total_good"] == 1000 and result["total_defect"] == 50
+    assert len([s for s in statements if not s.startswith("BEGIN")]) <= 6
+    assert len(commits) == 1
+    async with sqlite_factory() as db:
+        wo1, wo2 = await db.get(WorkOrder, WO_ID), await db.get(WorkOrder, second.id)
+        summaries = (await db.execute(select(ShiftSummary))).scalars().all()
+        pending = (await db.execute(
+            select(ProductionReport).where(ProductionReport.rolled_up_at.is_(None)))).scalars().all()
+    assert (wo1.good_qty, wo1.defect_qty) == (500, 0)
+    assert (wo2.good_qty, wo2.completed_qty) == (505, 555)
+    assert len(summaries) == 6 and sum(s.report_count for s in summaries) == 100
+    assert pending == []
+
+
+@pytest.mark.asyncio
+async def test_batch_report_is_all_or_nothing(sqlite_factory, monkeypatch):
+    """测试：引用不存在的工单直接拒绝；中途写汇总失败整批回滚，不留半截报工"""
+    async with sqlite_factory() as db:
+        result = await ReportService(db).batch_report(
+            "F1", [{"work_order_id": WO_ID, "station_id": "S1", "good_qty": 3},
+                   {"work_order_id": "missing", "station_id": "S1", "good_qty": 3}])
+    assert "missing" in result["error"]
+
+    async def boom(*a, **k):
+        raise RuntimeError("rollup failed")
+
+    monkeypatch.setattr(report_service, "apply_rollups", boom)
+    async with sqlite_factory() as db:
+        with pytest.raises(RuntimeError):
+            await ReportService(db).batch_report("F1", [{"work_order_id": WO_ID, "station_id": "S1", "good_qty": 3}])
+
+    async with sqlite_factory() as db:
+        assert (await db.execute(select(ProductionReport))).scalars().all() == []
+        assert (await db.get(WorkOrder, WO_ID)).good_qty == 0
@@ -0,0 +1,65 @@
+"""
+组织仿真引擎单元测试 - 强连通分量 / 脏集合增量传播 / 大图影响追踪
+"""
+
+import time
+
+import pytest
+
+from core.org_panel.presets import build_electronics_factory, build_multi_line_factory
+from core.org_panel.signals import SignalType
+
+
+def _outputs(engine):
+    return {nid: dict(n.output_signals) for nid, n in engine.nodes.items()}
+
+
+def test_only_feedback_loop_is_cyclic_component():
+    """测试：线长-设备-HR 反馈环缩成一个分量，其余节点各自成无环分量且排在环之后"""
+    engine = build_electronics_factory()
+    engine.propagate()
+
+    cyclic = [comp for comp, flag in zip(engine._components, engine._cyclic) if flag]
+    assert cyclic == [["line_leader", "equipment_sup", "hr_sup"]]
+    order = [nid for comp in engine._components for nid in comp]
+    assert order.index("prod_manager") > order.index("quality_sup") > order.index("line_leader")
+
+
+def test_incremental_propagation_matches_full_and_touches_only_downstream():
+    """测试：改一条线的参数只重算该线节点，结果与整图重算一致"""
+    engine = build_multi_line_factory(20)
+    engine.propagate()
+
+    engine.set_parameter("L5.line_leader", "speed", 1.6)
+    recomputed = engine._run()
+
+    assert recomputed and all(nid.startswith("L5.") for nid in recomputed)
+    fresh = build_multi_line_factory(20)
+    fresh.set_parameter("L5.line_leader", "speed", 1.6)
+    fresh.propagate(full=True)
+    for nid, signals in _outputs(fresh).items():
+        for sig, value in signals.items():
+            assert engine.nodes[nid].output_signals[sig] == pytest.approx(value, abs=1e-5)
+
+    # 没有变化时不重算任何节点
+    assert engine._run() == set()
+
+
+def test_trace_impact_restores_state_on_large_graph():
+    """测试：1800 节点上影响追踪保持交互级延迟，且追踪后状态原样恢复"""
+    engine = build_multi_line_factory(300)
+    engine.propagate()
+    baseline = _outputs(engine)
+
+    started = time.perf_counter()
+    report = engine.trace_impact("L42.line_leader", "speed", 0.5)
+    what_if = engine.what_if({("L42.line_leader", "speed"): 1.8, ("L43.line_leader", "shifts"): 3})
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5
+    assert {imp.node_id.split(".")[0] for imp in report.impacts} == {"L42"}
+    assert what_if["L43.prod_manager"].outputs != what_if["L44.prod_manager"].outputs
+    assert _outputs(engine) == baseline
+    assert engine.nodes["L42.line_leader"].parameters["speed"].value == 1.0
+    assert engine.nodes["L42.prod_manager"].output_signals[SignalType.THROUGHPUT] == \
+        baseline["L42.prod_manager"][SignalType.THROUGHPUT]
@@ -0,0 +1,184 @@
+"""
+组织面板会话单元测试 - 写时复制分支 / 会话隔离 / 场景缓存
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from core.auth.security import create_access_token, create_refresh_token
+from core.org_panel import api_adapter, sessions
+from core.org_panel.presets import build_electronics_factory
+from core.org_panel.sessions import OrgSessionStore
+from core.org_panel.signals import SignalType
+from database.db_config import get_db
+from database.models import User
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_adapter, "_store", OrgSessionStore())
+    path = tmp_path / "org.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    User.metadata.create_all(sync_engine, tables=[User.__table__])
+    with Session(sync_engine) as db:
+        db.add_all([
+            User(id=f"u-{name}", username=name, email=f"{name}@example.com", hashed_password="x")
+            for name in ("alice", "bob")
+        ])
+        db.commit()
+    sync_engine.dispose()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+
+    async def override_db():
+        async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(api_adapter.router)
+    app.dependency_overrides[get_db] = override_db
+    client = TestClient(app)
+    client.engine = sync_engine
+    return client
+
+
+def _bearer(user, version=0, **extra):
+    return {"Authorization": f"Bearer {create_access_token({'sub': user, 'ver': version})}", **extra}
+
+
+def test_fork_copies_only_written_nodes():
+    """测试：分支调参只复制被重算的节点，父引擎与未波及节点保持共享且不变"""
+    base = build_electronics_factory()
+    base.propagate()
+    before = {nid: dict(n.output_signals) for nid, n in base.nodes.items()}
+
+    branch = base.fork()
+    branch.set_parameter("quality_sup", "inspection_ratio", 0.6)
+    branch.propagate()
+
+    assert branch.nodes["line_leader"] is base.nodes["line_leader"]
+    assert branch.nodes["quality_sup"] is not base.nodes["quality_sup"]
+    assert {nid: dict(n.output_signals) for nid, n in base.nodes.items()} == before
+    assert base.nodes["quality_sup"].parameters["inspection_ratio"].value == 0.2
+
+
+def test_sessions_are_isolated_and_what_if_is_memoized(client):
+    """测试：一个用户调参不影响另一个用户；相同场景第二次命中缓存且结果一致"""
+    a, b = {"X-Org-Session": "alice"}, {"X-Org-Session": "bob"}
+    client.post("/api/v1/org-panel/nodes/line_leader/param", json={"param_key": "speed", "value": 1.8}, headers=a)
+
+    out_a = client.get("/api/v1/org-panel/nodes/prod_manager/detail", headers=a).json()["outputs"]
+    out_b = client.get("/api/v1/org-panel/nodes/prod_manager/detail", headers=b).json()["outputs"]
+    assert out_a != out_b
+
+    body = {"adjustments": {"line_leader.speed": 1.5}}
+    first = client.post("/api/v1/org-panel/what-if", json=body, headers=b).json()
+    second = client.post("/api/v1/org-panel/what-if", json=body, headers={"X-Org-Session": "carol"}).json()
+    assert first == second
+    stats = client.get("/api/v1/org-panel/sessions/stats").json()
+    assert (stats["memo_hits"], stats["memo_misses"]) == (1, 1)
+
+    # what-if 不改会话状态
+    assert client.get("/api/v1/org-panel/nodes/prod_manager/detail", headers=b).json()["outputs"] == out_b
+
+
+def test_session_header_is_scoped_to_authenticated_user(client):
+    """测试：X-Org-Session 只在登录用户名下区分会话，冒用他人用户名进不了对方会话；刷新令牌直接 401"""
+    client.post("/api/v1/org-panel/nodes/line_leader/param", json={"param_key": "speed", "value": 1.8},
+                headers=_bearer("alice"))
+    mine = client.get("/api/v1/org-panel/nodes/prod_manager/detail", headers=_bearer("alice")).json()["outputs"]
+    for headers in (_bearer("bob", **{"X-Org-Session": "alice"}), {"X-Org-Session": "alice"},
+                    {"X-Org-Session": "user:alice"}, _bearer("alice", **{"X-Org-Session": "plan-b"})):
+        assert client.get("/api/v1/org-panel/nodes/prod_manager/detail", headers=headers).json()["outputs"] != mine
+
+    refresh = {"Authorization": f"Bearer {create_refresh_token({'sub': 'alice', 'ver': 0})}"}
+    assert client.get("/api/v1/org-panel/nodes/prod_manager/detail", headers=refresh).status_code == 401
+
+    store = api_adapter.get_store()
+    assert "user:alice" in store._sessions and "user:alice/plan-b" in store._sessions
+    assert "anon:alice" in store._anon_sessions
+
+
+def test_revoked_or_unknown_token_is_rejected(client):
+    """测试：token_version 已递增（改密/登出全部设备）或用户不存在时返回 401，不退回匿名会话"""
+    assert client.get("/api/v1/org-panel/graph", headers=_bearer("alice")).status_code == 200
+    with Session(client.engine) as db:
+        db.get(User, "u-alice").token_version = 1
+        db.commit()
+
+    assert client.get("/api/v1/org-panel/graph", headers=_bearer("alice")).status_code == 401
+    assert client.get("/api/v1/org-panel/graph", headers=_bearer("alice", version=1)).status_code == 200
+    assert client.get("/api/v1/org-panel/graph", headers=_bearer("mallory")).status_code == 401
+    assert "anon:default" not in api_adapter.get_store()._anon_sessions
+
+
+def test_anonymous_sessions_have_own_quota(client, monkeypatch):
+    """测试：匿名会话超出自己的限额只淘汰匿名会话，登录用户的会话保留"""
+    monkeypatch.setattr(sessions, "MAX_ANON_SESSIONS", 3)
+    client.get("/api/v1/org-panel/graph", headers=_bearer("alice"))
+    for i in range(10):
+        client.get("/api/v1/org-panel/graph", headers={"X-Org-Session": f"probe-{i}"})
+
+    store = api_adapter.get_store()
+    assert "user:alice" in store._sessions
+    assert list(store._anon_sessions) == ["anon:probe-7", "anon:probe-8", "anon:probe-9"]
+    assert client.get("/api/v1/org-panel/sessions/stats").json()["anonymous_sessions"] == 3
+
+
+def test_sweep_rejects_too_many_scenarios(client, monkeypatch):
+    """测试：单次 /sweep 场景数超过上限返回 400，不进入计算"""
+    monkeypatch.setattr(api_adapter, "MAX_SWEEP_SCENARIOS", 4)
+    body = {"scenarios": [{"line_leader.speed": 1.0 + i / 10} for i in range(5)]}
+    resp = client.post("/api/v1/org-panel/sweep", json=body)
+    assert resp.status_code == 400 and "分批" in resp.json()["detail"]
+
+    body["scenarios"] = body["scenarios"][:4]
+    assert client.post("/api/v1/org-panel/sweep", json=body).status_code == 200
+
+
+def test_reads_and_memo_hits_do_not_fork_session(client):
+    """测试：逻辑链/图描述只读、what-if 命中缓存时都不分支，会话已复制的节点不会被重置为共享"""
+    headers = {"X-Org-Session": "alice"}
+    client.post("/api/v1/org-panel/nodes/line_leader/param", json={"param_key": "speed", "value": 1.8}, headers=headers)
+    body = {"adjustments": {"quality_sup.inspection_ratio": 0.5}}
+    client.post("/api/v1/org-panel/what-if", json=body, headers=headers)
+    engine = api_adapter.get_store().get("anon:alice", anonymous=True).engine
+    engine.set_parameter("line_leader", "speed", 1.7)
+    owned = set(engine._owned)
+    assert "line_leader" in owned
+
+    assert client.get("/api/v1/org-panel/chains", headers=headers).json()["total"] > 0
+    assert "组织仿真图" in client.get("/api/v1/org-panel/graph", headers=headers).json()["description"]
+    engine.set_parameter("line_leader", "speed", 1.8)
+    client.post("/api/v1/org-panel/what-if", json=body, headers=headers)
+    assert engine._owned == owned
+    assert client.get("/api/v1/org-panel/sessions/stats").json()["memo_hits"] == 1
+
+
+def test_concurrent_sessions_do_not_corrupt_each_other():
+    """测试：多线程并发调参 + what-if，各会话结果与单独计算一致"""
+    store = OrgSessionStore()
+    speeds = [0.6, 0.9, 1.2, 1.5, 1.8, 2.1]
+
+    def work(speed):
+        session = store.get(f"user-{speed}")
+        session.set_parameter("line_leader", "speed", speed)
+        branch, _ = session.branch()
+        snap = branch.what_if({("quality_sup", "inspection_ratio"): 0.5})
+        return session.engine.nodes["prod_manager"].output_signals[SignalType.OEE], snap["prod_manager"].outputs
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(work, speeds * 3))
+
+    for speed, (oee, _) in zip(speeds * 3, results):
+        expected = build_electronics_factory()
+        expected.set_parameter("line_leader", "speed", speed)
+        expected.propagate()
+        assert oee == pytest.approx(expected.nodes["prod_manager"].output_signals[SignalType.OEE], abs=1e-6)
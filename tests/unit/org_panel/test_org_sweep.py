@@ -0,0 +1,64 @@
+"""
+组织面板批量扫描单元测试 - 向量化多场景 / 数组兼容传导函数 / 龙卷风敏感性
+"""
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.org_panel import api_adapter
+from core.org_panel.chains import exponential_decay, power_stress, quadratic_degrade, threshold_linear
+from core.org_panel.presets import build_electronics_factory
+from core.org_panel.sessions import OrgSessionStore
+from core.org_panel.signals import SignalType
+
+
+def test_chain_functions_accept_vectors():
+    """测试：传导函数对 K 维向量逐元素计算，与逐个标量调用一致"""
+    xs = np.array([0.3, 1.0, 1.2, 1.7, 3.0])
+    for fn in (quadratic_degrade(), power_stress(), threshold_linear(1.2, 2.0), exponential_decay()):
+        assert fn(xs) == pytest.approx([fn(float(x)) for x in xs])
+        assert isinstance(fn(1.5), float)
+
+
+def test_sweep_matches_scalar_what_if_per_scenario():
+    """测试：K 个场景一次扫描的结果与逐场景 what-if 一致（含部分场景触发停线约束），且不改引擎状态"""
+    engine = build_electronics_factory()
+    engine.propagate()
+    before = {nid: dict(n.output_signals) for nid, n in engine.nodes.items()}
+    scenarios = [
+        {("line_leader", "speed"): speed, ("hr_sup", "rotation_policy"): rotation}
+        for speed in (0.5, 1.0, 1.6, 2.2, 3.0) for rotation in (1.0, 3.0)
+    ] + [{("warehouse_sup", "current_stock"): 50.0}]
+
+    result = engine.sweep(scenarios)
+
+    assert result.passes == 1
+    for i, scenario in enumerate(scenarios):
+        expected = engine.what_if(scenario)
+        got = result.scenario(i)
+        for nid, snap in expected.items():
+            for sig, value in got[nid].items():
+                assert value == pytest.approx(snap.outputs[sig.label]["value"], abs=1e-6), (i, nid, sig)
+    assert any("场景" in v for v in result.violations["line_leader"])
+    assert {nid: dict(n.output_signals) for nid, n in engine.nodes.items()} == before
+
+
+def test_tornado_covers_every_parameter(monkeypatch):
+    """测试：龙卷风覆盖全图每个参数并按摆幅排序；API 分批扫描与整批一致"""
+    engine = build_electronics_factory()
+    bars = engine.tornado("prod_manager", SignalType.OEE, span=0.1)
+
+    assert len(bars) == sum(len(n.parameters) for n in engine.nodes.values())
+    assert [b.swing for b in bars] == sorted((b.swing for b in bars), reverse=True)
+    assert {b.param_key for b in bars[:2]} == {"target_output", "speed"}
+
+    monkeypatch.setattr(api_adapter, "_store", OrgSessionStore())
+    app = FastAPI()
+    app.include_router(api_adapter.router)
+    client = TestClient(app)
+    monkeypatch.setattr(type(engine), "SWEEP_BATCH", 3)
+    resp = client.get("/api/v1/org-panel/tornado/prod_manager/oee", params={"span": 0.1})
+    assert resp.status_code == 200
+    assert [b["swing"] for b in resp.json()["bars"]] == [b.swing for b in bars]
@@ -0,0 +1,110 @@
+"""
+SPC 判异规则引擎单元测试 - 向量化批量评估与逐点增量评估口径一致
+"""
+
+import numpy as np
+import pytest
+
+from api.services.spc_rules import (
+    RULE_CODES, SpcRuleState, evaluate_windows, limits_to_sigma, summarize_hits,
+)
+
+
+def _incremental_hits(values, cl, sigma):
+    state = SpcRuleState()
+    return [state.push(v, cl, sigma) for v in values]
+
+
+def test_run_of_seven_above_center():
+    """测试：连续 7 点在中心线同侧触发 run 规则（第 7 点起）"""
+    values = [0.5, 0.2, 0.8, 0.4, 0.6, 0.3, 0.7]
+    hits = _incremental_hits(values, 0.0, 1.0)
+    assert "run" not in hits[5]
+    assert "run" in hits[6]
+
+
+def test_trend_of_six_increasing():
+    """测试：连续 6 点单调上升触发 trend 规则"""
+    hits = _incremental_hits([0.0, 0.1, 0.2, 0.3, 0.4, 0.5], 0.0, 1.0)
+    assert "trend" not in hits[4]
+    assert "trend" in hits[5]
+
+
+def test_two_of_three_beyond_two_sigma():
+    """测试：3 点中 2 点超出同侧 2σ；异侧不计"""
+    assert "2of3_2s" in _incremental_hits([2.5, 0.0, 2.2], 0.0, 1.0)[2]
+    assert "2of3_2s" not in _incremental_hits([2.5, 0.0, -2.2], 0.0, 1.0)[2]
+
+
+def test_stratification_within_one_sigma():
+    """测试：连续 15 点落在 ±1σ 内触发分层规则"""
+    values = [0.3 * (-1) ** i for i in range(15)]
+    hits = _incremental_hits(values, 0.0, 1.0)
+    assert "stratification" in hits[14]
+    assert all("stratification" not in h for h in hits[:14])
+
+
+def test_window_rules_wait_for_full_window():
+    """测试：流开头窗口未凑满时 2/3、4/5 规则不触发（两条路径一致）"""
+    hits = _incremental_hits([2.5, 2.5, 0.0], 0.0, 1.0)
+    assert "2of3_2s" not in hits[1] and "2of3_2s" in hits[2]
+    hits = _incremental_hits([1.5, 1.5, 1.5, 1.5, 0.0], 0.0, 1.0)
+    assert "4of5_1s" not in hits[3] and "4of5_1s" in hits[4]
+    vec = evaluate_windows(np.array([[2.5, 2.5, 0.0]]), np.zeros(1), np.ones(1))
+    assert vec["2of3_2s"][0].tolist() == [False, False, True]
+
+
+def test_trend_without_sigma_in_both_paths():
+    """测试：无控制限（σ 缺失）时两条路径都只判趋势"""
+    values = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.2]
+    assert _incremental_hits(values, None, None)[5] == ["trend"]
+    vec = evaluate_windows(np.array([values]), np.zeros(1), np.array([np.nan]))
+    assert [r for r in RULE_CODES if vec[r][0, 5]] == ["trend"]
+    assert not any(vec[r][0, 6] for r in RULE_CODES)
+
+
+def _assert_paths_agree(seed):
+    rng = np.random.default_rng(seed)
+    n_chars, window = 12, 40
+    values = rng.normal(0, rng.uniform(0.5, 2.5), size=(n_chars, window))
+    for i in range(n_chars):
+        values[i, :rng.integers(0, window - 1)] = np.nan  # 历史长短不一，覆盖流开头
+    values[rng.integers(n_chars), -8:] = np.linspace(-1, 2, 8)  # 人为制造趋势
+    cl = rng.normal(0, 0.2, size=n_chars)
+    sigma = rng.uniform(0.5, 1.5, size=n_chars)
+    sigma[rng.random(n_chars) < 0.3] = np.nan  # 无控制限的特性只判趋势
+
+    hits = evaluate_windows(values, cl, sigma)
+    for i in range(n_chars):
+        row = values[i][~np.isnan(values[i])]
+        offset = window - len(row)
+        sg = None if np.isnan(sigma[i]) else sigma[i]
+        expected = _incremental_hits(row, cl[i] if sg else None, sg)
+        for j, rules in enumerate(expected):
+            got = [r for r in RULE_CODES if hits[r][i, offset + j]]
+            assert got == rules, (seed, i, j)
+
+
+def test_vectorized_matches_incremental():
+    """测试：300 组随机序列上整厂滑窗结果与逐点增量结果逐点一致（含流开头、左侧 NaN 填充、无 σ 特性）"""
+    for seed in range(300):
+        _assert_paths_agree(seed)
+
+
+def test_summarize_hits_lists_latest_point_rules():
+    """测试：汇总只列出有命中的特性，并区分窗口内命中与最新点命中"""
+    values = np.array([[0.0] * 10 + [3.5], [0.1, -0.1] * 5 + [0.0]])
+    hits = evaluate_windows(values, np.zeros(2), np.ones(2))
+    summary = summarize_hits(["A", "B"], hits)
+    assert [s["characteristic_code"] for s in summary] == ["A"]
+    assert summary[0]["latest_point_rules"] == ["beyond_3s"]
+
+
+@pytest.mark.parametrize("cl,ucl,lcl,expected", [
+    (10.0, 10.3, 9.7, (10.0, pytest.approx(0.1))),
+    (10.0, None, 9.4, (10.0, pytest.approx(0.2))),
+    (None, 10.3, 9.7, (None, None)),
+])
+def test_limits_to_sigma(cl, ucl, lcl, expected):
+    """测试：由控制限推 σ，单侧控制限可用"""
+    assert limits_to_sigma(cl, ucl, lcl) == expected
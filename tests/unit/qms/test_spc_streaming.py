@@ -0,0 +1,216 @@
+"""
+SPC 流式统计单元测试 - Welford 运行统计 / 子组 X̄-R 累加器 / 批量写入
+"""
+
+import statistics
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from api.services import spc_service
+from api.services.spc_service import CharacteristicState, RunningStats, SpcService
+
+
+def test_running_stats_matches_two_pass():
+    """测试：Welford 在线统计与两遍算法结果一致"""
+    values = [10.02, 9.98, 10.05, 9.97, 10.01, 10.03, 9.99, 10.00]
+    stats = RunningStats()
+    for v in values:
+        stats.push(v)
+
+    assert stats.n == len(values)
+    assert stats.mean == pytest.approx(statistics.mean(values))
+    assert stats.std == pytest.approx(statistics.stdev(values))
+    assert (stats.min, stats.max) == (min(values), max(values))
+
+
+def test_running_stats_merge_equals_single_pass():
+    """测试：两段统计合并（多 worker 落库）等价于整体统计"""
+    a, b, whole = RunningStats(), RunningStats(), RunningStats()
+    for i, v in enumerate([1.0, 2.5, 3.1, 4.7, 5.2, 6.9, 7.3]):
+        (a if i < 3 else b).push(v)
+        whole.push(v)
+
+    merged = a.merged(b)
+    assert merged.n == whole.n
+    assert merged.mean == pytest.approx(whole.mean)
+    assert merged.m2 == pytest.approx(whole.m2)
+
+
+def test_state_closes_subgroups_by_sample_group_and_size():
+    """测试：按 sample_group 变化闭合子组；无组号时按子组容量切分"""
+    st = CharacteristicState({"subgroup_size": 3})
+    for v, g in [(1.0, 1), (3.0, 1), (2.0, 2), (4.0, 2)]:
+        st.push(v, g)
+    # 组 1 已闭合，组 2 仍开放
+    assert st.xbar_r() == (1, 2.0, 2.0)
+
+    for v in [5.0, 6.0, 7.0]:
+        st.push(v)
+    k, xbarbar, rbar = st.xbar_r()
+    assert k == 3
+    assert xbarbar == pytest.approx((2.0 + 3.0 + 6.0) / 3)
+    assert rbar == pytest.approx((2.0 + 2.0 + 2.0) / 3)
+
+
+def test_state_cpk_from_running_moments():
+    """测试：Cpk 由运行均值/标准差计算，少于 10 点时不给出"""
+    st = CharacteristicState({"usl": 10.5, "lsl": 9.5})
+    values = [10.0, 10.1, 9.9, 10.2, 9.8, 10.0, 10.1, 9.9]
+    for v in values:
+        st.push(v)
+    assert st.cpk() is None
+
+    for v in [10.0, 10.05]:
+        st.push(v)
+    stats = st.totals()
+    expected = round(min(10.5 - stats.mean, stats.mean - 9.5) / (3 * stats.std), 3)
+    assert st.cpk() == expected
+
+
+@pytest.mark.asyncio
+async def test_ingest_batch_single_insert_and_commit(mock_db_session):
+    """测试：批量写入只查一次最近点、执行一次多行 INSERT 和一次 commit，失控判定基于缓存配置"""
+    spc_service._states.clear()
+    state = CharacteristicState({"ucl": 10.5, "cl": 10.0, "lcl": 9.5, "is_active": True})
+    spc_service._states[("F1", "DIA")] = state
+    mock_db_session.execute = AsyncMock(return_value=MagicMock())
+
+    svc = SpcService(mock_db_session)
+    result = await svc.ingest_batch("F1", [
+        {"characteristic_code": "DIA", "measured_value": 10.1},
+        {"characteristic_code": "DIA", "measured_value": 10.9},
+        {"characteristic_code": "DIA", "measured_value": 9.7},
+    ])
+
+    assert result["accepted"] == 3
+    assert result["out_of_control"] == 1
+    assert mock_db_session.execute.await_count == 2
+    rows = mock_db_session.execute.await_args.args[1]
+    assert len(rows) == 3
+    mock_db_session.commit.assert_awaited_once()
+    assert state.totals().n == 3
+    spc_service._states.clear()
+
+
+@pytest.mark.asyncio
+async def test_rule_state_rebuilt_from_recent_points(mock_db_session):
+    """测试：判异状态由库中最近点回放（其他 worker 写入的点也算），不沿用本进程旧状态"""
+    spc_service._states.clear()
+    spc_service._states[("F1", "DIA")] = CharacteristicState({"ucl": 10.3, "cl": 10.0, "lcl": 9.7})
+    recent = MagicMock()
+    # 时间倒序：库中已有 6 点在中心线上方
+    recent.mappings.return_value.all.return_value = [
+        {"characteristic_code": "DIA", "vals": [10.05, 10.02, 10.04, 10.01, 10.03, 10.02]},
+    ]
+    mock_db_session.execute = AsyncMock(side_effect=[recent, MagicMock()])
+    result = await SpcService(mock_db_session).ingest_batch(
+        "F1", [{"characteristic_code": "DIA", "measured_value": 10.02}],
+    )
+    assert result["points"][0]["rules"] == ["run"]
+    assert mock_db_session.execute.await_args_list[0].args[1]["codes"] == ["DIA"]
+
+    mock_db_session.execute = AsyncMock(return_value=MagicMock())
+    result = await SpcService(mock_db_session).ingest_batch(
+        "F1", [{"characteristic_code": "DIA", "measured_value": 10.02}],
+    )
+    assert result["points"][0]["rules"] == []
+    spc_service._states.clear()
+
+
+@pytest.mark.asyncio
+async def test_failed_commit_keeps_pending_delta(mock_db_session):
+    """测试：运行统计落库后提交失败，增量并回 pending、基线不被未提交结果覆盖，本批点不计入统计"""
+    spc_service._states.clear()
+    state = CharacteristicState({"ucl": 10.5, "cl": 10.0, "lcl": 9.5})
+    for v in [10.0, 10.2, 9.9]:
+        state.push(v)
+    spc_service._states[("F1", "DIA")] = state
+    returning = MagicMock()
+    returning.mappings.return_value.first.return_value = {
+        "n": 103, "mean": 10.0, "m2": 1.0, "min_value": 9.0, "max_value": 11.0,
+        "subgroup_count": 20, "xbar_sum": 200.0, "r_sum": 4.0,
+    }
+    mock_db_session.execute = AsyncMock(side_effect=[MagicMock(), MagicMock(), returning])
+    mock_db_session.commit = AsyncMock(side_effect=RuntimeError("connection lost"))
+
+    with pytest.raises(RuntimeError):
+        await SpcService(mock_db_session).ingest_batch(
+            "F1", [{"characteristic_code": "DIA", "measured_value": 10.1}], flush_stats=True,
+        )
+    mock_db_session.rollback.assert_awaited_once()
+    assert state.flushing is None and state.base.n == 0
+    assert state.pending.n == 3 and state.pending.mean == pytest.approx((10.0 + 10.2 + 9.9) / 3)
+    assert spc_service._states[("F1", "DIA")] is state
+
+    mock_db_session.execute = AsyncMock(side_effect=[MagicMock(), MagicMock(), returning])
+    mock_db_session.commit = AsyncMock()
+    await SpcService(mock_db_session).ingest_batch(
+        "F1", [{"characteristic_code": "DIA", "measured_value": 10.1}], flush_stats=True,
+    )
+    assert state.base.n == 103 and state.base_subgroups == 20
+    assert state.pending.n == 1 and state.totals().n == 104
+    spc_service._states.clear()
+
+
+@pytest.mark.asyncio
+async def test_seed_row_always_written_and_dropped_on_rollback(mock_db_session):
+    """测试：冷启动播种必写一行（无历史点也写 n=0 空行）；事务回滚时新播种的状态作废"""
+    spc_service._states.clear()
+    mock_db_session.execute = AsyncMock(return_value=MagicMock())
+    mock_db_session.commit = AsyncMock(side_effect=RuntimeError("connection lost"))
+
+    with pytest.raises(RuntimeError):
+        await SpcService(mock_db_session).ingest_batch(
+            "F1", [{"characteristic_code": "DIA", "measured_value": 10.1}],
+        )
+    sqls = [" ".join(str(c.args[0]).split()) for c in mock_db_session.execute.await_args_list]
+    assert any(q.startswith("INSERT INTO spc_running_stats") and "unnest" in q for q in sqls)
+    assert ("F1", "DIA") not in spc_service._states
+    spc_service._states.clear()
+
+
+@pytest.mark.asyncio
+async def test_control_limits_use_requested_subgroup_size(mock_db_session):
+    """测试：子组容量与配置不同时按请求容量重新分组并取对应 A2；不支持的容量直接报错"""
+    spc_service._states.clear()
+    state = CharacteristicState({"subgroup_size": 5})
+    for i in range(40):
+        state.push(10.0 + (i % 4) * 0.1)
+    spc_service._states[("F1", "DIA")] = state
+    svc = SpcService(mock_db_session)
+
+    assert "error" in await svc.calculate_control_limits("F1", "DIA", subgroup_size=12)
+
+    # 时间倒序返回：每 4 点一组 → 组内 R = 0.3，X̄ = 10.15
+    points = [{"measured_value": 10.0 + (i % 4) * 0.1, "sample_group": None} for i in range(40)][::-1]
+    scan = MagicMock()
+    scan.mappings.return_value.all.return_value = points
+    mock_db_session.execute = AsyncMock(side_effect=[scan, MagicMock()])
+    result = await svc.calculate_control_limits("F1", "DIA", subgroup_size=4)
+    assert result["subgroup_size"] == 4 and result["subgroups_used"] == 10
+    assert result["xbar_chart"]["ucl"] == round(10.15 + spc_service.A2_TABLE[4] * 0.3, 4)
+    assert result["r_chart"]["ucl"] == round(spc_service.D4_TABLE[4] * 0.3, 4)
+    spc_service._states.clear()
+
+
+@pytest.mark.asyncio
+async def test_control_chart_cpk_covers_all_history(mock_db_session):
+    """测试：控制图 points 只取最近 limit 点，Cpk 基于全部历史运行统计并在响应中注明"""
+    spc_service._states.clear()
+    spc_service._states[("F1", "DIA")] = CharacteristicState({"usl": 10.6, "lsl": 9.4})
+    points = MagicMock()
+    points.mappings.return_value.all.return_value = [
+        {"measured_value": 10.0, "is_out_of_control": False},
+        {"measured_value": 10.1, "is_out_of_control": False},
+    ]
+    stats = MagicMock()
+    stats.mappings.return_value.first.return_value = {
+        "n": 500, "mean": 10.0, "m2": 499 * 0.01, "min_value": 9.7, "max_value": 10.3,
+    }
+    mock_db_session.execute = AsyncMock(side_effect=[points, stats])
+
+    chart = await SpcService(mock_db_session).get_control_chart("F1", "DIA", limit=2)
+    assert chart["total_points"] == 2 and chart["sample_count"] == 500
+    assert chart["cpk_scope"] == "all_history" and chart["cpk"] == 2.0
+    spc_service._states.clear()
@@ -0,0 +1,115 @@
+"""
+TMS 分发引擎单元测试 - 批量特征评分 / 批量分发内存负载 / 容量约束最优指派
+"""
+
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from core.tms import assignment_solver
+from core.tms.assignment_solver import solve_capacitated_assignment
+from core.tms.distribution_engine import CandidateFeatures, DistributionEngine
+
+
+def _user(i, role="operator"):
+    return SimpleNamespace(id=f"u{i}", username=f"user{i}", full_name=f"员工{i}", role=role)
+
+
+def _task(i, skills=None, priority="medium"):
+    return SimpleNamespace(
+        id=f"t{i}", task_code=f"TASK-{i}", task_type="inspection", priority=priority,
+        required_skills=skills or [], required_roles=[], deadline=None, created_at=None,
+    )
+
+
+def test_skill_vector_matches_scalar_formula():
+    """测试：向量化技能分与逐人公式一致（匹配率 70% + 平均等级 30%）"""
+    features = CandidateFeatures(
+        users=[_user(0), _user(1), _user(2)],
+        skills=[{"WELD": "L5", "CNC": "L3"}, {"WELD": "L2"}, {}],
+        known_skills={"WELD", "CNC"},
+        load=np.zeros(3),
+    )
+    scores = features.skill_vector(["WELD", "CNC"])
+
+    assert scores[0] == pytest.approx(min(1.0, 1.0 * 0.7 + (1.0 + 0.6) / 2 * 0.3))
+    assert scores[1] == pytest.approx(0.5 * 0.7 + 0.4 * 0.3)
+    assert scores[2] == pytest.approx(0.0)
+    assert features.skill_vector([]).tolist() == [0.7, 0.7, 0.7]
+    # 资质过滤：至少一项 ≥ L3
+    assert features.qualified_mask(["WELD", "CNC"]).tolist() == [True, False, False]
+    assert features.qualified_mask(["UNKNOWN"]).all()
+
+
+@pytest.mark.asyncio
+async def test_distribute_many_spreads_load_in_memory(mock_db_session):
+    """测试：批量分发时负载在内存中累加，满负载者不再接单，只提交一次"""
+    users = [_user(0), _user(1)]
+    engine = DistributionEngine(mock_db_session)
+    engine.MAX_TASKS_PER_USER = 2
+    users_result = MagicMock()
+    users_result.scalars.return_value.all.return_value = users
+    mock_db_session.execute = AsyncMock(return_value=users_result)
+    mock_db_session.add = MagicMock()
+    engine._load_features = AsyncMock(return_value=CandidateFeatures(
+        users=users, skills=[{}, {}], known_skills=set(), load=np.array([0.0, 1.0]),
+    ))
+    engine._publish_distributed = AsyncMock()
+
+    tasks = [_task(i) for i in range(4)]
+    results = await engine.distribute_many(tasks, strategy="load_balance")
+
+    assigned = [r.assigned_to for r in results]
+    assert assigned[:3] == ["u0", "u0", "u1"]
+    assert results[3].success is False  # 两人都已满负载
+    mock_db_session.commit.assert_awaited_once()
+    assert engine._publish_distributed.await_count == 3
+
+
+def _brute_force(scores, capacity, penalty):
+    """小规模穷举最优（每个任务都必须分配）"""
+    best = -np.inf
+    for combo in itertools.product(range(scores.shape[1]), repeat=scores.shape[0]):
+        counts = np.bincount(combo, minlength=scores.shape[1])
+        if (counts > capacity).any():
+            continue
+        value = scores[np.arange(len(combo)), combo].sum() - penalty * (counts * (counts - 1) / 2).sum()
+        best = max(best, value)
+    return best
+
+
+@pytest.mark.parametrize("method", ["transport", "hungarian"])
+@pytest.mark.parametrize("duplicate_rows", [False, True])
+def test_capacitated_assignment_is_optimal(duplicate_rows, method, monkeypatch):
+    """测试：容量约束指派与穷举最优一致（运输/匈牙利两条路径）"""
+    if method == "hungarian":
+        monkeypatch.setattr(assignment_solver, "TRANSPORT_MAX_CELLS", 0)
+    rng = np.random.default_rng(7)
+    scores = rng.random((6, 3))
+    if duplicate_rows:
+        scores[3:] = scores[0]
+    capacity = np.array([2, 3, 2])
+
+    solution = solve_capacitated_assignment(scores, capacity, slot_penalty=0.05)
+
+    assert solution.method == method
+    assert (np.bincount(solution.assignment, minlength=3) <= capacity).all()
+    assert solution.objective == pytest.approx(_brute_force(scores, capacity, 0.05))
+
+
+def test_capacitated_assignment_1000_by_500_respects_constraints():
+    """测试：1000 任务 × 500 候选人规模全部分配，且遵守资质与容量"""
+    rng = np.random.default_rng(0)
+    scores = rng.random((1000, 500))
+    eligible = rng.random((1000, 500)) > 0.3
+    capacity = rng.integers(0, 11, 500)
+
+    solution = solve_capacitated_assignment(scores, capacity, eligible, slot_penalty=0.025)
+
+    assigned = np.flatnonzero(solution.assignment >= 0)
+    assert len(assigned) == 1000
+    assert eligible[assigned, solution.assignment[assigned]].all()
+    assert (np.bincount(solution.assignment[assigned], minlength=500) <= capacity).all()
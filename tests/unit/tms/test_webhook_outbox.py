@@ -0,0 +1,102 @@
+"""
+TMS 事件 Outbox 单元测试 - 事务内写入、提交后本地派发 / 按订阅者顺序并发投递 / 退避
+"""
+
+import asyncio
+import json
+from datetime import datetime
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from core.tms import webhook_dispatcher as wd
+from core.tms.events import TMSEvent, TMSEventBus
+from database.models import TMSEventOutbox
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'tms.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: TMSEventOutbox.metadata.create_all(c, tables=[TMSEventOutbox.__table__]))
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_publish_defers_local_dispatch_until_commit(db):
+    """测试：传入 db 时 Outbox 行随调用方提交；handlers 与投递器唤醒在提交后才执行，回滚则丢弃"""
+    bus = TMSEventBus()
+    handled, woken = [], []
+    bus.subscribe("task.created", lambda e: handled.append(e.payload["task_id"]))
+    bus.add_outbox_listener(lambda: woken.append(True))
+
+    event = await bus.publish("task.created", {"task_id": "t1", "at": datetime(2026, 1, 1)}, db=db)
+    assert len(event.event_id) == 32 and event.event_id != TMSEvent("x", {}).event_id
+    assert handled == [] and woken == []
+
+    await db.commit()
+    await asyncio.sleep(0)
+    assert handled == ["t1"] and woken == [True]
+    row = (await db.execute(select(TMSEventOutbox))).scalar_one()
+    assert row.event_id == event.event_id
+    assert row.payload == {"task_id": "t1", "at": "2026-01-01 00:00:00"}
+
+    await bus.publish("task.created", {"task_id": "t2"}, db=db)
+    await db.rollback()
+    await db.commit()
+    await asyncio.sleep(0)
+    assert handled == ["t1"]
+    assert (await db.execute(select(TMSEventOutbox))).scalars().all() == [row]
+
+
+def _claimed(i, sub, n):
+    return wd.ClaimedDelivery(
+        id=i, subscription_id=sub, agent_id=sub, webhook_url=f"http://{sub}/hook", attempts=0,
+        event_id=f"e{i}", event_type="task.created", source="system", payload=json.dumps({"n": n}),
+        event_created_at=datetime.utcnow(), secret="s" if sub == "a" else None, is_active=sub != "gone",
+    )
+
+
+@pytest.mark.asyncio
+async def test_deliver_keeps_order_per_subscriber_and_runs_subscribers_concurrently():
+    """测试：慢订阅者不拖累其他订阅者；同订阅者一条失败后其后事件原样放回"""
+    received = []
+
+    async def handler(request):
+        host, n = request.url.host, json.loads(request.content)["payload"]["n"]
+        received.append((host, n))
+        if host == "slow":
+            await asyncio.sleep(0.2)
+        if host == "b" and n == 1:
+            return httpx.Response(503)
+        if host == "a":
+            assert request.headers["X-TMS-Signature"].startswith("sha256=")
+        return httpx.Response(200)
+
+    dispatcher = wd.WebhookDispatcher(concurrency=8)
+    dispatcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    claimed = [_claimed(i, sub, i) for i, sub in enumerate(["a", "b", "slow", "b", "slow", "b", "gone"])]
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    outcomes = {o.delivery.id: o for o in await dispatcher.deliver(claimed)}
+    elapsed = loop.time() - started
+    await dispatcher.close()
+
+    assert elapsed < 0.6  # 两条慢投递串行 0.4s，其余订阅者并发不叠加
+    assert [n for host, n in received if host == "b"] == [1]
+    assert outcomes[1].status == "failed" and outcomes[3].status == outcomes[5].status == "released"
+    assert outcomes[0].status == outcomes[2].status == outcomes[4].status == "delivered"
+    assert outcomes[6].permanent  # 订阅已注销直接进死信
+
+
+def test_backoff_grows_exponentially_with_cap(monkeypatch):
+    """测试：指数退避带抖动，不超过上限"""
+    monkeypatch.setattr(wd.random, "random", lambda: 1.0)
+    assert [wd.backoff_delay(n) for n in (1, 2, 3)] == [2.0, 4.0, 8.0]
+    assert wd.backoff_delay(30) == wd.BACKOFF_MAX_SECONDS